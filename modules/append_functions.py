@@ -0,0 +1,219 @@
+import json
+import numpy as np
+import os
+import pickle
+from . import cache_functions, qaqc_functions
+
+
+# Bumped whenever the contents of a station state change, so that states saved by older versions are never appended to
+STATE_VERSION = 1
+
+# Arrays corrected by each journal variable, named as the data arrays of WeatherQAQC without their 'data_' prefix.
+# Journal steps on compiled ea are carried over separately, once the humidity variables have been recalculated.
+JOURNAL_VARIABLE_ARRAYS = {'tmax_tmin': ['tmax', 'tmin'], 'tmin_tdew': ['tmin', 'tdew'], 'ws': ['ws'],
+                           'precip': ['precip'], 'rs': ['rs'], 'ea': ['ea'], 'rhmax_rhmin': ['rhmax', 'rhmin'],
+                           'rhavg': ['rhavg']}
+
+# Correction methods that are carried over to appended days if their interval ran to the end of the record. Modified
+# z-score outliers are always carried over, as they are found across the whole record whatever the interval was.
+INTERVAL_METHODS = ['additive', 'multiplicative', 'set_to_nan', 'rolling_z_score_outliers', 'rs_period_ratio',
+                    'rh_yearly_percentile']
+
+
+def default_state_path(folder_path, station_name):
+    """
+        Creates the path of the file a station's state is saved to, next to its other output files.
+
+        Parameters:
+            folder_path : string of folder the station's data file is in
+            station_name : string of station name
+
+        Returns:
+            state_file_path : string of path to state file
+    """
+    return folder_path + "/correction_files/" + station_name + "_state" + ".pkl"
+
+
+def _config_signature(config_dict):
+    """
+        Describes every setting of a config file that changes how a station is processed
+    """
+    normalized = {key: value for (key, value) in config_dict.items()
+                  if key not in cache_functions.IGNORED_CONFIG_KEYS}
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+def save_state(state_file_path, state, config_dict):
+    """
+        Saves the state of a station once it has been processed, so that days added to its data file later can be
+        appended without processing the whole record again. Same as checkpoints, the state is first written to a
+        temporary file and then moved over the previous one.
+
+        Parameters:
+            state_file_path : string of path to state file
+            state : dictionary of everything WeatherQAQC needs to append to the station
+            config_dict : dictionary of config file settings the station was processed with, see
+                input_functions.read_config
+
+        Returns:
+            None
+    """
+    saved_state = {'version': STATE_VERSION, 'config': _config_signature(config_dict), 'state': state}
+
+    temporary_file_path = state_file_path + '.tmp'
+    with open(temporary_file_path, 'wb') as state_file:
+        pickle.dump(saved_state, state_file, protocol=pickle.HIGHEST_PROTOCOL)
+        state_file.flush()
+        os.fsync(state_file.fileno())
+    os.replace(temporary_file_path, state_file_path)
+
+
+def load_state(state_file_path, config_dict):
+    """
+        Loads the saved state of a station, if it has one that can be appended to. A state is ignored if it was saved
+        by a different version of the script, can't be read, or if the station was processed with different config
+        file settings, as the days already processed would then no longer match the ones appended.
+
+        Parameters:
+            state_file_path : string of path to state file
+            config_dict : dictionary of current config file settings, see input_functions.read_config
+
+        Returns:
+            state : dictionary of everything WeatherQAQC needs to append to the station, None if there is no state
+    """
+    if not os.path.isfile(state_file_path):
+        return None
+
+    try:
+        with open(state_file_path, 'rb') as state_file:
+            saved_state = pickle.load(state_file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        print('\nSystem: Station state at {} could not be read.'.format(state_file_path))
+        return None
+
+    if saved_state.get('version') != STATE_VERSION:
+        print('\nSystem: Station state at {} is from a different version of the script.'.format(state_file_path))
+        return None
+    elif saved_state['config'] != _config_signature(config_dict):
+        print('\nSystem: The config file has changed since the station state at {} was saved.'
+              .format(state_file_path))
+        return None
+
+    return saved_state['state']
+
+
+def carried_steps(journal, record_length):
+    """
+        Finds every operation of a correction journal that also applies to days appended after the record, in the
+        order they were applied.
+
+        Parameters:
+            journal : list of journal steps, see recipe_functions.write_journal
+            record_length : integer of number of days in the record the journal was made on
+
+        Returns:
+            steps : list of tuples of journal variable and operation
+    """
+    steps = []
+    for journal_step in journal:
+        for operation in journal_step['operations']:
+            reaches_end = operation['end_index'] == record_length
+            if journal_step['variable'] == 'compiled_ea':
+                carried = reaches_end and operation['source'] != 'skip'
+            else:
+                carried = operation['method'] == 'z_score_outliers' or \
+                    (reaches_end and operation['method'] in INTERVAL_METHODS)
+
+            if carried:
+                steps.append((journal_step['variable'], operation))
+    return steps
+
+
+def extend_carried_steps(steps, record_length, appended_length, end_date):
+    """
+        Extends every carried operation that ran to the end of the record over the days appended to it, so that they
+        still reach the end of the record, and are carried over again, when more days are appended later.
+
+        Parameters:
+            steps : list of tuples of journal variable and operation, see carried_steps, which are changed in place
+            record_length : integer of number of days in the record before the days were appended
+            appended_length : integer of number of days appended
+            end_date : string of date of last appended day, as 'YYYY-MM-DD'
+
+        Returns:
+            None
+    """
+    for (_variable, operation) in steps:
+        if operation['end_index'] == record_length:
+            operation['end_index'] = record_length + appended_length
+            # Same as recipe_functions.create_journal_entry, the end is a date unless the interval was out of bounds
+            operation['end'] = end_date if isinstance(operation['end'], str) else operation['end_index']
+
+
+def carry_operation(log_writer, operation, values, month, doy, start):
+    """
+        Applies a journal operation to the days appended after the record, the same way it was applied to the end of
+        the record. Outliers are found against the record as it was processed, and period and year based corrections
+        use the factor they applied to the end of it (see qaqc_functions.end_factor).
+
+        Parameters:
+            log_writer : logging object for log file
+            operation : dictionary of journal operation, see recipe_functions.create_journal_entry
+            values : list of 1D numpy arrays corrected together by the operation, each holding the processed record
+                followed by the appended days
+            month : 1D numpy array of month values matching values
+            doy : 1D numpy array of day of year values matching values
+            start : index of first appended day
+
+        Returns:
+            corrected : list of 1D numpy arrays after correction, only the appended days are changed
+    """
+    method = operation['method']
+    end = values[0].shape[0]
+    corrected = [np.array(var) for var in values]
+
+    for var in corrected:
+        if method == 'additive':
+            var[start:end] += float(operation['modifier'])
+        elif method == 'multiplicative':
+            var[start:end] *= float(operation['modifier'])
+        elif method == 'set_to_nan':
+            var[start:end] = np.nan
+        elif method == 'z_score_outliers':
+            for k in np.unique(month[start:end]):
+                t_index = np.where(month == k)[0]
+                (cleaned_values, _outlier_count) = qaqc_functions.modified_z_score_outlier_detection(var[t_index])
+                appended = t_index >= start
+                var[t_index[appended]] = cleaned_values[appended]
+        elif method == 'rolling_z_score_outliers':
+            (var[:], _outlier_count) = qaqc_functions.\
+                rolling_z_score_outlier_detection(var, doy, start, end, operation['window_type'],
+                                                  operation['half_width'])
+        elif method == 'rs_period_ratio' or method == 'rh_yearly_percentile':
+            # A period that was thrown out has no factor, so the days after it are thrown out too
+            factor = np.nan if operation['end_factor'] is None else operation['end_factor']
+            var[start:end] *= factor
+        else:
+            raise ValueError('Unsupported method {} passed to carry_operation.'.format(method))
+
+    if method == 'rh_yearly_percentile':
+        # Same limits as rh_yearly_percentile_corr puts on the values it corrects
+        (rhmax, rhmin) = corrected
+        with np.errstate(invalid='ignore'):
+            for var in corrected:
+                var[start:end][var[start:end] > 100] = 100
+                var[start:end][var[start:end] <= 0] = 1
+            inverted = np.flatnonzero(rhmax[start:end] < rhmin[start:end]) + start
+        rhmax[inverted] = np.nan
+        rhmin[inverted] = np.nan
+
+    changed = sum(int(np.sum(~np.isclose(var[start:end], original[start:end], equal_nan=True)))
+                  for (var, original) in zip(corrected, values))
+    log_writer.write('Journal operation %s was carried over to the appended days, changing %s values. \n'
+                     % (method, changed))
+    return corrected
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -0,0 +1,404 @@
+import concurrent.futures as cf
+import configparser as cp
+import datetime as dt
+import multiprocessing as mp
+import numpy as np
+import os
+import pandas as pd
+import pathlib as pl
+import sys
+import time
+import traceback
+from . import metadata_functions, output_functions
+from .input_functions import read_config, validate_file
+
+try:
+    import resource  # Only available on unix systems, used to cap and measure worker memory
+except ImportError:
+    resource = None
+
+
+# Number of times a station is started before it is given up on, used when a worker process dies unexpectedly
+MAX_ATTEMPTS = 2
+
+
+def read_manifest(manifest_file_path, config_file_path=None, folder_path='batch_files'):
+    """
+        Reads the list of stations that a batch will process. The manifest is either a .csv file with a 'config_path'
+        column, one row per station, and an optional 'recipe_file_path' column, or a network metadata workbook (.xlsx)
+        in the same format used by qaqc_single_station.py. Every row of a metadata workbook that has not finished both
+        of its runs (run_count below 2, after applying the progress kept in the metadata store) becomes a station, and
+        a config file is created for it from the template config file with the station's metadata filled in.
+
+        The second run of a metadata workbook station corrects it, which a batch can only do with a recipe, taken from
+        an optional 'recipe_file_path' column of the workbook. Stations on their second run without one are marked as
+        needing correction, and are reported instead of being run, see run_batch.
+
+        Parameters:
+            manifest_file_path : string of path to manifest .csv or metadata workbook .xlsx
+            config_file_path : string of path to template config file, required for metadata workbooks
+            folder_path : string of path to folder that created config files are saved to
+
+        Returns:
+            jobs : list of dictionaries, one per station, each with the keys 'name', 'config_path',
+                'recipe_file_path', 'metadata_id', and 'run_count' (both None unless the station came from a metadata
+                workbook), and 'needs_correction'
+    """
+    validate_file(manifest_file_path, ['csv', 'xlsx'])
+    jobs = []
+
+    if pl.PurePath(manifest_file_path).suffix.lower() == '.csv':
+        manifest_df = pd.read_csv(manifest_file_path, dtype=str, keep_default_na=False)
+        if 'config_path' not in manifest_df.columns:
+            raise ValueError('\n\nManifest file \'{}\' does not have a \'config_path\' column.'
+                             .format(manifest_file_path))
+
+        for (row_number, row) in enumerate(manifest_df.itertuples(index=False)):
+            recipe_file_path = getattr(row, 'recipe_file_path', '')
+            jobs.append({'name': '{:03d}_{}'.format(row_number + 1, pl.Path(row.config_path).stem),
+                         'config_path': row.config_path,
+                         'recipe_file_path': recipe_file_path if recipe_file_path != '' else None,
+                         'metadata_id': None, 'run_count': None, 'needs_correction': False})
+    else:
+        if config_file_path is None:
+            raise ValueError('\n\nA template config file is required to run a batch from a metadata workbook.')
+        validate_file(config_file_path, ['ini'])
+        os.makedirs(folder_path, exist_ok=True)
+
+        metadata_df = pd.read_excel(manifest_file_path, sheet_name=0, index_col=0, engine='openpyxl',
+                                    keep_default_na=True, na_filter=True)
+        metadata_df = metadata_functions.apply_network_progress(read_config(config_file_path)['metadata_store_path'],
+                                                                metadata_df)
+        for (row_number, (index, row)) in enumerate(metadata_df.iterrows()):
+            if row.run_count >= 2:
+                continue  # Station has already been fully corrected
+
+            name = '{:03d}_{}'.format(row_number + 1, row.id)
+            station_config_path = os.path.join(folder_path, name + '_config.ini')
+            write_station_config(config_file_path, station_config_path,
+                                 {'METADATA': {'data_file_path': row.input_path, 'station_latitude': row.latitude,
+                                               'station_longitude': row.longitude, 'station_elevation': row.elev_m,
+                                               'anemometer_height': row.anemom_height_m},
+                                  'OPTIONS': {'correction_option': int(row.run_count)}})
+            recipe_file_path = row.get('recipe_file_path', np.nan)
+            recipe_file_path = recipe_file_path if isinstance(recipe_file_path, str) and recipe_file_path != '' \
+                else None
+            jobs.append({'name': name, 'config_path': station_config_path, 'recipe_file_path': recipe_file_path,
+                         'metadata_id': row.id, 'run_count': int(row.run_count),
+                         'needs_correction': int(row.run_count) == 1 and recipe_file_path is None})
+
+    return jobs
+
+
+def write_station_config(template_file_path, config_file_path, overrides):
+    """
+        Creates a config file for a single station by copying a template config file and replacing some of its values.
+
+        Parameters:
+            template_file_path : string of path to template config file
+            config_file_path : string of path to save the new config file to
+            overrides : dictionary of config sections, each a dictionary of the keys to replace and their values
+
+        Returns:
+            None
+    """
+    config_reader = cp.ConfigParser()
+    config_reader.read(template_file_path)
+    for (section, values) in overrides.items():
+        for (key, value) in values.items():
+            config_reader[section][key] = str(value)
+
+    with open(config_file_path, 'w') as config_file:
+        config_reader.write(config_file)
+
+
+def initialize_worker(memory_limit_mb):
+    """
+        Sets up every worker process of the pool before it runs any stations.
+
+        Parameters:
+            memory_limit_mb : maximum size in megabytes the worker's memory is allowed to grow to, None for no limit
+
+        Returns:
+            None
+    """
+    if memory_limit_mb is not None:
+        if resource is None:
+            print('\nSystem: Worker memory limits are not supported on this platform, ignoring them.')
+        else:
+            memory_limit = int(memory_limit_mb * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def run_station(job, folder_path, output_writer=None):
+    """
+        Processes a single station inside a worker process. Everything the station prints is written to its own
+        console file instead of the screen, and any error is caught and returned instead of raised, so that one station
+        failing does not stop the rest of the batch.
+
+        Parameters:
+            job : dictionary of the station to process, see read_manifest
+            folder_path : string of path to folder that console files are saved to
+            output_writer : output_functions.OutputWriter to hand the station's output files to, if None they are
+                written before this returns
+
+        Returns:
+            result : dictionary of the outcome of the station
+    """
+    console_file_path = os.path.join(folder_path, job['name'] + '_console.txt')
+    result = failed_result(job, None)
+    start_time = time.perf_counter()
+
+    with open(console_file_path, 'w') as console_file, open(os.devnull, 'r') as null_input:
+        (original_stdout, original_stdin) = (sys.stdout, sys.stdin)
+        (sys.stdout, sys.stdin) = (console_file, null_input)
+        try:
+            from .py_weather_qaqc import WeatherQAQC  # Imported here so a broken install only fails the station
+
+            # Batches can append every station to one Parquet dataset and one NetCDF cube, share one result cache,
+            # and only process the days added to each station since it was last processed, see qaqc_batch.py
+            station_qaqc = WeatherQAQC(job['config_path'], recipe_file_path=job['recipe_file_path'],
+                                       output_writer=output_writer,
+                                       parquet_dataset_path=job.get('parquet_dataset_path'),
+                                       netcdf_file_path=job.get('netcdf_file_path'),
+                                       result_cache_path=job.get('result_cache_path'),
+                                       result_cache_max_mb=job.get('result_cache_max_mb'),
+                                       append=job.get('append', False))
+            station_qaqc.process_station()
+
+            result['station'] = station_qaqc.station_name
+            result['record_start'] = str(station_qaqc.record_start)
+            result['record_end'] = str(station_qaqc.record_end)
+            result['output_path'] = station_qaqc.output_file_path
+            result['status'] = 'succeeded'
+        except EOFError:
+            # Batches cannot answer prompts, so a station that asks for input has to be corrected with a recipe
+            result['error'] = 'Station asked for user input, correct it with a recipe or turn correction off.'
+            traceback.print_exc(file=console_file)
+        except MemoryError:
+            result['error'] = 'Station ran out of memory.'
+            traceback.print_exc(file=console_file)
+        except Exception as error:
+            result['error'] = '{}: {}'.format(type(error).__name__, ' '.join(str(error).split()))
+            traceback.print_exc(file=console_file)
+        finally:
+            (sys.stdout, sys.stdin) = (original_stdout, original_stdin)
+
+    result['seconds'] = round(time.perf_counter() - start_time, 2)
+    if resource is not None:
+        # Workers are replaced after every group of stations, so this is the peak of the station and any before it
+        # in its group, which is the station alone unless stations_per_worker is above 1
+        # ru_maxrss is in kilobytes on linux but bytes on mac
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['peak_memory_mb'] = round(peak_memory / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    return result
+
+
+def run_stations(jobs, folder_path):
+    """
+        Processes a group of stations one after the other inside a worker process. The output files of each station
+        are written in the background while the next station is read in and corrected, and a station only counts as
+        succeeded once all of its output files were written.
+
+        Parameters:
+            jobs : list of dictionaries of the stations to process, see read_manifest
+            folder_path : string of path to folder that console files are saved to
+
+        Returns:
+            results : list of dictionaries of the outcome of each station, in the same order as jobs
+    """
+    results = []
+    output_writer = output_functions.OutputWriter()
+    try:
+        for job in jobs:
+            results.append(run_station(job, folder_path, output_writer))
+            if len(results) > 1:
+                finish_outputs(results[-2], output_writer)
+    finally:
+        output_writer.close(raise_errors=False)
+    if len(results) > 0:
+        finish_outputs(results[-1], output_writer)
+    return results
+
+
+def finish_outputs(result, output_writer):
+    """
+        Waits for the output files and exports of a station to be written, and fails the station if any of them could
+        not be.
+
+        Parameters:
+            result : dictionary of the outcome of the station, see run_station
+            output_writer : output_functions.OutputWriter the station's output files were handed to
+
+        Returns:
+            None
+    """
+    if result['station'] is None:
+        return
+    errors = output_writer.wait(result['station'])
+    # Exports are written under a tag of their own, so the station's other output files are kept if one fails
+    export_errors = output_writer.wait(output_functions.export_tag(result['station']))
+    if result['status'] == 'succeeded' and len(errors) > 0:
+        result['status'] = 'failed'
+        result['error'] = 'Output files could not be written. ' + ' '.join(errors + export_errors)
+    elif result['status'] == 'succeeded' and len(export_errors) > 0:
+        result['status'] = 'failed'
+        result['error'] = 'Output files were written, but exports could not be. ' + ' '.join(export_errors)
+
+
+def failed_result(job, error):
+    """
+        Creates the outcome of a station that failed.
+
+        Parameters:
+            job : dictionary of the station, see read_manifest
+            error : string describing why the station failed
+
+        Returns:
+            result : dictionary of the outcome of the station
+    """
+    return {'name': job['name'], 'config_path': job['config_path'], 'station': None, 'status': 'failed',
+            'seconds': np.nan, 'peak_memory_mb': np.nan, 'record_start': None, 'record_end': None,
+            'output_path': None, 'error': error, 'metadata_id': job['metadata_id'], 'run_count': job['run_count']}
+
+
+def run_batch(jobs, workers=None, memory_limit_mb=None, folder_path='batch_files', stations_per_worker=1):
+    """
+        Processes every station of a batch in parallel across a pool of worker processes. By default each worker runs
+        one station and is then replaced, so nothing is carried over between stations. Workers can instead run a group
+        of stations each, which saves starting a new process for every station and lets the output files of each
+        station be written in the background while the next one is processed, see run_stations. If a worker dies
+        outright (for example if the operating system kills it) the stations of its group are started again in a new
+        worker, up to MAX_ATTEMPTS times. Stations that need interactive correction are not run, they are given the
+        status 'needs interactive correction' instead.
+
+        Parameters:
+            jobs : list of stations to process, see read_manifest
+            workers : integer of number of worker processes, defaults to the number of processors
+            memory_limit_mb : maximum size in megabytes each worker's memory is allowed to grow to, None for no limit
+            folder_path : string of path to folder that console files are saved to
+            stations_per_worker : integer of number of stations each worker runs before it is replaced
+
+        Returns:
+            results : list of dictionaries of the outcome of each station, in the same order as jobs
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError('Number of batch workers must be at least 1, but {} was provided.'.format(workers))
+    if stations_per_worker < 1:
+        raise ValueError('Number of stations per worker must be at least 1, but {} was provided.'
+                         .format(stations_per_worker))
+
+    os.makedirs(folder_path, exist_ok=True)
+
+    # Batches cannot prompt the user, so stations that can only be corrected interactively are reported, not run
+    results = {}
+    for job in jobs:
+        if job.get('needs_correction', False):
+            results[job['name']] = failed_result(job, 'Station needs interactive correction, run it with '
+                                                      'qaqc_single_station.py or give it a recipe_file_path in the '
+                                                      'metadata workbook.')
+            results[job['name']]['status'] = 'needs interactive correction'
+            print('\nSystem: Station {} needs interactive correction, it was not run.'.format(job['name']))
+
+    # Spawning fresh processes keeps stations from inheriting any state from the parent or from each other
+    context = mp.get_context('spawn')
+    run_jobs = [job for job in jobs if job['name'] not in results]
+    attempts = {job['name']: 0 for job in run_jobs}
+    pending = [run_jobs[i:i + stations_per_worker] for i in range(0, len(run_jobs), stations_per_worker)]
+    running = {}
+
+    while len(pending) > 0 or len(running) > 0:
+        # Every group is given a pool with a single worker of its own, so the worker is replaced once the group is
+        # done and a worker that dies can only take down the stations of its own group
+        while len(pending) > 0 and len(running) < workers:
+            group = pending.pop(0)
+            executor = cf.ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=initialize_worker,
+                                              initargs=(memory_limit_mb,))
+            if stations_per_worker == 1:
+                future = executor.submit(run_station, group[0], folder_path)
+            else:
+                future = executor.submit(run_stations, group, folder_path)
+            running[future] = (group, executor)
+
+        (done, not_done) = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+        for future in done:
+            (group, executor) = running.pop(future)
+            executor.shutdown(wait=True)
+            for job in group:
+                attempts[job['name']] += 1
+            try:
+                group_results = future.result()
+                if stations_per_worker == 1:
+                    group_results = [group_results]
+                for (job, result) in zip(group, group_results):
+                    results[job['name']] = result
+            except cf.process.BrokenProcessPool:
+                retried = []
+                for job in group:
+                    if attempts[job['name']] < MAX_ATTEMPTS:
+                        retried.append(job)
+                    else:
+                        results[job['name']] = failed_result(job, 'Worker process died unexpectedly.')
+                        print('\nSystem: Station {} failed, its worker process died unexpectedly.'.format(job['name']))
+                if len(retried) > 0:
+                    print('\nSystem: A worker process died unexpectedly, restarting {} stations.'.format(len(retried)))
+                    pending.append(retried)
+                continue
+            except Exception as error:
+                # Errors raised outside of the station itself, such as running out of memory while starting up
+                for job in group:
+                    results[job['name']] = failed_result(job, '{}: {}'.format(type(error).__name__, error))
+
+            for job in group:
+                print('\nSystem: Station {} {} after {} seconds.'.format(
+                    job['name'], results[job['name']]['status'], results[job['name']]['seconds']))
+
+    return [results[job['name']] for job in jobs]
+
+
+def update_network_progress(store_path, results):
+    """
+        Advances the run count of every station of a metadata workbook that was successfully processed, and records
+        its record dates and output file in the metadata store, the same as a single station run does.
+
+        Parameters:
+            store_path : string of path to metadata store
+            results : list of dictionaries of the outcome of each station, see run_station
+
+        Returns:
+            None
+    """
+    for result in results:
+        if result['status'] == 'succeeded' and result['metadata_id'] is not None:
+            metadata_functions.upsert_network_station(store_path, result['metadata_id'], result['run_count'] + 1,
+                                                      result['record_start'], result['record_end'],
+                                                      result['output_path'])
+
+
+def write_batch_summary(summary_file_path, results):
+    """
+        Writes the outcome of every station to a .csv file and prints a short summary of the batch.
+
+        Parameters:
+            summary_file_path : string of path to save summary .csv to
+            results : list of dictionaries of the outcome of each station, see run_station
+
+        Returns:
+            None
+    """
+    summary_df = pd.DataFrame(results).drop(columns=['metadata_id', 'run_count'])
+    summary_df.to_csv(summary_file_path, index=False)
+
+    succeeded = int((summary_df.status == 'succeeded').sum())
+    print('\nSystem: Batch finished at {}, {} of {} stations succeeded, summary saved to {}.'
+          .format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), succeeded, len(results), summary_file_path))
+    for result in results:
+        if result['status'] != 'succeeded':
+            print('    {} : {}'.format(result['name'], result['error']))
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
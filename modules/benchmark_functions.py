@@ -0,0 +1,397 @@
+import contextlib
+import datetime as dt
+import json
+import numpy as np
+import os
+import pandas as pd
+import platform
+import subprocess
+import sys
+import time
+from . import batch_functions, cache_functions, data_functions, input_functions, qaqc_functions, synthetic_functions
+from .py_weather_qaqc import WeatherQAQC
+
+
+# Benchmarks that are run on a single station of every record length
+STATION_BENCHMARKS = ['obtain_data', 'calc_rso_and_refet', 'calc_org_and_opt_rs_tr', 'compile_ea',
+                      'temp_find_outliers', 'rh_yearly_percentile_corr', 'rs_period_ratio_corr', 'create_plots',
+                      'write_outputs']
+
+# Seconds that starting a new interpreter and importing the script may take when nothing is plotted, most of which is
+# numpy and pandas, checked by qaqc_benchmark.py
+IMPORT_TIME_BUDGET = 1.0
+
+# Packages that should only be imported once a plot is actually made
+PLOTTING_PACKAGES = ['bokeh']
+
+# Recipe the headless run benchmark corrects its station with, which uses every recommended correction method
+HEADLESS_RECIPE = {'steps': [
+    {'variable': 'tmax_tmin', 'operations': [{'method': 'z_score_outliers'}]},
+    {'variable': 'tmin_tdew', 'operations': [{'method': 'rolling_z_score_outliers'}]},
+    {'variable': 'rs', 'operations': [{'method': 'rs_period_ratio'}]},
+    {'variable': 'rhmax_rhmin', 'operations': [{'method': 'rh_yearly_percentile'}]},
+    {'variable': 'compiled_ea', 'operations': [{'source': 'rhmax_rhmin'}]}]}
+
+# Version of the layout of the results file, bumped if it changes so old results are not compared against new ones
+RESULTS_VERSION = 1
+
+
+def time_function(function, repeat):
+    """
+        Times a function several times, with everything it prints thrown away.
+
+        Parameters:
+            function : function that takes no arguments
+            repeat : integer of number of times to run it
+
+        Returns:
+            seconds : list of wall time in seconds of every run
+    """
+    seconds = []
+    with open(os.devnull, 'w') as null_output, contextlib.redirect_stdout(null_output):
+        for i in range(repeat):
+            start_time = time.perf_counter()
+            function()
+            seconds.append(time.perf_counter() - start_time)
+    return seconds
+
+
+def create_result(benchmark, years, days, batch_size, seconds, **extra):
+    """
+        Creates the record of a single benchmark, the same layout is used by every benchmark so results can be compared.
+
+        Parameters:
+            benchmark : string of benchmark name
+            years : integer of years in each station record
+            days : integer of days in each station record
+            batch_size : integer of number of stations, 1 for station benchmarks
+            seconds : list of wall time in seconds of every run
+            **extra : anything else worth keeping about the benchmark
+
+        Returns:
+            result : dictionary of benchmark record
+    """
+    result = {'benchmark': benchmark, 'years': years, 'days': days, 'batch_size': batch_size, 'repeat': len(seconds),
+              'seconds': [round(value, 5) for value in seconds], 'min_seconds': round(min(seconds), 5),
+              'median_seconds': round(float(np.median(seconds)), 5)}
+    result.update(extra)
+    return result
+
+
+def prepare_station(years, folder_path, template_config_path, seed=0):
+    """
+        Generates a synthetic station and runs it up to the point where its plots and output files would be created,
+        so that every benchmark can start from the same state.
+
+        Parameters:
+            years : integer of years in station record
+            folder_path : string of path to folder to save the station to
+            template_config_path : string of path to config file that the station config is copied from
+            seed : integer seed of the synthetic station
+
+        Returns:
+            station_qaqc : WeatherQAQC of the station, with data read in, secondary variables calculated, and the
+                uncorrected data ready to be plotted and written out
+    """
+    name = 'synthetic_{:03d}_years'.format(years)
+    config_file_path = synthetic_functions.write_station(
+        synthetic_functions.generate_station(years, seed), folder_path, name, template_config_path,
+        {'OPTIONS': {'plot_option': 1, 'metadata_store_path': os.path.join(folder_path, 'benchmark_metadata.db')}})
+
+    station_qaqc = WeatherQAQC(config_file_path, use_checkpoints=False)
+    with open(os.devnull, 'w') as null_output, contextlib.redirect_stdout(null_output):
+        station_qaqc._obtain_data()
+        station_qaqc._calculate_secondary_vars()
+        station_qaqc._start_correction()
+        station_qaqc._correct_data()
+        station_qaqc._fill_data()
+    return station_qaqc
+
+
+def run_station_benchmarks(years, repeat, folder_path, template_config_path, mc_iterations=50, benchmarks=None):
+    """
+        Runs every station benchmark on a synthetic station of a given length.
+
+        Parameters:
+            years : integer of years in station record
+            repeat : integer of number of times to run each benchmark
+            folder_path : string of path to folder to save the station to
+            template_config_path : string of path to config file that the station config is copied from
+            mc_iterations : integer of iterations used by the Thornton-Running Monte Carlo simulation
+            benchmarks : list of names of benchmarks to run, defaults to all of STATION_BENCHMARKS
+
+        Returns:
+            results : list of dictionaries of benchmark records, see create_result
+    """
+    station = prepare_station(years, folder_path, template_config_path)
+    days = station.data_length
+    null_log = open(os.devnull, 'w')
+
+    # None of these change the arrays passed to them, so every repeat does the same work
+    functions = {
+        'obtain_data': lambda: input_functions.obtain_data(station.config_path),
+        'calc_rso_and_refet': lambda: data_functions.calc_rso_and_refet(
+            station.station_lat, station.station_elev, station.ws_anemometer_height, station.data_doy,
+            station.data_month, station.data_tmax, station.data_tmin, station.compiled_ea, station.data_ws,
+            station.data_rs),
+        'calc_org_and_opt_rs_tr': lambda: data_functions.calc_org_and_opt_rs_tr(
+            mc_iterations, station.log_file, station.data_month, station.delta_t, station.mm_delta_t,
+            station.data_rs, station.rso, np.random.default_rng(0)),
+        'compile_ea': lambda: data_functions.compile_ea(
+            station.data_tmax, station.data_tmin, station.data_tavg, station.data_ea, station.data_tdew,
+            station.column_df.tdew, station.data_rhmax, station.column_df.rhmax, station.data_rhmin,
+            station.column_df.rhmin, station.data_rhavg, station.column_df.rhavg, station.data_tdew_ko),
+        'temp_find_outliers': lambda: qaqc_functions.temp_find_outliers(
+            null_log, station.data_tmax, 'TMax', station.data_tmin, 'TMin', station.data_month),
+        'rh_yearly_percentile_corr': lambda: qaqc_functions.rh_yearly_percentile_corr(
+            null_log, 0, days, station.data_rhmax, station.data_rhmin, station.data_year, 2),
+        'rs_period_ratio_corr': lambda: qaqc_functions.rs_period_ratio_corr(
+            null_log, 0, days, station.data_rs, station.rso, 6, 60),
+        'create_plots': station._create_plots,
+        'write_outputs': station._write_outputs,
+    }
+
+    results = []
+    try:
+        for benchmark in benchmarks or STATION_BENCHMARKS:
+            print('\nSystem: Running benchmark {} on a {} year station.'.format(benchmark, years))
+            results.append(create_result(benchmark, years, days, 1, time_function(functions[benchmark], repeat)))
+    finally:
+        null_log.close()
+    return results
+
+
+def run_import_benchmark(repeat):
+    """
+        Times importing the script in a new interpreter, which every batch worker and every run of
+        qaqc_single_station.py pays before reading any data, and finds which plotting packages got imported with it.
+
+        Parameters:
+            repeat : integer of number of new interpreters to time
+
+        Returns:
+            result : dictionary of benchmark record, see create_result, with the plotting packages that were imported
+    """
+    code = ('import sys, time\n'
+            'start_time = time.perf_counter()\n'
+            'import modules.py_weather_qaqc\n'
+            'print(time.perf_counter() - start_time)\n'
+            'print(" ".join(sorted(set(name.partition(".")[0] for name in sys.modules))))\n')
+    repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    seconds = []
+    imported = set()
+    print('\nSystem: Running import benchmark.')
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=repo_path).stdout.split('\n')
+        seconds.append(float(output[0]))
+        imported.update(package for package in output[1].split() if package in PLOTTING_PACKAGES)
+    return create_result('import', 0, 0, 1, seconds, plotting_packages_imported=sorted(imported))
+
+
+def run_headless_benchmark(repeat, folder_path, template_config_path, years=10):
+    """
+        Times a complete run of a synthetic station in a new interpreter, corrected by a recipe with plotting off, the
+        same way batch and service stations are run. Nothing is plotted by such a run, so it also finds which plotting
+        packages got imported and which correction plots were saved by it.
+
+        Parameters:
+            repeat : integer of number of new interpreters to time
+            folder_path : string of path to folder to save the station to
+            template_config_path : string of path to config file that the station config is copied from
+            years : integer of years in station record
+
+        Returns:
+            result : dictionary of benchmark record, see create_result, with the plotting packages that were imported
+                and the correction plots that were saved
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    recipe_file_path = os.path.abspath(os.path.join(folder_path, 'headless_recipe.json'))
+    with open(recipe_file_path, 'w') as recipe_file:
+        json.dump(HEADLESS_RECIPE, recipe_file, indent=2)
+
+    station_df = synthetic_functions.generate_station(years, 0)
+    config_file_path = os.path.abspath(synthetic_functions.write_station(
+        station_df, folder_path, 'synthetic_headless', template_config_path,
+        {'OPTIONS': {'plot_option': 0, 'recipe_file_path': recipe_file_path,
+                     'metadata_store_path': os.path.abspath(os.path.join(folder_path, 'benchmark_metadata.db'))}}))
+    correction_folder_path = os.path.join(folder_path, 'correction_files')
+
+    code = ('import contextlib, os, sys, time\n'
+            'start_time = time.perf_counter()\n'
+            'from modules.py_weather_qaqc import WeatherQAQC\n'
+            'with open(os.devnull, "w") as null_output, contextlib.redirect_stdout(null_output):\n'
+            '    WeatherQAQC(sys.argv[1], use_checkpoints=False).process_station()\n'
+            'print(time.perf_counter() - start_time)\n'
+            'print(" ".join(sorted(set(name.partition(".")[0] for name in sys.modules))))\n')
+    repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    seconds = []
+    imported = set()
+    plot_files = set()
+    print('\nSystem: Running headless run benchmark on a {} year station.'.format(years))
+    for i in range(repeat):
+        # Any correction plots left behind by earlier runs would otherwise be counted against this one
+        for file_name in os.listdir(correction_folder_path) if os.path.isdir(correction_folder_path) else []:
+            if file_name.endswith(cache_functions.CORRECTION_PLOT_SUFFIX):
+                os.remove(os.path.join(correction_folder_path, file_name))
+
+        output = subprocess.run([sys.executable, '-c', code, config_file_path], capture_output=True, text=True,
+                                check=True, cwd=repo_path).stdout.split('\n')
+        seconds.append(float(output[-3]))
+        imported.update(package for package in output[-2].split() if package in PLOTTING_PACKAGES)
+        plot_files.update(file_name for file_name in os.listdir(correction_folder_path)
+                          if file_name.endswith(cache_functions.CORRECTION_PLOT_SUFFIX))
+    return create_result('headless_run', years, station_df.shape[0], 1, seconds,
+                         plotting_packages_imported=sorted(imported), correction_plots_saved=sorted(plot_files))
+
+
+def check_import_budget(result, budget=IMPORT_TIME_BUDGET, headless_result=None):
+    """
+        Checks the import benchmark against its budget, and that a headless run didn't plot anything either.
+
+        Parameters:
+            result : dictionary of import benchmark record, see run_import_benchmark
+            budget : float of seconds the fastest import may take
+            headless_result : dictionary of headless run benchmark record, see run_headless_benchmark, None to skip it
+
+        Returns:
+            problems : list of strings describing every way the import went over budget
+    """
+    problems = []
+    if result['min_seconds'] > budget:
+        problems.append('importing the script took {:.3f}s, over the budget of {:.3f}s'
+                        .format(result['min_seconds'], budget))
+    if len(result['plotting_packages_imported']) > 0:
+        problems.append('importing the script also imported {}'.format(', '.join(result['plotting_packages_imported'])))
+    if headless_result is not None:
+        if len(headless_result['plotting_packages_imported']) > 0:
+            problems.append('a corrected run with plotting off imported {}'
+                            .format(', '.join(headless_result['plotting_packages_imported'])))
+        if len(headless_result['correction_plots_saved']) > 0:
+            problems.append('a corrected run with plotting off saved {}'
+                            .format(', '.join(headless_result['correction_plots_saved'])))
+    return problems
+
+
+def run_batch_benchmarks(batch_sizes, years, folder_path, template_config_path, workers=None):
+    """
+        Times complete runs of batches of synthetic stations through batch_functions.run_batch. Every batch is made
+        up of the first stations of one shared set, so larger batches only add stations to smaller ones.
+
+        Parameters:
+            batch_sizes : list of integers of number of stations in each batch
+            years : integer of years in each station record
+            folder_path : string of path to folder to save the stations to
+            template_config_path : string of path to config file that the station configs are copied from
+            workers : integer of number of worker processes, defaults to the number of processors
+
+        Returns:
+            results : list of dictionaries of benchmark records, see create_result
+    """
+    station_folder_path = os.path.join(folder_path, 'batch_stations')
+    config_file_paths = []
+    for station_number in range(max(batch_sizes)):
+        station_df = synthetic_functions.generate_station(years, seed=station_number)
+        config_file_paths.append(synthetic_functions.write_station(
+            station_df, station_folder_path, 'synthetic_{:04d}'.format(station_number), template_config_path,
+            {'OPTIONS': {'metadata_store_path': os.path.join(folder_path, 'benchmark_metadata.db')}}))
+    days = len(station_df)
+
+    results = []
+    for batch_size in batch_sizes:
+        print('\nSystem: Running batch benchmark of {} stations.'.format(batch_size))
+        jobs = [{'name': '{:04d}_{}'.format(i, os.path.basename(path)[:-len('_config.ini')]), 'config_path': path,
+                 'recipe_file_path': None, 'metadata_id': None, 'run_count': None}
+                for (i, path) in enumerate(config_file_paths[:batch_size])]
+
+        batch_results = []
+        seconds = time_function(lambda: batch_results.extend(
+            batch_functions.run_batch(jobs, workers, None, os.path.join(folder_path, 'batch_console'))), 1)
+        failed = len([result for result in batch_results if result['status'] != 'succeeded'])
+        results.append(create_result('run_batch', years, days, batch_size, seconds,
+                                     stations_per_second=round(batch_size / seconds[0], 4), failed_stations=failed,
+                                     workers=workers or os.cpu_count() or 1))
+    return results
+
+
+def environment_info():
+    """
+        Describes the code and machine the benchmarks were run on, so results from different commits can be told apart.
+
+        Returns:
+            info : dictionary of environment details
+    """
+    def git(*arguments):
+        try:
+            return subprocess.run(['git'] + list(arguments), capture_output=True, text=True, timeout=30,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    return {'commit': git('rev-parse', 'HEAD'), 'uncommitted_changes': bool(git('status', '--porcelain')),
+            'created': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform(),
+            'processors': os.cpu_count()}
+
+
+def write_results(results_file_path, results):
+    """
+        Saves benchmark results to a .json file.
+
+        Parameters:
+            results_file_path : string of path to save results to
+            results : list of dictionaries of benchmark records, see create_result
+
+        Returns:
+            None
+    """
+    with open(results_file_path, 'w') as results_file:
+        json.dump({'version': RESULTS_VERSION, 'environment': environment_info(), 'results': results}, results_file,
+                  indent=4)
+
+
+def compare_results(results, baseline_file_path, threshold=0.1):
+    """
+        Compares benchmark results against results saved from an earlier commit, matching benchmarks by name, station
+        length, and batch size. The fastest run of each is compared, as it is the least affected by other load on the
+        machine.
+
+        Parameters:
+            results : list of dictionaries of benchmark records, see create_result
+            baseline_file_path : string of path to earlier results file
+            threshold : float of fraction slower than the baseline a benchmark has to be to count as a regression
+
+        Returns:
+            regressions : list of strings describing every benchmark that got slower than the threshold allows
+    """
+    with open(baseline_file_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('version') != RESULTS_VERSION:
+        raise ValueError('Baseline results at {} are version {} but version {} was expected.'
+                         .format(baseline_file_path, baseline.get('version'), RESULTS_VERSION))
+
+    baseline_results = {(result['benchmark'], result['years'], result['batch_size']): result
+                        for result in baseline['results']}
+    print('\nSystem: Comparing against results of commit {}.'.format(baseline['environment']['commit']))
+
+    regressions = []
+    for result in results:
+        key = (result['benchmark'], result['years'], result['batch_size'])
+        if key not in baseline_results:
+            continue
+        ratio = result['min_seconds'] / max(baseline_results[key]['min_seconds'], 1e-9)
+        description = '{} ({} years, {} stations): {:.4f}s vs {:.4f}s, {:.2f}x'.format(
+            key[0], key[1], key[2], result['min_seconds'], baseline_results[key]['min_seconds'], ratio)
+        if ratio > 1 + threshold:
+            regressions.append(description)
+            print('    REGRESSION ' + description)
+        else:
+            print('    ' + description)
+    return regressions
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -0,0 +1,319 @@
+import datetime as dt
+import functools
+import hashlib
+import importlib.metadata
+import json
+import os
+import pathlib as pl
+import shutil
+import time
+import uuid
+from .checkpoint_functions import file_signature
+
+
+# Bumped whenever what is cached or how it is keyed changes, so that results cached by older versions are never used
+RESULT_CACHE_VERSION = 1
+
+# Packages whose versions can change the output files, on top of the script's own modules
+RESULT_PACKAGES = ['bokeh', 'numpy', 'openpyxl', 'pandas', 'refet', 'xlrd', 'xlsxwriter']
+
+# Config settings that only say where else things are saved or how the plots are shown, so they don't change the
+# output files of the station. The data file and recipe are keyed by their contents instead of their paths.
+IGNORED_CONFIG_KEYS = ['data_file_path', 'recipe_file_path', 'plot_server_flag', 'plot_server_port',
+                       'metadata_store_path', 'parquet_dataset_path', 'netcdf_file_path', 'result_cache_flag',
+                       'result_cache_path', 'result_cache_max_mb']
+
+# Folders inside correction_files that output files are saved to
+RESULT_FOLDERS = ['', 'before_graphs', 'after_graphs', 'histograms']
+
+# Output files of a station, named by what follows the station name and an underscore
+RESULT_FILE_NAMES = ['output.xlsx', 'changes_log.txt', 'correction_journal.json', 'humidity_adjustment_plots.html',
+                     'histograms.html', 'before_corrections_composite_graph.html',
+                     'after_corrections_composite_graph.html', 'state.pkl']
+
+# Correction plots are named after the variables plotted, none of which have an underscore in their name
+CORRECTION_PLOT_SUFFIX = '_correction_plots.html'
+
+# Seconds after which an entry that never finished being cached is assumed to be left over from a crash
+STALE_ENTRY_SECONDS = 60 * 60
+
+# Bytes read at a time when hashing a data file
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version():
+    """
+        Creates a fingerprint of the version of the script, from the source of every one of its modules and the
+        versions of the packages it relies on, so that changing either one stops older results from being restored.
+        Only worked out once per process.
+
+        Returns:
+            version : string of sha256 hex digest
+    """
+    hasher = hashlib.sha256(str(RESULT_CACHE_VERSION).encode())
+    for module_path in sorted(pl.Path(__file__).parent.glob('*.py')):
+        hasher.update(module_path.name.encode())
+        hasher.update(module_path.read_bytes())
+    for package in RESULT_PACKAGES:
+        try:
+            package_version = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            package_version = None
+        hasher.update('{}={}'.format(package, package_version).encode())
+    return hasher.hexdigest()
+
+
+def file_digest(file_path):
+    """
+        Hashes the contents of a file, reading it a chunk at a time so large files are never held in memory.
+
+        Parameters:
+            file_path : string of path to file
+
+        Returns:
+            digest : string of sha256 hex digest
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as hashed_file:
+        for chunk in iter(functools.partial(hashed_file.read, HASH_CHUNK_BYTES), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def result_key(config_dict, station_name, recipe=None, settings=None):
+    """
+        Creates the key a station's result is cached under. Two runs get the same key only if they read the same data,
+        with the same config settings (other than IGNORED_CONFIG_KEYS), apply the same recipe, and run on the same
+        version of the script, in which case they write the same output files.
+
+        Parameters:
+            config_dict : dictionary of config file settings, see input_functions.read_config
+            station_name : string of station name, which every output file is named after
+            recipe : list of recipe steps the station is corrected with, see recipe_functions.read_recipe, None if it
+                isn't corrected
+            settings : dictionary of any other settings passed to WeatherQAQC that change the output files
+
+        Returns:
+            key : string of sha256 hex digest
+    """
+    normalized = {key: value for (key, value) in config_dict.items() if key not in IGNORED_CONFIG_KEYS}
+    normalized.update({'station_name': station_name, 'recipe': recipe, 'settings': settings,
+                       'data_file': file_digest(config_dict['data_file_path']), 'version': tool_version()})
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def station_result_files(folder_path, station_name, started=None):
+    """
+        Finds the output files of a station. A station's name can start with the name of another station saved to the
+        same folder, so a file only counts if what follows the station name is the name of one of its output files.
+
+        Parameters:
+            folder_path : string of folder the station's correction_files folder is in
+            station_name : string of station name
+            started : time in seconds since the epoch, files last written before it are left out, None to find all
+
+        Returns:
+            result_files : list of strings of paths of output files, relative to the correction_files folder
+    """
+    result_files = []
+    for result_folder in RESULT_FOLDERS:
+        folder = os.path.join(folder_path, 'correction_files', result_folder)
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            if not entry.is_file() or not entry.name.startswith(station_name + '_'):
+                continue
+            if not _is_result_file(entry.name[len(station_name) + 1:]):
+                continue
+            if started is None or entry.stat().st_mtime >= started:
+                result_files.append(pl.PurePath(result_folder, entry.name).as_posix())
+    return sorted(result_files)
+
+
+def detach_result_files(folder_path, station_name):
+    """
+        Gives every output file of a station that is linked to the result cache a copy of its own. The script writes
+        over its output files in place, so this has to be done before a station is processed again, otherwise the
+        results in the cache would be written over along with them.
+
+        Parameters:
+            folder_path : string of folder the station's correction_files folder is in
+            station_name : string of station name
+
+        Returns:
+            None
+    """
+    for result_file in station_result_files(folder_path, station_name):
+        file_path = os.path.join(folder_path, 'correction_files', result_file)
+        if os.stat(file_path).st_nlink > 1:
+            temporary_file_path = file_path + '.tmp'
+            shutil.copy2(file_path, temporary_file_path)
+            os.replace(temporary_file_path, file_path)
+
+
+def store_result(cache_path, key, folder_path, station_name, started, record_start, record_end, max_mb):
+    """
+        Adds the output files of a station that just finished to the result cache, then removes the results that
+        were used the longest time ago until the cache fits in max_mb again. Files are hard linked into the cache
+        where possible, so caching a station takes no time and no extra space, and copied otherwise. A result larger
+        than the whole cache is not cached.
+
+        Parameters:
+            cache_path : string of path to result cache folder
+            key : string of key to cache the result under, see result_key
+            folder_path : string of folder the station's correction_files folder is in
+            station_name : string of station name
+            started : time in seconds since the epoch the station started, older output files are left out
+            record_start : date of first day of record
+            record_end : date of last day of record
+            max_mb : size in megabytes the cache is kept under
+
+        Returns:
+            None
+    """
+    entry_path = os.path.join(cache_path, key)
+    if os.path.isdir(entry_path):
+        return
+
+    result_files = station_result_files(folder_path, station_name, started)
+    source_paths = [os.path.join(folder_path, 'correction_files', result_file) for result_file in result_files]
+    result_size = sum(os.path.getsize(source_path) for source_path in source_paths)
+    max_bytes = max_mb * 1024 * 1024
+    if result_size > max_bytes:
+        print('\nSystem: Output files of station {} are larger than the result cache, they were not cached.'
+              .format(station_name))
+        return
+
+    # The entry is put together under a temporary name and then renamed, so an entry is either complete or missing
+    temporary_path = '{}.{}.tmp'.format(entry_path, uuid.uuid4().hex)
+    try:
+        for (result_file, source_path) in zip(result_files, source_paths):
+            _link_file(source_path, os.path.join(temporary_path, 'files', result_file))
+        manifest = {'version': RESULT_CACHE_VERSION, 'station_name': station_name,
+                    'record_start': str(record_start), 'record_end': str(record_end), 'size': result_size,
+                    'cached': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'files': {result_file: file_signature(os.path.join(temporary_path, 'files', result_file))
+                              for result_file in result_files}}
+        with open(os.path.join(temporary_path, 'manifest.json'), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.rename(temporary_path, entry_path)
+    except OSError:
+        # Either another process cached the same result first, or the cache could not be written to
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        if not os.path.isdir(entry_path):
+            raise
+        return
+
+    print('\nSystem: Output files of station {} were added to the result cache at {}.'.format(station_name, cache_path))
+    evict_results(cache_path, max_bytes)
+
+
+def restore_result(cache_path, key, folder_path):
+    """
+        Restores the output files of a station from the result cache, hard linking them where possible and copying
+        them otherwise. A cached file that was changed since it was cached (for example by writing over an output file
+        it is still linked to) means the result can't be trusted, so it is removed from the cache instead.
+
+        Parameters:
+            cache_path : string of path to result cache folder
+            key : string of key the result was cached under, see result_key
+            folder_path : string of folder to restore the station's correction_files folder into
+
+        Returns:
+            manifest : dictionary describing the restored result, None if nothing was cached under the key
+    """
+    entry_path = os.path.join(cache_path, key)
+    manifest_path = os.path.join(entry_path, 'manifest.json')
+    try:
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get('version') != RESULT_CACHE_VERSION:
+            raise ValueError('Result cached by a different version of the script.')
+
+        changed_files = [result_file for (result_file, signature) in manifest['files'].items()
+                         if file_signature(os.path.join(entry_path, 'files', result_file)) != tuple(signature)]
+        if len(changed_files) > 0:
+            raise ValueError('The following cached files were changed: {}.'.format(changed_files))
+
+        for result_file in manifest['files']:
+            _link_file(os.path.join(entry_path, 'files', result_file),
+                       os.path.join(folder_path, 'correction_files', result_file))
+        os.utime(manifest_path)  # Marks the result as just used, so it is the last to be removed
+    except FileNotFoundError:
+        # Nothing was cached, or another process removed it while it was being restored
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        print('\nSystem: Result cached at {} could not be restored, processing the station instead. {}'
+              .format(entry_path, error))
+        shutil.rmtree(entry_path, ignore_errors=True)
+        return None
+    return manifest
+
+
+def evict_results(cache_path, max_bytes):
+    """
+        Removes results from the cache, starting with the one that was restored or cached the longest time ago, until
+        the results left fit in max_bytes. Also removes entries that were left unfinished by a crash.
+
+        Parameters:
+            cache_path : string of path to result cache folder
+            max_bytes : size in bytes the cache is kept under
+
+        Returns:
+            None
+    """
+    entries = []
+    for entry in os.scandir(cache_path):
+        if not entry.is_dir():
+            continue
+        if entry.name.endswith('.tmp'):
+            if time.time() - entry.stat().st_mtime > STALE_ENTRY_SECONDS:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            continue
+        manifest_path = os.path.join(entry.path, 'manifest.json')
+        try:
+            with open(manifest_path, 'r') as manifest_file:
+                result_size = json.load(manifest_file)['size']
+            entries.append((os.stat(manifest_path).st_mtime, result_size, entry.path))
+        except (OSError, ValueError, KeyError):
+            continue  # Removed by another process while the cache was being read
+
+    cache_size = sum(result_size for (_last_used, result_size, _entry_path) in entries)
+    for (_last_used, result_size, entry_path) in sorted(entries):
+        if cache_size <= max_bytes:
+            break
+        shutil.rmtree(entry_path, ignore_errors=True)
+        cache_size -= result_size
+
+
+def _is_result_file(file_name):
+    """
+        Checks whether what follows the station name in the name of a file is the name of one of its output files
+    """
+    if file_name.endswith(CORRECTION_PLOT_SUFFIX):
+        return '_' not in file_name[:-len(CORRECTION_PLOT_SUFFIX)]
+    return file_name in RESULT_FILE_NAMES
+
+
+def _link_file(source_path, destination_path):
+    """
+        Hard links a file to a new path, or copies it if it can't be linked, replacing anything already at that path
+    """
+    if os.path.exists(destination_path) and os.path.samefile(source_path, destination_path):
+        return  # Already linked, and renaming a link over the same file would leave the temporary link behind
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    temporary_file_path = destination_path + '.tmp'
+    if os.path.exists(temporary_file_path):
+        os.remove(temporary_file_path)
+    try:
+        os.link(source_path, temporary_file_path)
+    except OSError:
+        # Links can't cross file systems, and some file systems don't support them at all
+        shutil.copy2(source_path, temporary_file_path)
+    os.replace(temporary_file_path, destination_path)
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
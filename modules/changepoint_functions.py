@@ -0,0 +1,252 @@
+import numpy as np
+import warnings
+
+
+def remove_seasonality(values, dt_array, smoothing_days=31):
+    """
+        Subtracts the seasonal cycle from a daily record, so that it isn't mistaken for a change. The seasonal cycle is
+        the mean of every day of year across all years, smoothed with a moving average that wraps around the year.
+
+        Parameters:
+            values : 1D numpy array of daily values
+            dt_array : 1D numpy datetime64 array of the record
+            smoothing_days : integer of length of the moving average used to smooth the seasonal cycle
+
+        Returns:
+            anomalies : 1D numpy array of daily values with the seasonal cycle removed
+    """
+    days = dt_array.astype('datetime64[D]')
+    doy = (days - days.astype('datetime64[Y]')).astype(int)  # 0 to 365
+    valid = ~np.isnan(values)
+
+    doy_sums = np.bincount(doy[valid], weights=values[valid], minlength=366)
+    doy_counts = np.bincount(doy[valid], minlength=366).astype(float)
+
+    # Smoothing the sums and counts separately lets days of year without any data borrow from their neighbours
+    kernel = np.ones(smoothing_days)
+    half = smoothing_days // 2
+    wrapped_sums = np.concatenate((doy_sums[-half:], doy_sums, doy_sums[:half]))
+    wrapped_counts = np.concatenate((doy_counts[-half:], doy_counts, doy_counts[:half]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        climatology = np.convolve(wrapped_sums, kernel, 'valid') / np.convolve(wrapped_counts, kernel, 'valid')
+
+    return values - climatology[doy]
+
+
+def block_statistic(values, dt_array, block_days, percentile=None, min_valid=10):
+    """
+        Splits a daily record into consecutive blocks and reduces each one down to a single statistic, which removes
+        most of the day to day noise before looking for changes.
+
+        Parameters:
+            values : 1D numpy array of daily values
+            dt_array : 1D numpy datetime64 array of the record
+            block_days : integer of number of days in each block
+            percentile : percentile to use as the block statistic, if None then the block mean is used
+            min_valid : integer of minimum number of non-nan days a block needs, blocks with fewer are dropped
+
+        Returns:
+            block_starts : 1D numpy array of the index each kept block starts on
+            block_values : 1D numpy array of the statistic of each kept block
+            block_doy : 1D numpy array of the day of year of the middle of each kept block
+    """
+    data_size = values.shape[0]
+    block_count = int(np.ceil(data_size / block_days))
+
+    # Pad the record out to a whole number of blocks so they can all be reduced at once
+    padded = np.full(block_count * block_days, np.nan)
+    padded[:data_size] = values
+    blocks = padded.reshape(block_count, block_days)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # blocks that are entirely nan
+        if percentile is None:
+            block_values = np.nanmean(blocks, axis=1)
+        else:
+            block_values = np.nanpercentile(blocks, percentile, axis=1)
+
+    block_starts = np.arange(block_count) * block_days
+    middle_days = dt_array[np.minimum(block_starts + block_days // 2, data_size - 1)].astype('datetime64[D]')
+    block_doy = (middle_days - middle_days.astype('datetime64[Y]')).astype(int) + 1
+
+    keep = np.sum(~np.isnan(blocks), axis=1) >= min_valid
+    return block_starts[keep], block_values[keep], block_doy[keep]
+
+
+def remove_block_seasonality(block_values, block_doy):
+    """
+        Removes any seasonal cycle left in the block statistics, such as the spread of a variable changing with the
+        seasons, by subtracting a least squares fit of the first two annual harmonics. Level shifts and drift aren't
+        periodic, so they are left behind.
+
+        Parameters:
+            block_values : 1D numpy array of block statistics
+            block_doy : 1D numpy array of the day of year of the middle of each block
+
+        Returns:
+            anomalies : 1D numpy array of block statistics with the seasonal cycle removed
+    """
+    angle = 2 * np.pi * block_doy / 365.25
+    harmonics = np.column_stack((np.cos(angle), np.sin(angle), np.cos(2 * angle), np.sin(2 * angle)))
+    design = np.column_stack((np.ones(block_values.size), harmonics))
+    (coefficients, residuals, rank, singular_values) = np.linalg.lstsq(design, block_values, rcond=None)
+    return block_values - harmonics @ coefficients[1:]
+
+
+def robust_noise_level(signal):
+    """
+        Estimates the standard deviation of the noise in a signal from the median absolute deviation of its first
+        differences, which is barely affected by the level shifts being searched for.
+
+        Parameters:
+            signal : 1D numpy array without nan's
+
+        Returns:
+            sigma : float of noise standard deviation
+    """
+    if signal.size < 3:
+        return float(np.std(signal))
+
+    differences = np.diff(signal)
+    sigma = 1.4826 * np.median(np.abs(differences - np.median(differences))) / np.sqrt(2)
+    if sigma == 0:
+        sigma = float(np.std(signal))
+    return sigma
+
+
+def binary_segmentation(signal, min_size, penalty):
+    """
+        Finds the points where the mean level of a signal changes. The signal is split at the point that most reduces
+        the squared error, and each side is searched again, until no split reduces the error by more than the penalty.
+        Using cumulative sums lets every possible split of a segment be scored at once, so the whole search takes
+        O(n log n) time.
+
+        Parameters:
+            signal : 1D numpy array without nan's
+            min_size : integer of minimum number of points in a segment
+            penalty : float of minimum reduction in squared error needed to accept a split
+
+        Returns:
+            change_points : sorted list of indices where a new segment starts
+    """
+    signal_size = signal.shape[0]
+    sums = np.concatenate(([0.0], np.cumsum(signal)))
+    squared_sums = np.concatenate(([0.0], np.cumsum(signal ** 2)))
+
+    def segment_cost(start, end):  # squared error of a segment around its own mean, works on arrays of ends too
+        return (squared_sums[end] - squared_sums[start]) - (sums[end] - sums[start]) ** 2 / (end - start)
+
+    change_points = []
+    segments = [(0, signal_size)]
+    while len(segments) > 0:
+        (start, end) = segments.pop()
+        if end - start < 2 * min_size:
+            continue
+
+        splits = np.arange(start + min_size, end - min_size + 1)
+        split_costs = segment_cost(start, splits) + segment_cost(splits, end)
+        best = int(np.argmin(split_costs))
+
+        if segment_cost(start, end) - split_costs[best] > penalty:
+            split = int(splits[best])
+            change_points.append(split)
+            segments.append((start, split))
+            segments.append((split, end))
+
+    return sorted(change_points)
+
+
+def propose_intervals(values, dt_array, percentile=None, block_days=30, min_blocks=3, penalty_factor=3.0):
+    """
+        Proposes intervals of a record that are likely to need correcting, such as a period of sensor drift or a step
+        change after a sensor was replaced. The seasonal cycle is removed, the record is reduced to blocks, and the
+        change points in its level are found with binary segmentation. Every segment between change points becomes a
+        candidate interval, unless its level is within the noise of the rest of the record, and they are ranked by how
+        far their level is from the record as a whole.
+
+        Parameters:
+            values : 1D numpy array of daily values of the signal to search
+            dt_array : 1D numpy datetime64 array of the record
+            percentile : percentile to use as the block statistic, if None then the block mean is used
+            block_days : integer of number of days in each block
+            min_blocks : integer of minimum number of blocks in a candidate interval
+            penalty_factor : float scaling how much evidence is needed before accepting a change point
+
+        Returns:
+            candidates : list of dictionaries with the keys 'rank', 'start', 'end' (not inclusive), and 'score', best
+                candidate first, which is empty if no change points were found
+    """
+    (block_starts, block_values, block_doy) = block_statistic(remove_seasonality(values, dt_array), dt_array,
+                                                              block_days, percentile)
+    if block_values.size < 2 * min_blocks:
+        return []
+
+    signal = remove_block_seasonality(block_values, block_doy)
+
+    sigma = robust_noise_level(signal)
+    if sigma == 0:
+        return []
+
+    # BIC style penalty, grows slowly with the length of the record
+    penalty = penalty_factor * sigma ** 2 * np.log(signal.size)
+    change_points = binary_segmentation(signal, min_blocks, penalty)
+    if len(change_points) == 0:
+        return []
+
+    reference = np.median(signal)
+    boundaries = [0] + change_points + [signal.size]
+    candidates = []
+    for (segment_start, segment_end) in zip(boundaries[:-1], boundaries[1:]):
+        deviation = abs(np.mean(signal[segment_start:segment_end]) - reference) / sigma
+        if deviation < 1:
+            continue  # Segment is at the same level as most of the record, so there is nothing to correct
+
+        # Scores are in units of noise standard deviation, scaled up for longer segments as they are more certain
+        score = deviation * np.sqrt(segment_end - segment_start)
+
+        if segment_end < signal.size:
+            end = int(block_starts[segment_end])
+        else:
+            end = int(values.shape[0])
+        candidates.append({'start': int(block_starts[segment_start]), 'end': end, 'score': float(score)})
+
+    candidates.sort(key=lambda candidate: candidate['score'], reverse=True)
+    for (rank, candidate) in enumerate(candidates):
+        candidate['rank'] = rank + 1
+    return candidates
+
+
+def propose_correction_intervals(code, var_one, var_two, dt_array):
+    """
+        Builds the signal change points are searched for in, based on which variables are being corrected.
+            Solar radiation : the ratio of Rs to Rso, using a high percentile to focus on clear sky days
+            Relative humidity : a high percentile of RHMax, which should be near 100% when sensors are working
+            Minimum and dewpoint temperature : the mean difference between TMin and TDew
+
+        Parameters:
+            code : integer code that indicates what variables are passed as var_one and var_two
+            var_one : 1D numpy array of first variable
+            var_two : 1D numpy array of second variable
+            dt_array : 1D numpy datetime64 array of the record
+
+        Returns:
+            candidates : list of candidate intervals, see propose_intervals, empty for any other variables
+    """
+    if code == 5:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            signal = var_one / var_two
+        signal[~np.isfinite(signal)] = np.nan
+        candidates = propose_intervals(signal, dt_array, percentile=90)
+    elif code == 8:
+        candidates = propose_intervals(var_one, dt_array, percentile=95)
+    elif code == 2:
+        candidates = propose_intervals(var_one - var_two, dt_array)
+    else:
+        candidates = []
+
+    return candidates
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
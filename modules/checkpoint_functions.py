@@ -0,0 +1,133 @@
+import os
+import pathlib as pl
+import pickle
+
+
+# Bumped whenever the contents of a checkpoint change, so that checkpoints from older versions are never resumed
+CHECKPOINT_VERSION = 2
+
+# Stages of WeatherQAQC.process_station that a checkpoint can be taken after, in the order they finish
+CHECKPOINT_STAGES = ['obtain_data', 'secondary_vars', 'correction', 'rs_tr']
+
+
+def default_checkpoint_path(config_file_path, metadata_file_path=None):
+    """
+        Creates the path of the checkpoint file of a run, next to its config file. Runs that use a metadata file get
+        their own checkpoint so that they do not resume from a run of the same config file without one.
+
+        Parameters:
+            config_file_path : string of path to config file
+            metadata_file_path : string of path to metadata file, optional
+
+        Returns:
+            checkpoint_file_path : string of path to checkpoint file
+    """
+    config_path = pl.Path(config_file_path)
+    name = config_path.stem
+    if metadata_file_path is not None:
+        name += '_' + pl.Path(metadata_file_path).stem
+    return str(config_path.with_name(name + '_checkpoint.pkl'))
+
+
+def file_signature(file_path):
+    """
+        Describes the current version of a file by its size and modification time, used to tell if a file has changed
+        since a checkpoint was taken without having to read it.
+
+        Parameters:
+            file_path : string of path to file
+
+        Returns:
+            signature : tuple of size in bytes and modification time in nanoseconds, None if the file doesn't exist
+    """
+    try:
+        file_stats = os.stat(file_path)
+    except OSError:
+        return None
+    return file_stats.st_size, file_stats.st_mtime_ns
+
+
+def save_checkpoint(checkpoint_file_path, stage, state, input_file_paths):
+    """
+        Saves the state of a run after a stage has finished. The checkpoint is first written to a temporary file and
+        then moved over the previous one, so a crash while saving always leaves the last complete checkpoint behind.
+
+        Parameters:
+            checkpoint_file_path : string of path to checkpoint file
+            stage : string of stage that just finished, one of CHECKPOINT_STAGES
+            state : dictionary of everything needed to continue the run
+            input_file_paths : list of paths of every file the run was created from, checked again before resuming
+
+        Returns:
+            None
+    """
+    if stage not in CHECKPOINT_STAGES:
+        raise ValueError('Unknown checkpoint stage \'{}\', expected one of {}.'.format(stage, CHECKPOINT_STAGES))
+
+    checkpoint = {'version': CHECKPOINT_VERSION, 'stage': stage, 'state': state,
+                  'inputs': {file_path: file_signature(file_path) for file_path in input_file_paths}}
+
+    temporary_file_path = checkpoint_file_path + '.tmp'
+    with open(temporary_file_path, 'wb') as checkpoint_file:
+        pickle.dump(checkpoint, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_file_path, checkpoint_file_path)
+
+
+def load_checkpoint(checkpoint_file_path):
+    """
+        Loads the checkpoint of a run, if it has one that can still be resumed. A checkpoint is ignored if it was
+        saved by a different version of the script, can't be read, or if any of the files the run was created from
+        (config, metadata, recipe, or data file) have changed since it was saved.
+
+        Parameters:
+            checkpoint_file_path : string of path to checkpoint file
+
+        Returns:
+            stage : string of last stage that finished, None if there is nothing to resume
+            state : dictionary of everything needed to continue the run, None if there is nothing to resume
+    """
+    if not os.path.isfile(checkpoint_file_path):
+        return None, None
+
+    try:
+        with open(checkpoint_file_path, 'rb') as checkpoint_file:
+            checkpoint = pickle.load(checkpoint_file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        print('\nSystem: Checkpoint at {} could not be read, starting over.'.format(checkpoint_file_path))
+        return None, None
+
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        print('\nSystem: Checkpoint at {} is from a different version of the script, starting over.'
+              .format(checkpoint_file_path))
+        return None, None
+
+    changed_files = [file_path for (file_path, signature) in checkpoint['inputs'].items()
+                     if file_signature(file_path) != signature]
+    if len(changed_files) > 0:
+        print('\nSystem: The following files changed after the checkpoint at {} was saved, starting over: {}.'
+              .format(checkpoint_file_path, changed_files))
+        return None, None
+
+    return checkpoint['stage'], checkpoint['state']
+
+
+def remove_checkpoint(checkpoint_file_path):
+    """
+        Deletes the checkpoint of a run once it has finished, so the next run starts from the beginning.
+
+        Parameters:
+            checkpoint_file_path : string of path to checkpoint file
+
+        Returns:
+            None
+    """
+    for file_path in [checkpoint_file_path, checkpoint_file_path + '.tmp']:
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -237,7 +237,7 @@ def calc_rs_tr(month, rso, delta_t, mm_delta_t, b_zero, b_one, b_two):
     return rs_tr, mm_rs_tr
 
 
-def calc_org_and_opt_rs_tr(mc_iterations, log_path, month, delta_t, mm_delta_t, rs, rso):
+def calc_org_and_opt_rs_tr(mc_iterations, log_path, month, delta_t, mm_delta_t, rs, rso, rng=None):
     """
         This function performs a monte carlo simulation on the b coefficients that go into generating thornton-
         running solar radiation in an attempt to optimize a model that best fits observed solar radiation data.
@@ -259,19 +259,24 @@ def calc_org_and_opt_rs_tr(mc_iterations, log_path, month, delta_t, mm_delta_t,
             rso : 1D numpy array of clear-sky solar radiation values in w/m2
             delta_t : 1D numpy array of difference between maximum and minimum temperature values for the time step
             mm_delta_t : monthly averaged delta_t (12 values total) values across all of record
+            rng : numpy random Generator to draw b coefficients from, a new unseeded one is used if not provided
 
         Returns:
             org_rs_tr : 1D numpy array of thornton-running solar radiation with original B coefficient values
             mm_org_rs_tr : monthly averaged org_rs_tr (12 values total) values across all of record
             opt_rs_tr : 1D numpy array of thornton-running solar radiation with optimized B coefficient values
             mm_opt_rs_tr : monthly averaged opt_rs_tr (12 values total) values across all of record
+            opt_coefficients : tuple of the b_zero, b_one, and b_two coefficients used to calculate opt_rs_tr
     """
     print("\nSystem: Now performing a Monte Carlo simulation to optimize Thornton Running solar radiation parameters.")
     print("\nSystem: %s iterations are being run, this may take some time." % mc_iterations)
 
-    b_zero = np.array(0.031 + (0.031 * 0.5) * np.random.uniform(low=-1, high=1, size=mc_iterations))
-    b_one = np.array(0.201 + (0.201 * 0.5) * np.random.uniform(low=-1, high=1, size=mc_iterations))
-    b_two = np.array(-0.185 + (-0.185 * 0.5) * np.random.uniform(low=-1, high=1, size=mc_iterations))
+    if rng is None:
+        rng = np.random.default_rng()
+
+    b_zero = np.array(0.031 + (0.031 * 0.5) * rng.uniform(low=-1, high=1, size=mc_iterations))
+    b_one = np.array(0.201 + (0.201 * 0.5) * rng.uniform(low=-1, high=1, size=mc_iterations))
+    b_two = np.array(-0.185 + (-0.185 * 0.5) * rng.uniform(low=-1, high=1, size=mc_iterations))
 
     mc_rmse = np.zeros(mc_iterations)
 
@@ -299,8 +304,8 @@ def calc_org_and_opt_rs_tr(mc_iterations, log_path, month, delta_t, mm_delta_t,
           format(mc_rmse[min_rmse_index]))
 
     # Calculate the optimized rs_tr using the B coefficients that caused the lowest rmse
-    (opt_rs_tr, mm_opt_rs_tr) = calc_rs_tr(month, rso, delta_t, mm_delta_t, b_zero[min_rmse_index],
-                                           b_one[min_rmse_index], b_two[min_rmse_index])
+    opt_coefficients = (float(b_zero[min_rmse_index]), float(b_one[min_rmse_index]), float(b_two[min_rmse_index]))
+    (opt_rs_tr, mm_opt_rs_tr) = calc_rs_tr(month, rso, delta_t, mm_delta_t, *opt_coefficients)
 
     # Write the b coefficients used to the log file then close it
     log.basicConfig()
@@ -320,6 +325,7 @@ def calc_org_and_opt_rs_tr(mc_iterations, log_path, month, delta_t, mm_delta_t,
         # which is likely because we're not correcting data, so just return original as optimized
         opt_rs_tr = orig_rs_tr
         mm_opt_rs_tr = mm_orig_rs_tr
+        opt_coefficients = (0.031, 0.201, -0.185)
     elif orig_rmse < mc_rmse[min_rmse_index] and mc_iterations != 50:
         # this shouldn't happen, as we should have done enough iterations to beat original values, so raise an error
         raise ValueError('Thornton running optimization failed to beat original coefficient values.' +
@@ -327,8 +333,8 @@ def calc_org_and_opt_rs_tr(mc_iterations, log_path, month, delta_t, mm_delta_t,
     else:
         pass
 
-    # Return both original and optimized rs_tr
-    return orig_rs_tr, mm_orig_rs_tr, opt_rs_tr, mm_opt_rs_tr
+    # Return both original and optimized rs_tr, along with the coefficients that were settled on
+    return orig_rs_tr, mm_orig_rs_tr, opt_rs_tr, mm_opt_rs_tr, opt_coefficients
 
 
 def compile_ea(tmax, tmin, tavg, ea, tdew, tdew_col, rhmax, rhmax_col, rhmin, rhmin_col, rhavg, rhavg_col, tdew_ko):
@@ -0,0 +1,356 @@
+import contextlib
+import datetime as dt
+import json
+import numpy as np
+import os
+import pandas as pd
+import time
+import warnings
+from . import data_functions, fill_functions, flag_functions, input_functions, qaqc_functions, reference_functions, \
+    rolling_functions, synthetic_functions
+
+
+# Patterns of missing data that every randomized station is created with
+GAP_PATTERNS = ['scattered', 'long_gaps', 'isolated', 'missing_month', 'leap_years', 'short_record']
+
+# Original Thornton-Running coefficients, see data_functions.calc_rs_tr
+TR_COEFFICIENTS = (0.031, 0.201, -0.185)
+
+
+def create_case(name, year, month, day, variables, latitude=40.0, elevation=1500.0):
+    """
+        Bundles a station record together with everything derived from it that the kernels take as input.
+
+        Parameters:
+            name : string describing the case
+            year : 1D numpy array of year values
+            month : 1D numpy array of month values
+            day : 1D numpy array of day values
+            variables : dictionary of 1D numpy arrays of tmax, tmin, tavg, tdew, ea, rhmax, rhmin, rhavg, rs, and ws
+            latitude : station latitude in decimal degrees
+            elevation : station elevation in meters
+
+        Returns:
+            case : dictionary of every input array, keyed on name
+    """
+    case = {'name': name, 'year': np.asarray(year, dtype=int), 'month': np.asarray(month, dtype=int)}
+    case.update({key: np.asarray(values, dtype=float) for (key, values) in variables.items()})
+    case['doy'] = pd.to_datetime(pd.DataFrame({'year': case['year'], 'month': case['month'], 'day': day}))\
+        .dt.dayofyear.values
+
+    with warnings_silenced():
+        (case['delta_t'], case['mm_delta_t'], case['k_not'], case['mm_k_not'], case['mm_tmin'], case['mm_tdew']) = \
+            data_functions.calc_temperature_variables(case['month'], case['tmax'], case['tmin'], case['tdew'])
+        case['rso'] = data_functions.calc_rso_and_refet(latitude, elevation, 2, case['doy'], case['month'],
+                                                        case['tmax'], case['tmin'], case['ea'], case['ws'],
+                                                        case['rs'])[0]
+
+        # Gap free versions of the variables the fill kernels build on, filled with monthly means so they are the
+        # same for both the reference and optimized kernels
+        month_index = case['month'] - 1
+        case['complete_tmin'] = np.where(np.isnan(case['tmin']), case['mm_tmin'][month_index], case['tmin'])
+        case['complete_tdew'] = np.where(np.isnan(case['tdew']),
+                                         case['complete_tmin'] - case['mm_k_not'][month_index], case['tdew'])
+        case['rs_tr'] = data_functions.calc_rs_tr(case['month'], case['rso'], case['delta_t'], case['mm_delta_t'],
+                                                  *TR_COEFFICIENTS)[0]
+    return case
+
+
+def synthetic_case(pattern, seed):
+    """
+        Creates a randomized station with a pattern of missing data.
+
+        Parameters:
+            pattern : string of one of GAP_PATTERNS
+            seed : integer seed, the same seed and pattern always create the same station
+
+        Returns:
+            case : dictionary of every input array, see create_case
+    """
+    rng = np.random.default_rng(seed)
+    if pattern == 'leap_years':
+        station_df = synthetic_functions.generate_station(12, seed, start_year=1895)  # 1900 is not a leap year
+    elif pattern == 'short_record':
+        station_df = synthetic_functions.generate_station(1, seed, start_year=2000).iloc[:45]
+    else:
+        station_df = synthetic_functions.generate_station(10, seed,
+                                                          gap_fraction=0.05 if pattern == 'scattered' else 0.02)
+
+    variables = [column for column in synthetic_functions.SYNTHETIC_COLUMNS if column not in ['date', 'precip']]
+    dates = pd.to_datetime(station_df.date)
+    size = len(station_df)
+
+    if pattern == 'long_gaps':
+        # Blocks of a month up to over a year where every sensor is down, and blocks where only one is
+        for i in range(4):
+            start = int(rng.integers(0, size - 400))
+            station_df.loc[start:start + int(rng.integers(30, 400)), variables] = np.nan
+        for variable in variables:
+            start = int(rng.integers(0, size - 100))
+            station_df.loc[start:start + int(rng.integers(10, 100)), variable] = np.nan
+    elif pattern == 'isolated':
+        # Stretches where only every other day was recorded, so many observations are surrounded by missing ones
+        for variable in variables:
+            for i in range(10):
+                start = int(rng.integers(0, size - 60))
+                station_df.loc[start:start + 60:2, variable] = np.nan
+    elif pattern == 'missing_month':
+        # Every February is missing entirely, so there are no statistics for that month at all
+        station_df.loc[(dates.dt.month == 2).values, ['tmax', 'ws', 'rs', 'rhmax']] = np.nan
+
+    return create_case('{}_seed_{}'.format(pattern, seed), dates.dt.year.values, dates.dt.month.values,
+                       dates.dt.day.values, {variable: station_df[variable].values for variable in variables})
+
+
+def real_station_case(config_file_path):
+    """
+        Creates a case from a real station, read in the same way the script reads every station.
+
+        Parameters:
+            config_file_path : string of path to station config file
+
+        Returns:
+            case : dictionary of every input array, see create_case
+    """
+    with open(os.devnull, 'w') as null_output, contextlib.redirect_stdout(null_output):
+        (data_df, column_df, flag_df, metadata_df, metadata_series, config_dict) = \
+            input_functions.obtain_data(config_file_path)
+
+    variables = {variable: data_df[variable].values for variable in
+                 ['tmax', 'tmin', 'tavg', 'tdew', 'ea', 'rhmax', 'rhmin', 'rhavg', 'rs', 'ws']}
+    # Dewpoint and vapor pressure are worked out from whichever humidity variables the station has, as the script does
+    (variables['ea'], variables['tdew']) = data_functions.calc_humidity_variables(
+        variables['tmax'], variables['tmin'], variables['tavg'], variables['ea'], column_df.ea, variables['tdew'],
+        column_df.tdew, variables['rhmax'], column_df.rhmax, variables['rhmin'], column_df.rhmin, variables['rhavg'],
+        column_df.rhavg)
+
+    return create_case('real_' + config_dict['station_name'], data_df.year.values, data_df.month.values,
+                       data_df.day.values, variables, config_dict['station_latitude'],
+                       config_dict['station_elevation'])
+
+
+def _remove_isolated_reference(data):
+    processed_data = reference_functions.remove_isolated_observations(data)
+    flags = flag_functions.create_flags(data.shape[0])
+    flag_functions.flag_removed(flags, data, processed_data, flag_functions.ISOLATED)
+    return processed_data, flags
+
+
+def _remove_isolated_optimized(data):
+    flags = flag_functions.create_flags(data.shape[0])
+    return input_functions.remove_isolated_observations(data, flags), flags
+
+
+# Every kernel that is checked, as its name, reference and optimized versions, and a function that creates its
+# arguments from a case and a random generator (only used by kernels that take random samples)
+KERNELS = [
+    ('remove_isolated_observations', _remove_isolated_reference, _remove_isolated_optimized,
+     lambda case, rng: (case['tmax'],)),
+    ('monthly_mean_and_std', reference_functions.monthly_mean_and_std, fill_functions.monthly_mean_and_std,
+     lambda case, rng: (case['month'], case['tmax'])),
+    ('fill_temperature', reference_functions.fill_temperature, fill_functions.fill_temperature,
+     lambda case, rng: (rng, case['month'], case['tmax'], case['tmin'], case['mm_delta_t'])),
+    ('fill_dewpoint', reference_functions.fill_dewpoint, fill_functions.fill_dewpoint,
+     lambda case, rng: (case['month'], case['tdew'], case['tmin'], case['complete_tmin'], case['mm_k_not'])),
+    ('fill_vapor_pressure', reference_functions.fill_vapor_pressure, fill_functions.fill_vapor_pressure,
+     lambda case, rng: (case['ea'], case['complete_tdew'])),
+    ('fill_solar_radiation_and_wind', reference_functions.fill_solar_radiation_and_wind,
+     fill_functions.fill_solar_radiation_and_wind,
+     lambda case, rng: (rng, case['month'], case['rs'], case['rs_tr'], case['ws'])),
+    ('seasonal_median_mad', reference_functions.seasonal_median_mad, rolling_functions.seasonal_median_mad,
+     lambda case, rng: (case['tmax'], case['doy'], 15, 10)),
+    ('moving_median_mad', reference_functions.moving_median_mad, rolling_functions.moving_median_mad,
+     lambda case, rng: (case['tmax'], 15, 10)),
+    ('calc_rs_tr', reference_functions.calc_rs_tr, data_functions.calc_rs_tr,
+     lambda case, rng: (case['month'], case['rso'], case['delta_t'], case['mm_delta_t']) + TR_COEFFICIENTS),
+    ('compile_ea', reference_functions.compile_ea, data_functions.compile_ea,
+     lambda case, rng: (case['tmax'], case['tmin'], case['tavg'], case['ea'], case['tdew'], 1, case['rhmax'], 1,
+                        case['rhmin'], 1, case['rhavg'], 1, case['tdew'])),
+    ('modified_z_score_outlier_detection', reference_functions.modified_z_score_outlier_detection,
+     qaqc_functions.modified_z_score_outlier_detection, lambda case, rng: (case['tmax'],)),
+    ('temp_find_outliers', reference_functions.temp_find_outliers, qaqc_functions.temp_find_outliers,
+     lambda case, rng: (NullLog(), case['tmax'], 'TMax', case['tmin'], 'TMin', case['month'])),
+    ('rh_yearly_percentile_corr', reference_functions.rh_yearly_percentile_corr,
+     qaqc_functions.rh_yearly_percentile_corr,
+     lambda case, rng: (NullLog(), case['year'].size // 4, case['year'].size, case['rhmax'], case['rhmin'],
+                        case['year'], 2)),
+    ('rs_period_ratio_corr', reference_functions.rs_period_ratio_corr, qaqc_functions.rs_period_ratio_corr,
+     lambda case, rng: (NullLog(), case['year'].size // 4, case['year'].size, case['rs'], case['rso'], 6, 60)),
+]
+
+
+class NullLog:
+    """
+        Stands in for the log file of kernels that write to one
+    """
+
+    def write(self, text):
+        pass
+
+
+@contextlib.contextmanager
+def warnings_silenced():
+    """
+        Throws away everything printed and every warning raised inside a with block.
+    """
+    with open(os.devnull, 'w') as null_output, contextlib.redirect_stdout(null_output), \
+            np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def run_kernel(kernel, arguments):
+    """
+        Runs a kernel on its own copies of its arguments, so that a kernel that edits its inputs can't affect the
+        other version of it.
+
+        Parameters:
+            kernel : function to run
+            arguments : tuple of arguments
+
+        Returns:
+            outputs : whatever the kernel returned, None if it raised an error
+            error : string of error the kernel raised, None if it didn't
+            seconds : float of wall time the kernel took
+    """
+    arguments = tuple(np.array(argument) if isinstance(argument, np.ndarray) else argument for argument in arguments)
+    start_time = time.perf_counter()
+    try:
+        with warnings_silenced():
+            outputs = kernel(*arguments)
+        error = None
+    except Exception as kernel_error:
+        (outputs, error) = (None, '{}: {}'.format(type(kernel_error).__name__, kernel_error))
+    return outputs, error, time.perf_counter() - start_time
+
+
+def flatten_outputs(outputs):
+    """
+        Turns the outputs of a kernel into a flat list of numpy arrays, so that outputs of any shape can be compared.
+
+        Parameters:
+            outputs : array, number, or (nested) tuple or list of them
+
+        Returns:
+            arrays : list of 1D numpy arrays
+    """
+    if isinstance(outputs, (tuple, list)):
+        return [array for output in outputs for array in flatten_outputs(output)]
+    else:
+        return [np.ravel(np.asarray(outputs))]
+
+
+def compare_outputs(reference_outputs, optimized_outputs, rtol=1e-9, atol=1e-9):
+    """
+        Compares the outputs of the reference and optimized versions of a kernel. Floating point values are compared
+        with np.isclose tolerances, with nan only matching nan. Integer outputs, such as QC flags and counts, have to
+        match exactly.
+
+        Parameters:
+            reference_outputs : outputs of the reference kernel
+            optimized_outputs : outputs of the optimized kernel
+            rtol : float of relative tolerance
+            atol : float of absolute tolerance
+
+        Returns:
+            comparison : dictionary of the largest absolute and relative differences, the number of values that
+                differed by more than the tolerances, the number of values that were nan in only one of the outputs,
+                the number of mismatched integer values (flags), and the number of outputs with different shapes
+    """
+    comparison = {'max_abs_diff': 0.0, 'max_rel_diff': 0.0, 'mismatched_values': 0, 'nan_mismatches': 0,
+                  'flag_mismatches': 0, 'shape_mismatches': 0}
+    reference_arrays = flatten_outputs(reference_outputs)
+    optimized_arrays = flatten_outputs(optimized_outputs)
+    if len(reference_arrays) != len(optimized_arrays):
+        comparison['shape_mismatches'] += abs(len(reference_arrays) - len(optimized_arrays))
+
+    for (reference, optimized) in zip(reference_arrays, optimized_arrays):
+        if reference.shape != optimized.shape:
+            comparison['shape_mismatches'] += 1
+        elif np.issubdtype(reference.dtype, np.integer) and np.issubdtype(optimized.dtype, np.integer):
+            comparison['flag_mismatches'] += int(np.count_nonzero(reference != optimized))
+        elif np.issubdtype(reference.dtype, np.number) and np.issubdtype(optimized.dtype, np.number):
+            reference = reference.astype(float)
+            optimized = optimized.astype(float)
+            (reference_nan, optimized_nan) = (np.isnan(reference), np.isnan(optimized))
+            comparison['nan_mismatches'] += int(np.count_nonzero(reference_nan != optimized_nan))
+
+            both = ~reference_nan & ~optimized_nan
+            if both.any():
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    abs_diff = np.abs(reference[both] - optimized[both])
+                    rel_diff = np.where(abs_diff == 0, 0.0, abs_diff / np.abs(reference[both]))
+                comparison['max_abs_diff'] = max(comparison['max_abs_diff'], float(abs_diff.max()))
+                comparison['max_rel_diff'] = max(comparison['max_rel_diff'], float(rel_diff.max()))
+                comparison['mismatched_values'] += \
+                    int(np.count_nonzero(~np.isclose(optimized[both], reference[both], rtol=rtol, atol=atol)))
+        elif not np.array_equal(reference, optimized):
+            comparison['mismatched_values'] += 1  # Strings or other objects, which have to be equal
+    return comparison
+
+
+def run_harness(cases, kernel_names=None, rtol=1e-9, atol=1e-9, seed=0):
+    """
+        Runs the reference and optimized versions of every kernel on every case and compares their outputs. Kernels
+        that take random samples are handed two generators created from the same seed, so their samples match.
+
+        Parameters:
+            cases : list of dictionaries of inputs, see create_case
+            kernel_names : list of names of kernels to check, defaults to every kernel in KERNELS
+            rtol : float of relative tolerance
+            atol : float of absolute tolerance
+            seed : integer seed of the generators handed to kernels that take random samples
+
+        Returns:
+            reports : list of dictionaries, one per kernel and case, with the comparison, whether it passed, any
+                errors raised, and how long each version took
+    """
+    reports = []
+    for (name, reference, optimized, create_arguments) in KERNELS:
+        if kernel_names is not None and name not in kernel_names:
+            continue
+
+        for case in cases:
+            (reference_outputs, reference_error, reference_seconds) = \
+                run_kernel(reference, create_arguments(case, np.random.default_rng(seed)))
+            (optimized_outputs, optimized_error, optimized_seconds) = \
+                run_kernel(optimized, create_arguments(case, np.random.default_rng(seed)))
+
+            report = {'kernel': name, 'case': case['name'], 'days': int(case['year'].size),
+                      'reference_error': reference_error, 'optimized_error': optimized_error,
+                      'reference_seconds': round(reference_seconds, 5),
+                      'optimized_seconds': round(optimized_seconds, 5),
+                      'speedup': round(reference_seconds / max(optimized_seconds, 1e-9), 2)}
+            if reference_error is None and optimized_error is None:
+                report.update(compare_outputs(reference_outputs, optimized_outputs, rtol, atol))
+                report['passed'] = report['mismatched_values'] == 0 and report['nan_mismatches'] == 0 and \
+                    report['flag_mismatches'] == 0 and report['shape_mismatches'] == 0
+            else:
+                # Both versions failing the same way is still equivalent
+                report['passed'] = reference_error is not None and optimized_error is not None and \
+                    reference_error.split(':')[0] == optimized_error.split(':')[0]
+            reports.append(report)
+    return reports
+
+
+def write_report(report_file_path, reports, rtol, atol):
+    """
+        Saves the results of the harness to a .json file.
+
+        Parameters:
+            report_file_path : string of path to save the report to
+            reports : list of dictionaries of results, see run_harness
+            rtol : float of relative tolerance used
+            atol : float of absolute tolerance used
+
+        Returns:
+            None
+    """
+    with open(report_file_path, 'w') as report_file:
+        json.dump({'created': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'rtol': rtol, 'atol': atol,
+                   'passed': all(report['passed'] for report in reports), 'reports': reports}, report_file, indent=4)
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -0,0 +1,163 @@
+import numpy as np
+
+
+def create_generator(seed=None):
+    """
+        Creates the random number generator used for everything random done to a station, so that a station run with
+        the same seed fills in exactly the same values every time.
+
+        Parameters:
+            seed : integer seed, if None the generator is seeded from the operating system and results will differ
+
+        Returns:
+            rng : numpy random Generator
+    """
+    return np.random.default_rng(seed)
+
+
+def monthly_mean_and_std(month, data):
+    """
+        Calculates the mean and standard deviation of each month of the year across the whole record.
+
+        Parameters:
+            month : 1D numpy array of month values
+            data : 1D numpy array of values
+
+        Returns:
+            mm_data : 1D numpy array of 12 monthly means, nan for months without any data
+            std_data : 1D numpy array of 12 monthly standard deviations, nan for months without any data
+    """
+    valid = ~np.isnan(data)
+    month_index = month[valid] - 1
+    counts = np.bincount(month_index, minlength=12).astype(float)
+    sums = np.bincount(month_index, weights=data[valid], minlength=12)
+    squared_sums = np.bincount(month_index, weights=data[valid] ** 2, minlength=12)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mm_data = sums / counts
+        std_data = np.sqrt(np.maximum(squared_sums / counts - mm_data ** 2, 0))  # population std, same as np.nanstd
+    return mm_data, std_data
+
+
+def fill_temperature(rng, month, tmax, tmin, mm_delta_t):
+    """
+        Fills every missing maximum and minimum temperature with a sample from a normal distribution with the mean and
+        standard deviation of that month. As tmax has to be warmer than tmin and daily temperature isn't constant, any
+        filled day where the completed tmax isn't at least 3 degrees warmer than tmin is instead set to the monthly
+        means pushed apart by half of the mean monthly temperature difference. Days with both values observed are
+        never changed.
+
+        Parameters:
+            rng : numpy random Generator to sample from
+            month : 1D numpy array of month values
+            tmax : 1D numpy array of maximum temperature values
+            tmin : 1D numpy array of minimum temperature values
+            mm_delta_t : 1D numpy array of 12 mean monthly differences between tmax and tmin
+
+        Returns:
+            complete_tmax : 1D numpy array of tmax with every gap filled where possible
+            complete_tmin : 1D numpy array of tmin with every gap filled where possible
+    """
+    month_index = month - 1
+    (mm_tmax, std_tmax) = monthly_mean_and_std(month, tmax)
+    (mm_tmin, std_tmin) = monthly_mean_and_std(month, tmin)
+
+    # Both sets of samples are drawn at once, one per missing day
+    complete_tmax = np.array(tmax)
+    complete_tmin = np.array(tmin)
+    missing_tmax = np.isnan(tmax)
+    missing_tmin = np.isnan(tmin)
+    complete_tmax[missing_tmax] = rng.normal(mm_tmax[month_index[missing_tmax]], std_tmax[month_index[missing_tmax]])
+    complete_tmin[missing_tmin] = rng.normal(mm_tmin[month_index[missing_tmin]], std_tmin[month_index[missing_tmin]])
+
+    # todo the below lines always provide a higher than average tmax and a lower than average tmin, this can be improved
+    with np.errstate(invalid='ignore'):
+        too_close = (missing_tmax | missing_tmin) & \
+            ((complete_tmax <= complete_tmin) | (complete_tmax - complete_tmin <= 3))
+    complete_tmax[too_close] = mm_tmax[month_index[too_close]] + (0.5 * mm_delta_t[month_index[too_close]])
+    complete_tmin[too_close] = mm_tmin[month_index[too_close]] - (0.5 * mm_delta_t[month_index[too_close]])
+
+    return complete_tmax, complete_tmin
+
+
+def fill_dewpoint(month, tdew, tmin, complete_tmin, mm_k_not):
+    """
+        Fills every missing dewpoint temperature with the tmin - ko curve. Tdew_ko is only filled where the original
+        tmin is present, while complete_tdew uses the completed tmin so that it has no gaps.
+
+        Parameters:
+            month : 1D numpy array of month values
+            tdew : 1D numpy array of dewpoint temperature values
+            tmin : 1D numpy array of minimum temperature values
+            complete_tmin : 1D numpy array of tmin with every gap filled
+            mm_k_not : 1D numpy array of 12 mean monthly ko values
+
+        Returns:
+            tdew_ko : 1D numpy array of tdew filled wherever tmin is present
+            complete_tdew : 1D numpy array of tdew filled wherever complete_tmin is present
+    """
+    missing = np.isnan(tdew)
+    k_not = mm_k_not[month[missing] - 1]
+
+    tdew_ko = np.array(tdew)
+    complete_tdew = np.array(tdew)
+    tdew_ko[missing] = tmin[missing] - k_not
+    complete_tdew[missing] = complete_tmin[missing] - k_not
+    return tdew_ko, complete_tdew
+
+
+def fill_vapor_pressure(compiled_ea, complete_tdew):
+    """
+        Fills every gap of the compiled vapor pressure with vapor pressure calculated from the completed dewpoint
+        temperature.
+
+        Parameters:
+            compiled_ea : 1D numpy array of compiled vapor pressure values
+            complete_tdew : 1D numpy array of tdew with every gap filled
+
+        Returns:
+            complete_ea : 1D numpy array of vapor pressure with every gap filled where possible
+    """
+    missing = np.isnan(compiled_ea)
+    complete_ea = np.array(compiled_ea)
+    complete_ea[missing] = 0.6108 * np.exp((17.27 * complete_tdew[missing]) / (complete_tdew[missing] + 237.3))
+    return complete_ea
+
+
+def fill_solar_radiation_and_wind(rng, month, rs, rs_tr, ws, min_ws=0.2):
+    """
+        Fills every missing solar radiation value with thornton-running solar radiation, and every missing wind speed
+        with a sample from a normal distribution with the mean and standard deviation of that month.
+
+        Parameters:
+            rng : numpy random Generator to sample from
+            month : 1D numpy array of month values
+            rs : 1D numpy array of solar radiation values
+            rs_tr : 1D numpy array of thornton-running solar radiation values
+            ws : 1D numpy array of wind speed values
+            min_ws : float of lowest reasonable wind speed, filled values below it are raised to it
+
+        Returns:
+            complete_rs : 1D numpy array of rs with every gap filled where possible
+            complete_ws : 1D numpy array of ws with every gap filled where possible
+    """
+    month_index = month - 1
+    (mm_ws, std_ws) = monthly_mean_and_std(month, ws)
+
+    complete_rs = np.array(rs)
+    missing_rs = np.isnan(rs)
+    complete_rs[missing_rs] = rs_tr[missing_rs]
+
+    complete_ws = np.array(ws)
+    missing_ws = np.isnan(ws)
+    filled_ws = rng.normal(mm_ws[month_index[missing_ws]], std_ws[month_index[missing_ws]])
+    with np.errstate(invalid='ignore'):
+        filled_ws[filled_ws < min_ws] = min_ws  # check to see if filled windspeed is lower than reasonable
+    complete_ws[missing_ws] = filled_ws
+
+    return complete_rs, complete_ws
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -0,0 +1,149 @@
+import numpy as np
+
+
+# Every variable gets one unsigned 16 bit integer per day, and each QC action that touched that day sets its own bit,
+# so a single array holds the full history of a variable at an eighth of the memory of a float array
+FLAG_DTYPE = np.uint16
+
+# Bits set while reading in the data file
+LIMITS = np.uint16(1 << 0)  # Removed for exceeding realistic limits (input_functions.daily_realistic_limits)
+ISOLATED = np.uint16(1 << 1)  # Removed as an isolated observation (input_functions.remove_isolated_observations)
+TMAX_EQUALS_TMIN = np.uint16(1 << 2)  # Removed because TMax equalled TMin, which is how HPRCC marks missing days
+MISSING_DATE = np.uint16(1 << 3)  # Date was missing entirely from the data file and was added in by reindexing
+
+# Bits set by correction methods (qaqc_functions.correction and compiled_humidity_adjustment)
+ADDITIVE = np.uint16(1 << 4)
+MULTIPLICATIVE = np.uint16(1 << 5)
+SET_TO_NAN = np.uint16(1 << 6)
+Z_SCORE_OUTLIER = np.uint16(1 << 7)
+ROLLING_Z_SCORE_OUTLIER = np.uint16(1 << 8)
+RS_PERIOD_RATIO = np.uint16(1 << 9)
+RH_YEARLY_PERCENTILE = np.uint16(1 << 10)
+HUMIDITY_SOURCE = np.uint16(1 << 11)  # Compiled ea was overwritten with a different humidity source
+
+# Bits set after correction
+FILLED = np.uint16(1 << 12)  # Missing value was filled in by the script
+
+# Names of every bit, in bit order, used to write out the flag legend
+FLAG_NAMES = {LIMITS: 'Exceeded realistic limits', ISOLATED: 'Isolated observation',
+              TMAX_EQUALS_TMIN: 'TMax equal to TMin', MISSING_DATE: 'Missing date',
+              ADDITIVE: 'Additive correction', MULTIPLICATIVE: 'Multiplicative correction',
+              SET_TO_NAN: 'Set to nan', Z_SCORE_OUTLIER: 'Modified z-score outlier',
+              ROLLING_Z_SCORE_OUTLIER: 'Rolling modified z-score outlier',
+              RS_PERIOD_RATIO: 'Rs period ratio correction',
+              RH_YEARLY_PERCENTILE: 'RH yearly percentile correction', HUMIDITY_SOURCE: 'Humidity source overwritten',
+              FILLED: 'Filled'}
+
+# Journal method names (see recipe_functions.journal_method_name) mapped onto the bit each of them sets
+METHOD_FLAGS = {'additive': ADDITIVE, 'multiplicative': MULTIPLICATIVE, 'set_to_nan': SET_TO_NAN,
+                'z_score_outliers': Z_SCORE_OUTLIER, 'rolling_z_score_outliers': ROLLING_Z_SCORE_OUTLIER,
+                'rs_period_ratio': RS_PERIOD_RATIO, 'rh_yearly_percentile': RH_YEARLY_PERCENTILE}
+
+# Variables that are flagged, in the order they are written to the output file
+FLAG_VARIABLES = ['tavg', 'tmax', 'tmin', 'tdew', 'ea', 'compiled_ea', 'rhavg', 'rhmax', 'rhmin', 'rs', 'ws',
+                  'precip']
+
+
+def create_flags(data_size):
+    """
+        Creates an empty flag array.
+
+        Parameters:
+            data_size : integer of length of record
+
+        Returns:
+            flags : 1D numpy uint16 array of zeros
+    """
+    return np.zeros(data_size, dtype=FLAG_DTYPE)
+
+
+def flag_removed(flags, old_values, new_values, bit):
+    """
+        Sets a bit on every day that had a value before a step and is nan after it.
+
+        Parameters:
+            flags : 1D numpy uint16 array of flags, edited in place
+            old_values : 1D numpy array of values before the step
+            new_values : 1D numpy array of values after the step
+            bit : flag bit to set
+
+        Returns:
+            None
+    """
+    flags[~np.isnan(old_values) & np.isnan(new_values)] |= bit
+
+
+def flag_changed(flags, old_values, new_values, bit):
+    """
+        Sets a bit on every day where a value differs before and after a step. NaN's are treated as equal to each other
+        so that untouched missing data is not flagged.
+
+        Parameters:
+            flags : 1D numpy uint16 array of flags, edited in place
+            old_values : 1D numpy array of values before the step
+            new_values : 1D numpy array of values after the step
+            bit : flag bit to set
+
+        Returns:
+            None
+    """
+    with np.errstate(invalid='ignore'):
+        changed = ~((old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values)))
+    flags[changed] |= bit
+
+
+def flag_history(flags, history):
+    """
+        Sets the bit of the method used by every iteration kept in a correction history on the days it changed.
+
+        Parameters:
+            flags : list of 1D numpy uint16 arrays, one for each array tracked by the history, or None for any arrays
+                that are not flagged
+            history : snapshot_functions.CorrectionHistory of the finished correction
+
+        Returns:
+            None
+    """
+    for (payload, changed_indices) in history.changes():
+        if 'source' in payload:
+            bit = HUMIDITY_SOURCE
+        else:
+            bit = METHOD_FLAGS.get(payload.get('method'))
+
+        if bit is None:
+            continue  # 'skip' never changes anything
+
+        for (var_flags, indices) in zip(flags, changed_indices):
+            if var_flags is not None:
+                var_flags[indices] |= bit
+
+
+def flag_values(flags, values, bit, fill_value=0):
+    """
+        Picks out the values of a variable on every day with a bit set, used to rebuild the old sheet of filled values.
+
+        Parameters:
+            flags : 1D numpy uint16 array of flags
+            values : 1D numpy array of values
+            bit : flag bit to check
+            fill_value : value to use on days without the bit set
+
+        Returns:
+            flagged_values : 1D numpy array of values, fill_value where the bit is not set
+    """
+    return np.where((flags & bit) != 0, values, fill_value)
+
+
+def flag_legend():
+    """
+        Lists what every bit means so the flags in the output file can be decoded.
+
+        Returns:
+            legend : list of tuples of bit number, integer value, and description
+    """
+    return [(int(bit).bit_length() - 1, int(bit), description) for (bit, description) in FLAG_NAMES.items()]
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -6,6 +6,18 @@ import os
 import pandas as pd
 import pathlib as pl
 import warnings
+from . import flag_functions, metadata_functions, output_functions
+
+
+# Backends bokeh can draw plots with, webgl is much faster to pan and zoom through long records
+PLOT_BACKENDS = ['canvas', 'webgl', 'svg']
+
+# Port the correction plots are served on when none is set, the same one bokeh serves on by default
+PLOT_SERVER_PORT = 5006
+
+# Folder of the result cache when none is set, and the size in megabytes it is kept under
+RESULT_CACHE_PATH = 'result_cache'
+RESULT_CACHE_MAX_MB = 2048
 
 
 def validate_file(file_path, expected_extensions):
@@ -75,6 +87,26 @@ def read_config(config_file_path):
     config_dict['auto_flag'] = config_reader['OPTIONS'].getboolean('automatic_option')  # auto first iteration of QAQC
     config_dict['fill_flag'] = config_reader['OPTIONS'].getboolean('fill_option')  # Option to fill in missing data
     config_dict['plot_flag'] = config_reader['OPTIONS'].getboolean('plot_option')  # Option to generate bokeh plots
+    plot_max_points = config_reader['OPTIONS'].get('plot_max_points', fallback='')  # Optional, added after checks below
+    config_dict['plot_backend'] = config_reader['OPTIONS'].get('plot_backend', fallback='')  # Optional
+    if config_dict['plot_backend'] == '':
+        config_dict['plot_backend'] = 'canvas'
+    config_dict['plot_server_flag'] = config_reader['OPTIONS'].getboolean('plot_server_option', fallback=False)
+    plot_server_port = config_reader['OPTIONS'].get('plot_server_port', fallback='')  # Optional, added after checks
+    config_dict['recipe_file_path'] = config_reader['OPTIONS'].get('recipe_file_path', fallback='')  # Optional
+    config_dict['metadata_store_path'] = config_reader['OPTIONS'].get('metadata_store_path', fallback='')  # Optional
+    if config_dict['metadata_store_path'] == '':
+        config_dict['metadata_store_path'] = metadata_functions.DEFAULT_METADATA_STORE
+    random_seed = config_reader['OPTIONS'].get('random_seed', fallback='')  # Optional, added after checks below
+    config_dict['parquet_flag'] = config_reader['OPTIONS'].getboolean('parquet_option', fallback=False)  # Optional
+    config_dict['parquet_dataset_path'] = config_reader['OPTIONS'].get('parquet_dataset_path', fallback='')  # Optional
+    config_dict['netcdf_flag'] = config_reader['OPTIONS'].getboolean('netcdf_option', fallback=False)  # Optional
+    config_dict['netcdf_file_path'] = config_reader['OPTIONS'].get('netcdf_file_path', fallback='')  # Optional
+    config_dict['result_cache_flag'] = config_reader['OPTIONS'].getboolean('result_cache_option', fallback=False)
+    config_dict['result_cache_path'] = config_reader['OPTIONS'].get('result_cache_path', fallback='')  # Optional
+    if config_dict['result_cache_path'] == '':
+        config_dict['result_cache_path'] = RESULT_CACHE_PATH
+    result_cache_max_mb = config_reader['OPTIONS'].get('result_cache_max_mb', fallback='')  # Optional, added later
 
     # DATA Section - Data Columns
     config_dict['string_date_col'] = config_reader['DATA'].getint('string_date_col')
@@ -119,6 +151,18 @@ def read_config(config_file_path):
         raise ValueError('\n\nThe following required variables were missing values in the config file: {}.'
                          .format(missing_keys))
     else:
+        # A blank seed means filled values are drawn differently every run
+        config_dict['random_seed'] = int(random_seed) if random_seed != '' else None
+        # A blank number of points means every point of every plot is drawn
+        config_dict['plot_max_points'] = int(plot_max_points) if plot_max_points != '' else None
+        config_dict['plot_server_port'] = int(plot_server_port) if plot_server_port != '' else PLOT_SERVER_PORT
+        config_dict['result_cache_max_mb'] = float(result_cache_max_mb) if result_cache_max_mb != '' \
+            else RESULT_CACHE_MAX_MB
+        if config_dict['plot_backend'] not in PLOT_BACKENDS:
+            raise ValueError('\n\nplot_backend in the config file is set to \'{}\', it must be one of {}.'
+                             .format(config_dict['plot_backend'], PLOT_BACKENDS))
+        # Optional outputs are only written once the station is finished, so check for their packages up front
+        output_functions.check_output_dependencies(config_dict['parquet_flag'], config_dict['netcdf_flag'])
         return config_dict
 
 
@@ -248,7 +292,7 @@ def convert_units(config_dict, original_data, var_type):
     return converted_data
 
 
-def daily_realistic_limits(original_data, log_path, var_type):
+def daily_realistic_limits(original_data, log_path, var_type, flags=None):
     """
         Applies a realistic limit to data to automatically catch and remove bad values that may have resulted
         from sensor malfunctions, sensor degradation, etc. Caught values are replaced by a numpy nan. This function
@@ -258,6 +302,7 @@ def daily_realistic_limits(original_data, log_path, var_type):
             original_data : 1D numpy array of original data from input file.
             log_path : path of the log file that is used to track how the data is modified
             var_type : string of text used to signify what type of data has been passed.
+            flags : 1D numpy array of QC flags, if provided every removed value is flagged
 
         Returns:
             limited_data : 1D numpy array of data after it has been checked for bad values.
@@ -296,6 +341,9 @@ def daily_realistic_limits(original_data, log_path, var_type):
     mask = ~(np.isnan(original_data))  # create an inverse mask for when the original data has so they don't get counted
     num_clipped_values = np.sum(limited_data[mask] != original_data[mask])  # Count the values that were clipped out
 
+    if flags is not None:
+        flag_functions.flag_removed(flags, original_data, limited_data, flag_functions.LIMITS)
+
     log.basicConfig()
     # Reopen log file to append corrections, then close it.
     corr_log = open(log_path, 'a')
@@ -306,7 +354,7 @@ def daily_realistic_limits(original_data, log_path, var_type):
     return limited_data  # Return the limited data
 
 
-def remove_isolated_observations(original_var):
+def remove_isolated_observations(original_var, flags=None):
     """
         Iterates through provided variable and tries to find any isolated observation, here defined as any observation
         that is surrounded by missing observations, and sets them to nan.
@@ -319,37 +367,25 @@ def remove_isolated_observations(original_var):
 
         Args:
             original_var : 1D numpy array of original variable data
+            flags : 1D numpy array of QC flags, if provided every removed observation is flagged
 
         Returns:
             processed_var : 1D numpy array of variable that has been filtered of all isolated observations.
     """
+    missing = np.isnan(original_var)
 
-    data_size = original_var.shape[0]  # number of rows in data
-    processed_var = np.empty(data_size) * np.nan
-
-    for i in range(data_size):
-        if i == 0 or i == (data_size - 1):  # Special handling for first and last index
-            if i == 0:  # First index
-                if np.isnan(original_var[i + 1]):
-                    # Very first observation is followed by a nan, remove it
-                    pass
-                else:
-                    # First observation is not followed by a nan
-                    processed_var[i] = original_var[i]
-            else:  # last index
-                if np.isnan(original_var[i - 1]):
-                    # Very last observation is preceded by a nan, remove it
-                    pass
-                else:
-                    # Last observation is not preceded by a nan
-                    processed_var[i] = original_var[i]
-
-        elif np.isnan(original_var[i - 1]) and np.isnan(original_var[i + 1]) and not np.isnan(original_var[i]):
-            # Observation is surrounded by nans, remove it.
-            pass
-        else:
-            # Either observation is valid and not surrounded by nans or is itself a nan.
-            processed_var[i] = original_var[i]
+    # The first and last observations only have one neighbour, so they are isolated if that one neighbour is missing.
+    # When days are appended to a record, both ends are checked again against their real neighbours: obtain_data reads
+    # in the day before the start date, and WeatherQAQC._append_data processes the old last day again if needed
+    missing_before = np.concatenate(([True], missing[:-1]))
+    missing_after = np.concatenate((missing[1:], [True]))
+    isolated = ~missing & missing_before & missing_after
+
+    processed_var = np.array(original_var, dtype='float')
+    processed_var[isolated] = np.nan
+
+    if flags is not None:
+        flags[isolated] |= flag_functions.ISOLATED
 
     return processed_var
 
@@ -369,6 +405,7 @@ def process_variable(config_dict, raw_data, var_name):
         Returns:
             processed_var : 1D numpy array of variable that has been extracted, converted, and filtered
             var_col : column of pulled variable, used to track what is provided and what is calculated
+            var_flags : 1D numpy array of QC flags of the variable, marking every value that was filtered out
     """
 
     var_name = var_name.lower()
@@ -412,13 +449,41 @@ def process_variable(config_dict, raw_data, var_name):
 
     original_var = extract_variable(raw_data, var_col)  # Will either return data or an array of nans of expected size
     converted_var = convert_units(config_dict, original_var, var_type)  # converts data to appropriate units
-    filtered_var = daily_realistic_limits(converted_var, config_dict['log_file_path'], var_type)  # removed bad vals
-    processed_var = remove_isolated_observations(filtered_var)  # returns data with no isolated observations
+    var_flags = flag_functions.create_flags(converted_var.shape[0])
+    filtered_var = daily_realistic_limits(converted_var, config_dict['log_file_path'], var_type,
+                                          var_flags)  # removed bad vals
+    processed_var = remove_isolated_observations(filtered_var, var_flags)  # returns data with no isolated observations
+
+    return processed_var, var_col, var_flags
+
+
+def station_paths(data_file_path):
+    """
+        Works out the name of a station and the folder its output files are saved to from the path of its data file.
+
+        Args:
+            data_file_path : string of path to data file
+
+        Returns:
+            station_name : string of data file name without its extension
+            file_name : string of data file path without its extension
+            station_extension : string of data file extension
+            folder_path : string of folder the data file is in, the current working directory if it is just a name
+    """
+    (file_name, station_extension) = os.path.splitext(data_file_path)
 
-    return processed_var, var_col
+    # check to see if file is in a subdirectory or by itself
+    if '/' in file_name:
+        (folder_path, delimiter, station_name) = file_name.rpartition('/')
+    elif '\\' in file_name:
+        (folder_path, delimiter, station_name) = file_name.rpartition('\\')
+    else:
+        station_name = file_name
+        folder_path = os.getcwd()
+    return station_name, file_name, station_extension, folder_path
 
 
-def obtain_data(config_file_path, metadata_file_path=None):
+def obtain_data(config_file_path, metadata_file_path=None, start_date=None):
     """
         Uses read_config() to acquire a full dictionary of the config file and then uses the values contained within it
         to direct how data is processed and what variables are obtained.
@@ -426,13 +491,18 @@ def obtain_data(config_file_path, metadata_file_path=None):
         If a metadata file is provided, the config file will still be used for data organization, but the metadata will
         be pulled from the metadata file.
 
+        If a start date is provided, only the days from it onwards are kept and the log file is appended to instead of
+        being started over, which is used to add new days onto a station that was already processed.
+
         Args:
             config_file_path : string of path to config file, should work with absolute or relative path
             metadata_file_path : string of path to metadata file if provided
+            start_date : first date to keep, all days are kept if None
 
         Returns:
             extracted_data : pandas dataframe of entire dataset, with the variables being organized into columns
             col_df : pandas series of what variables are stored in what columns, used to track which vars are provided
+            flag_df : pandas dataframe of QC flags of every variable, see flag_functions for what each bit means
             station_name : string of file, including path, that was provided to dataset
             log_file : string of log file, including path, that was provided to dataset
             station_lat : station latitude in decimal degrees
@@ -457,6 +527,9 @@ def obtain_data(config_file_path, metadata_file_path=None):
                                     keep_default_na=True, na_filter=True, verbose=True)
         print('\nSuccessfully opened metadata file at %s' % metadata_file_path)
 
+        # The workbook is never rewritten, the progress of each station is kept in the metadata store instead
+        metadata_df = metadata_functions.apply_network_progress(config_dict['metadata_store_path'], metadata_df)
+
         current_row = metadata_df.run_count.ne(2).idxmax() - 1
         metadata_series = metadata_df.iloc[current_row]
 
@@ -488,16 +561,7 @@ def obtain_data(config_file_path, metadata_file_path=None):
 
         metadata_df = None
         metadata_series = None
-        (file_name, station_extension) = os.path.splitext(config_dict['data_file_path'])
-
-        # check to see if file is in a subdirectory or by itself
-        if '/' in file_name:
-            (folder_path, delimiter, station_name) = file_name.rpartition('/')
-        elif '\\' in file_name:
-            (folder_path, delimiter, station_name) = file_name.rpartition('\\')
-        else:
-            station_name = file_name
-            folder_path = os.getcwd()
+        (station_name, file_name, station_extension, folder_path) = station_paths(config_dict['data_file_path'])
 
         # Add new keys to config_dict for directory and file information to save files later on
         config_dict['station_name'] = station_name
@@ -554,7 +618,10 @@ def obtain_data(config_file_path, metadata_file_path=None):
     config_dict['log_file_path'] = config_dict['folder_path'] + \
         '/correction_files/' + config_dict['station_name'] + '_changes_log' + '.txt'
     log.basicConfig()
-    logger = open(config_dict['log_file_path'], 'w')
+    log_mode = 'w' if start_date is None else 'a'
+    logger = open(config_dict['log_file_path'], log_mode)
+    if start_date is not None:
+        logger.write('\n\n')  # The log of the last time the station was processed doesn't end with a new line
     logger.write('The raw data for %s has been successfully read in at %s. \n \n' %
                  (config_dict['station_name'], dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
     logger.close()
@@ -602,41 +669,44 @@ def obtain_data(config_file_path, metadata_file_path=None):
         # Script cannot function without a time variable
         raise ValueError('Parameter error: date_format is set to an unexpected value.')
 
+    if start_date is not None:
+        # The day before the start date is also kept, so that isolated observations on the start date are found the
+        # same way as they would be if the whole file was read in. It is dropped again when the data is reindexed.
+        start_date = pd.Timestamp(start_date)
+        kept_rows = np.array(pd.to_datetime(pd.DataFrame({'year': data_year, 'month': data_month, 'day': data_day}))
+                             >= start_date - pd.Timedelta(days=1))
+        raw_data = raw_data[kept_rows]
+        data_year = data_year[kept_rows]
+        data_month = data_month[kept_rows]
+        data_day = data_day[kept_rows]
+
     #########################
     # Variable processing
     # Imports all weather variables, converts them into the correct units, and filters them to remove impossible values
 
-    (data_tmax, tmax_col) = process_variable(config_dict, raw_data, 'maximum_temperature')
-    (data_tmin, tmin_col) = process_variable(config_dict, raw_data, 'minimum_temperature')
-    (data_tavg, tavg_col) = process_variable(config_dict, raw_data, 'average_temperature')
-    (data_tdew, tdew_col) = process_variable(config_dict, raw_data, 'dewpoint_temperature')
-    (data_ea, ea_col) = process_variable(config_dict, raw_data, 'vapor_pressure')
-    (data_rhmax, rhmax_col) = process_variable(config_dict, raw_data, 'maximum_relative_humidity')
-    (data_rhmin, rhmin_col) = process_variable(config_dict, raw_data, 'minimum_relative_humidity')
-    (data_rhavg, rhavg_col) = process_variable(config_dict, raw_data, 'average_relative_humidity')
-    (data_rs, rs_col) = process_variable(config_dict, raw_data, 'solar_radiation')
-    (data_ws, ws_col) = process_variable(config_dict, raw_data, 'wind_speed')
-    (data_precip, precip_col) = process_variable(config_dict, raw_data, 'precipitation')
+    (data_tmax, tmax_col, flags_tmax) = process_variable(config_dict, raw_data, 'maximum_temperature')
+    (data_tmin, tmin_col, flags_tmin) = process_variable(config_dict, raw_data, 'minimum_temperature')
+    (data_tavg, tavg_col, flags_tavg) = process_variable(config_dict, raw_data, 'average_temperature')
+    (data_tdew, tdew_col, flags_tdew) = process_variable(config_dict, raw_data, 'dewpoint_temperature')
+    (data_ea, ea_col, flags_ea) = process_variable(config_dict, raw_data, 'vapor_pressure')
+    (data_rhmax, rhmax_col, flags_rhmax) = process_variable(config_dict, raw_data, 'maximum_relative_humidity')
+    (data_rhmin, rhmin_col, flags_rhmin) = process_variable(config_dict, raw_data, 'minimum_relative_humidity')
+    (data_rhavg, rhavg_col, flags_rhavg) = process_variable(config_dict, raw_data, 'average_relative_humidity')
+    (data_rs, rs_col, flags_rs) = process_variable(config_dict, raw_data, 'solar_radiation')
+    (data_ws, ws_col, flags_ws) = process_variable(config_dict, raw_data, 'wind_speed')
+    (data_precip, precip_col, flags_precip) = process_variable(config_dict, raw_data, 'precipitation')
 
     # HPRCC data reports '0' for missing observations as well as a text column, but this script doesn't interpret text
     # columns, so instead we see if both tmax and tmin have the same value (0, or -17.7778 depending on units) and if so
     # mark that row as missing
     # realistically tmax should never equal tmin, so this is an okay check to have in general
-    for i in range(len(data_tmax)):
-        if data_tmax[i] == data_tmin[i]:
-            data_tmax[i] = np.nan
-            data_tmin[i] = np.nan
-            data_tavg[i] = np.nan
-            data_tdew[i] = np.nan
-            data_ea[i] = np.nan
-            data_rhmax[i] = np.nan
-            data_rhmin[i] = np.nan
-            data_rhavg[i] = np.nan
-            data_rs[i] = np.nan
-            data_ws[i] = np.nan
-            data_precip[i] = np.nan
-        else:
-            pass
+    hprcc_missing = data_tmax == data_tmin
+    for (data_var, var_flags) in [(data_tmax, flags_tmax), (data_tmin, flags_tmin), (data_tavg, flags_tavg),
+                                  (data_tdew, flags_tdew), (data_ea, flags_ea), (data_rhmax, flags_rhmax),
+                                  (data_rhmin, flags_rhmin), (data_rhavg, flags_rhavg), (data_rs, flags_rs),
+                                  (data_ws, flags_ws), (data_precip, flags_precip)]:
+        var_flags[hprcc_missing & ~np.isnan(data_var)] |= flag_functions.TMAX_EQUALS_TMIN
+        data_var[hprcc_missing] = np.nan
 
     #########################
     # Dataframe Construction
@@ -649,12 +719,17 @@ def obtain_data(config_file_path, metadata_file_path=None):
     datetime_df = pd.DataFrame({'year': data_year, 'month': data_month, 'day': data_day})
     datetime_df = pd.to_datetime(datetime_df)
 
-    # Create a series of all dates in time series
-    date_reindex = pd.date_range(datetime_df.iloc[0], datetime_df.iloc[-1])
+    # Create a series of all dates in time series, which is empty if there are no days from the start date onwards
+    if start_date is None:
+        date_reindex = pd.date_range(datetime_df.iloc[0], datetime_df.iloc[-1])
+    elif datetime_df.size > 0:
+        date_reindex = pd.date_range(start_date, max(datetime_df.max(), start_date - pd.Timedelta(days=1)))
+    else:
+        date_reindex = pd.date_range(start_date, periods=0)
 
     reindexing_additions = np.setdiff1d(np.array(date_reindex), np.array(datetime_df), assume_unique=False)
 
-    logger = open(config_dict['log_file_path'], 'w')
+    logger = open(config_dict['log_file_path'], log_mode)
     logger.write('The raw data file had %s missing date entries from its time record. \n \n' %
                  reindexing_additions.size)
     logger.close()
@@ -673,19 +748,26 @@ def obtain_data(config_file_path, metadata_file_path=None):
                         'rhmax': rhmax_col, 'rhmin': rhmin_col, 'rhavg': rhavg_col, 'rs': rs_col, 'ws': ws_col,
                         'precip': precip_col})
 
+    # Create dataframe of QC flags, which mark every value that was removed while reading in the data
+    flag_df = pd.DataFrame({'tavg': flags_tavg, 'tmax': flags_tmax, 'tmin': flags_tmin, 'tdew': flags_tdew,
+                            'ea': flags_ea, 'rhavg': flags_rhavg, 'rhmax': flags_rhmax, 'rhmin': flags_rhmin,
+                            'rs': flags_rs, 'ws': flags_ws, 'precip': flags_precip}, index=datetime_df)
+
     # Check for the existence of duplicate indexes
     # if found, since it cannot be determined which value is true, we default to first instance and remove all following
     data_df = data_df[~data_df.index.duplicated(keep='first')]
+    flag_df = flag_df[~flag_df.index.duplicated(keep='first')]
 
     # Reindex data with filled date series in case there are gaps in the data
     data_df = data_df.reindex(date_reindex, fill_value=np.nan)
+    flag_df = flag_df.reindex(date_reindex, fill_value=flag_functions.MISSING_DATE).astype(flag_functions.FLAG_DTYPE)
 
     # Now replace M/D/Y columns with reindexed dates so there are no missing days
     data_df.year = date_reindex.year
     data_df.month = date_reindex.month
     data_df.day = date_reindex.day
 
-    return data_df, col_df, metadata_df, metadata_series, config_dict
+    return data_df, col_df, flag_df, metadata_df, metadata_series, config_dict
 
 
 # This is never run by itself
@@ -0,0 +1,236 @@
+import contextlib
+import datetime as dt
+import os
+import pandas as pd
+import sqlite3
+
+
+# Default location of the metadata store, in the folder the script is run from
+DEFAULT_METADATA_STORE = 'correction_metadata.db'
+
+# Workbook corrected stations were kept in before the metadata store, also in the folder the script is run from
+LEGACY_METADATA_WORKBOOK = 'correction_metadata.xlsx'
+
+# Version of the store stamped in its header, stores at version 0 haven't had the legacy workbook imported yet
+STORE_VERSION = 1
+
+# Every corrected station, one row per station, which replaces the old correction_metadata.xlsx
+# Network progress, one row per station of a network metadata workbook, which replaces rewriting that workbook
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS corrected_stations (
+        station TEXT NOT NULL,
+        latitude REAL,
+        longitude REAL,
+        station_elev_m REAL,
+        record_start TEXT,
+        record_end TEXT,
+        anemom_height_m REAL,
+        output_path TEXT,
+        run_count INTEGER NOT NULL DEFAULT 1,
+        last_updated TEXT
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS corrected_stations_station ON corrected_stations (station);
+    CREATE TABLE IF NOT EXISTS network_stations (
+        id TEXT NOT NULL,
+        run_count INTEGER NOT NULL,
+        record_start TEXT,
+        record_end TEXT,
+        output_path TEXT,
+        last_updated TEXT
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS network_stations_id ON network_stations (id);
+"""
+
+
+@contextlib.contextmanager
+def open_metadata_store(store_path=DEFAULT_METADATA_STORE):
+    """
+        Opens the metadata store, creating it if it doesn't exist yet, along with any stations from the workbook it
+        replaced (see import_legacy_metadata). The store uses write-ahead logging so that
+        stations run at the same time can read it while another one is writing, and writers wait on each other
+        instead of failing. Everything done inside the with block is a single transaction, committed at the end of it
+        or rolled back if an error is raised.
+
+        Parameters:
+            store_path : string of path to metadata store
+
+        Returns:
+            connection : sqlite3 connection to the store
+    """
+    connection = sqlite3.connect(store_path, timeout=60)
+    try:
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(_SCHEMA)
+        if connection.execute('PRAGMA user_version').fetchone()[0] < STORE_VERSION:
+            with connection:
+                # Checked again once the store is locked, in case another station imported it in the meantime
+                connection.execute('BEGIN IMMEDIATE')
+                if connection.execute('PRAGMA user_version').fetchone()[0] < STORE_VERSION:
+                    import_legacy_metadata(connection)
+                    connection.execute('PRAGMA user_version = {}'.format(STORE_VERSION))
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def import_legacy_metadata(connection, workbook_path=LEGACY_METADATA_WORKBOOK):
+    """
+        Copies the corrected stations of a correction_metadata.xlsx workbook into the metadata store the first time it
+        is opened, so their run counts carry on instead of starting over. The workbook had a row added every time a
+        station was run, so each station's run count is its number of rows (or the run_count column, if the workbook
+        was exported from a store) and its most recent row is kept. Stations that are already in the store keep their
+        own values, with the runs from the workbook added to their run count.
+
+        Parameters:
+            connection : sqlite3 connection to the store, inside a transaction
+            workbook_path : string of path to correction_metadata.xlsx workbook
+
+        Returns:
+            None
+    """
+    if not os.path.isfile(workbook_path):
+        return
+
+    workbook_df = pd.read_excel(workbook_path, sheet_name=0, index_col=None, engine='openpyxl')
+    if 'run_count' not in workbook_df.columns:
+        workbook_df['run_count'] = 1
+    workbook_df = workbook_df.dropna(subset=['Station'])
+    run_counts = workbook_df.groupby('Station', sort=False).run_count.sum()
+    latest_df = workbook_df.drop_duplicates(subset='Station', keep='last')
+
+    def date_text(value):  # the workbook was written with dates, exported workbooks have strings
+        return None if pd.isna(value) else str(pd.to_datetime(value).date())
+
+    for row in latest_df.itertuples(index=False):
+        connection.execute(
+            'INSERT INTO corrected_stations (station, latitude, longitude, station_elev_m, record_start, record_end, '
+            'anemom_height_m, output_path, run_count, last_updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (station) DO UPDATE SET run_count = corrected_stations.run_count + excluded.run_count',
+            (str(row.Station), float(row.Latitude), float(row.Longitude), float(row.station_elev_m),
+             date_text(row.record_start), date_text(row.record_end), float(row.anemom_height_m), str(row.Filename),
+             int(run_counts[row.Station]), dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    print('\nSystem: Imported {} corrected stations from {} into the metadata store.'
+          .format(latest_df.shape[0], workbook_path))
+
+
+def upsert_corrected_station(store_path, station, latitude, longitude, elevation, record_start, record_end,
+                             anemometer_height, output_path):
+    """
+        Adds a corrected station to the metadata store, or updates it and counts one more run if it is already there.
+        This is a single statement, so it is applied completely or not at all even if several stations finish at once.
+
+        Parameters:
+            store_path : string of path to metadata store
+            station : string of station name
+            latitude : station latitude in decimal degrees
+            longitude : station longitude in decimal degrees
+            elevation : station elevation in meters
+            record_start : date of first day of record
+            record_end : date of last day of record
+            anemometer_height : height of anemometer in meters
+            output_path : string of path to station output file
+
+        Returns:
+            None
+    """
+    with open_metadata_store(store_path) as connection:
+        connection.execute(
+            'INSERT INTO corrected_stations (station, latitude, longitude, station_elev_m, record_start, record_end, '
+            'anemom_height_m, output_path, run_count, last_updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?) '
+            'ON CONFLICT (station) DO UPDATE SET latitude = excluded.latitude, longitude = excluded.longitude, '
+            'station_elev_m = excluded.station_elev_m, record_start = excluded.record_start, '
+            'record_end = excluded.record_end, anemom_height_m = excluded.anemom_height_m, '
+            'output_path = excluded.output_path, run_count = corrected_stations.run_count + 1, '
+            'last_updated = excluded.last_updated',
+            (str(station), float(latitude), float(longitude), float(elevation), str(record_start), str(record_end),
+             float(anemometer_height), str(output_path), dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def upsert_network_station(store_path, station_id, run_count, record_start, record_end, output_path):
+    """
+        Records the progress of a station of a network metadata workbook, replacing any progress already stored for it.
+
+        Parameters:
+            store_path : string of path to metadata store
+            station_id : id of station in the network metadata workbook
+            run_count : integer of number of times the station has been run
+            record_start : date of first day of record
+            record_end : date of last day of record
+            output_path : string of path to station output file
+
+        Returns:
+            None
+    """
+    with open_metadata_store(store_path) as connection:
+        connection.execute(
+            'INSERT INTO network_stations (id, run_count, record_start, record_end, output_path, last_updated) '
+            'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET run_count = excluded.run_count, '
+            'record_start = excluded.record_start, record_end = excluded.record_end, '
+            'output_path = excluded.output_path, last_updated = excluded.last_updated',
+            (str(station_id), int(run_count), str(record_start), str(record_end), str(output_path),
+             dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def apply_network_progress(store_path, metadata_df):
+    """
+        Overwrites the progress columns (run_count, record_start, record_end, and output_path) of a network metadata
+        workbook with any progress recorded in the metadata store, as the workbook itself is no longer rewritten.
+
+        Parameters:
+            store_path : string of path to metadata store
+            metadata_df : pandas dataframe of network metadata workbook, with an 'id' column
+
+        Returns:
+            metadata_df : pandas dataframe of network metadata workbook with progress applied
+    """
+    with open_metadata_store(store_path) as connection:
+        progress_df = pd.read_sql_query('SELECT id, run_count, record_start, record_end, output_path '
+                                        'FROM network_stations', connection)
+
+    metadata_df = metadata_df.copy()
+    progress_df = progress_df.set_index('id')
+    for column in ['record_start', 'record_end', 'output_path']:
+        metadata_df[column] = metadata_df[column].astype(object)
+
+    station_ids = metadata_df.id.astype(str)
+    stored = station_ids.isin(progress_df.index)
+    for column in ['run_count', 'record_start', 'record_end', 'output_path']:
+        metadata_df.loc[stored, column] = progress_df.loc[station_ids[stored], column].values
+    return metadata_df
+
+
+def export_metadata(store_path, output_file_path, metadata_file_path=None):
+    """
+        Exports the metadata store to an .xlsx file for anyone who wants it as a spreadsheet. The corrected stations
+        are written to the first sheet, in the same layout as the old correction_metadata.xlsx. If a network metadata
+        workbook is provided it is also written out, with the stored progress applied, as a second sheet.
+
+        Parameters:
+            store_path : string of path to metadata store
+            output_file_path : string of path to save the .xlsx file to
+            metadata_file_path : string of path to network metadata workbook, optional
+
+        Returns:
+            None
+    """
+    with open_metadata_store(store_path) as connection:
+        corrected_df = pd.read_sql_query(
+            'SELECT station AS Station, latitude AS Latitude, longitude AS Longitude, station_elev_m, record_start, '
+            'record_end, anemom_height_m, output_path AS Filename, run_count, last_updated '
+            'FROM corrected_stations ORDER BY station', connection)
+
+    with pd.ExcelWriter(output_file_path, engine='openpyxl', mode='w') as writer:
+        corrected_df.to_excel(writer, header=True, index=False, sheet_name='Corrected Stations')
+
+        if metadata_file_path is not None:
+            metadata_df = pd.read_excel(metadata_file_path, sheet_name=0, index_col=0, engine='openpyxl',
+                                        keep_default_na=True, na_filter=True)
+            apply_network_progress(store_path, metadata_df).to_excel(writer, header=True, index=True,
+                                                                     sheet_name='Network Stations')
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -0,0 +1,516 @@
+import contextlib
+import importlib.util
+import numpy as np
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import urllib.parse
+
+try:
+    import fcntl  # Only available on unix systems, used to stop batch workers appending to a cube at the same time
+except ImportError:
+    fcntl = None
+
+
+# Errors raised when a package an optional output needs is not installed
+PARQUET_REQUIRED = '\n\nWriting Parquet output requires the pyarrow package, either install it or set parquet_option ' \
+    'to 0 in the config file.'
+NETCDF_REQUIRED = '\n\nWriting NetCDF output requires the netCDF4 package, either install it or set netcdf_option to ' \
+    '0 in the config file.'
+
+# Number of output files that can be waiting to be written before the station handing them over has to wait
+MAX_PENDING_OUTPUTS = 8
+
+# Rows of a workbook sheet that are converted at once, enough to keep numpy busy while keeping memory use small
+WORKBOOK_BLOCK_ROWS = 4096
+
+# Days of a cube are counted from this date, so that stations with different records share one time axis
+CUBE_EPOCH = np.datetime64('1900-01-01', 'D')
+
+# Chunks of a cube hold this many stations by this many days. For networks of around a thousand stations with a
+# century of days, reading the whole record of one station and reading one day of every station both touch a few dozen
+# chunks, instead of one of them touching thousands
+CUBE_CHUNK_STATIONS = 16
+CUBE_CHUNK_DAYS = 1024
+
+# Variables saved to a cube, along with their CF metadata
+CUBE_VARIABLES = [
+    ('tavg', {'standard_name': 'air_temperature', 'long_name': 'daily average air temperature', 'units': 'degC',
+              'cell_methods': 'time: mean'}),
+    ('tmax', {'standard_name': 'air_temperature', 'long_name': 'daily maximum air temperature', 'units': 'degC',
+              'cell_methods': 'time: maximum'}),
+    ('tmin', {'standard_name': 'air_temperature', 'long_name': 'daily minimum air temperature', 'units': 'degC',
+              'cell_methods': 'time: minimum'}),
+    ('tdew', {'standard_name': 'dew_point_temperature', 'long_name': 'daily average dewpoint temperature',
+              'units': 'degC', 'cell_methods': 'time: mean'}),
+    ('ea', {'standard_name': 'water_vapor_partial_pressure_in_air', 'long_name': 'daily average vapor pressure',
+            'units': 'kPa', 'cell_methods': 'time: mean'}),
+    ('rhavg', {'standard_name': 'relative_humidity', 'long_name': 'daily average relative humidity', 'units': '%',
+               'cell_methods': 'time: mean'}),
+    ('rhmax', {'standard_name': 'relative_humidity', 'long_name': 'daily maximum relative humidity', 'units': '%',
+               'cell_methods': 'time: maximum'}),
+    ('rhmin', {'standard_name': 'relative_humidity', 'long_name': 'daily minimum relative humidity', 'units': '%',
+               'cell_methods': 'time: minimum'}),
+    ('rs', {'standard_name': 'surface_downwelling_shortwave_flux_in_air', 'long_name': 'daily average solar radiation',
+            'units': 'W m-2', 'cell_methods': 'time: mean'}),
+    ('rso', {'long_name': 'daily average clear sky solar radiation', 'units': 'W m-2', 'cell_methods': 'time: mean'}),
+    ('ws', {'standard_name': 'wind_speed', 'long_name': 'daily average wind speed at anemometer height',
+            'units': 'm s-1', 'cell_methods': 'time: mean'}),
+    ('precip', {'standard_name': 'lwe_thickness_of_precipitation_amount', 'long_name': 'daily precipitation',
+                'units': 'mm', 'cell_methods': 'time: sum'}),
+    ('etr', {'long_name': 'daily ASCE standardized tall (alfalfa) reference evapotranspiration', 'units': 'mm',
+             'cell_methods': 'time: sum'}),
+    ('eto', {'long_name': 'daily ASCE standardized short (grass) reference evapotranspiration', 'units': 'mm',
+             'cell_methods': 'time: sum'}),
+]
+
+
+class OutputWriter:
+    """
+        Writes output files (plots, spreadsheets, and log entries) on a background thread, so that a station can hand
+        over everything it has finished and move on while the files are written. Numpy, file writes, and compression
+        all release the GIL, which is what lets writing overlap with reading in and correcting the next station.
+
+        Every task is handed over with a tag, normally the name of the station it belongs to. Tasks are written in the
+        order they were handed over. If a task fails, the error is kept until it is collected with wait() or flush(),
+        and every task with the same tag handed over until then is skipped, since it normally depends on the failed
+        one. The queue is bounded by MAX_PENDING_OUTPUTS, so a station that produces output faster than it can be
+        written waits instead of holding every output in memory.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_OUTPUTS):
+        self.tasks = queue.Queue(maxsize=max_pending)
+        self.condition = threading.Condition()
+        self.pending = {}  # Number of tasks of each tag that have not finished yet
+        self.errors = {}  # Errors of each tag that have not been collected yet
+        self.closed = False
+        self.thread = threading.Thread(target=self._write, name='output_writer', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't hide the original error behind any errors of the outputs
+            self.close(raise_errors=False)
+        return False
+
+    def submit(self, tag, description, function, *args, **kwargs):
+        """
+            Hands over an output to be written. Blocks if MAX_PENDING_OUTPUTS outputs are already waiting.
+
+            Parameters:
+                tag : string that the output is grouped under, such as the station name
+                description : string describing the output, used in error messages
+                function : function that writes the output
+                *args : arguments of function
+                **kwargs : keyword arguments of function
+
+            Returns:
+                None
+        """
+        with self.condition:
+            if self.closed:
+                raise IOError('Output writer has already been closed, \'{}\' was not written.'.format(description))
+            self.pending[tag] = self.pending.get(tag, 0) + 1
+        self.tasks.put((tag, description, function, args, kwargs))
+
+    def wait(self, tag=None):
+        """
+            Waits until every output of a tag has been written, and collects any errors they raised.
+
+            Parameters:
+                tag : string of tag to wait on, None to wait on every tag
+
+            Returns:
+                errors : list of strings of every error raised while writing the outputs
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending.get(tag, 0) == 0 if tag is not None
+                                    else sum(self.pending.values()) == 0)
+            if tag is not None:
+                return self.errors.pop(tag, [])
+
+            errors = [error for tag_errors in self.errors.values() for error in tag_errors]
+            self.errors = {}
+            return errors
+
+    def flush(self):
+        """
+            Waits until every output handed over so far has been written.
+
+            Returns:
+                None
+        """
+        errors = self.wait()
+        if len(errors) > 0:
+            raise IOError('\n\n{} outputs could not be written:\n{}'.format(len(errors), '\n'.join(errors)))
+
+    def close(self, raise_errors=True):
+        """
+            Writes everything still waiting, then stops the background thread.
+
+            Parameters:
+                raise_errors : boolean of whether to raise an IOError if any outputs could not be written
+
+            Returns:
+                None
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+        self.tasks.put(None)
+        self.thread.join()
+        if raise_errors:
+            self.flush()
+
+    def _write(self):
+        """
+            Runs on the background thread, writing every output in the order it was handed over
+        """
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+
+            (tag, description, function, args, kwargs) = task
+            with self.condition:
+                failed = tag in self.errors
+
+            error = None
+            if failed:
+                error = '{} : skipped, an earlier output of {} could not be written.'.format(description, tag)
+            else:
+                try:
+                    function(*args, **kwargs)
+                except Exception as write_error:
+                    error = '{} : {}: {}'.format(description, type(write_error).__name__,
+                                                 ' '.join(str(write_error).split()))
+
+            with self.condition:
+                if error is not None:
+                    self.errors.setdefault(tag, []).append(error)
+                self.pending[tag] -= 1
+                if self.pending[tag] == 0:
+                    del self.pending[tag]
+                self.condition.notify_all()
+
+
+def check_output_dependencies(parquet=False, netcdf=False):
+    """
+        Checks that the packages needed to write the optional outputs are installed, without importing them. Called
+        before a station is processed, so that a missing package fails it right away instead of once its output files
+        are written.
+
+        Parameters:
+            parquet : boolean of whether Parquet output is written
+            netcdf : boolean of whether NetCDF output is written
+
+        Returns:
+            None
+    """
+    if parquet and importlib.util.find_spec('pyarrow') is None:
+        raise ImportError(PARQUET_REQUIRED)
+    if netcdf and importlib.util.find_spec('netCDF4') is None:
+        raise ImportError(NETCDF_REQUIRED)
+
+
+def export_tag(tag):
+    """
+        Tag the optional exports of a station (Parquet and NetCDF) are handed to an OutputWriter under, kept apart from
+        the tag of its other output files so that a failed export never causes them to be skipped
+    """
+    return tag + ' exports'
+
+
+def write_workbook(workbook_file_path, dates, sheets):
+    """
+        Streams sheets of columns into an .xlsx workbook a block of rows at a time, using xlsxwriter's constant memory
+        mode, which writes each row out as soon as the next one is started. No dataframe of the record is ever made,
+        and columns that are calculated from other arrays are only calculated one block at a time, so memory use stays
+        the same no matter how long the record is. The layout is the same as pandas.DataFrame.to_excel creates, with a
+        bold header row and an optional first column of dates.
+
+        Parameters:
+            workbook_file_path : string of path to save the workbook to
+            dates : 1D numpy datetime64 array of the date of every row
+            sheets : list of tuples of sheet name, list of columns, boolean of whether to start every row with its
+                date, and string written in place of missing values. Each column is a tuple of its header and either
+                a 1D array of its values, or a tuple of a function and the 1D arrays it calculates the values from,
+                such as (np.subtract, corrected, original).
+
+        Returns:
+            None
+    """
+    import xlsxwriter  # Only imported once a workbook is actually written
+
+    workbook = xlsxwriter.Workbook(workbook_file_path, {'constant_memory': True})
+    header_style = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+    header_format = workbook.add_format(header_style)
+    date_format = workbook.add_format(dict(header_style, num_format='YYYY-MM-DD HH:MM:SS'))  # Dates are the index
+    # Excel stores dates as the number of days since 1899-12-30
+    excel_dates = (dates.astype('datetime64[D]') - np.datetime64('1899-12-30', 'D')).astype(float)
+
+    try:
+        for (sheet_name, columns, write_dates, na_rep) in sheets:
+            worksheet = workbook.add_worksheet(sheet_name)
+            first_column = 1 if write_dates else 0
+            if write_dates:
+                worksheet.write_string(0, 0, 'date', header_format)
+            for (column_number, (header, values)) in enumerate(columns):
+                worksheet.write_string(0, first_column + column_number, header, header_format)
+
+            first_values = columns[0][1]
+            rows = len(first_values[1] if isinstance(first_values, tuple) else first_values)
+            for start in range(0, rows, WORKBOOK_BLOCK_ROWS):
+                end = min(start + WORKBOOK_BLOCK_ROWS, rows)
+                block = np.empty((end - start, len(columns)), dtype=object)
+                for (column_number, (header, values)) in enumerate(columns):
+                    block[:, column_number] = _workbook_values(values, start, end, na_rep)
+
+                for (i, row_values) in enumerate(block.tolist()):
+                    if write_dates:
+                        worksheet.write_number(start + i + 1, 0, excel_dates[start + i], date_format)
+                    worksheet.write_row(start + i + 1, first_column, row_values)
+    finally:
+        workbook.close()
+
+
+def write_parquet_dataset(dataset_path, station_name, dates, tables, legend_columns=None):
+    """
+        Writes tables of columns into a Parquet dataset partitioned by station and year, laid out as
+        <dataset_path>/<table name>/station=<station name>/year=<year>/part-0.parquet so that it can be read with
+        pyarrow.dataset (or any other reader that understands hive partitioning). Arrow arrays are made straight from
+        the numpy arrays without copying them, missing values are stored as nulls rather than NaN, and every file keeps
+        the min/max statistics of its columns so readers can skip files that can't match a query.
+
+        Each station only ever replaces its own partitions, so a whole batch of stations can append to one dataset,
+        and running a station again replaces what it wrote last time instead of adding to it.
+
+        Parameters:
+            dataset_path : string of path to folder of the dataset, created if it doesn't exist
+            station_name : string of name of the station, used as its partition
+            dates : 1D numpy datetime64 array of the date of every row
+            tables : list of tuples of table name and list of columns, where every column is the same as the columns
+                of write_workbook. Headers are turned into column names by dropping the units in brackets, which are
+                kept in the column's metadata instead, so 'TMax (C)' is stored as 'tmax' with units 'C'.
+            legend_columns : list of columns of what each bit of the QC flags means, saved as flag_legend.parquet at the
+                top of the dataset, None to not save it
+
+        Returns:
+            None
+    """
+    try:
+        import pyarrow as pa  # Only imported once a dataset is actually written
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(PARQUET_REQUIRED)
+
+    os.makedirs(dataset_path, exist_ok=True)
+    if legend_columns is not None:
+        _replace_parquet_file(pq, _parquet_table(pa, legend_columns), os.path.join(dataset_path, 'flag_legend.parquet'))
+
+    # Records are in order, so every year is one slice of the table, which arrow takes without copying anything
+    years = dates.astype('datetime64[Y]').astype(int) + 1970
+    year_starts = np.flatnonzero(np.diff(years, prepend=years[0] - 1))
+    year_ends = np.append(year_starts[1:], years.shape[0])
+    station_partition = 'station=' + urllib.parse.quote(station_name, safe='')
+
+    for (table_name, columns) in tables:
+        table = _parquet_table(pa, [('date', dates.astype('datetime64[D]'))] + columns)
+        table_path = os.path.join(dataset_path, table_name)
+        os.makedirs(table_path, exist_ok=True)
+
+        # Written next to the station's old partitions first, then swapped in, so readers never see half of a station
+        new_station_path = tempfile.mkdtemp(prefix='.' + station_partition + '.', dir=table_path)
+        try:
+            for (start, end) in zip(year_starts, year_ends):
+                year_path = os.path.join(new_station_path, 'year={}'.format(years[start]))
+                os.makedirs(year_path)
+                pq.write_table(table.slice(start, end - start), os.path.join(year_path, 'part-0.parquet'),
+                               write_statistics=True)
+
+            station_path = os.path.join(table_path, station_partition)
+            if os.path.exists(station_path):
+                shutil.rmtree(station_path)
+            os.replace(new_station_path, station_path)
+        finally:
+            if os.path.exists(new_station_path):
+                shutil.rmtree(new_station_path)
+
+
+def write_netcdf_cube(cube_file_path, station_name, latitude, longitude, elevation, anemometer_height, dates,
+                      variables):
+    """
+        Appends a station to a station by day cube of corrected data, saved as a compressed NetCDF4 (HDF5) file that
+        follows the CF conventions for time series of stations (an orthogonal multidimensional array, with station and
+        time dimensions that both grow as stations are added). Time is counted in days from CUBE_EPOCH so every station
+        lines up on the same axis, and the cube is chunked by CUBE_CHUNK_STATIONS and CUBE_CHUNK_DAYS so that reading
+        either a single station or a single day is fast. Days a station has no data for are left as NaN.
+
+        A station that is already in the cube replaces its earlier data, every other station is added to the end. On
+        unix systems a lock file next to the cube stops batch workers from appending to it at the same time.
+
+        Parameters:
+            cube_file_path : string of path to cube file, created if it doesn't exist
+            station_name : string of name of the station
+            latitude : float of latitude of the station in decimal degrees
+            longitude : float of longitude of the station in decimal degrees
+            elevation : float of elevation of the station in meters
+            anemometer_height : float of height of the station's anemometer in meters
+            dates : 1D numpy datetime64 array of the date of every value
+            variables : dictionary of 1D numpy arrays of every variable in CUBE_VARIABLES
+
+        Returns:
+            None
+    """
+    try:
+        import netCDF4  # Only imported once a cube is actually written
+    except ImportError:
+        raise ImportError(NETCDF_REQUIRED)
+
+    days = (dates.astype('datetime64[D]') - CUBE_EPOCH).astype(int)
+    if days[0] < 0:
+        raise ValueError('\n\nStation {} starts before {}, which is the first day a cube can hold.'
+                         .format(station_name, CUBE_EPOCH))
+    # Records are normally continuous already, this just makes sure every value lands on the right day
+    record_length = days[-1] - days[0] + 1
+
+    cube_folder = os.path.dirname(cube_file_path)
+    if cube_folder != '':
+        os.makedirs(cube_folder, exist_ok=True)
+
+    with _file_lock(cube_file_path + '.lock'):
+        with netCDF4.Dataset(cube_file_path, 'a' if os.path.exists(cube_file_path) else 'w') as cube:
+            if 'station' not in cube.dimensions:
+                _create_cube(cube)
+
+            station_names = list(cube['station_name'][:])
+            if station_name in station_names:
+                station = station_names.index(station_name)
+                for (name, attributes) in CUBE_VARIABLES:
+                    cube[name][station, :] = np.nan  # The new record may not cover all of the old one
+            else:
+                station = len(station_names)
+                cube['station_name'][station] = station_name
+            cube['lat'][station] = latitude
+            cube['lon'][station] = longitude
+            cube['elevation'][station] = elevation
+            cube['anemometer_height'][station] = anemometer_height
+
+            time_length = len(cube.dimensions['time'])
+            if days[-1] >= time_length:
+                cube['time'][time_length:days[-1] + 1] = np.arange(time_length, days[-1] + 1)
+
+            for (name, attributes) in CUBE_VARIABLES:
+                record = np.full(record_length, np.nan, dtype=np.float32)
+                record[days - days[0]] = variables[name]
+                cube[name][station, days[0]:days[-1] + 1] = record
+
+
+def _create_cube(cube):
+    """
+        Creates the dimensions, coordinates, and variables of an empty cube
+    """
+    cube.Conventions = 'CF-1.8'
+    cube.featureType = 'timeSeries'
+    cube.title = 'Corrected daily weather station data'
+    cube.source = 'pyWeatherQAQC'
+    cube.createDimension('station', None)
+    cube.createDimension('time', None)
+
+    time = cube.createVariable('time', 'i4', ('time',), chunksizes=(CUBE_CHUNK_DAYS,))
+    time.setncatts({'standard_name': 'time', 'long_name': 'time', 'axis': 'T', 'calendar': 'standard',
+                    'units': 'days since {} 00:00:00'.format(CUBE_EPOCH)})
+    station_name = cube.createVariable('station_name', str, ('station',))
+    station_name.setncatts({'long_name': 'station name', 'cf_role': 'timeseries_id'})
+    for (name, attributes) in [('lat', {'standard_name': 'latitude', 'long_name': 'station latitude',
+                                        'units': 'degrees_north'}),
+                               ('lon', {'standard_name': 'longitude', 'long_name': 'station longitude',
+                                        'units': 'degrees_east'}),
+                               ('elevation', {'standard_name': 'surface_altitude', 'long_name': 'station elevation',
+                                              'units': 'm', 'positive': 'up'}),
+                               ('anemometer_height', {'long_name': 'height of anemometer above ground',
+                                                      'units': 'm'})]:
+        coordinate = cube.createVariable(name, 'f8', ('station',), fill_value=np.nan)
+        coordinate.setncatts(attributes)
+
+    for (name, attributes) in CUBE_VARIABLES:
+        variable = cube.createVariable(name, 'f4', ('station', 'time'), zlib=True, complevel=4, shuffle=True,
+                                       chunksizes=(CUBE_CHUNK_STATIONS, CUBE_CHUNK_DAYS),
+                                       fill_value=np.float32(np.nan))
+        variable.setncatts(attributes)
+        variable.coordinates = 'lat lon elevation station_name'
+
+
+@contextlib.contextmanager
+def _file_lock(lock_file_path):
+    """
+        Holds an exclusive lock on a file until the block finishes, does nothing on systems without fcntl
+    """
+    with open(lock_file_path, 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the file is closed
+        yield
+
+
+def _parquet_table(pa, columns):
+    """
+        Builds an arrow table from columns without copying their arrays, with NaN turned into nulls
+    """
+    fields = []
+    arrays = []
+    for (header, values) in columns:
+        if isinstance(values, tuple):
+            values = values[0](*values[1:])
+        values = np.asarray(values)
+        mask = np.isnan(values) if values.dtype.kind == 'f' else None
+        arrays.append(pa.array(values, mask=mask))
+
+        (name, units) = re.match(r'^(.*?)\s*(?:\((.*)\))?$', header).groups()
+        field_name = re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+        fields.append(pa.field(field_name, arrays[-1].type, metadata={'units': units} if units is not None else None))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def _replace_parquet_file(pq, table, file_path):
+    """
+        Writes a table to a parquet file through a temporary file, so the file is never seen half written
+    """
+    (file_descriptor, temporary_path) = tempfile.mkstemp(suffix='.parquet', dir=os.path.dirname(file_path))
+    os.close(file_descriptor)
+    try:
+        pq.write_table(table, temporary_path, write_statistics=True)
+        os.replace(temporary_path, file_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def _workbook_values(values, start, end, na_rep):
+    """
+        Gets one block of rows of a workbook column, with missing and infinite values replaced the same way pandas does
+    """
+    if isinstance(values, tuple):
+        block = np.asarray(values[0](*[array[start:end] for array in values[1:]]))
+    else:
+        block = np.asarray(values[start:end])
+
+    block_values = block.astype(object)
+    if block.dtype.kind == 'f':
+        block_values[np.isnan(block)] = na_rep
+        block_values[block == np.inf] = 'inf'
+        block_values[block == -np.inf] = '-inf'
+    return block_values
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
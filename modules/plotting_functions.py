@@ -1,7 +1,7 @@
 from bokeh.layouts import gridplot
 from bokeh.models import Label, ColumnDataSource, HoverTool
-from bokeh.plotting import figure, output_file, reset_output
-
+from bokeh.plotting import figure, output_file, reset_output, save, show
+from math import ceil
 import numpy as np
 
 
@@ -139,7 +139,184 @@ def histogram_plot(data, title, color, units):
     return h_plot
 
 
-def line_plot(x_size, y_size, dt_array, var_one, var_two, code, usage, link_plot=None):
+def downsample_indices(series, max_points):
+    """
+        Picks which points of one or more lines sharing an x-axis to plot so that a long record can be drawn with
+        about max_points points without changing its shape. The record is split into equal buckets, and from every
+        bucket the lowest and highest value of each line is kept, so every spike and outlier is still drawn, along with
+        the first missing value of each line, so gaps in the data still show up as gaps. The first and last points
+        are always kept so the x-axis covers the whole record.
+
+        Parameters:
+            series : list of 1D numpy arrays of the same length, one per line
+            max_points : integer of the most points to keep
+
+        Returns:
+            indices : 1D numpy array of the sorted indices of the points to plot
+    """
+    record_length = series[0].shape[0]
+    if record_length <= max_points:
+        return np.arange(record_length)
+
+    # Each bucket keeps up to three points of each line
+    bucket_size = ceil(record_length / max(1, (max_points - 2) // (3 * len(series))))
+    bucket_count = ceil(record_length / bucket_size)
+    bucket_starts = np.arange(bucket_count) * bucket_size
+
+    picks = [np.array([0, record_length - 1])]
+    for values in series:
+        buckets = np.full(bucket_count * bucket_size, np.nan)
+        buckets[:record_length] = values
+        buckets = buckets.reshape(bucket_count, bucket_size)
+        empty = np.isnan(buckets)
+        has_values = ~empty.all(axis=1)
+        lowest = np.where(empty, np.inf, buckets).argmin(axis=1)
+        highest = np.where(empty, -np.inf, buckets).argmax(axis=1)
+
+        missing = empty.copy()
+        missing.reshape(-1)[record_length:] = False  # The end of the last bucket is padding, not missing data
+        picks += [(bucket_starts + lowest)[has_values], (bucket_starts + highest)[has_values],
+                  (bucket_starts + missing.argmax(axis=1))[missing.any(axis=1)]]
+
+    return np.unique(np.concatenate(picks))
+
+
+class SharedSource:
+    """
+        The data of every linked line plot of a figure, kept so that the date axis, and any variable drawn by more than
+        one plot, is only saved to the figure once. Dates are stored as milliseconds since the epoch (what bokeh's
+        datetime axes use), and every column is a numpy array of a type bokeh saves as binary instead of as a list of
+        numbers written out as text.
+
+        Plots add their variables with add_plot, then finish is called once every plot has been made, before the
+        figure is saved or shown. Normally every plot draws from the same ColumnDataSource. If max_points is set and
+        the record is longer, each plot instead gets a small ColumnDataSource of its own, holding only the points
+        downsample_indices picks for its lines, since a shared one would need the points of every line in every column.
+
+        Once finished, update can replace the values of any columns, and only the columns that changed are sent to the
+        plots, patched in place where possible (see update).
+    """
+
+    def __init__(self, dt_array, max_points=None):
+        if np.issubdtype(dt_array.dtype, np.datetime64):
+            self.dates = dt_array.astype('datetime64[ms]').astype(np.float64)
+        else:  # Mean monthly plots use month numbers
+            self.dates = np.asarray(dt_array, dtype=np.float64)
+        self.downsampled = max_points is not None and self.dates.size > max_points
+        self.max_points = max_points
+        self.source = ColumnDataSource()
+        self.names = {}  # Column of every unnamed array added, by id, so an array drawn twice is only kept once
+        self.arrays = {}  # Array of every column, by name, until finish copies them into values
+        self.values = {}  # Float copy of every column once finished, used to tell what changed in update
+        self.plots = []  # ColumnDataSource of each plot, the columns it draws, and which of them have data
+
+    def add_plot(self, var_one, var_two, columns=None):
+        """
+            Adds the variables of a plot to the source.
+
+            Parameters:
+                var_one : 1D numpy array of first variable
+                var_two : 1D numpy array of second variable, or None
+                columns : tuple of names to give the columns of var_one and var_two, so that their values can be
+                    replaced with update, None to name them automatically, with any array added twice kept once
+
+            Returns:
+                plot_source : ColumnDataSource the plot draws from
+                column_one : string of name of var_one's column
+                column_two : string of name of var_two's column, a column of NaN if var_two is None
+        """
+        if columns is None:
+            columns = (None, None)
+        plot_columns = [self._column(values, name) for (values, name) in zip([var_one, var_two], columns)]
+        plot_source = ColumnDataSource() if self.downsampled else self.source
+        self.plots.append((plot_source, plot_columns,
+                           [name for (name, values) in zip(plot_columns, [var_one, var_two]) if values is not None]))
+        return plot_source, plot_columns[0], plot_columns[1]
+
+    def finish(self):
+        """
+            Fills in the plots' data with every column added, downsampled if needed. Must be called before saving.
+
+            Returns:
+                None
+        """
+        self.values = {name: self._float_values(values) for (name, values) in self.arrays.items()}
+        self.names = {}
+        self.arrays = {}
+
+        if not self.downsampled:
+            self.source.data = dict({'date': self.dates}, **{name: values.copy() for (name, values)
+                                                             in self.values.items()})
+        else:
+            for plot in self.plots:
+                self._fill_plot(*plot)
+
+    def update(self, columns):
+        """
+            Replaces the values of named columns of a finished source. Columns that didn't change are left alone, and
+            a column that did only has the stretch from its first to its last changed value patched in, which is all
+            a bokeh server session sends to the browser. Downsampled plots are refilled instead, since which points
+            they keep depends on the values.
+
+            Parameters:
+                columns : dictionary of 1D numpy arrays (or None for a column of NaN) of new values, by column name
+
+            Returns:
+                changed : list of names of columns that changed
+        """
+        patches = {}
+        for (name, values) in columns.items():
+            new_values = self._float_values(values)
+            old_values = self.values[name]
+            changed = np.flatnonzero((new_values != old_values) & ~(np.isnan(new_values) & np.isnan(old_values)))
+            if changed.size > 0:
+                self.values[name] = new_values
+                patches[name] = [(slice(int(changed[0]), int(changed[-1]) + 1),
+                                  new_values[changed[0]:changed[-1] + 1])]
+
+        if len(patches) == 0:
+            pass
+        elif not self.downsampled:
+            self.source.patch(patches)
+        else:
+            for (plot_source, plot_columns, data_columns) in self.plots:
+                if any(name in patches for name in plot_columns):
+                    self._fill_plot(plot_source, plot_columns, data_columns)
+        return list(patches)
+
+    def _column(self, values, name):
+        """
+            Gets the name of the column of an array, adding it if it hasn't been added yet
+        """
+        if name is None:
+            if id(values) not in self.names:
+                self.names[id(values)] = 'v{}'.format(len(self.arrays))
+            name = self.names[id(values)]
+        # Kept until finish, which also stops the id of an unnamed array from being reused by a new one
+        self.arrays.setdefault(name, values)
+        return name
+
+    def _fill_plot(self, plot_source, plot_columns, data_columns):
+        """
+            Fills in the ColumnDataSource of a single downsampled plot with the points picked for its lines
+        """
+        indices = downsample_indices([self.values[name] for name in data_columns], self.max_points) \
+            if len(data_columns) > 0 else np.array([0, self.dates.size - 1])
+        data = {'date': self.dates[indices], 'index': indices.astype(np.int32)}
+        data.update({name: self.values[name][indices] for name in plot_columns})
+        plot_source.data = data
+
+    def _float_values(self, values):
+        """
+            Copies the values of a column as floats, None becomes a column of NaN
+        """
+        if values is None:
+            return np.full(self.dates.size, np.nan)
+        return np.array(values, dtype=np.float64)
+
+
+def line_plot(x_size, y_size, dt_array, var_one, var_two, code, usage, link_plot=None, max_points=None,
+              output_backend='canvas', source=None, columns=None):
     """
         Creates a bokeh line plot for provided variables and links them if appropriate
 
@@ -152,24 +329,31 @@ def line_plot(x_size, y_size, dt_array, var_one, var_two, code, usage, link_plot
             code : integer indicating what variables were passed
             usage : additional string indicating why plot is being created
             *link_plot : either nothing or the plot we want to link x-axis with
+            *max_points : integer of the most points to plot of each line, longer records are downsampled with
+                downsample_indices, None to plot every point, ignored if a source is passed
+            *output_backend : string of backend bokeh draws the plot with, 'canvas', 'webgl', or 'svg'
+            *source : SharedSource made from the same dt_array to draw from, which has to be finished once every
+                plot using it has been made, if None the plot gets a source of its own
+            *columns : tuple of names of the columns of var_one and var_two in source, see SharedSource.add_plot
 
         Returns:
             subplot : constructed figure
     """
     (units, title, var_one_name, var_one_color, var_two_name, var_two_color) = generate_line_plot_features(code, usage)
 
-    date_list = dt_array.tolist()
-    source = ColumnDataSource(data=dict(date=date_list, v_one=var_one))
-    empty_array = np.zeros(len(date_list))
-    empty_array[:] = np.nan
+    own_source = source is None
+    if own_source:
+        source = SharedSource(dt_array, max_points)
+    (plot_source, column_one, column_two) = source.add_plot(var_one, var_two, columns)
 
-    if var_two is None:
-        source.add(empty_array, name='v_two')
+    if source.downsampled:
+        # Points were dropped, so the position of a point in the plot is no longer its position in the record
+        index_tooltip = '@index'
     else:
-        source.add(var_two, name='v_two')
+        index_tooltip = '$index'
 
     tooltips = [
-        ('Index', '$index'),
+        ('Index', index_tooltip),
         ('Date', '@date{%F}'),
         ('Value', '$y')]
     formatters = {'@date': 'datetime'}
@@ -185,27 +369,44 @@ def line_plot(x_size, y_size, dt_array, var_one, var_two, code, usage, link_plot
         subplot = figure(
             width=x_size, height=y_size, x_axis_type=x_axis_type,
             x_axis_label=x_label, y_axis_label=units, title=title,
-            tools='pan, box_zoom, undo, reset, save')
+            tools='pan, box_zoom, undo, reset, save', output_backend=output_backend)
     else:  # Plot is passed to link x-axis with
         subplot = figure(
             x_range=link_plot.x_range,
             width=x_size, height=y_size, x_axis_type=x_axis_type,
             x_axis_label=x_label, y_axis_label=units, title=title,
-            tools='pan, box_zoom, undo, reset, save')
+            tools='pan, box_zoom, undo, reset, save', output_backend=output_backend)
 
-    subplot.line(x='date', y='v_one', line_color=var_one_color, legend_label=var_one_name, source=source)
+    subplot.line(x='date', y=column_one, line_color=var_one_color, legend_label=var_one_name, source=plot_source)
     if var_two_name.lower() == 'null':
         pass
     else:
-        subplot.line(x='date', y='v_two', line_color=var_two_color, legend_label=var_two_name, source=source)
+        subplot.line(x='date', y=column_two, line_color=var_two_color, legend_label=var_two_name, source=plot_source)
 
     subplot.legend.location = 'bottom_left'
     subplot.add_tools(HoverTool(tooltips=tooltips, formatters=formatters))
 
+    if own_source:
+        source.finish()
+
     return subplot
 
 
-def variable_correction_plots(station, dt_array, var_one, corr_var_one, var_two, corr_var_two, code, folder_path):
+class FigureCache:
+    """
+        Keeps the last figure made by variable_correction_plots or humidity_adjustment_plots, along with its data, so
+        that when it is made again after a correction only the columns that changed are updated (see
+        SharedSource.update), instead of building every plot of the figure again. A cache should only be passed to
+        calls that make the same figure of the same record, such as the iterations of correcting one variable.
+    """
+
+    def __init__(self):
+        self.figure = None
+        self.source = None
+
+
+def variable_correction_plots(station, dt_array, var_one, corr_var_one, var_two, corr_var_two, code, folder_path,
+                              cache=None, **plot_options):
     x_size = 800
     y_size = 350
     reset_output()  # clears bokeh output, prevents ballooning file sizes
@@ -221,25 +422,40 @@ def variable_correction_plots(station, dt_array, var_one, corr_var_one, var_two,
     (units, title, var_one_name, var_one_color, var_two_name, var_two_color) = generate_line_plot_features(code, '')
     output_file(folder_path + "/correction_files/" + station + "_" + title + "_correction_plots.html")
 
-    original_plot = line_plot(x_size, y_size, dt_array, var_one, var_two, code, station + ' Original ', link_plot=None)
+    if cache is not None and cache.figure is not None:
+        cache.source.update({'var_one': var_one, 'var_two': var_two, 'corr_var_one': corr_var_one,
+                             'corr_var_two': corr_var_two, 'delta_var_one': delta_var_one,
+                             'delta_var_two': delta_var_two, 'prct_var_one': prct_var_one,
+                             'prct_var_two': prct_var_two})
+        return cache.figure
+
+    source = SharedSource(dt_array, plot_options.get('max_points'))
+    original_plot = line_plot(x_size, y_size, dt_array, var_one, var_two, code, station + ' Original ', link_plot=None,
+                              source=source, columns=('var_one', 'var_two'), **plot_options)
 
     corrected_plot = line_plot(x_size, y_size, dt_array, corr_var_one, corr_var_two, code, 'Corrected ',
-                               link_plot=original_plot)
+                               link_plot=original_plot, source=source, columns=('corr_var_one', 'corr_var_two'),
+                               **plot_options)
 
     delta_plot = line_plot(x_size, y_size, dt_array, delta_var_one, delta_var_two, code, 'Deltas of ',
-                           link_plot=original_plot)
+                           link_plot=original_plot, source=source, columns=('delta_var_one', 'delta_var_two'),
+                           **plot_options)
 
     percent_plot = line_plot(x_size, y_size, dt_array, prct_var_one, prct_var_two, code, '% Difference of ',
-                             link_plot=original_plot)
+                             link_plot=original_plot, source=source, columns=('prct_var_one', 'prct_var_two'),
+                             **plot_options)
+    source.finish()
 
     corr_fig = gridplot([[original_plot], [corrected_plot], [delta_plot], [percent_plot]],
                         toolbar_location="left", sizing_mode='scale_both')
     corr_fig.sizing_mode = 'stretch_both'
+    if cache is not None:
+        (cache.figure, cache.source) = (corr_fig, source)
     return corr_fig
 
 
 def humidity_adjustment_plots(station, dt_array, comp_ea, ea, ea_col, tmin, tdew, tdew_col, rhmax, rhmax_col,
-                              rhmin, rhmin_col, rhavg, rhavg_col, tdew_ko, folder_path):
+                              rhmin, rhmin_col, rhavg, rhavg_col, tdew_ko, folder_path, cache=None, **plot_options):
 
     x_size = 800
     y_size = 350
@@ -248,27 +464,40 @@ def humidity_adjustment_plots(station, dt_array, comp_ea, ea, ea_col, tmin, tdew
 
     output_file(folder_path + "/correction_files/" + station + "_humidity_adjustment_plots.html")
 
-    ea_comp_plot = line_plot(x_size, y_size, dt_array, comp_ea, None, 7, station + ' Composite ', link_plot=None)
+    # Only the compiled ea is ever adjusted, every other variable is just shown for comparison
+    if cache is not None and cache.figure is not None:
+        cache.source.update({'comp_ea': comp_ea})
+        return cache.figure
+
+    source = SharedSource(dt_array, plot_options.get('max_points'))
+    ea_comp_plot = line_plot(x_size, y_size, dt_array, comp_ea, None, 7, station + ' Composite ', link_plot=None,
+                             source=source, columns=('comp_ea', None), **plot_options)
     humidity_plot_list.append(ea_comp_plot)
 
     if ea_col != -1:
-        ea_provided_plot = line_plot(x_size, y_size, dt_array, ea, None, 7, 'Provided ', link_plot=ea_comp_plot)
+        ea_provided_plot = line_plot(x_size, y_size, dt_array, ea, None, 7, 'Provided ', link_plot=ea_comp_plot,
+                                     source=source, **plot_options)
         humidity_plot_list.append(ea_provided_plot)
 
     if tdew_col != -1:
-        tdew_provided_plot = line_plot(x_size, y_size, dt_array, tmin, tdew, 2, 'Provided ', link_plot=ea_comp_plot)
+        tdew_provided_plot = line_plot(x_size, y_size, dt_array, tmin, tdew, 2, 'Provided ', link_plot=ea_comp_plot,
+                                       source=source, **plot_options)
         humidity_plot_list.append(tdew_provided_plot)
 
     if rhmax_col != -1 and rhmin_col != -1:
-        rh_max_min_plot = line_plot(x_size, y_size, dt_array, rhmax, rhmin, 8, '', link_plot=ea_comp_plot)
+        rh_max_min_plot = line_plot(x_size, y_size, dt_array, rhmax, rhmin, 8, '', link_plot=ea_comp_plot,
+                                    source=source, **plot_options)
         humidity_plot_list.append(rh_max_min_plot)
 
     if rhavg_col != -1:
-        rh_avg_plot = line_plot(x_size, y_size, dt_array, rhavg, None, 9, '', link_plot=ea_comp_plot)
+        rh_avg_plot = line_plot(x_size, y_size, dt_array, rhavg, None, 9, '', link_plot=ea_comp_plot, source=source,
+                                **plot_options)
         humidity_plot_list.append(rh_avg_plot)
 
-    tdew_ko_filled_plot = line_plot(x_size, y_size, dt_array, tmin, tdew_ko, 2, 'Ko curve ', link_plot=ea_comp_plot)
+    tdew_ko_filled_plot = line_plot(x_size, y_size, dt_array, tmin, tdew_ko, 2, 'Ko curve ', link_plot=ea_comp_plot,
+                                    source=source, **plot_options)
     humidity_plot_list.append(tdew_ko_filled_plot)
+    source.finish()
 
     # Now construct grid plot out of all of the subplots
     number_of_plots = len(humidity_plot_list)
@@ -283,10 +512,53 @@ def humidity_adjustment_plots(station, dt_array, comp_ea, ea, ea_col, tmin, tdew
 
     humidity_fig = gridplot(humid_grid_of_plots, toolbar_location='left')
     humidity_fig.sizing_mode = 'stretch_both'
+    if cache is not None:
+        (cache.figure, cache.source) = (humidity_fig, source)
 
     return humidity_fig
 
 
+def show_plots(session, build, *args, **kwargs):
+    """
+        Builds a figure and shows it, in a new browser tab, or in the open tab of a correction session if there is one
+
+        Parameters:
+            session : session_functions.CorrectionSession the figure is shown in, None to open it in a new tab
+            build : function that returns the figure to show, such as variable_correction_plots
+            *args, **kwargs : arguments passed on to build
+
+        Returns:
+            fig : figure returned by build
+    """
+    if session is not None:
+        return session.show(build, *args, **kwargs)
+    fig = build(*args, **kwargs)
+    show(fig)
+    return fig
+
+
+def save_plots(session, build, *args, **kwargs):
+    """
+        Builds a figure and saves it to the file set by build, also showing it in the tab of a correction session if
+        there is one
+
+        Parameters:
+            session : session_functions.CorrectionSession the figure is shown in, None to only save it
+            build : function that returns the figure to save, such as variable_correction_plots
+            *args, **kwargs : arguments passed on to build
+
+        Returns:
+            fig : figure returned by build
+    """
+    if session is not None:
+        fig = session.show(build, *args, **kwargs)
+        session.save(fig)
+    else:
+        fig = build(*args, **kwargs)
+        save(fig)
+    return fig
+
+
 # This is never run by itself
 if __name__ == "__main__":
     print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -0,0 +1,215 @@
+import datetime as dt
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from . import data_functions, input_functions, plotting_functions, qaqc_functions
+
+try:
+    import resource  # Only available on unix systems, used to report the peak memory of the whole process
+except ImportError:
+    resource = None
+
+
+# Modules whose public functions are timed while profiling
+PROFILED_MODULES = [data_functions, input_functions, plotting_functions, qaqc_functions]
+
+# Seconds between each sample of the memory used by the process
+MEMORY_SAMPLE_INTERVAL = 0.01
+
+
+def current_memory():
+    """
+        Finds the memory currently used by the process (its resident set size). This is read from /proc, so it is only
+        available on linux.
+
+        Returns:
+            memory : integer of memory in bytes, None if it can't be found on this platform
+    """
+    try:
+        with open('/proc/self/statm') as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Profiler:
+    """
+        Records the wall time, CPU time, number of calls, and peak memory of every stage of a station and of every
+        public function of PROFILED_MODULES. Functions are only wrapped between start() and stop(), so nothing is
+        added to any call while profiling is off.
+
+        Times are inclusive, a stage or function includes everything it calls. Wall time also includes any time
+        spent waiting for the user to answer a prompt, CPU time does not. Peak memory is the largest amount of memory
+        used by the process above what it was already using when the stage or function was entered. It is sampled
+        every MEMORY_SAMPLE_INTERVAL seconds from a background thread, which keeps profiling from slowing the script
+        down but means calls shorter than the interval may not have their peak recorded.
+    """
+
+    def __init__(self):
+        self.records = {}  # Totals of every stage and function, keyed on their name
+        self.stack = []  # Stages and functions currently running, outermost first
+        self.originals = []  # Every function that was wrapped, so it can be put back afterwards
+        self.started = None
+        self.sampler = None
+        self.sampling = threading.Event()
+
+    def start(self):
+        """
+            Starts sampling memory and wraps every public function of PROFILED_MODULES so that it is measured.
+
+            Returns:
+                None
+        """
+        self.started = dt.datetime.now()
+        if current_memory() is not None:
+            self.sampling.set()
+            self.sampler = threading.Thread(target=self._sample_memory, daemon=True)
+            self.sampler.start()
+
+        for module in PROFILED_MODULES:
+            for (name, function) in list(vars(module).items()):
+                if inspect.isfunction(function) and function.__module__ == module.__name__ \
+                        and not name.startswith('_'):
+                    self.originals.append((module, name, function))
+                    setattr(module, name, self._wrap(module.__name__.rpartition('.')[2] + '.' + name, function))
+
+    def stop(self):
+        """
+            Puts back every wrapped function and stops sampling memory.
+
+            Returns:
+                None
+        """
+        for (module, name, function) in self.originals:
+            setattr(module, name, function)
+        self.originals = []
+
+        if self.sampler is not None:
+            self.sampling.clear()
+            self.sampler.join()
+            self.sampler = None
+
+    def _sample_memory(self):
+        """
+            Runs on the background thread, raising the peak of everything currently running to the memory in use
+        """
+        while self.sampling.is_set():
+            memory = current_memory()
+            for frame in list(self.stack):
+                frame['peak'] = max(frame['peak'], memory)
+            time.sleep(MEMORY_SAMPLE_INTERVAL)
+
+    def _wrap(self, name, function):
+        """
+            Creates a version of a function that is measured every time it is called.
+
+            Parameters:
+                name : string to record the function under
+                function : function to measure
+
+            Returns:
+                wrapper : function that measures and then calls the original function
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.measure(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def _enter(self, name):
+        """
+            Starts measuring a stage or function
+        """
+        memory = current_memory() if self.sampler is not None else 0
+        self.stack.append({'name': name, 'start_memory': memory, 'peak': memory,
+                           'wall': time.perf_counter(), 'cpu': time.process_time()})
+
+    def _exit(self):
+        """
+            Finishes measuring the innermost running stage or function and adds it to its totals
+        """
+        (wall, cpu) = (time.perf_counter(), time.process_time())
+        frame = self.stack.pop()
+        if self.sampler is not None:
+            frame['peak'] = max(frame['peak'], current_memory())
+
+        record = self.records.setdefault(frame['name'], {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                         'peak_memory_mb': None})
+        record['calls'] += 1
+        record['wall_seconds'] += wall - frame['wall']
+        record['cpu_seconds'] += cpu - frame['cpu']
+        if self.sampler is not None:
+            peak_memory_mb = (frame['peak'] - frame['start_memory']) / (1024 * 1024)
+            record['peak_memory_mb'] = max(record['peak_memory_mb'] or 0.0, peak_memory_mb)
+
+    def measure(self, name):
+        """
+            Measures everything run inside a with block and adds it to the totals recorded under a name.
+
+            Parameters:
+                name : string to record the block under, such as the name of a stage
+
+            Returns:
+                context manager
+        """
+        return _Measurement(self, name)
+
+    def write_report(self, report_file_path, station_name):
+        """
+            Writes every recorded total to a .json file, stages and functions each sorted from slowest to fastest.
+
+            Parameters:
+                report_file_path : string of path to save the report to
+                station_name : string of station that was profiled
+
+            Returns:
+                None
+        """
+        def rounded(records):
+            return {name: {'calls': record['calls'], 'wall_seconds': round(record['wall_seconds'], 4),
+                           'cpu_seconds': round(record['cpu_seconds'], 4),
+                           'peak_memory_mb': None if record['peak_memory_mb'] is None
+                           else round(record['peak_memory_mb'], 2)}
+                    for (name, record) in sorted(records.items(), key=lambda item: -item[1]['wall_seconds'])}
+
+        report = {'station': station_name,
+                  'started': self.started.strftime('%Y-%m-%d %H:%M:%S'),
+                  'finished': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                  'process_peak_memory_mb': None,
+                  'stages': rounded({name: record for (name, record) in self.records.items() if '.' not in name}),
+                  'functions': rounded({name: record for (name, record) in self.records.items() if '.' in name})}
+
+        if resource is not None:
+            # ru_maxrss is in kilobytes on linux but bytes on mac
+            peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            report['process_peak_memory_mb'] = round(peak_memory / (1024 * 1024 if sys.platform == 'darwin'
+                                                                    else 1024), 1)
+
+        with open(report_file_path, 'w') as report_file:
+            json.dump(report, report_file, indent=4)
+
+
+class _Measurement:
+    """
+        Context manager returned by Profiler.measure
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._exit()
+        return False
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
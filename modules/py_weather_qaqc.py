@@ -1,28 +1,69 @@
-import bokeh.plotting
-from bokeh.layouts import gridplot
-from bokeh.plotting import output_file, reset_output, save
+import contextlib
 import datetime as dt
+import functools
 from math import ceil
 import numpy as np
-import os
 import pandas as pd
-from . import data_functions, input_functions, plotting_functions, qaqc_functions
+from . import append_functions, cache_functions, checkpoint_functions, data_functions, fill_functions, flag_functions, \
+    input_functions, metadata_functions, output_functions, qaqc_functions, recipe_functions
 from refet.calcs import _wind_height_adjust
+import time
+import types
 import warnings
 
 
 class WeatherQAQC:
 
-    def __init__(self, config_file_path='config.ini', metadata_file_path=None, gridplot_columns=1):
+    def __init__(self, config_file_path='config.ini', metadata_file_path=None, gridplot_columns=1,
+                 recipe_file_path=None, use_checkpoints=True, checkpoint_file_path=None, profile=False,
+                 output_writer=None, parquet_dataset_path=None, netcdf_file_path=None, result_cache_path=None,
+                 result_cache_max_mb=None, append=False):
         self.config_path = config_file_path
         self.metadata_path = metadata_file_path
         self.gridplot_columns = gridplot_columns
+        self.recipe_path = recipe_file_path
+        self.parquet_dataset_path = parquet_dataset_path
+        self.netcdf_file_path = netcdf_file_path
+        # Same check as read_config does for the optional outputs turned on in the config file
+        output_functions.check_output_dependencies(parquet_dataset_path is not None, netcdf_file_path is not None)
+
+        # If profiling, the time and memory of every stage is written to a report next to the station log
+        self.profile = profile
+        self.profiler = None
+
+        # The run is saved here after every stage, and resumed from here if it was interrupted
+        if not use_checkpoints:
+            self.checkpoint_path = None
+        elif checkpoint_file_path is None:
+            self.checkpoint_path = checkpoint_functions.default_checkpoint_path(config_file_path, metadata_file_path)
+        else:
+            self.checkpoint_path = checkpoint_file_path
+        self.checkpoint_stage = None
+
+        # If an output_functions.OutputWriter is passed in, output files are handed to it to be written in the
+        # background and process_station returns without waiting for them, otherwise they are written right away
+        self.output_writer = output_writer
+
+        # If the plots are served, the session showing them stays open for as long as the user is correcting
+        self.plot_session = None
+
+        # A result cache passed in directly takes priority over the config file, and always turns the cache on
+        self.result_cache_path = result_cache_path
+        self.result_cache_max_mb = result_cache_max_mb
+        self.result_cache_key = None  # Key the station is cached under once it finishes, None if it isn't cached
+
+        # If appending, only the days after the end of the record the station was last processed with are read in,
+        # and added onto the state it was saved with, see append_functions
+        self.append = append
 
     def _obtain_data(self):
         """
             Obtain initial data and put it into a dataframe
         """
-        (self.data_df, self.column_df, self.metadata_df, self.metadata_series, self.config_dict) = \
+        # Output files last written before this are left over from earlier runs, whole seconds suit every file system
+        self.started = int(time.time())
+
+        (self.data_df, self.column_df, self.flag_df, self.metadata_df, self.metadata_series, self.config_dict) = \
             input_functions.obtain_data(self.config_path, self.metadata_path)
 
         # todo this individual assignment section is only temporary as the config_dict of input functions will be
@@ -35,11 +76,31 @@ class WeatherQAQC:
         self.ws_anemometer_height = self.config_dict['anemometer_height']
         self.missing_fill_value = self.config_dict['missing_fill_value']
         self.folder_path = self.config_dict['folder_path']
+        self.metadata_store_path = self.config_dict['metadata_store_path']
+
+        # Every random sample taken for this station comes from this generator, so a seeded run can be reproduced
+        self.rng = fill_functions.create_generator(self.config_dict['random_seed'])
 
         self.script_mode = self.config_dict['corr_flag']
         self.auto_mode = self.config_dict['auto_flag']
         self.fill_mode = self.config_dict['fill_flag']
         self.generate_bokeh = self.config_dict['plot_flag']
+        self.plot_options = {'max_points': self.config_dict['plot_max_points'],
+                             'output_backend': self.config_dict['plot_backend']}
+        self.plot_server = self.config_dict['plot_server_flag']
+        self.plot_server_port = self.config_dict['plot_server_port']
+
+        # A recipe passed in directly takes priority over one specified in the config file
+        if self.recipe_path is None and self.config_dict['recipe_file_path'] != '':
+            self.recipe_path = self.config_dict['recipe_file_path']
+
+        if self.recipe_path is not None:
+            # Recipes always correct the data, they just do it without prompting the user
+            self.recipe = recipe_functions.read_recipe(self.recipe_path)
+            self.script_mode = 1
+            print("\nSystem: Correction recipe successfully read, corrections will be applied without prompting.")
+        else:
+            self.recipe = None
 
         if self.script_mode == 1:  # correcting data
             self.mc_iterations = 1000  # Number of iters for MC simulation of thornton running solar radiation gen
@@ -64,7 +125,28 @@ class WeatherQAQC:
         self.data_ws = np.array(self.data_df.ws)
         self.data_precip = np.array(self.data_df.precip)
 
+        # QC flags of every variable, each QC action sets its own bit on the days it touched (see flag_functions)
+        self.qc_flags = {var: np.array(self.flag_df[var]) for var in self.flag_df.columns}
+        self.qc_flags['compiled_ea'] = flag_functions.create_flags(self.data_year.shape[0])
+
         self.output_file_path = self.folder_path + "/correction_files/" + self.station_name + "_output" + ".xlsx"
+        self.journal_file_path = self.folder_path + "/correction_files/" + self.station_name + \
+            "_correction_journal" + ".json"
+        self.state_file_path = append_functions.default_state_path(self.folder_path, self.station_name)
+
+        # A dataset passed in directly takes priority over the config file, and always turns Parquet output on
+        if self.parquet_dataset_path is None and self.config_dict['parquet_flag']:
+            if self.config_dict['parquet_dataset_path'] != '':
+                self.parquet_dataset_path = self.config_dict['parquet_dataset_path']
+            else:
+                self.parquet_dataset_path = self.folder_path + "/correction_files/" + self.station_name + "_parquet"
+
+        # Same for the NetCDF cube, which is shared by every station in the folder unless another file is given
+        if self.netcdf_file_path is None and self.config_dict['netcdf_flag']:
+            if self.config_dict['netcdf_file_path'] != '':
+                self.netcdf_file_path = self.config_dict['netcdf_file_path']
+            else:
+                self.netcdf_file_path = self.folder_path + "/correction_files/station_cube.nc"
 
     def _calculate_secondary_vars(self):
         """
@@ -152,7 +234,9 @@ class WeatherQAQC:
         # Back up original data
         # Original data will be saved to output file
         # Values are also used to generate delta values of corrected data - original data
-        self.original_df = self.data_df.copy(deep=True)  # Create an unlinked copy of read-in values dataframe
+        # All of the data arrays above are unlinked copies of data_df's columns, so data_df itself is never modified
+        # by correction and can be used as the record of original values without making another copy of it
+        self.original_df = self.data_df
         self.original_df['rso'] = self.rso
         self.original_df['etr'] = self.etr
         self.original_df['eto'] = self.eto
@@ -167,6 +251,20 @@ class WeatherQAQC:
         self.data_null = np.empty(self.data_length) * np.nan
         self.mm_data_null = np.zeros(12) * np.nan
 
+    def _start_correction(self):
+        """
+            Sets up everything that is tracked while correcting, before any corrections are made
+        """
+        # create a flag to check if composite ea has been adjusted or not before correcting solar radiation
+        self.humidity_adjusted = False
+        self._start_complete_records(self)
+
+        # Every accepted correction is recorded here so the whole session can be replayed on a fresh ingest
+        self.journal = []
+        self.corrected_options = []  # Menu options applied, which decides what is filled on any appended days
+        self.corrections_applied = 0
+        self.corrections_finished = False
+
     def _correct_data(self):
         """
             Correct data
@@ -176,31 +274,42 @@ class WeatherQAQC:
         # Loop where user selects an option, corrects it, script recalculates, and then loops.
         # If user opts to not correct data (sets script_mode = 0),
         # then skips this section and just generates composite plot
-        if self.script_mode == 1:
+        if self.checkpoint_stage == 'correction':
+            print("\nSystem: Resuming correction on data after {} corrections.".format(self.corrections_applied))
+        elif self.script_mode == 1:
             print("\nSystem: Now beginning correction on data.")
         else:
             print("\nSystem: Skipping data correction and plotting raw data.")
 
-        # create a flag to check if composite ea has been adjusted or not before correcting solar radiation
-        self.humidity_adjusted = False
-
-        # Complete_vars are going to be filled for the whole record, which may be put into output file if user requests
-        self.complete_tmax = np.array(self.data_tmax)
-        self.complete_tmin = np.array(self.data_tmin)
-        self.complete_ea = np.array(self.compiled_ea)
-        self.complete_tdew = np.array(self.data_tdew)
-
-        # Create arrays that will track which values have been filled (replace missing data) by the script
-        self.fill_tmax = np.zeros(self.data_length)
-        self.fill_tmin = np.zeros(self.data_length)
-        self.fill_ea = np.zeros(self.data_length)
-        self.fill_tdew = np.zeros(self.data_length)
-        self.fill_rs = np.zeros(self.data_length)
-        self.fill_ws = np.zeros(self.data_length)
-        self.fill_rso = np.zeros(self.data_length)
+        # Headless mode, every step of the recipe is run in order without prompting the user
+        if self.recipe is not None:
+            # Steps already applied before a checkpoint are skipped
+            for recipe_step in self.recipe[self.corrections_applied:]:
+                self._check_option_provided(recipe_step['option'])
+                self._apply_correction_option(recipe_step['option'], recipe_step['operations'])
+                self.corrections_applied += 1
+                self._save_checkpoint('correction')
+
+            print('\nSystem: Now finishing up corrections.')
+
+            # Recipes that came from a journal carry checksums, report any operations that no longer produce the same
+            # values, which happens when the underlying data has changed since the journal was written
+            checked_operations = [operation for recipe_step in self.recipe for operation in recipe_step['operations']
+                                  if 'checksum_matched' in operation]
+            if len(checked_operations) > 0:
+                mismatched = len([operation for operation in checked_operations if not operation['checksum_matched']])
+                print('\nSystem: Journal replay finished, {0} of {1} operations no longer match their checksums.'
+                      .format(mismatched, len(checked_operations)))
+
+        # The plots of every variable corrected are shown in the same browser tab, see session_functions
+        if self.script_mode == 1 and self.recipe is None and not self.corrections_finished and self.plot_server:
+            from . import session_functions  # Imports bokeh, so only imported once the user is correcting data
+            self.plot_session = session_functions.CorrectionSession(self.plot_server_port)
+            self.plot_session.start()
 
         # Begin loop for correcting variables
-        while self.script_mode == 1:
+        while self.script_mode == 1 and self.recipe is None and not self.corrections_finished:
+            from bokeh.plotting import reset_output  # Only imported once the user is correcting data, it is slow
             reset_output()  # clears bokeh output, prevents ballooning file sizes
             print('\nPlease select which of the following variables you want to correct'
                   '\n   Enter 1 for TMax and TMin.'
@@ -263,68 +372,7 @@ class WeatherQAQC:
                     print('\nPlease enter a valid option.')
                     user = int(input('Specify which variable you would like to correct: '))
 
-            ##########
-            # Correcting individual variables based on user choice
-            # Correcting Max/Min Temperature data
-            if user == 1:
-                (self.data_tmax, self.data_tmin) = qaqc_functions.\
-                    correction(self.station_name, self.log_file, self.folder_path,
-                               self.data_tmax, self.data_tmin, self.dt_array,
-                               self.data_month, self.data_year, 1, self.auto_mode)
-            # Correcting Min/Dew Temperature data
-            elif user == 2:
-                (self.data_tmin, self.data_tdew) = qaqc_functions.\
-                    correction(self.station_name, self.log_file, self.folder_path,
-                               self.data_tmin, self.data_tdew, self.dt_array,
-                               self.data_month, self.data_year, 2, self.auto_mode)
-            # Correcting Windspeed
-            elif user == 3:
-                (self.data_ws, self.data_null) = qaqc_functions.\
-                    correction(self.station_name, self.log_file, self.folder_path,
-                               self.data_ws, self.data_null, self.dt_array,
-                               self.data_month, self.data_year, 3, self.auto_mode)
-            # Correcting Precipitation
-            elif user == 4:
-                (self.data_precip, self.data_null) = qaqc_functions.\
-                    correction(self.station_name, self.log_file, self.folder_path,
-                               self.data_precip, self.data_null, self.dt_array,
-                               self.data_month, self.data_year, 4, self.auto_mode)
-            # Correcting Solar radiation
-            elif user == 5:
-                (self.data_rs, self.data_null) = qaqc_functions.\
-                    correction(self.station_name, self.log_file, self.folder_path,
-                               self.data_rs, self.rso, self.dt_array,
-                               self.data_month, self.data_year, 5, self.auto_mode)
-            # Correcting Vapor Pressure
-            elif user == 6:
-                (self.data_ea, self.data_null) = qaqc_functions.\
-                    correction(self.station_name, self.log_file, self.folder_path,
-                               self.data_ea, self.data_null, self.dt_array,
-                               self.data_month, self.data_year, 7, self.auto_mode)
-            # Correcting Relative Humidity Max and Min
-            elif user == 7:
-                (self.data_rhmax, self.data_rhmin) = qaqc_functions.\
-                    correction(self.station_name, self.log_file, self.folder_path,
-                               self.data_rhmax, self.data_rhmin, self.dt_array,
-                               self.data_month, self.data_year, 8, self.auto_mode)
-            # Correcting Relative Humidity Average
-            elif user == 8:
-                (self.data_rhavg, self.data_null) = qaqc_functions.\
-                    correction(self.station_name, self.log_file, self.folder_path,
-                               self.data_rhavg, self.data_null, self.dt_array,
-                               self.data_month, self.data_year, 9, self.auto_mode)
-            # Adjusting compiled_ea
-            elif user == 9:
-                self.compiled_ea = qaqc_functions.\
-                    compiled_humidity_adjustment(self.station_name, self.log_file, self.folder_path, self.dt_array,
-                                                 self.data_tmax, self.data_tmin, self.data_tavg, self.compiled_ea,
-                                                 self.data_ea, self.column_df.ea, self.data_tdew, self.column_df.tdew,
-                                                 self.data_tdew_ko, self.data_rhmax, self.column_df.rhmax,
-                                                 self.data_rhmin, self.column_df.rhmin,
-                                                 self.data_rhavg, self.column_df.rhavg)
-
-                self.humidity_adjusted = True
-            else:
+            if user == 0:
                 # todo make this more explicit and handle user input that isnt strictly int without breaking
                 # user quits, exit out of loop
                 print('\nSystem: Now finishing up corrections.')
@@ -332,229 +380,22 @@ class WeatherQAQC:
                 # also we break as opposed to setting script_mode to 0 because it is used later in the program
                 break
 
-            if 1 <= user <= 2 or 6 <= user <= 8:
-                if user == 1:  # User has corrected temperature, so fill all missing values with a normal distribution
-
-                    # Reset 'complete' vars as the underlying var has been changed.
-                    self.complete_tmax = np.array(self.data_tmax)
-                    self.complete_tmin = np.array(self.data_tmin)
-
-                    # Remove corresponding TAvg observations after outliers have been removed from TMax and TMin
-                    tmax_removed_indices = np.array(np.where(np.isnan(self.data_tmax)))  # array of indices of nans
-                    tmin_removed_indices = np.array(np.where(np.isnan(self.data_tmin)))  # array of indices of nans
-                    self.data_tavg[tmax_removed_indices] = np.nan
-                    self.data_tavg[tmin_removed_indices] = np.nan
-
-                    # Create mean monthly and standard deviation
-                    self.mm_tmax = np.zeros(12)
-                    self.mm_tmin = np.zeros(12)
-                    self.std_tmax = np.zeros(12)
-                    self.std_tmin = np.zeros(12)
-
-                    for k in range(12):
-                        temp_indexes = np.where(self.data_month == k+1)[0]
-                        temp_indexes = np.array(temp_indexes, dtype=int)
-                        self.mm_tmax[k] = np.nanmean(self.data_tmax[temp_indexes])
-                        self.std_tmax[k] = np.nanstd(self.data_tmax[temp_indexes])
-                        self.mm_tmin[k] = np.nanmean(self.data_tmin[temp_indexes])
-                        self.std_tmin[k] = np.nanstd(self.data_tmin[temp_indexes])
-
-                    # Fill missing observations with samples from a normal distribution with monthly mean and variance
-                    for i in range(self.data_length):
-                        if np.isnan(self.data_tmax[i]):
-                            self.complete_tmax[i] = np.random.normal(self.mm_tmax[self.data_month[i] - 1],
-                                                                     self.std_tmax[self.data_month[i] - 1], 1)
-                            self.fill_tmax[i] = self.complete_tmax[i]
-                        else:
-                            pass
-
-                        if np.isnan(self.data_tmin[i]):
-                            self.complete_tmin[i] = np.random.normal(self.mm_tmin[self.data_month[i] - 1],
-                                                                     self.std_tmin[self.data_month[i] - 1], 1)
-                            self.fill_tmin[i] = self.complete_tmin[i]
-                        else:
-                            pass
-
-                        if (self.complete_tmax[i] <= self.complete_tmin[i]) or \
-                                (self.complete_tmax[i] - self.complete_tmin[i] <= 3):
-                            # This is a logical check to make sure that tmax is sufficiently distant from tmin once
-                            # they have been filled in, tmax needs to be warmer than tmin and daily temp isn't constant
-                            # so there should be at least a small difference in tmax-tmin
-
-                            # todo the below lines always provide a higher than average tmax
-                            #   and a lower than average tmin, this can be improved
-                            # Fill this observation in with  mm observation with the difference of 1/2 of mm delta t
-                            self.complete_tmax[i] = self.mm_tmax[self.data_month[i] - 1] + \
-                                                    (0.5 * self.mm_delta_t[self.data_month[i] - 1])
-                            self.fill_tmax[i] = self.complete_tmax[i]
-
-                            self.complete_tmin[i] = self.mm_tmin[self.data_month[i] - 1] - \
-                                (0.5 * self.mm_delta_t[self.data_month[i] - 1])
-                            self.fill_tmin[i] = self.complete_tmin[i]
-                        else:
-                            # data is different enough to appear valid
-                            pass
-
-                    if self.fill_mode:
-                        # we are filling in data, so copy all of the filled versions onto the original temperature
-                        self.data_tmax = np.array(self.complete_tmax)
-                        self.data_tmin = np.array(self.complete_tmin)
-                    else:
-                        # if we are not filling, we will hold the copies to later fill in rso, but will reset fill
-                        # tracking variables
-                        self.fill_tmax = np.zeros(self.data_length)
-                        self.fill_tmin = np.zeros(self.data_length)
-                else:
-                    # user did not correct option 1
-                    pass
-
-                # Figure out which humidity variables are provided and recalculate Ea and TDew if needed
-                # This function is safe to use after correcting because it tracks what variable was provided by the data
-                # and recalculates appropriately. It doesn't overwrite provided variables with calculated versions.
-                # Ex. if only TDew is provided, it recalculates ea while returning original provided tdew
-                (self.data_ea, self.data_tdew) = data_functions.\
-                    calc_humidity_variables(self.data_tmax, self.data_tmin, self.data_tavg, self.data_ea,
-                                            self.column_df.ea, self.data_tdew, self.column_df.tdew,
-                                            self.data_rhmax, self.column_df.rhmax, self.data_rhmin,
-                                            self.column_df.rhmin, self.data_rhavg, self.column_df.rhavg)
-
-                # Recalculates secondary temperature values and mean monthly counterparts
-                (self.delta_t, self.mm_delta_t, self.k_not, self.mm_k_not, self.mm_tmin, self.mm_tdew) = \
-                    data_functions.calc_temperature_variables(self.data_month, self.data_tmax,
-                                                              self.data_tmin, self.data_tdew)
-
-                # Since we are recalculating humidity variables, we also need to reset tdew_ko to ensure it matches the
-                # underlying unfilled tdew. It is filled later after this once the user corrects a humidity var
-                # so this reset is acceptable
-                self.data_tdew_ko = np.array(self.data_tdew)
-
-                if user == 2 or 6 <= user <= 8:
-
-                    # Reset 'complete' version as underlying variable may have changed
-                    self.complete_tdew = np.array(self.data_tdew)
-                    '''
-                        Fill in any missing tdew data with tmin - k0 curve.
-                        
-                        As detailed above, data_tdew_ko only fills in missing tdew observations with real tmin obs,
-                        while complete_tdew is a full record filled in using a filled in tmin.
-                        
-                        Nothing occurs if this fill code is run a second time because vars are already filled unless
-                        correction methods throw out data, in which case we need to refill for the complete record
-                        that Rs correction requires.
-                    '''
-                    for i in range(self.data_length):
-                        if np.isnan(self.data_tdew[i]):
-
-                            # Tdew_ko will have gaps that match gaps in Tmin
-                            # Complete_tdew will match complete_tmin in having no gaps
-                            self.data_tdew_ko[i] = self.data_tmin[i] - self.mm_k_not[self.data_month[i] - 1]
-                            self.complete_tdew[i] = self.complete_tmin[i] - self.mm_k_not[self.data_month[i] - 1]
-                            self.fill_tdew[i] = self.complete_tdew[i]
-                        else:
-                            # If TDew isn't empty then nothing is required to be done.
-                            pass
-
-                    if self.fill_mode:
-                        # we are filling in data, so copy all of the filled versions onto the original arrays
-                        self.data_tdew = np.array(self.complete_tdew)
-                    else:
-                        # if we are not filling, we will hold the copies to later fill in rso, but will reset fill
-                        # tracking variables
-                        self.fill_tdew = np.zeros(self.data_length)
-                else:
-                    # user did not select option 2 or 6-8
-                    pass
-
-                '''
-                    Recreate the 'compiled' ea as temperature or humidity vars were corrected and may have changed the
-                    data underlying the compiled ea. Once that is done we will fill in all the gaps with the 
-                    variable 'complete_tdew' so that a complete record of ea exists for rs correction
-                    
-                    The gaps in compiled_ea are reset every time temperature or humidity is corrected so this code is 
-                    okay to run multiple times
-                '''
-                self.compiled_ea = data_functions.compile_ea(self.data_tmax, self.data_tmin, self.data_tavg,
-                                                             self.data_ea, self.data_tdew, self.column_df.tdew,
-                                                             self.data_rhmax, self.column_df.rhmax, self.data_rhmin,
-                                                             self.column_df.rhmin, self.data_rhavg,
-                                                             self.column_df.rhavg, self.data_tdew_ko)
-
-                # Reset 'complete' version as underlying variable may have changed.
-                self.complete_ea = np.array(self.compiled_ea)
-
-                for i in range(self.data_length):
-                    if np.isnan(self.compiled_ea[i]):
-                        self.complete_ea[i] = (0.6108 * np.exp((17.27 * self.complete_tdew[i]) / (self.complete_tdew[i]
-                                                                                                  + 237.3)))
-                        self.fill_ea[i] = self.complete_ea[i]
-                else:
-                    # Ea is provided and the index is not empty, do nothing to avoid overwriting actual data
-                    pass
+            self._apply_correction_option(user)
+            self.corrections_applied += 1
+            self._save_checkpoint('correction')
 
-                if self.fill_mode:
-                    # we are filling in data, so copy all of the filled versions onto the original arrays
-                    self.data_ea = np.array(self.complete_ea)
-                    self.compiled_ea = np.array(self.complete_ea)
-                else:
-                    # if we are not filling, we will hold the copies to later fill in rso, but will reset fill
-                    # tracking variables
-                    self.fill_ea = np.zeros(self.data_length)
-
-            elif user == 9:  # User has adjusted how the compiled humidity is sourced, recreate complete_ea
-                self.complete_ea = np.array(self.compiled_ea)
-
-                for i in range(self.data_length):
-                    if np.isnan(self.compiled_ea[i]):
-                        self.complete_ea[i] = (0.6108 * np.exp((17.27 * self.complete_tdew[i]) /
-                                                               (self.complete_tdew[i] + 237.3)))
-                        self.fill_ea[i] = self.complete_ea[i]
-                else:
-                    # the index is not empty, do nothing to avoid overwriting actual data
-                    pass
+        if self.plot_session is not None:
+            self.plot_session.close()
+            self.plot_session = None
 
-                if self.fill_mode:
-                    # we are filling in data, so copy all of the filled versions onto the original arrays
-                    self.data_ea = np.array(self.complete_ea)
-                    self.compiled_ea = np.array(self.complete_ea)
-                else:
-                    # if we are not filling, we will hold the copies to later fill in rso, but will reset fill
-                    # tracking variables
-                    self.fill_ea = np.zeros(self.data_length)
-            else:
-                # user did not select options 1,2, 6, 7, 8, or 9.
-                pass
+        # Saved so that a run interrupted after this point does not ask the user to finish correcting again
+        self.corrections_finished = True
+        self._save_checkpoint('correction')
 
-            '''
-                Even if the user doesn't want to put filled data into their output file, we still need to use complete
-                records to get a complete record of Rso for use in Rs correction. This completed rso is only used for 
-                this step and is not written as data to the output file
-            '''
-            if self.fill_mode:
-                '''                  
-                    This recalculates Rso and ETr values using the filled 'completed_' versions to provide a complete
-                    record of ETr values.
-                    
-                    If this code is executing then 'data_' vars have already been replaced by their 'completed_' 
-                    versions so the code is accurate in calling them 'data_'
-                '''
-                warnings.filterwarnings('ignore', 'invalid value encountered')  # catch invalid value warning, nans
-                (self.rso, self.mm_rs, self.eto, self.etr, self.mm_eto, self.mm_etr) = data_functions. \
-                    calc_rso_and_refet(self.station_lat, self.station_elev, self.ws_anemometer_height, self.data_doy,
-                                       self.data_month, self.data_tmax, self.data_tmin, self.data_ea, self.data_ws,
-                                       self.data_rs)
-                warnings.resetwarnings()
-            else:
-                '''
-                    User doesn't want to keep filled in data, so use complete versions to create a filled version of
-                    rso while saving the other outputs of calc_rso_and_refet as temporary names which are unused to 
-                    prevent them from impacting later calculations
-                '''
-                warnings.filterwarnings('ignore', 'invalid value encountered')  # catch invalid value warning, nans
-                (self.rso, self._mm_rs, self._eto, self._etr, self._mm_eto, self._mm_etr) = \
-                    data_functions.calc_rso_and_refet(self.station_lat, self.station_elev, self.ws_anemometer_height,
-                                                      self.data_doy, self.data_month, self.complete_tmax,
-                                                      self.complete_tmin, self.complete_ea, self.data_ws, self.data_rs)
-                warnings.resetwarnings()
+        if self.script_mode == 1:
+            recipe_functions.write_journal(self.journal_file_path, self.station_name, self.journal)
+            print('\nSystem: Correction journal saved to {}, it can be passed back in as a recipe to replay it.'
+                  .format(self.journal_file_path))
 
         '''
             At this point the user has finished correcting all variables they want to.
@@ -570,62 +411,365 @@ class WeatherQAQC:
             Radiation correction with one using only real data.
         '''
 
-        (self.orig_rs_tr, self.mm_orig_rs_tr, self.opt_rs_tr, self.mm_opt_rs_tr) = data_functions. \
-            calc_org_and_opt_rs_tr(self.mc_iterations, self.log_file, self.data_month, self.delta_t, self.mm_delta_t,
-                                   self.data_rs, self.rso)
+        (self.orig_rs_tr, self.mm_orig_rs_tr, self.opt_rs_tr, self.mm_opt_rs_tr, self.opt_coefficients) = \
+            data_functions.calc_org_and_opt_rs_tr(self.mc_iterations, self.log_file, self.data_month, self.delta_t,
+                                                  self.mm_delta_t, self.data_rs, self.rso, self.rng)
+        self._save_checkpoint('rs_tr')
+
+    def _fill_data(self):
+        """
+            Fills solar radiation and wind speed and does the final calculation of Rso and ETr
+        """
 
         # todo this section of code is out of place, currently we are not filling data but it could be situated better
         if self.script_mode == 1:
-            self.mm_ws = np.zeros(12)
-            self.std_ws = np.zeros(12)
-            for k in range(12):
-                temp_indexes = np.where(self.data_month == k + 1)[0]
-                temp_indexes = np.array(temp_indexes, dtype=int)
-                self.mm_ws[k] = np.nanmean(self.data_ws[temp_indexes])
-                self.std_ws[k] = np.nanmean(self.data_ws[temp_indexes])
+            (self.rso, self.mm_rs, self.eto, self.etr, self.mm_eto, self.mm_etr) = \
+                self._fill_solar_radiation_and_wind(self)
+        else:
+            # script_mode == 0 so we are not correcting data and we do not generate filled versions or need to recalc
+            # secondary vars
+            pass
 
-            if self.fill_mode:
-                for i in range(self.data_length):
-                    # fill data_rs with rs_tr and data_ws with an exponential function centered on mm_ws for that month
-                    if np.isnan(self.data_rs[i]):
-                        self.data_rs[i] = self.opt_rs_tr[i]
-                        self.fill_rs[i] = self.opt_rs_tr[i]
-                    else:
-                        # If rs isn't empty then nothing is required to be done.
-                        pass
-                    if np.isnan(self.data_ws[i]):
-                        self.data_ws[i] = np.random.normal(self.mm_ws[self.data_month[i] - 1],
-                                                           self.std_ws[self.data_month[i] - 1], 1)
+    def _check_option_provided(self, user):
+        """
+            Raises an error if a recipe step asks to correct a variable that was not provided by the data file
+        """
+        if user == 2 and self.column_df.tdew == -1:
+            raise ValueError('Recipe asked to correct dewpoint temperature, but it was not provided by the file.')
+        elif user == 6 and self.column_df.ea == -1:
+            raise ValueError('Recipe asked to correct vapor pressure, but it was not provided by the file.')
+        elif user == 7 and (self.column_df.rhmax == -1 or self.column_df.rhmin == -1):
+            raise ValueError('Recipe asked to correct RHMax and RHMin, but they were not provided by the file.')
+        elif user == 8 and self.column_df.rhavg == -1:
+            raise ValueError('Recipe asked to correct RHAvg, but it was not provided by the file.')
+        else:
+            pass
 
-                        if self.data_ws[i] < 0.2:  # check to see if filled windspeed is lower than reasonable
-                            self.data_ws[i] = 0.2
-                        else:
-                            pass
+    def _apply_correction_option(self, user, recipe_operations=None):
+        """
+            Corrects the variable selected from the correction menu, then recalculates everything that depends on it.
+            If recipe operations are passed then the correction is done without prompting the user.
+        """
+        ##########
+        # Correcting individual variables based on user choice
+        # Correcting Max/Min Temperature data
+        if user == 1:
+            (self.data_tmax, self.data_tmin) = qaqc_functions.\
+                correction(self.station_name, self.log_file, self.folder_path,
+                           self.data_tmax, self.data_tmin, self.dt_array,
+                           self.data_month, self.data_year, 1, self.auto_mode,
+                           recipe_operations, self.journal, [self.qc_flags['tmax'], self.qc_flags['tmin']],
+                           plot_options=self.plot_options, session=self.plot_session, recipe_plots=self.generate_bokeh)
+        # Correcting Min/Dew Temperature data
+        elif user == 2:
+            (self.data_tmin, self.data_tdew) = qaqc_functions.\
+                correction(self.station_name, self.log_file, self.folder_path,
+                           self.data_tmin, self.data_tdew, self.dt_array,
+                           self.data_month, self.data_year, 2, self.auto_mode,
+                           recipe_operations, self.journal, [self.qc_flags['tmin'], self.qc_flags['tdew']],
+                           plot_options=self.plot_options, session=self.plot_session, recipe_plots=self.generate_bokeh)
+        # Correcting Windspeed
+        elif user == 3:
+            (self.data_ws, self.data_null) = qaqc_functions.\
+                correction(self.station_name, self.log_file, self.folder_path,
+                           self.data_ws, self.data_null, self.dt_array,
+                           self.data_month, self.data_year, 3, self.auto_mode,
+                           recipe_operations, self.journal, [self.qc_flags['ws'], None],
+                           plot_options=self.plot_options, session=self.plot_session, recipe_plots=self.generate_bokeh)
+        # Correcting Precipitation
+        elif user == 4:
+            (self.data_precip, self.data_null) = qaqc_functions.\
+                correction(self.station_name, self.log_file, self.folder_path,
+                           self.data_precip, self.data_null, self.dt_array,
+                           self.data_month, self.data_year, 4, self.auto_mode,
+                           recipe_operations, self.journal, [self.qc_flags['precip'], None],
+                           plot_options=self.plot_options, session=self.plot_session, recipe_plots=self.generate_bokeh)
+        # Correcting Solar radiation
+        elif user == 5:
+            (self.data_rs, self.data_null) = qaqc_functions.\
+                correction(self.station_name, self.log_file, self.folder_path,
+                           self.data_rs, self.rso, self.dt_array,
+                           self.data_month, self.data_year, 5, self.auto_mode,
+                           recipe_operations, self.journal, [self.qc_flags['rs'], None],
+                           plot_options=self.plot_options, session=self.plot_session, recipe_plots=self.generate_bokeh)
+        # Correcting Vapor Pressure
+        elif user == 6:
+            (self.data_ea, self.data_null) = qaqc_functions.\
+                correction(self.station_name, self.log_file, self.folder_path,
+                           self.data_ea, self.data_null, self.dt_array,
+                           self.data_month, self.data_year, 7, self.auto_mode,
+                           recipe_operations, self.journal, [self.qc_flags['ea'], None],
+                           plot_options=self.plot_options, session=self.plot_session, recipe_plots=self.generate_bokeh)
+        # Correcting Relative Humidity Max and Min
+        elif user == 7:
+            (self.data_rhmax, self.data_rhmin) = qaqc_functions.\
+                correction(self.station_name, self.log_file, self.folder_path,
+                           self.data_rhmax, self.data_rhmin, self.dt_array,
+                           self.data_month, self.data_year, 8, self.auto_mode,
+                           recipe_operations, self.journal, [self.qc_flags['rhmax'], self.qc_flags['rhmin']],
+                           plot_options=self.plot_options, session=self.plot_session, recipe_plots=self.generate_bokeh)
+        # Correcting Relative Humidity Average
+        elif user == 8:
+            (self.data_rhavg, self.data_null) = qaqc_functions.\
+                correction(self.station_name, self.log_file, self.folder_path,
+                           self.data_rhavg, self.data_null, self.dt_array,
+                           self.data_month, self.data_year, 9, self.auto_mode,
+                           recipe_operations, self.journal, [self.qc_flags['rhavg'], None],
+                           plot_options=self.plot_options, session=self.plot_session, recipe_plots=self.generate_bokeh)
+        # Adjusting compiled_ea
+        elif user == 9:
+            self.compiled_ea = qaqc_functions.\
+                compiled_humidity_adjustment(self.station_name, self.log_file, self.folder_path, self.dt_array,
+                                             self.data_tmax, self.data_tmin, self.data_tavg, self.compiled_ea,
+                                             self.data_ea, self.column_df.ea, self.data_tdew, self.column_df.tdew,
+                                             self.data_tdew_ko, self.data_rhmax, self.column_df.rhmax,
+                                             self.data_rhmin, self.column_df.rhmin,
+                                             self.data_rhavg, self.column_df.rhavg, recipe_operations,
+                                             self.journal, self.qc_flags['compiled_ea'], self.plot_options,
+                                             self.plot_session)
+
+            self.humidity_adjusted = True
+        else:
+            # Shouldn't happen, the menu loop only passes valid options through
+            raise ValueError('Unsupported correction option {} passed to _apply_correction_option.'.format(user))
 
-                        self.fill_ws[i] = self.data_ws[i]
-                    else:
-                        # If ws isn't empty then nothing is required to be done.
-                        pass
+        if 1 <= user <= 2 or 6 <= user <= 8:
+            if user == 1:  # User has corrected temperature, so fill all missing values with a normal distribution
+                self._fill_temperature(self)
             else:
+                # user did not correct option 1
                 pass
 
-            # Recalculate eto and etr one final time
-            # This also overwrites the filled Rso, so we will create a copy for posterity
-            self.fill_rso = np.array(self.rso)
+            # Dewpoint is only filled once the user corrects a humidity variable
+            self._recalculate_humidity(self, fill_tdew=(user == 2 or 6 <= user <= 8))
+            self._fill_vapor_pressure(self)
 
-            (self.rso, self.mm_rs, self.eto, self.etr, self.mm_eto, self.mm_etr) = data_functions. \
-                calc_rso_and_refet(self.station_lat, self.station_elev, self.ws_anemometer_height, self.data_doy,
-                                   self.data_month, self.data_tmax, self.data_tmin, self.compiled_ea,
-                                   self.data_ws, self.data_rs)
+        elif user == 9:  # User has adjusted how the compiled humidity is sourced, recreate complete_ea
+            self._fill_vapor_pressure(self)
         else:
-            # script_mode == 0 so we are not correcting data and we do not generate filled versions or need to recalc
-            # secondary vars
+            # user did not select options 1,2, 6, 7, 8, or 9.
             pass
 
+        refet = self._recalculate_rso(self)
+        if self.fill_mode:
+            (self.rso, self.mm_rs, self.eto, self.etr, self.mm_eto, self.mm_etr) = refet
+        else:
+            '''
+                User doesn't want to keep filled in data, so the outputs of calc_rso_and_refet other than the filled 
+                version of rso are saved as temporary names which are unused to prevent them from impacting later 
+                calculations
+            '''
+            (self.rso, self._mm_rs, self._eto, self._etr, self._mm_eto, self._mm_etr) = refet
+
+        self.corrected_options.append(user)
+
+    def _days_before(self, days):
+        """
+            Number of days of the record that come before days, none if days is the whole record
+        """
+        return 0 if days is self else self.data_length
+
+    def _start_complete_records(self, days):
+        """
+            Copies the arrays of days that are going to be filled into their complete versions
+        """
+        # Complete_vars are going to be filled for the whole record, which may be put into output file if user requests
+        days.complete_tmax = np.array(days.data_tmax)
+        days.complete_tmin = np.array(days.data_tmin)
+        days.complete_ea = np.array(days.compiled_ea)
+        days.complete_tdew = np.array(days.data_tdew)
+
+        # Values filled in by the script are tracked with the FILLED bit of the QC flags, except for the complete
+        # record of Rso, which is created after all corrections are finished
+        days.complete_rso = np.zeros(days.data_tmax.shape[0])
+
+    def _refet(self, days, tmax, tmin, ea):
+        """
+            Calculates Rso and reference ET of days, ignoring the warnings raised by missing values and by months
+            without any days
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return data_functions.calc_rso_and_refet(self.station_lat, self.station_elev, self.ws_anemometer_height,
+                                                     days.data_doy, days.data_month, tmax, tmin, ea, days.data_ws,
+                                                     days.data_rs)
+
+    def _fill_temperature(self, days):
+        """
+            Fills the gaps in temperature of days, which are either the whole record or days appended after it
+        """
+        # Remove corresponding TAvg observations after outliers have been removed from TMax and TMin
+        days.data_tavg[np.isnan(days.data_tmax) | np.isnan(days.data_tmin)] = np.nan
+
+        # Reset 'complete' vars as the underlying var has been changed, filling missing observations with
+        # samples from a normal distribution with monthly mean and variance. Appended days are filled from the
+        # distributions of the whole record, but only their own gaps are filled
+        start = self._days_before(days)
+        (complete_tmax, complete_tmin) = fill_functions.\
+            fill_temperature(self.rng, np.concatenate([self.data_month[:start], days.data_month]),
+                             np.concatenate([self.complete_tmax[:start], days.data_tmax]),
+                             np.concatenate([self.complete_tmin[:start], days.data_tmin]), self.mm_delta_t)
+        days.complete_tmax = complete_tmax[start:]
+        days.complete_tmin = complete_tmin[start:]
+
+        if self.fill_mode:
+            # we are filling in data, so flag and copy all of the filled versions onto the original temperature
+            flag_functions.flag_changed(days.qc_flags['tmax'], days.data_tmax, days.complete_tmax,
+                                        flag_functions.FILLED)
+            flag_functions.flag_changed(days.qc_flags['tmin'], days.data_tmin, days.complete_tmin,
+                                        flag_functions.FILLED)
+            days.data_tmax = np.array(days.complete_tmax)
+            days.data_tmin = np.array(days.complete_tmin)
+        else:
+            # if we are not filling, we will hold the copies to later fill in rso, but nothing is flagged
+            pass
+
+    def _recalculate_humidity(self, days, fill_tdew=False):
+        """
+            Recalculates the humidity variables and compiled ea of days after temperature or humidity has changed,
+            optionally filling dewpoint first
+        """
+        # Figure out which humidity variables are provided and recalculate Ea and TDew if needed
+        # This function is safe to use after correcting because it tracks what variable was provided by the data
+        # and recalculates appropriately. It doesn't overwrite provided variables with calculated versions.
+        # Ex. if only TDew is provided, it recalculates ea while returning original provided tdew
+        (days.data_ea, days.data_tdew) = data_functions.\
+            calc_humidity_variables(days.data_tmax, days.data_tmin, days.data_tavg, days.data_ea,
+                                    self.column_df.ea, days.data_tdew, self.column_df.tdew,
+                                    days.data_rhmax, self.column_df.rhmax, days.data_rhmin,
+                                    self.column_df.rhmin, days.data_rhavg, self.column_df.rhavg)
+
+        if days is self:
+            # Recalculates secondary temperature values and mean monthly counterparts, appended days keep the monthly
+            # means of the record
+            (self.delta_t, self.mm_delta_t, self.k_not, self.mm_k_not, self.mm_tmin, self.mm_tdew) = \
+                data_functions.calc_temperature_variables(self.data_month, self.data_tmax,
+                                                          self.data_tmin, self.data_tdew)
+
+        # Since we are recalculating humidity variables, we also need to reset tdew_ko to ensure it matches the
+        # underlying unfilled tdew. It is filled later after this once the user corrects a humidity var
+        # so this reset is acceptable
+        days.data_tdew_ko = np.array(days.data_tdew)
+
+        if fill_tdew:
+            '''
+                Fill in any missing tdew data with tmin - k0 curve.
+
+                As detailed above, data_tdew_ko only fills in missing tdew observations with real tmin obs,
+                while complete_tdew is a full record filled in using a filled in tmin.
+
+                Nothing occurs if this fill code is run a second time because vars are already filled unless
+                correction methods throw out data, in which case we need to refill for the complete record
+                that Rs correction requires.
+
+                Tdew_ko will have gaps that match gaps in Tmin, complete_tdew will match complete_tmin in having
+                no gaps. Both are reset as the underlying variable may have changed.
+            '''
+            (days.data_tdew_ko, days.complete_tdew) = fill_functions.\
+                fill_dewpoint(days.data_month, days.data_tdew, days.data_tmin, days.complete_tmin, self.mm_k_not)
+
+            if self.fill_mode:
+                # we are filling in data, so flag and copy all of the filled versions onto the original arrays
+                flag_functions.flag_changed(days.qc_flags['tdew'], days.data_tdew, days.complete_tdew,
+                                            flag_functions.FILLED)
+                days.data_tdew = np.array(days.complete_tdew)
+            else:
+                # if we are not filling, we will hold the copies to later fill in rso, but nothing is flagged
+                pass
+
+        '''
+            Recreate the 'compiled' ea as temperature or humidity vars were corrected and may have changed the
+            data underlying the compiled ea. Once that is done the gaps are filled in with the variable 
+            'complete_tdew' by _fill_vapor_pressure so that a complete record of ea exists for rs correction
+
+            The gaps in compiled_ea are reset every time temperature or humidity is corrected so this code is 
+            okay to run multiple times
+        '''
+        days.compiled_ea = data_functions.compile_ea(days.data_tmax, days.data_tmin, days.data_tavg,
+                                                     days.data_ea, days.data_tdew, self.column_df.tdew,
+                                                     days.data_rhmax, self.column_df.rhmax, days.data_rhmin,
+                                                     self.column_df.rhmin, days.data_rhavg,
+                                                     self.column_df.rhavg, days.data_tdew_ko)
+
+    def _fill_vapor_pressure(self, days):
+        """
+            Fills the gaps in compiled ea of days with the complete record of dewpoint
+        """
+        # Reset 'complete' version as underlying variable may have changed, provided values are never overwritten
+        days.complete_ea = fill_functions.fill_vapor_pressure(days.compiled_ea, days.complete_tdew)
+
+        if self.fill_mode:
+            # we are filling in data, so flag and copy all of the filled versions onto the original arrays
+            for var in ['ea', 'compiled_ea']:
+                flag_functions.flag_changed(days.qc_flags[var], days.compiled_ea, days.complete_ea,
+                                            flag_functions.FILLED)
+            days.data_ea = np.array(days.complete_ea)
+            days.compiled_ea = np.array(days.complete_ea)
+        else:
+            # if we are not filling, we will hold the copies to later fill in rso, but nothing is flagged
+            pass
+
+    def _recalculate_rso(self, days):
+        """
+            Recalculates Rso and reference ET of days from their complete records, returns the outputs of
+            calc_rso_and_refet
+        """
+        '''
+            Even if the user doesn't want to put filled data into their output file, we still need to use complete
+            records to get a complete record of Rso for use in Rs correction. This completed rso is only used for 
+            this step and is not written as data to the output file
+        '''
+        if self.fill_mode:
+            '''                  
+                This recalculates Rso and ETr values using the filled 'completed_' versions to provide a complete
+                record of ETr values.
+
+                If this code is executing then 'data_' vars have already been replaced by their 'completed_' 
+                versions so the code is accurate in calling them 'data_'
+            '''
+            return self._refet(days, days.data_tmax, days.data_tmin, days.data_ea)
+        else:
+            return self._refet(days, days.complete_tmax, days.complete_tmin, days.complete_ea)
+
+    def _fill_solar_radiation_and_wind(self, days):
+        """
+            Fills the gaps in solar radiation and wind speed of days, returns the outputs of the final
+            calc_rso_and_refet
+        """
+        # fill data_rs with rs_tr and data_ws with a normal distribution centered on mm_ws for that month, appended
+        # days are filled from the distributions of the whole record, but only their own gaps are filled
+        start = self._days_before(days)
+        (complete_rs, complete_ws) = fill_functions.\
+            fill_solar_radiation_and_wind(self.rng, np.concatenate([self.data_month[:start], days.data_month]),
+                                          np.concatenate([self.data_rs[:start], days.data_rs]),
+                                          np.concatenate([self.opt_rs_tr[:start], days.opt_rs_tr]),
+                                          np.concatenate([self.data_ws[:start], days.data_ws]))
+
+        if self.fill_mode:
+            flag_functions.flag_changed(days.qc_flags['rs'], days.data_rs, complete_rs[start:], flag_functions.FILLED)
+            flag_functions.flag_changed(days.qc_flags['ws'], days.data_ws, complete_ws[start:], flag_functions.FILLED)
+            days.data_rs = complete_rs[start:]
+            days.data_ws = complete_ws[start:]
+        else:
+            pass
+
+        # Recalculate eto and etr one final time
+        # This also overwrites the filled Rso, so we will create a copy for posterity
+        days.complete_rso = np.array(days.rso)
+
+        return self._refet(days, days.data_tmax, days.data_tmin, days.compiled_ea)
+
     def _create_plots(self):
         """
             Makes and saves histogram and composite plots.
         """
+        if self.generate_bokeh:
+            # Bokeh takes longer to import than the rest of the script, so runs that don't plot never import it
+            from bokeh.layouts import gridplot
+            from bokeh.plotting import save
+            from bokeh.resources import CDN
+            from . import plotting_functions
+
         #########################
         # Histograms of original data
         # Generates composite plot of specific variables before correction
@@ -644,11 +788,10 @@ class WeatherQAQC:
             k_not_hist = plotting_functions.histogram_plot(self.k_not[~np.isnan(self.k_not)],
                                                            'Ko', 'black', 'degrees C')
 
-            output_file(self.folder_path + "/correction_files/histograms/" + self.station_name + '_histograms.html',
-                        title=self.station_name + ' histograms')
-
-            save(gridplot([ws_hist, tmax_hist, tmin_hist, tavg_hist, tdew_hist, k_not_hist], ncols=2,
-                          width=400, height=400, toolbar_location=None))
+            histograms = gridplot([ws_hist, tmax_hist, tmin_hist, tavg_hist, tdew_hist, k_not_hist], ncols=2,
+                                  width=400, height=400, toolbar_location=None)
+            self._output('histograms', save, histograms, filename=self.folder_path + "/correction_files/histograms/" +
+                         self.station_name + '_histograms.html', resources=CDN, title=self.station_name + ' histograms')
 
         #########################
         # Generate bokeh composite plot
@@ -663,82 +806,99 @@ class WeatherQAQC:
             y_size = 350
 
             if self.script_mode == 0:
-                output_file(self.folder_path + "/correction_files/before_graphs/" + self.station_name +
-                            "_before_corrections_composite_graph.html")
+                composite_file_path = self.folder_path + "/correction_files/before_graphs/" + self.station_name + \
+                    "_before_corrections_composite_graph.html"
             elif self.script_mode == 1:
-                output_file(self.folder_path + "/correction_files/after_graphs/" + self.station_name +
-                            "_after_corrections_composite_graph.html")
+                composite_file_path = self.folder_path + "/correction_files/after_graphs/" + self.station_name + \
+                    "_after_corrections_composite_graph.html"
             else:
                 # Incorrect setup of script mode variable, raise an error
                 raise ValueError('Incorrect parameters: script mode is not set to a valid option.')
 
+            # Every daily plot draws from one source and every mean monthly plot from another, see SharedSource
+            daily_source = plotting_functions.SharedSource(self.dt_array, self.plot_options['max_points'])
+            monthly_source = plotting_functions.SharedSource(self.mm_dt_array, self.plot_options['max_points'])
+
             # Temperature Maximum and Minimum Plot
             plot_tmax_tmin = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.data_tmax,
-                                                          self.data_tmin, 1, '')
+                                                          self.data_tmin, 1, '',
+                                                          source=daily_source, **self.plot_options)
             plot_list.append(plot_tmax_tmin)
             # Temperature Minimum and Dewpoint Plot
             plot_tmin_tdew = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.data_tmin,
-                                                          self.data_tdew, 2, '', plot_tmax_tmin)
+                                                          self.data_tdew, 2, '', plot_tmax_tmin,
+                                                          source=daily_source, **self.plot_options)
             plot_list.append(plot_tmin_tdew)
 
             # 'Completed' vapor pressure plot
             plot_comp_ea = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.compiled_ea, self.data_null,
-                                                        7, 'Composite ', plot_tmax_tmin)
+                                                        7, 'Composite ', plot_tmax_tmin,
+                                                        source=daily_source, **self.plot_options)
             plot_list.append(plot_comp_ea)
 
             # vapor pressure plot that was just the provided dataset
             if self.column_df.ea != -1:
                 plot_data_ea = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.data_ea, self.data_null,
-                                                            7, 'Provided ', plot_tmax_tmin)
+                                                            7, 'Provided ', plot_tmax_tmin,
+                                                            source=daily_source, **self.plot_options)
                 plot_list.append(plot_data_ea)
 
             # rh max and rh min plot if it was provided in dataset
             if self.column_df.rhmax != -1 and self.column_df.rhmin != -1:  # RH max and RH min
                 plot_rhmax_rhmin = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.data_rhmax,
-                                                                self.data_rhmin, 8, '', plot_tmax_tmin)
+                                                                self.data_rhmin, 8, '', plot_tmax_tmin,
+                                                                source=daily_source, **self.plot_options)
                 plot_list.append(plot_rhmax_rhmin)
 
             # rh avg if it was provided in the dataset
             if self.column_df.rhavg != -1:  # RH Avg
                 plot_rhavg = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.data_rhavg,
-                                                          self.data_null, 9, '', plot_tmax_tmin)
+                                                          self.data_null, 9, '', plot_tmax_tmin,
+                                                          source=daily_source, **self.plot_options)
                 plot_list.append(plot_rhavg)
 
             # Mean Monthly Temperature Minimum and Dewpoint
             plot_mm_tmin_tdew = plotting_functions.line_plot(x_size, y_size, self.mm_dt_array, self.mm_tmin,
-                                                             self.mm_tdew, 2, 'MM ')
+                                                             self.mm_tdew, 2, 'MM ',
+                                                             source=monthly_source, **self.plot_options)
             plot_list.append(plot_mm_tmin_tdew)
 
             # Mean Monthly k0 curve (Tmin-Tdew)
             plot_mm_k_not = plotting_functions.line_plot(x_size, y_size, self.mm_dt_array, self.mm_k_not,
-                                                         self.mm_data_null, 10, '', plot_mm_tmin_tdew)
+                                                         self.mm_data_null, 10, '', plot_mm_tmin_tdew,
+                                                         source=monthly_source, **self.plot_options)
             plot_list.append(plot_mm_k_not)
 
             # Solar radiation and clear sky solar radiation
             plot_rs_rso = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.data_rs, self.rso,
-                                                       5, '', plot_tmax_tmin)
+                                                       5, '', plot_tmax_tmin, source=daily_source, **self.plot_options)
             plot_list.append(plot_rs_rso)
 
             # Windspeed
             plot_ws = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.data_ws, self.data_null,
-                                                   3, '', plot_tmax_tmin)
+                                                   3, '', plot_tmax_tmin, source=daily_source, **self.plot_options)
             plot_list.append(plot_ws)
 
             # Precipitation
             plot_precip = plotting_functions.line_plot(x_size, y_size, self.dt_array, self.data_precip, self.data_null,
-                                                       4, '', plot_tmax_tmin)
+                                                       4, '', plot_tmax_tmin, source=daily_source, **self.plot_options)
             plot_list.append(plot_precip)
 
             # Optimized mean monthly Thornton-Running solar radiation and Mean Monthly solar radiation
             plot_mm_opt_rs_tr = plotting_functions.line_plot(x_size, y_size, self.mm_dt_array, self.mm_rs,
-                                                             self.mm_opt_rs_tr, 6, 'MM Optimized ', plot_mm_tmin_tdew)
+                                                             self.mm_opt_rs_tr, 6, 'MM Optimized ', plot_mm_tmin_tdew,
+                                                             source=monthly_source, **self.plot_options)
             plot_list.append(plot_mm_opt_rs_tr)
 
             # Optimized mean monthly Thornton-Running solar radiation and Mean Monthly solar radiation
             plot_mm_orig_rs_tr = plotting_functions.line_plot(x_size, y_size, self.mm_dt_array, self.mm_rs,
-                                                              self.mm_orig_rs_tr, 6, 'MM Original ', plot_mm_tmin_tdew)
+                                                              self.mm_orig_rs_tr, 6, 'MM Original ', plot_mm_tmin_tdew,
+                                                              source=monthly_source, **self.plot_options)
             plot_list.append(plot_mm_orig_rs_tr)
 
+            daily_source.finish()
+            monthly_source.finish()
+
             # Now construct grid plot out of all of the subplots
             number_of_plots = len(plot_list)
             number_of_rows = ceil(number_of_plots / self.gridplot_columns)
@@ -754,7 +914,7 @@ class WeatherQAQC:
                         pass
 
             fig = gridplot(grid_of_plots, toolbar_location='left', sizing_mode='scale_both')
-            save(fig)
+            self._output('composite graph', save, fig, filename=composite_file_path, resources=CDN, title='Bokeh Plot')
 
             print("\nSystem: Composite bokeh graph has been generated.")
 
@@ -766,40 +926,15 @@ class WeatherQAQC:
         #########################
         # Create necessary variables for generic metadata file, as well as
         # generate and fill metadata file
-        record_start = pd.to_datetime(self.dt_array[0]).date()
-        record_end = pd.to_datetime(self.dt_array[-1]).date()
+        self.record_start = pd.to_datetime(self.dt_array[0]).date()
+        self.record_end = pd.to_datetime(self.dt_array[-1]).date()
 
         if self.script_mode == 1:  # only need to generate metadata if we are correcting it
-            # First check to see if metadata file already exists
-            if not os.path.isfile('correction_metadata.xlsx'):
-                # file does not exist, create new one
-                metadata_info = pd.DataFrame({'Station': self.station_name, 'Latitude': self.station_lat,
-                                              'Longitude': self.station_lon, 'station_elev_m': self.station_elev,
-                                              'record_start': record_start, 'record_end': record_end,
-                                              'anemom_height_m': self.ws_anemometer_height,
-                                              'Filename': self.output_file_path}, index=np.array([1]))
-
-                with pd.ExcelWriter('correction_metadata.xlsx', date_format='YYYY-MM-DD',
-                                    datetime_format='YYYY-MM-DD HH:MM:SS', engine='openpyxl', mode='w') as writer:
-                    metadata_info.to_excel(writer, header=True,  index=False, sheet_name='Sheet1')
-            else:
-                # file is already created, so we need to read it in, append our new information to the bottom of it
-                # and then save the info
-                metadata_info = pd.read_excel('correction_metadata.xlsx', sheet_name=0, index_col=None,
-                                              engine='openpyxl', keep_default_na=False, verbose=True)
-
-                new_meta_info = pd.DataFrame({'Station': self.station_name, 'Latitude': self.station_lat,
-                                              'Longitude': self.station_lon, 'station_elev_m': self.station_elev,
-                                              'record_start': record_start, 'record_end': record_end,
-                                              'anemom_height_m': self.ws_anemometer_height,
-                                              'Filename': self.output_file_path}, index=np.array([1]))
-
-                output_metadata = pd.concat([metadata_info, new_meta_info], ignore_index=True)
-
-                with pd.ExcelWriter('correction_metadata.xlsx', date_format='YYYY-MM-DD',
-                                    datetime_format='YYYY-MM-DD HH:MM:SS', engine='openpyxl', mode='w') as writer:
-                    output_metadata.to_excel(writer, header=True, index=False, sheet_name='Sheet1')
-
+            # Stations are upserted into the metadata store, export it with qaqc_export_metadata.py to get a spreadsheet
+            metadata_functions.upsert_corrected_station(self.metadata_store_path, self.station_name, self.station_lat,
+                                                        self.station_lon, self.station_elev, self.record_start,
+                                                        self.record_end, self.ws_anemometer_height,
+                                                        self.output_file_path)
         else:
             # do nothing
             pass
@@ -810,112 +945,521 @@ class WeatherQAQC:
             current_run = self.metadata_df.run_count.iloc[current_row] + 1
 
             self.metadata_df.run_count.iloc[current_row] = current_run
-            self.metadata_df.record_start.iloc[current_row] = record_start
-            self.metadata_df.record_end.iloc[current_row] = record_end
+            self.metadata_df.record_start.iloc[current_row] = self.record_start
+            self.metadata_df.record_end.iloc[current_row] = self.record_end
             self.metadata_df.output_path.iloc[current_row] = self.output_file_path
 
-            with pd.ExcelWriter(self.metadata_path, date_format='YYYY-MM-DD',
-                                datetime_format='YYYY-MM-DD', engine='openpyxl', mode='w') as writer:
-                self.metadata_df.to_excel(writer, header=True, index=True, sheet_name='Sheet1')
+            # Progress is kept in the metadata store rather than rewriting the whole workbook
+            metadata_functions.upsert_network_station(self.metadata_store_path, self.metadata_df.id.iloc[current_row],
+                                                      current_run, self.record_start, self.record_end,
+                                                      self.output_file_path)
 
         #########################
         # Generate output file
-        # Create any final variables, then create panda dataframes to save all the data
         # Includes the following sheets:
         #     Corrected Data : Actual corrected values
         #     Delta : Magnitude of difference between original data and corrected data
         #     Filled Data : Tracks which data points have been filled by script generated values instead of provided
+        #     QC Flags : Bitmask of every QC action applied to each day of each variable, decoded by QC Flag Legend
         # Data that is provided and subsequently corrected by the script do not count as filled values.
         print("\nSystem: Saving corrected data to .xslx file.")
 
-        # Create any individually-requested output data
-        ws_2m = _wind_height_adjust(uz=self.data_ws, zw=self.ws_anemometer_height)
-
-        # Create corrected-original delta numpy arrays
-        diff_tavg = np.array(self.data_tavg - self.original_df.tavg)
-        diff_tmax = np.array(self.data_tmax - self.original_df.tmax)
-        diff_tmin = np.array(self.data_tmin - self.original_df.tmin)
-        diff_tdew = np.array(self.data_tdew - self.original_df.tdew)
-        diff_ea = np.array(self.data_ea - self.original_df.ea)
-        diff_rhavg = np.array(self.data_rhavg - self.original_df.rhavg)
-        diff_rhmax = np.array(self.data_rhmax - self.original_df.rhmax)
-        diff_rhmin = np.array(self.data_rhmin - self.original_df.rhmin)
-        diff_rs = np.array(self.data_rs - self.original_df.rs)
-        diff_rs_tr = np.array(self.opt_rs_tr - self.orig_rs_tr)
-        diff_rso = np.array(self.rso - self.original_df.rso)
-        diff_ws = np.array(self.data_ws - self.original_df.ws)
-        diff_precip = np.array(self.data_precip - self.original_df.precip)
-        diff_etr = np.array(self.etr - self.original_df.etr)
-        diff_eto = np.array(self.eto - self.original_df.eto)
+        # Every sheet is streamed straight from the arrays by output_functions.write_workbook. Columns that are
+        # calculated (deltas, filled values, and windspeed at 2m) are worked out a block of rows at a time as they are
+        # written, each is given as the function and the arrays it is calculated from.
+        original = self.original_df
+        filled = functools.partial(flag_functions.flag_values, bit=flag_functions.FILLED)
 
         # Create k0 array to output values
         k_not_vals = np.zeros(self.data_length)
         k_not_vals[0:12] = self.mm_k_not[0:12]
 
-        # Create datetime for output dataframe
-        datetime_df = pd.DataFrame({'year': self.data_year, 'month': self.data_month, 'day': self.data_day})
-        datetime_df = pd.to_datetime(datetime_df[['month', 'day', 'year']])
-
-        # Create output dataframe
-        output_df = pd.DataFrame({'year': self.data_year, 'month': self.data_month,
-                                  'day': self.data_day, 'TAvg (C)': self.data_tavg, 'TMax (C)': self.data_tmax,
-                                  'TMin (C)': self.data_tmin, 'TDew (C)': self.data_tdew,
-                                  'Compiled Ea (kPa)': self.compiled_ea,
-                                  'Vapor Pres (kPa)': self.data_ea, 'RHAvg (%)': self.data_rhavg,
-                                  'RHMax (%)': self.data_rhmax, 'RHMin (%)': self.data_rhmin, 'Rs (w/m2)': self.data_rs,
-                                  'Opt_Rs_TR (w/m2)': self.opt_rs_tr, 'Rso (w/m2)': self.rso,
-                                  'Windspeed (m/s)': self.data_ws, 'Precip (mm)': self.data_precip,
-                                  'ETr (mm)': self.etr, 'ETo (mm)': self.eto, 'ws_2m (m/s)': ws_2m},
-                                 index=datetime_df)
-
-        # Creating difference dataframe to track amount of correction
-        delta_df = pd.DataFrame({'year': self.data_year, 'month': self.data_month,
-                                 'day': self.data_day, 'TAvg (C)': diff_tavg, 'TMax (C)': diff_tmax,
-                                 'TMin (C)': diff_tmin, 'TDew (C)': diff_tdew,
-                                 'Vapor Pres (kPa)': diff_ea, 'RHAvg (%)': diff_rhavg, 'RHMax (%)': diff_rhmax,
-                                 'RHMin (%)': diff_rhmin, 'Rs (w/m2)': diff_rs, 'Opt - Orig Rs_TR (w/m2)': diff_rs_tr,
-                                 'Rso (w/m2)': diff_rso, 'Windspeed (m/s)': diff_ws, 'Precip (mm)': diff_precip,
-                                 'ETr (mm)': diff_etr, 'ETo (mm)': diff_eto}, index=datetime_df)
-
-        # Creating a fill dataframe that tracks where missing data was filled in
-        fill_df = pd.DataFrame({'year': self.data_year, 'month': self.data_month,
-                                'day': self.data_day, 'TMax (C)': self.fill_tmax, 'TMin (C)': self.fill_tmin,
-                                'TDew (C)': self.fill_tdew, 'Vapor Pres (kPa)': self.fill_ea, 'Rs (w/m2)': self.fill_rs,
-                                'Complete Record Rso (w/m2)': self.fill_rso, 'mm k0 values': k_not_vals},
-                               index=datetime_df)
-        output_df.index.name = 'date'
-        delta_df.index.name = 'date'
-        fill_df.index.name = 'date'
-        # Open up pandas excel writer
-        output_writer = pd.ExcelWriter(self.output_file_path, engine='xlsxwriter')
-        # Convert data frames to xlsxwriter excel objects
-        output_df.to_excel(output_writer, sheet_name='Corrected Data', na_rep=self.missing_fill_value)
-        delta_df.to_excel(output_writer, sheet_name='Delta (Corr - Orig)', na_rep=self.missing_fill_value)
-        fill_df.to_excel(output_writer, sheet_name='Filled Data', na_rep=self.missing_fill_value)
-        # Save output file
-        output_writer.close()
-
-        logger = open(self.log_file, 'a')
+        date_columns = [('year', self.data_year), ('month', self.data_month), ('day', self.data_day)]
+
+        # Actual corrected values
+        output_columns = [
+            ('TAvg (C)', self.data_tavg), ('TMax (C)', self.data_tmax), ('TMin (C)', self.data_tmin),
+            ('TDew (C)', self.data_tdew), ('Compiled Ea (kPa)', self.compiled_ea), ('Vapor Pres (kPa)', self.data_ea),
+            ('RHAvg (%)', self.data_rhavg), ('RHMax (%)', self.data_rhmax), ('RHMin (%)', self.data_rhmin),
+            ('Rs (w/m2)', self.data_rs), ('Opt_Rs_TR (w/m2)', self.opt_rs_tr), ('Rso (w/m2)', self.rso),
+            ('Windspeed (m/s)', self.data_ws), ('Precip (mm)', self.data_precip), ('ETr (mm)', self.etr),
+            ('ETo (mm)', self.eto),
+            ('ws_2m (m/s)', (functools.partial(_wind_height_adjust, zw=self.ws_anemometer_height), self.data_ws))]
+
+        # Difference between corrected and original data to track amount of correction
+        delta_columns = [
+            ('TAvg (C)', (np.subtract, self.data_tavg, original.tavg.values)),
+            ('TMax (C)', (np.subtract, self.data_tmax, original.tmax.values)),
+            ('TMin (C)', (np.subtract, self.data_tmin, original.tmin.values)),
+            ('TDew (C)', (np.subtract, self.data_tdew, original.tdew.values)),
+            ('Vapor Pres (kPa)', (np.subtract, self.data_ea, original.ea.values)),
+            ('RHAvg (%)', (np.subtract, self.data_rhavg, original.rhavg.values)),
+            ('RHMax (%)', (np.subtract, self.data_rhmax, original.rhmax.values)),
+            ('RHMin (%)', (np.subtract, self.data_rhmin, original.rhmin.values)),
+            ('Rs (w/m2)', (np.subtract, self.data_rs, original.rs.values)),
+            ('Opt - Orig Rs_TR (w/m2)', (np.subtract, self.opt_rs_tr, self.orig_rs_tr)),
+            ('Rso (w/m2)', (np.subtract, self.rso, original.rso.values)),
+            ('Windspeed (m/s)', (np.subtract, self.data_ws, original.ws.values)),
+            ('Precip (mm)', (np.subtract, self.data_precip, original.precip.values)),
+            ('ETr (mm)', (np.subtract, self.etr, original.etr.values)),
+            ('ETo (mm)', (np.subtract, self.eto, original.eto.values))]
+
+        # Tracks where missing data was filled in, using the filled flags
+        fill_columns = [
+            ('TMax (C)', (filled, self.qc_flags['tmax'], self.data_tmax)),
+            ('TMin (C)', (filled, self.qc_flags['tmin'], self.data_tmin)),
+            ('TDew (C)', (filled, self.qc_flags['tdew'], self.data_tdew)),
+            ('Vapor Pres (kPa)', (filled, self.qc_flags['ea'], self.data_ea)),
+            ('Rs (w/m2)', (filled, self.qc_flags['rs'], self.data_rs)),
+            ('Windspeed (m/s)', (filled, self.qc_flags['ws'], self.data_ws)),
+            ('Complete Record Rso (w/m2)', self.complete_rso), ('mm k0 values', k_not_vals)]
+
+        # One column of QC flags per variable, and what each bit of them means
+        qc_flag_columns = [(var, self.qc_flags[var]) for var in flag_functions.FLAG_VARIABLES]
+        legend = flag_functions.flag_legend()
+        legend_columns = [(header, np.array([row[i] for row in legend]))
+                          for (i, header) in enumerate(['bit', 'value', 'description'])]
+
+        # Handed over to be written, along with the rest of the log, in the background if there is an output writer
+        self._output('output workbook', output_functions.write_workbook, self.output_file_path, self.dt_array,
+                     [('Corrected Data', date_columns + output_columns, True, self.missing_fill_value),
+                      ('Delta (Corr - Orig)', date_columns + delta_columns, True, self.missing_fill_value),
+                      ('Filled Data', date_columns + fill_columns, True, self.missing_fill_value),
+                      ('QC Flags', date_columns + qc_flag_columns, True, ''),
+                      ('QC Flag Legend', legend_columns, False, '')])
+
+        log_lines = []
         if self.script_mode == 1 and self.fill_mode == 1:
             if np.isnan(self.eto).any() or np.isnan(self.etr).any():
                 print("\nSystem: After finishing corrections and filling data, "
                       "ETr and ETo still had missing observations.")
-                logger.write('After finishing corrections and filling data, '
-                             'ETr and ETo still had missing observations. \n')
+                log_lines.append('After finishing corrections and filling data, '
+                                 'ETr and ETo still had missing observations. \n')
             else:
-                logger.write('The output file for this station has a complete record of ETo and ETr observations. \n')
+                log_lines.append('The output file for this station has a complete record of ETo and ETr '
+                                 'observations. \n')
         else:
             pass
+        self._output('log file', self._finish_log, log_lines)
+
+        if self.metadata_path is None:
+            # Saved so that days added to the data file later can be appended without processing the whole record
+            self._output('station state', append_functions.save_state, self.state_file_path, self._state(),
+                         input_functions.read_config(self.config_path))
+
+        # Optional exports are handed over after the log and state, under a tag of their own, see _export
+        if self.parquet_dataset_path is not None:
+            # The year is the partition and the date is its own column, so month and day aren't needed
+            self._export('parquet dataset', output_functions.write_parquet_dataset, self.parquet_dataset_path,
+                         self.station_name, self.dt_array,
+                         [('corrected', output_columns), ('delta', delta_columns), ('filled', fill_columns),
+                          ('flags', qc_flag_columns)], legend_columns)
+
+        if self.netcdf_file_path is not None:
+            self._export('netcdf cube', output_functions.write_netcdf_cube, self.netcdf_file_path, self.station_name,
+                         self.station_lat, self.station_lon, self.station_elev, self.ws_anemometer_height,
+                         self.dt_array,
+                         {'tavg': self.data_tavg, 'tmax': self.data_tmax, 'tmin': self.data_tmin,
+                          'tdew': self.data_tdew, 'ea': self.data_ea, 'rhavg': self.data_rhavg,
+                          'rhmax': self.data_rhmax, 'rhmin': self.data_rhmin, 'rs': self.data_rs, 'rso': self.rso,
+                          'ws': self.data_ws, 'precip': self.data_precip, 'etr': self.etr, 'eto': self.eto})
+
+        if self.result_cache_key is not None:
+            # Handed over last, so that the station is only cached if every other output file was written
+            self._output('result cache', cache_functions.store_result, self.result_cache_path, self.result_cache_key,
+                         self.folder_path, self.station_name, self.started, self.record_start, self.record_end,
+                         self.result_cache_max_mb)
+
+    def _finish_log(self, log_lines):
+        """
+            Appends the last lines to the station log, once the output files have been saved
+        """
+        logger = open(self.log_file, 'a')
+        logger.writelines(log_lines)
         logger.write('\nThe file has been successfully processed and output files saved at %s.' %
                      dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         logger.close()
 
+    def _output(self, description, function, *args, **kwargs):
+        """
+            Writes an output file, or hands it to the output writer to be written in the background if there is one
+        """
+        if self.output_writer is None:
+            function(*args, **kwargs)
+        else:
+            self.output_writer.submit(self.station_name, self.station_name + ' ' + description, function, *args,
+                                      **kwargs)
+
+    def _export(self, description, function, *args):
+        """
+            Writes an optional export, same as _output, but under its own tag so that if it fails the station's other
+            output files are still written
+        """
+        if self.output_writer is None:
+            function(*args)
+        else:
+            self.output_writer.submit(output_functions.export_tag(self.station_name),
+                                      self.station_name + ' ' + description, function, *args)
+
+    def _save_checkpoint(self, stage):
+        """
+            Saves everything done so far so the run can be resumed from this stage if it is interrupted
+        """
+        if self.checkpoint_path is None:
+            return
+
+        self.checkpoint_stage = stage
+        state = self._state()
+        input_file_paths = [self.config_path, self.config_dict['data_file_path']] + \
+            [path for path in [self.metadata_path, self.recipe_path] if path is not None]
+        checkpoint_functions.save_checkpoint(self.checkpoint_path, stage, state, input_file_paths)
+
+    def _state(self):
+        """
+            Everything needed to continue processing the station, without what only applies to this run
+        """
+        return {key: value for (key, value) in self.__dict__.items()
+                if key not in ['checkpoint_path', 'profile', 'profiler', 'output_writer', 'plot_session',
+                               'result_cache_key']}
+
+    def _restore_result(self):
+        """
+            Restores the output files of the station from the result cache if an identical run was cached, returns
+            whether it was restored. Otherwise sets the key the station is cached under once it finishes.
+        """
+        config_dict = input_functions.read_config(self.config_path)
+        (station_name, _file_name, _station_extension, folder_path) = \
+            input_functions.station_paths(config_dict['data_file_path'])
+        if self.result_cache_path is None and config_dict['result_cache_flag']:
+            self.result_cache_path = config_dict['result_cache_path']
+        if self.result_cache_max_mb is None:
+            self.result_cache_max_mb = config_dict['result_cache_max_mb']
+
+        recipe_path = self.recipe_path
+        if recipe_path is None and config_dict['recipe_file_path'] != '':
+            recipe_path = config_dict['recipe_file_path']
+
+        # Only stations that are processed without prompting the user, and only save to files of their own, are cached
+        key = None
+        if self.result_cache_path is None:
+            pass
+        elif (config_dict['corr_flag'] and recipe_path is None) or self.metadata_path is not None or \
+                self.parquet_dataset_path is not None or config_dict['parquet_flag'] or \
+                self.netcdf_file_path is not None or config_dict['netcdf_flag']:
+            print("\nSystem: Station is corrected interactively, uses a metadata file, or saves to a shared file, so "
+                  "it is not cached.")
+        else:
+            recipe = recipe_functions.read_recipe(recipe_path) if recipe_path is not None else None
+            key = cache_functions.result_key(config_dict, station_name, recipe,
+                                             {'gridplot_columns': self.gridplot_columns})
+            manifest = cache_functions.restore_result(self.result_cache_path, key, folder_path)
+
+        if key is None or manifest is None:
+            # The output files may still be linked to a result restored by an earlier run, even one that used a
+            # different cache or none at all, which processing the station would write over
+            cache_functions.detach_result_files(folder_path, station_name)
+            self.result_cache_key = key
+            return False
+
+        self.station_name = station_name
+        self.folder_path = folder_path
+        self.log_file = folder_path + "/correction_files/" + station_name + "_changes_log" + ".txt"
+        self.output_file_path = folder_path + "/correction_files/" + station_name + "_output" + ".xlsx"
+        self.record_start = dt.date.fromisoformat(manifest['record_start'])
+        self.record_end = dt.date.fromisoformat(manifest['record_end'])
+        print("\nSystem: Station {} is unchanged since it was cached, its output files were restored from the result "
+              "cache at {}.".format(station_name, self.result_cache_path))
+
+        if config_dict['corr_flag'] or recipe_path is not None:
+            # Same as _write_outputs, the metadata store counts every run of a corrected station
+            metadata_functions.upsert_corrected_station(config_dict['metadata_store_path'], station_name,
+                                                        config_dict['station_latitude'],
+                                                        config_dict['station_longitude'],
+                                                        config_dict['station_elevation'], self.record_start,
+                                                        self.record_end, config_dict['anemometer_height'],
+                                                        self.output_file_path)
+
+        # Anything left of an interrupted run of the same station is no longer needed
+        if self.checkpoint_path is not None:
+            checkpoint_functions.remove_checkpoint(self.checkpoint_path)
+        return True
+
+    def _load_state(self):
+        """
+            Loads the state the station was saved with the last time it was processed, returns whether there was one
+            to append the new days of its data file to
+        """
+        if self.metadata_path is not None:
+            raise ValueError('\n\nNew days can only be appended to stations run without a metadata file.')
+
+        config_dict = input_functions.read_config(self.config_path)
+        (station_name, _file_name, _station_extension, folder_path) = \
+            input_functions.station_paths(config_dict['data_file_path'])
+        state_file_path = append_functions.default_state_path(folder_path, station_name)
+        state = append_functions.load_state(state_file_path, config_dict)
+        if state is None:
+            print("\nSystem: Station {} has no saved state to append to, so its whole record will be processed."
+                  .format(station_name))
+            return False
+
+        # Anything passed in for this run takes priority over what the station was last processed with
+        passed_settings = {key: value for (key, value) in self.__dict__.items()
+                           if key in ['config_path', 'gridplot_columns', 'parquet_dataset_path', 'netcdf_file_path',
+                                      'append'] and value is not None}
+        self.__dict__.update(state)
+        self.__dict__.update(passed_settings)
+        print("\nSystem: Station {} was last processed up to {}, appending any days after it."
+              .format(self.station_name, self.record_end))
+        return True
+
+    def _append_data(self):
+        """
+            Reads in the days after the end of the saved record, corrects and fills them the same way the end of the
+            record was, and adds them onto it. The correction factors, Thornton-Running coefficients, and monthly
+            climatology of the saved record are used as they are, so that only the new days have to be processed.
+        """
+        # Output files restored from the result cache are still linked to it, and are about to be added to
+        cache_functions.detach_result_files(self.folder_path, self.station_name)
+        self.started = int(time.time())
+
+        # The last day of the record had no day after it when isolated observations were removed, so if any of its
+        # values were removed as isolated it is read in and processed again along with the days after it, the same
+        # way it would have been if the whole record had been processed at once
+        reprocessed_days = int(any((var_flags[-1] & flag_functions.ISOLATED) != 0
+                                   for var_flags in self.qc_flags.values()))
+        record_length = self.data_length - reprocessed_days
+        start_date = pd.to_datetime(self.dt_array[-1]).date() + dt.timedelta(days=1 - reprocessed_days)
+        (new_df, _column_df, new_flag_df, _metadata_df, _metadata_series, _config_dict) = \
+            input_functions.obtain_data(self.config_path, start_date=start_date)
+
+        if new_df.shape[0] <= reprocessed_days:
+            self.appended_length = 0
+            print("\nSystem: The data file has no days after {}, there is nothing to append.".format(self.record_end))
+            logger = open(self.log_file, 'a')
+            logger.write('No days after %s were found in the data file, so nothing was appended.' % self.record_end)
+            logger.close()
+            return
+
+        # Days of the record are only read up to the reprocessed day, which is replaced once the new days are added
+        self.appended_length = new_df.shape[0]
+        self.data_length = record_length
+
+        print("\nSystem: Now processing the {} days from {} onwards.".format(self.appended_length, start_date))
+        # The new days are held under the same names as the arrays of the record, so that they are processed by the
+        # same methods the record was
+        days = types.SimpleNamespace(**{'data_' + var: np.array(new_df[var])
+                                        for var in ['year', 'month', 'day', 'tavg', 'tmax', 'tmin', 'tdew', 'ea',
+                                                    'rhavg', 'rhmax', 'rhmin', 'rs', 'ws', 'precip']})
+        days.qc_flags = {var: np.array(new_flag_df[var]) for var in new_flag_df.columns}
+        days.qc_flags['compiled_ea'] = flag_functions.create_flags(self.appended_length)
+        days.data_doy = np.array(new_df.index.dayofyear)
+        days.dt_array = np.array(new_df.index.to_pydatetime(), dtype=np.datetime64)
+
+        # Secondary variables of the original values, same as _calculate_secondary_vars
+        if self.column_df.tavg == -1:
+            days.data_tavg = np.array((days.data_tmax + days.data_tmin) / 2.0)
+
+        self._recalculate_humidity(days)
+        (days.rso, _mm_rs, days.eto, days.etr, _mm_eto, _mm_etr) = \
+            self._refet(days, days.data_tmax, days.data_tmin, days.compiled_ea)
+
+        new_original_df = new_df.copy()
+        new_original_df['rso'] = days.rso
+        new_original_df['etr'] = days.etr
+        new_original_df['eto'] = days.eto
+        new_original_df['compiled_ea'] = days.compiled_ea
+        self._start_complete_records(days)
+
+        #########################
+        # Carry over corrections
+        # Every journal operation that reached the end of the record is applied to the new days, in the same order
+        log_writer = open(self.log_file, 'a')
+        log_writer.write('\n' + '-' * 92 + '\n')
+        log_writer.write('Appending %s days from %s onwards to the %s days processed before. \n'
+                         % (self.appended_length, start_date, record_length))
+        if reprocessed_days > 0:
+            log_writer.write('The last day processed before had observations removed as isolated before the days '
+                             'after it were known, so it is processed again along with them. \n')
+
+        month = np.concatenate([self.data_month[:record_length], days.data_month])
+        doy = np.concatenate([self.data_doy[:record_length], days.data_doy])
+        steps = append_functions.carried_steps(self.journal, record_length + reprocessed_days)
+        source_operations = []
+        for (variable, operation) in steps:
+            if variable == 'compiled_ea':
+                source_operations.append(operation)
+                continue
+
+            names = append_functions.JOURNAL_VARIABLE_ARRAYS[variable]
+            values = [np.concatenate([getattr(self, 'data_' + name)[:record_length], getattr(days, 'data_' + name)])
+                      for name in names]
+            corrected = append_functions.carry_operation(log_writer, operation, values, month, doy, record_length)
+            for (name, corrected_values) in zip(names, corrected):
+                flag_functions.flag_changed(days.qc_flags[name], getattr(days, 'data_' + name),
+                                            corrected_values[record_length:],
+                                            flag_functions.METHOD_FLAGS[operation['method']])
+                setattr(days, 'data_' + name, corrected_values[record_length:])
+
+        # Recalculate and fill everything the corrections applied to the record recalculated and filled, same as
+        # _apply_correction_option, but only once as all the corrections have already been applied
+        options = set(self.corrected_options)
+        if 1 in options:
+            self._fill_temperature(days)
+
+        if len(options & {1, 2, 6, 7, 8}) > 0:
+            self._recalculate_humidity(days, fill_tdew=len(options & {2, 6, 7, 8}) > 0)
+
+        for operation in source_operations:
+            edited_compiled_ea = qaqc_functions.\
+                overwrite_compiled_ea(log_writer, recipe_functions.RECIPE_HUMIDITY_SOURCES[operation['source']], 0,
+                                      self.appended_length, days.compiled_ea, days.data_tmax, days.data_tmin,
+                                      days.data_tavg, days.data_ea, days.data_tdew, days.data_tdew_ko,
+                                      days.data_rhmax, days.data_rhmin, days.data_rhavg)
+            flag_functions.flag_changed(days.qc_flags['compiled_ea'], days.compiled_ea, edited_compiled_ea,
+                                        flag_functions.HUMIDITY_SOURCE)
+            days.compiled_ea = edited_compiled_ea
+        log_writer.close()
+
+        if len(options & {1, 2, 6, 7, 8, 9}) > 0:
+            self._fill_vapor_pressure(days)
+
+        if len(options) > 0:
+            days.rso = self._recalculate_rso(days)[0]
+
+        days.delta_t = np.array(days.data_tmax - days.data_tmin)
+        days.k_not = np.array(days.data_tmin - days.data_tdew)
+
+        # Thornton-Running solar radiation uses the coefficients the record settled on, and its monthly delta t
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            (days.orig_rs_tr, _mm_orig_rs_tr) = data_functions.\
+                calc_rs_tr(days.data_month, days.rso, days.delta_t, self.mm_delta_t, 0.031, 0.201, -0.185)
+            (days.opt_rs_tr, _mm_opt_rs_tr) = data_functions.\
+                calc_rs_tr(days.data_month, days.rso, days.delta_t, self.mm_delta_t, *self.opt_coefficients)
+
+        if self.script_mode == 1:
+            (days.rso, _mm_rs, days.eto, days.etr, _mm_eto, _mm_etr) = self._fill_solar_radiation_and_wind(days)
+
+        # The operations carried over now run to the end of the appended days, so they are carried over again the
+        # next time days are appended
+        append_functions.extend_carried_steps(steps, record_length + reprocessed_days,
+                                              self.appended_length - reprocessed_days,
+                                              np.datetime_as_string(days.dt_array[-1], unit='D'))
+
+        #########################
+        # Add the new days onto the record
+        new_flags = days.qc_flags
+        del days.qc_flags
+        for (name, values) in vars(days).items():
+            setattr(self, name, np.concatenate([getattr(self, name)[:record_length], values]))
+        self.qc_flags = {var: np.concatenate([self.qc_flags[var][:record_length], new_flags[var]])
+                         for var in self.qc_flags}
+        self.original_df = pd.concat([self.original_df.iloc[:record_length], new_original_df])
+        self.data_df = self.original_df
+        self.data_length = self.data_year.shape[0]
+        self.data_null = np.empty(self.data_length) * np.nan
+
+        # Monthly means that are only plotted are brought up to date, the ones the new days were processed with are not
+        self.mm_rs = fill_functions.monthly_mean_and_std(self.data_month, self.data_rs)[0]
+        self.mm_eto = fill_functions.monthly_mean_and_std(self.data_month, self.eto)[0]
+        self.mm_etr = fill_functions.monthly_mean_and_std(self.data_month, self.etr)[0]
+        self.mm_orig_rs_tr = fill_functions.monthly_mean_and_std(self.data_month, self.orig_rs_tr)[0]
+        self.mm_opt_rs_tr = fill_functions.monthly_mean_and_std(self.data_month, self.opt_rs_tr)[0]
+
+    def _resume_checkpoint(self):
+        """
+            Restores the state of an interrupted run, returns the number of stages that had already finished
+        """
+        if self.checkpoint_path is None:
+            return 0
+
+        (stage, state) = checkpoint_functions.load_checkpoint(self.checkpoint_path)
+        if stage is None:
+            return 0
+        elif self.recipe_path is not None and self.recipe_path != state['recipe_path']:
+            print("\nSystem: Checkpoint at {} was saved with a different recipe, starting over."
+                  .format(self.checkpoint_path))
+            return 0
+
+        self.__dict__.update(state)
+        print("\nSystem: Resuming interrupted run of station {} from checkpoint at {}."
+              .format(self.station_name, self.checkpoint_path))
+        return checkpoint_functions.CHECKPOINT_STAGES.index(stage) + 1
+
+    def _measure(self, stage):
+        """
+            Measures a stage if the station is being profiled, otherwise does nothing
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        else:
+            return self.profiler.measure(stage)
+
+    def _write_profile(self):
+        """
+            Writes the profiling report next to the station log
+        """
+        if not hasattr(self, 'station_name'):
+            print("\nSystem: Station failed before its data was read in, no profiling report was written.")
+            return
+
+        profile_file_path = self.folder_path + "/correction_files/" + self.station_name + "_profile" + ".json"
+        self.profiler.write_report(profile_file_path, self.station_name)
+        print("\nSystem: Profiling report saved to {}.".format(profile_file_path))
+
     def process_station(self):
-        self._obtain_data()
-        self._calculate_secondary_vars()
-        self._correct_data()
-        self._create_plots()
-        self._write_outputs()
+        if self.profile:
+            # Profiling wraps the plotting functions too, so it imports bokeh up front before the first stage
+            from . import profile_functions
+            self.profiler = profile_functions.Profiler()
+            self.profiler.start()
+
+        try:
+            # Only the new days are processed, unless the station has never been processed before
+            if self.append and self._load_state():
+                with self._measure('append_data'):
+                    self._append_data()
+                if self.appended_length > 0:
+                    with self._measure('create_plots'):
+                        self._create_plots()
+                    with self._measure('write_outputs'):
+                        self._write_outputs()
+                return
+
+            # A station with the same inputs, settings, and version of the script as a cached one is not processed
+            with self._measure('restore_result'):
+                if self._restore_result():
+                    return
+
+            # Stages that finished before the run was interrupted are skipped, see checkpoint_functions
+            finished_stages = self._resume_checkpoint()
+            if finished_stages < 1:
+                with self._measure('obtain_data'):
+                    self._obtain_data()
+                self._save_checkpoint('obtain_data')
+            if finished_stages < 2:
+                with self._measure('calculate_secondary_vars'):
+                    self._calculate_secondary_vars()
+                    self._start_correction()
+                self._save_checkpoint('secondary_vars')
+            if finished_stages < 4:
+                with self._measure('correct_data'):
+                    self._correct_data()
+            with self._measure('fill_data'):
+                self._fill_data()
+            with self._measure('create_plots'):
+                self._create_plots()
+            with self._measure('write_outputs'):
+                self._write_outputs()
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+                self._write_profile()
+                self.profiler = None
+
+        # The checkpoint is only removed once every output has been written, so a failed write can be resumed
+        if self.checkpoint_path is not None:
+            self._output('checkpoint removal', checkpoint_functions.remove_checkpoint, self.checkpoint_path)
 
 
 # This is never run by itself
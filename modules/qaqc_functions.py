@@ -1,14 +1,20 @@
 import numpy as np
 import math
 import datetime as dt
+import functools
 import logging as log
-from . import plotting_functions
+from . import changepoint_functions, flag_functions, recipe_functions, rolling_functions, snapshot_functions
 import warnings
 
-from bokeh.plotting import save, show
 
+# Names of the variables passed to correction for each code, the same ones plotting_functions labels them with, kept
+# here so that the log of a recipe run without plots doesn't have to import bokeh
+CORRECTION_VARIABLE_NAMES = {1: ('TMax', 'TMin'), 2: ('TMin', 'TDew'), 3: ('Wind Speed', 'null'),
+                             4: ('Precipitation', 'null'), 5: ('Solar Radiation', 'Clear-Sky Solar Radiation'),
+                             7: ('Vapor Pressure', 'null'), 8: ('RHMax', 'RHMin'), 9: ('RHAvg', 'null')}
 
-def additive_corr(log_writer, start, end, var_one, var_two):
+
+def additive_corr(log_writer, start, end, var_one, var_two, mod):
     """
         Corrects provided interval with a flat, user-provided additive modifier
 
@@ -18,6 +24,7 @@ def additive_corr(log_writer, start, end, var_one, var_two):
             end : ending index of correction interval
             var_one : 1D numpy array of first variable
             var_two : 1D numpy array of second variable, may be entirely nan's
+            mod : additive modifier to apply
 
         Returns:
             corr_var_one : 1D numpy array of first variable after correction
@@ -27,7 +34,6 @@ def additive_corr(log_writer, start, end, var_one, var_two):
     corr_var_one = np.array(var_one)
     corr_var_two = np.array(var_two)
 
-    mod = float(input("\nEnter the additive modifier you want to apply to all values: "))
     corr_var_one[start:end] = var_one[start:end] + mod
     corr_var_two[start:end] = var_two[start:end] + mod
     log_writer.write('Selected correction interval started at %s and ended at %s. \n' % (start, end))
@@ -78,6 +84,7 @@ def generate_corr_menu(code, auto_corr, first_pass):
           '\n   For user-defined multiplicative value correction, enter 2.'
           '\n   To set everything in this interval to NaN, enter 3.'.format(var_type))
     print(corr_method)
+    print('   To remove outliers in this interval using a rolling-window modified z-score approach, enter 5.')
 
     if auto_corr != 0 and first_pass == 1:  # automatic pass enabled
         choice = 4
@@ -89,7 +96,7 @@ def generate_corr_menu(code, auto_corr, first_pass):
         loop = 1
 
     while loop:
-        if 1 <= choice <= 4:
+        if 1 <= choice <= 5:
             loop = 0
         else:
             print('Please enter a valid option.')
@@ -98,12 +105,15 @@ def generate_corr_menu(code, auto_corr, first_pass):
     return choice, first_pass
 
 
-def generate_interval(var_size):
+def generate_interval(var_size, candidates=None, selection=None):
     """
         Generates menu and obtains user selection on what intervals the user wants to correct
 
         Parameters:
             var_size : integer of variable size, to prevent creation of an out of bound index
+            candidates : list of candidate intervals proposed by change-point detection, which may be empty or None
+            selection : function that returns the interval selected in the browser, or None if nothing is selected,
+                see session_functions.CorrectionSession.selected_interval, None if plots aren't shown in a session
 
         Returns:
             int_start : integer of index user wants to start correction on
@@ -111,11 +121,29 @@ def generate_interval(var_size):
     """
     print('\nPlease enter the starting index of your correction interval.'
           '\n   You may also enter -1 to select all data points.')
+    if candidates:
+        print('   You may also enter -2 to select one of the proposed candidate intervals.')
+    if selection is not None:
+        print('   You may also enter -3 to use the interval last selected in the browser with the box select tool.')
 
     int_start = int(input("Enter your starting index: "))
+    # The selection is read once the user answers, since they may have selected it while being asked
+    while int_start == -3 and selection is not None and selection() is None:
+        print('Nothing is selected in the browser, please select an interval or enter a starting index.')
+        int_start = int(input("Enter your starting index: "))
+
     if int_start == -1:
         int_start = 0
         int_end = var_size
+    elif int_start == -2 and candidates:
+        rank = int(input("Enter the rank of the candidate interval: "))
+        while not 1 <= rank <= len(candidates):
+            print('Please enter a valid option.')
+            rank = int(input("Enter the rank of the candidate interval: "))
+        int_start = candidates[rank - 1]['start']
+        int_end = candidates[rank - 1]['end']
+    elif int_start == -3 and selection is not None:
+        (int_start, int_end) = selection()
     else:
         int_end = int(input("Enter your ending index: "))
         # Check that user didn't select past the end of record.
@@ -126,7 +154,37 @@ def generate_interval(var_size):
     return int_start, int_end
 
 
-def multiplicative_corr(log_writer, start, end, var_one, var_two):
+def print_candidate_intervals(candidates, dt_array, log_writer=None):
+    """
+        Displays the candidate intervals proposed by change-point detection, and optionally writes them to the log
+
+        Parameters:
+            candidates : list of candidate intervals, see changepoint_functions.propose_intervals
+            dt_array : 1D numpy datetime64 array of the record
+            log_writer : logging object for log file, if None nothing is logged
+
+        Returns:
+            None
+    """
+    if len(candidates) == 0:
+        return
+
+    print('\nChange-point detection proposed the following candidate intervals, ranked from most to least likely to '
+          'need correction:')
+    if log_writer is not None:
+        log_writer.write('Change-point detection proposed %s candidate intervals. \n' % len(candidates))
+
+    for candidate in candidates:
+        description = 'Rank {0}: index {1} to {2} ({3} to {4}), score of {5:.1f}'.format(
+            candidate['rank'], candidate['start'], candidate['end'],
+            np.datetime_as_string(dt_array[candidate['start']], unit='D'),
+            np.datetime_as_string(dt_array[candidate['end'] - 1], unit='D'), candidate['score'])
+        print('   ' + description)
+        if log_writer is not None:
+            log_writer.write(description + '. \n')
+
+
+def multiplicative_corr(log_writer, start, end, var_one, var_two, mod):
     """
         Corrects provided interval with a user-provided multiplicative modifier
 
@@ -136,6 +194,7 @@ def multiplicative_corr(log_writer, start, end, var_one, var_two):
             end : ending index of correction interval
             var_one : 1D numpy array of first variable
             var_two : 1D numpy array of second variable, may be entirely nan's
+            mod : multiplicative modifier to apply
 
         Returns:
             corr_var_one : 1D numpy array of first variable after correction
@@ -145,7 +204,6 @@ def multiplicative_corr(log_writer, start, end, var_one, var_two):
     corr_var_one = np.array(var_one)
     corr_var_two = np.array(var_two)
 
-    mod = float(input("\nEnter the multiplicative modifier you want to apply to all values: "))
     corr_var_one[start:end] = var_one[start:end] * mod
     corr_var_two[start:end] = var_two[start:end] * mod
     log_writer.write('Selected correction interval started at %s and ended at %s. \n' % (start, end))
@@ -215,6 +273,102 @@ def modified_z_score_outlier_detection(data):
     return cleaned_data, outlier_count
 
 
+def rolling_z_score_outlier_detection(data, doy, start, end, window_type, half_width, min_samples=10):
+    """
+        Calculates modified z scores (see modified_z_score_outlier_detection) against the median and median absolute
+        deviation of a sliding window instead of a whole calendar month, so that a climate trend or a change in sensor
+        doesn't flag entire decades, and local spikes aren't hidden by the spread of the rest of the month.
+
+        Two types of windows are available, 'seasonal' uses all values within half_width days of the same day of year
+        in every year of the record, and 'moving' uses the values within half_width days along the record itself.
+        Windows with fewer than min_samples values, or where every value is the same (MAD of zero, such as a dry spell
+        of precipitation), cannot be scored and nothing is removed from them.
+
+    Parameters:
+        data : 1D numpy array of values
+        doy : 1D numpy array of day of year values matching data
+        start : starting index of interval to remove outliers from
+        end : ending index of interval to remove outliers from, not inclusive
+        window_type : string of either 'seasonal' or 'moving'
+        half_width : integer of number of days on either side of each day to include in its window
+        min_samples : integer of minimum number of values needed in a window
+
+    Returns:
+        cleaned_data : 1D numpy array of values that have had outliers removed
+        outlier_count : integer of number of outliers removed
+    """
+    threshold = 3.5
+    cleaned_data = np.array(data)
+
+    if window_type == 'seasonal':
+        (doy_median, doy_mad) = rolling_functions.seasonal_median_mad(data, doy, half_width, min_samples)
+        median = doy_median[doy[start:end]]
+        median_absolute_deviation = doy_mad[doy[start:end]]
+    elif window_type == 'moving':
+        (median, median_absolute_deviation) = rolling_functions.moving_median_mad(data, half_width, min_samples,
+                                                                                  start, end)
+        median = median[start:end]
+        median_absolute_deviation = median_absolute_deviation[start:end]
+    else:
+        raise ValueError('Unsupported window type {} passed to rolling_z_score_outlier_detection.'.format(window_type))
+
+    with np.errstate(divide='ignore', invalid='ignore'):  # Silencing all errors when we divide by a nan or zero
+        modified_z_scores = 0.6745 * (data[start:end] - median) / median_absolute_deviation
+        outliers = (np.abs(modified_z_scores) > threshold) & (median_absolute_deviation > 0)
+
+    removed_indices = np.flatnonzero(outliers) + start
+    cleaned_data[removed_indices] = np.nan  # set those indices to nan
+    outlier_count = removed_indices.size
+    return cleaned_data, outlier_count
+
+
+def rolling_find_outliers(log_writer, start, end, var_one, var_one_name, var_two, var_two_name, dt_array, code,
+                          window_type, half_width):
+    """
+        Uses a rolling-window modified z-score approach to automatically detect outliers and set them to nan.
+
+        Parameters:
+            log_writer : logging object for log file
+            start : starting index of correction interval
+            end : ending index of correction interval
+            var_one : 1D numpy array of first variable
+            var_one_name : string of var one name
+            var_two : 1D numpy array of second variable, may be entirely nan's
+            var_two_name : string of var two name
+            dt_array : 1D numpy datetime64 array of the record
+            code : integer code that indicates what variables are passed as var_one and var_two
+            window_type : string of either 'seasonal' or 'moving'
+            half_width : integer of number of days on either side of each day to include in its window
+
+        Returns:
+            corrected_var_one : 1D numpy array of first variable after data was removed
+            corrected_var_two : 1D numpy array of second variable after data was removed
+    """
+    log_writer.write('User has opted to use a rolling-window modified z-score approach to identify and remove '
+                     'outliers. \n')
+    log_writer.write('Selected correction interval started at %s and ended at %s. \n' % (start, end))
+    log_writer.write('Window type was %s with a half width of %s days. \n' % (window_type, half_width))
+
+    days = dt_array.astype('datetime64[D]')
+    doy = (days - days.astype('datetime64[Y]')).astype(int) + 1
+
+    (corrected_var_one, var_one_outlier_count) = \
+        rolling_z_score_outlier_detection(var_one, doy, start, end, window_type, half_width)
+    print('{0} outliers were removed on variable {1}.'.format(var_one_outlier_count, var_one_name))
+    log_writer.write('{0} outliers were removed on variable {1}. \n'.format(var_one_outlier_count, var_one_name))
+
+    if code == 1 or code == 2 or code == 8:
+        # Only these codes pass a second variable that is being corrected, the rest are either empty or Rso
+        (corrected_var_two, var_two_outlier_count) = \
+            rolling_z_score_outlier_detection(var_two, doy, start, end, window_type, half_width)
+        print('{0} outliers were removed on variable {1}.'.format(var_two_outlier_count, var_two_name))
+        log_writer.write('{0} outliers were removed on variable {1}. \n'.format(var_two_outlier_count, var_two_name))
+    else:
+        corrected_var_two = np.array(var_two)
+
+    return corrected_var_one, corrected_var_two
+
+
 def temp_find_outliers(log_writer, t_var_one, var_one_name, t_var_two, var_two_name, month):
     """
             Uses a modified z-score approach to automatically detect outliers and set them to nan.
@@ -449,8 +603,8 @@ def rs_period_ratio_corr(log_writer, start, end, rs, rso, sample_size_per_period
 
                 # each period's data is overwritten by the subsequent period's data, because the final period may not
                 # have 60 days, chop off remaining days that have values from previous period.
-                rs_period = rs_period[:count_two-(period-1)].copy()
-                rso_period = rso_period[:count_two-(period-1)].copy()
+                rs_period = rs_period[:count_two + 1].copy()
+                rso_period = rso_period[:count_two + 1].copy()
                 count_one += 1  # increment by 1 to end the loop after this iteration
 
             else:  # We have reached the end of a period, no special treatment needed
@@ -690,7 +844,151 @@ def rs_period_ratio_corr(log_writer, start, end, rs, rso, sample_size_per_period
     return corr_rs, rso
 
 
-def correction(station, log_path, folder_path, var_one, var_two, dt_array, month, year, code, auto_corr=0):
+def end_factor(var, corr_var, start, end):
+    """
+        Works out the correction factor a period or year based correction applied to the end of its interval, from the
+        values before and after it was applied. The median ratio is used so that the few values that were capped,
+        despiked, or removed by the correction don't change it.
+
+        Parameters:
+            var : 1D numpy array of values before correction
+            corr_var : 1D numpy array of values after correction
+            start : starting index of the last period or year of the correction interval
+            end : ending index of correction interval
+
+        Returns:
+            factor : float of correction factor, None if the last period was thrown out by the correction
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = corr_var[start:end] / var[start:end]
+    ratios = ratios[np.isfinite(ratios) & (ratios > 0)]
+
+    if ratios.size == 0:
+        return None
+    else:
+        return round(float(np.median(ratios)), 6)
+
+
+def apply_correction_method(log_writer, choice, code, start, end, var_one, var_one_name, var_two, var_two_name,
+                            month, year, dt_array, auto_corr=0, parameters=None):
+    """
+        Applies the correction method selected from generate_corr_menu to the provided interval. Any parameters the
+        method needs that are not passed in through parameters are asked of the user, and then stored in parameters
+        so the caller knows exactly what values were used.
+
+        Parameters:
+            log_writer : logging object for log file
+            choice : integer of correction method, as returned by generate_corr_menu
+            code : integer code that indicates what variables are passed as var_one and var_two
+            start : starting index of correction interval
+            end : ending index of correction interval
+            var_one : 1D numpy array of first variable
+            var_one_name : string of var one name
+            var_two : 1D numpy array of second variable, may be entirely nan's
+            var_two_name : string of var two name
+            month : 1D numpy array of month values
+            year : 1D numpy array of year values
+            dt_array : 1D numpy datetime64 array of the record
+            auto_corr : int flag for the "automatic first pass" mode, which uses the recommended parameters
+            parameters : dictionary of method parameters ('modifier', 'percentile', 'period', 'sample_size',
+                'window_type', 'half_width'), the period and year based corrections also add the 'end_factor' they
+                applied to the end of the interval
+
+        Returns:
+            corr_var_one : 1D numpy array of first variable after correction
+            corr_var_two : 1D numpy array of second variable after correction
+    """
+    if parameters is None:
+        parameters = {}
+
+    corr_var_one = np.array(var_one)
+    corr_var_two = np.array(var_two)
+
+    if choice == 1:
+        if 'modifier' not in parameters:
+            parameters['modifier'] = float(input("\nEnter the additive modifier you want to apply to all values: "))
+
+        (corr_var_one, corr_var_two) = additive_corr(log_writer, start, end, var_one, var_two,
+                                                     float(parameters['modifier']))
+    elif choice == 2:
+        if 'modifier' not in parameters:
+            parameters['modifier'] = float(input("\nEnter the multiplicative modifier you want to apply to all "
+                                                 "values: "))
+
+        (corr_var_one, corr_var_two) = multiplicative_corr(log_writer, start, end, var_one, var_two,
+                                                           float(parameters['modifier']))
+    elif choice == 3:
+        (corr_var_one, corr_var_two) = set_to_nan(log_writer, start, end, var_one, var_two)
+    elif choice == 4 and (code == 1 or code == 2):
+        (corr_var_one, corr_var_two) = temp_find_outliers(log_writer, var_one, var_one_name, var_two, var_two_name,
+                                                          month)
+    elif choice == 4 and code == 8:
+        if 'percentile' in parameters:
+            pass
+        elif auto_corr != 0:
+            parameters['percentile'] = 1
+        else:
+            parameters['percentile'] = int(input('\nEnter which top percentile you want to base corrections on '
+                                                 '(rec. 1): '))
+
+        (corr_var_one, corr_var_two) = rh_yearly_percentile_corr(log_writer, start, end, var_one, var_two,
+                                                                 year, parameters['percentile'])
+
+        # Kept so that days appended to the record later are corrected by the factor of the last year
+        last_year_start = start + int(np.argmax(year[start:end] == year[end - 1]))
+        parameters['end_factor'] = end_factor(var_one, corr_var_one, last_year_start, end)
+    elif choice == 4 and code == 5:
+        if 'period' in parameters or 'sample_size' in parameters:
+            parameters['period'] = int(parameters.get('period', 60))
+            parameters['sample_size'] = int(parameters.get('sample_size', 6))
+        elif auto_corr != 0:
+            parameters['period'] = 60
+            parameters['sample_size'] = 6
+        else:
+            parameters['period'] = int(input('\nEnter the number of days each correction period will last '
+                                             '(rec. 60): '))
+            parameters['sample_size'] = int(input('\nEnter the number of points per period to correct based on '
+                                                  '(rec 6): '))
+
+        (corr_var_one, corr_var_two) = rs_period_ratio_corr(log_writer, start, end, var_one, var_two,
+                                                            parameters['sample_size'], parameters['period'])
+
+        # Kept so that days appended to the record later are corrected by the factor of the last period
+        last_period_start = start + ((end - start - 1) // parameters['period']) * parameters['period']
+        parameters['end_factor'] = end_factor(var_one, corr_var_one, last_period_start, end)
+
+    elif choice == 5:
+        if 'window_type' in parameters or 'half_width' in parameters:
+            parameters['window_type'] = str(parameters.get('window_type', 'seasonal')).lower()
+            parameters['half_width'] = int(parameters.get('half_width', 15))
+        elif auto_corr != 0:
+            parameters['window_type'] = 'seasonal'
+            parameters['half_width'] = 15
+        else:
+            window_choice = int(input('\nEnter 1 to compare each day against the same days of year in every year '
+                                      '(rec.), or 2 to compare it against the days around it: '))
+            parameters['window_type'] = 'moving' if window_choice == 2 else 'seasonal'
+            parameters['half_width'] = int(input('\nEnter the number of days on either side of each day to include '
+                                                 'in its window (rec. 15): '))
+
+        (corr_var_one, corr_var_two) = rolling_find_outliers(log_writer, start, end, var_one, var_one_name, var_two,
+                                                             var_two_name, dt_array, code, parameters['window_type'],
+                                                             parameters['half_width'])
+
+    elif choice == 4 and (code == 3 or code == 4 or code == 7 or code == 9):
+        # Data is either uz, precip, ea, or rhavg and user doesn't want to correct it.
+        log_writer.write('Selected correction interval started at %s and ended at %s. \n' % (start, end))
+        log_writer.write('User decided to skip this interval without correcting it. \n')
+    else:
+        # Shouldn't happen, raise an error
+        raise ValueError('Unsupported code type {0} and choice type {1} passed to qaqc_functions.'
+                         .format(code, choice))
+
+    return corr_var_one, corr_var_two
+
+
+def correction(station, log_path, folder_path, var_one, var_two, dt_array, month, year, code, auto_corr=0,
+               recipe_operations=None, journal=None, flags=None, plot_options=None, session=None, recipe_plots=True):
     """
             This main qaqc function takes in two variables and, depending on the code provided, enables different
             correction methods for the user to use to correct data. Once a correction has been applied, user has the
@@ -711,21 +1009,39 @@ def correction(station, log_path, folder_path, var_one, var_two, dt_array, month
                 year : 1D numpy array of year values
                 code : integer that is used to determine what variables are actually passed as var_one and var_two
                 auto_corr : int flag for the "automatic first pass" mode, which auto-applies default correction first
+                recipe_operations : list of recipe operations to apply without prompting the user, see
+                    recipe_functions.read_recipe, if None the user is prompted as normal
+                journal : list of journal steps, if provided every accepted correction is appended to it
+                flags : list of the QC flag arrays of var_one and var_two, or None for either one that is not flagged,
+                    if provided the bit of every accepted correction method is set on the days it changed
+                plot_options : dictionary of keyword arguments passed on to plotting_functions.line_plot, such as
+                    max_points and output_backend, None to use its defaults
+                session : session_functions.CorrectionSession to show the plots in, which also lets the user select
+                    correction intervals with the box select tool, if None every plot is opened in a new browser tab
+                recipe_plots : boolean of whether to save the final plot when recipe operations are applied, the user
+                    always needs the plots when correcting by hand so this is ignored unless recipe_operations is given
 
             Returns:
                 corr_var_one : 1D numpy array of corrected var_one values
                 corr_var_two : 1D numpy array of corrected var_two values
     """
+    make_plots = recipe_operations is None or recipe_plots
+    if make_plots:
+        # Bokeh is slow to import, so it is only imported once a variable is actually corrected and plotted
+        from . import plotting_functions
+        # Every figure made while correcting this variable is the same, so later ones only update the data that changed
+        plot_cache = plotting_functions.FigureCache()
+
+    if plot_options is None:
+        plot_options = {}
+    selection = functools.partial(session.selected_interval, dt_array) if session is not None else None
     correction_loop = 1
     first_pass = 1  # boolean flag for whether or not it is the first pass, used in automation with auto_corr
     var_size = var_one.shape[0]
-    backup_var_one = np.array(var_one)
-    backup_var_two = np.array(var_two)
-    corr_var_one = np.array(var_one)
-    corr_var_two = np.array(var_two)
+    # Only the intervals changed by each iteration are stored, originals are rebuilt from them when needed
+    history = snapshot_functions.CorrectionHistory(np.array(var_one), np.array(var_two))
 
-    (units, title, var_one_name, var_one_color, var_two_name, var_two_color) = \
-        plotting_functions.generate_line_plot_features(code, '')
+    (var_one_name, var_two_name) = CORRECTION_VARIABLE_NAMES[code]
 
     ####################
     # Logging
@@ -738,12 +1054,46 @@ def correction(station, log_path, folder_path, var_one, var_two, dt_array, month
 
     ####################
     # Generate Before-Corrections Graph
-    if first_pass == 1 and auto_corr != 0:  # first automatic pass, skip plotting variables for now
+    if recipe_operations is not None:
+        # Headless mode, each recipe operation is applied in order as if the user accepted it as another iteration
+        # Any parameters the recipe leaves out fall back to the same recommended values the automatic pass uses
+        correction_loop = 0
+        for operation in recipe_operations:
+            if 'candidate' in operation:
+                # Candidates are proposed from the data as it is now, after any previous operations were applied
+                candidates = changepoint_functions.propose_correction_intervals(code, history.current[0],
+                                                                                history.current[1], dt_array)
+                print_candidate_intervals(candidates, dt_array, corr_log)
+                rank = int(operation['candidate'])
+                if not 1 <= rank <= len(candidates):
+                    print('\nSystem: Recipe asked for candidate interval {0}, but {1} were proposed. Skipping this '
+                          'operation.'.format(rank, len(candidates)))
+                    corr_log.write('Recipe asked for candidate interval %s, but %s were proposed. The operation was '
+                                   'skipped. \n' % (rank, len(candidates)))
+                    continue
+                (int_start, int_end) = (candidates[rank - 1]['start'], candidates[rank - 1]['end'])
+                corr_log.write('Candidate interval %s was selected by the recipe. \n' % rank)
+            else:
+                (int_start, int_end) = recipe_functions.resolve_interval(operation, dt_array)
+
+            (corr_var_one, corr_var_two) = \
+                apply_correction_method(corr_log, operation['choice'], code, int_start, int_end, history.current[0],
+                                        var_one_name, history.current[1], var_two_name, month, year, dt_array, 1,
+                                        operation)
+            corr_log.write('---> Recipe operation was applied without prompting. \n')
+
+            (checksum_start, checksum_end) = recipe_functions.checksum_bounds(operation['choice'], code, int_start,
+                                                                              int_end, var_size)
+            checksum = recipe_functions.compute_checksum(checksum_start, checksum_end, corr_var_one, corr_var_two)
+            recipe_functions.verify_checksum(corr_log, operation, checksum)
+            history.commit([corr_var_one, corr_var_two], payload=recipe_functions.
+                           create_journal_entry(int_start, int_end, dt_array, operation, checksum))
+    elif first_pass == 1 and auto_corr != 0:  # first automatic pass, skip plotting variables for now
         pass
     else:
-        corr_fig = plotting_functions.variable_correction_plots(station, dt_array, var_one, corr_var_one, var_two,
-                                                                corr_var_two, code, folder_path)
-        show(corr_fig)
+        plotting_functions.show_plots(session, plotting_functions.variable_correction_plots, station, dt_array,
+                                      history.current[0], history.current[0], history.current[1], history.current[1],
+                                      code, folder_path, cache=plot_cache, **plot_options)
 
     ####################
     # Correction Loop
@@ -757,107 +1107,203 @@ def correction(station, log_path, folder_path, var_one, var_two, dt_array, month
             int_start = 0
             int_end = var_size
         else:
-            (int_start, int_end) = generate_interval(var_size)
+            # Candidates are proposed from the data as it is now, after any accepted iterations
+            candidates = changepoint_functions.propose_correction_intervals(code, history.current[0],
+                                                                            history.current[1], dt_array)
+            print_candidate_intervals(candidates, dt_array)
+            (int_start, int_end) = generate_interval(var_size, candidates, selection)
 
         (choice, first_pass) = generate_corr_menu(code, auto_corr, first_pass)
 
-        if choice == 1:
-            (corr_var_one, corr_var_two) = additive_corr(corr_log, int_start, int_end, var_one, var_two)
-        elif choice == 2:
-            (corr_var_one, corr_var_two) = multiplicative_corr(corr_log, int_start, int_end, var_one, var_two)
-        elif choice == 3:
-            (corr_var_one, corr_var_two) = set_to_nan(corr_log, int_start, int_end, var_one, var_two)
-        elif choice == 4 and (code == 1 or code == 2):
-            (corr_var_one, corr_var_two) = temp_find_outliers(corr_log, var_one, var_one_name, var_two, var_two_name,
-                                                              month)
-        elif choice == 4 and code == 8:
-            if auto_corr != 0:
-                corr_percentile = 1
-            else:
-                corr_percentile = int(input('\nEnter which top percentile you want to base corrections on (rec. 1): '))
-
-            (corr_var_one, corr_var_two) = rh_yearly_percentile_corr(corr_log, int_start, int_end, var_one, var_two,
-                                                                     year, corr_percentile)
-        elif choice == 4 and code == 5:
-            if auto_corr != 0:
-                corr_period = 60
-                corr_sample = 6
-            else:
-                corr_period = int(input('\nEnter the number of days each correction period will last (rec. 60): '))
-                corr_sample = int(input('\nEnter the number of points per period to correct based on (rec 6): '))
-
-            (corr_var_one, corr_var_two) = rs_period_ratio_corr(corr_log, int_start, int_end, var_one, var_two,
-                                                                corr_sample, corr_period)
-
-        elif choice == 4 and (code == 3 or code == 4 or code == 7 or code == 9):
-            # Data is either uz, precip, ea, or rhavg and user doesn't want to correct it.
-            corr_log.write('Selected correction interval started at %s and ended at %s. \n' % (int_start, int_end))
-            corr_log.write('User decided to skip this interval without correcting it. \n')
-        else:
-            # Shouldn't happen, raise an error
-            raise ValueError('Unsupported code type {0} and choice type {1} passed to qaqc_functions.'
-                             .format(code, choice))
+        iteration_parameters = {'method': recipe_functions.journal_method_name(choice, code)}
+        (corr_var_one, corr_var_two) = \
+            apply_correction_method(corr_log, choice, code, int_start, int_end, history.current[0], var_one_name,
+                                    history.current[1], var_two_name, month, year, dt_array, auto_corr,
+                                    iteration_parameters)
 
         ####################
         # Generate After-Corrections Graph
-        corr_fig = plotting_functions.variable_correction_plots(station, dt_array, var_one, corr_var_one, var_two,
-                                                                corr_var_two, code, folder_path)
-        show(corr_fig)
+        plotting_functions.show_plots(session, plotting_functions.variable_correction_plots, station, dt_array,
+                                      history.current[0], corr_var_one, history.current[1], corr_var_two, code,
+                                      folder_path, cache=plot_cache, **plot_options)
+
+        # The iteration is kept in the history until the user undoes it or starts over
+        # Every method except the recommended ones (4) only touches the selected interval
+        (checksum_start, checksum_end) = recipe_functions.checksum_bounds(choice, code, int_start, int_end, var_size)
+        iteration_entry = recipe_functions.create_journal_entry(
+            int_start, int_end, dt_array, iteration_parameters,
+            recipe_functions.compute_checksum(checksum_start, checksum_end, corr_var_one, corr_var_two))
+        if choice != 4:
+            history.commit([corr_var_one, corr_var_two], int_start, int_end, iteration_entry)
+        else:
+            history.commit([corr_var_one, corr_var_two], payload=iteration_entry)
 
         if auto_corr == 1 or auto_corr == 0:
             auto_corr = 0  # set to 0 to prevent another automatic correction loop
 
         ####################
         # Determine if user wants to keep correcting
-        print('\nAre you done correcting?'
-              '\n   Enter 1 for yes.'
-              '\n   Enter 2 for another iteration.'
-              '\n   Enter 3 to start over.'
-              '\n   Enter 4 to discard all changes.')
+        # Undoing or redoing an iteration shows the result and then asks again
+        decision_loop = 1
+        while decision_loop:
+            print('\nAre you done correcting?'
+                  '\n   Enter 1 for yes.'
+                  '\n   Enter 2 for another iteration.'
+                  '\n   Enter 3 to start over.'
+                  '\n   Enter 4 to discard all changes.'
+                  '\n   Enter 5 to undo the most recent iteration.'
+                  '\n   Enter 6 to redo the most recently undone iteration.')
+
+            choice = int(input("Enter your selection: "))
+            loop = 1
+            while loop:
+                if 1 <= choice <= 6:
+                    loop = 0
+                else:
+                    print('Please enter a valid option.')
+                    choice = int(input('Enter your selection: '))
+
+            if choice == 5 or choice == 6:
+                if choice == 5 and history.undo():
+                    corr_log.write('---> User has undone the most recent iteration of corrections. \n')
+                elif choice == 6 and history.redo():
+                    corr_log.write('---> User has redone the most recently undone iteration of corrections. \n')
+                else:
+                    print('\nThere are no iterations to {}.'.format('undo' if choice == 5 else 'redo'))
 
-        choice = int(input("Enter your selection: "))
-        loop = 1
-        while loop:
-            if 1 <= choice <= 4:
-                loop = 0
+                # Show everything that is currently applied
+                (original_var_one, original_var_two) = history.original()
+                plotting_functions.show_plots(session, plotting_functions.variable_correction_plots, station, dt_array,
+                                              original_var_one, history.current[0], original_var_two,
+                                              history.current[1], code, folder_path, cache=plot_cache, **plot_options)
             else:
-                print('Please enter a valid option.')
-                choice = int(input('Enter your selection: '))
+                decision_loop = 0
 
         if choice == 1:
             correction_loop = 0
             corr_log.write('---> User has elected to end corrections. \n')
         elif choice == 2:
-            var_one = np.array(corr_var_one)
-            var_two = np.array(corr_var_two)
             corr_log.write('---> User has elected to do another iteration of corrections. \n')
         elif choice == 3:
-            var_one = np.array(backup_var_one)
-            var_two = np.array(backup_var_two)
-            corr_var_one = np.array(backup_var_one)
-            corr_var_two = np.array(backup_var_two)
+            history.revert()
             corr_log.write('---> User has elected to ignore previous iterations of corrections and start over. \n')
         else:
             correction_loop = 0
-            corr_var_one = np.array(backup_var_one)
-            corr_var_two = np.array(backup_var_two)
+            history.revert()
             corr_log.write('---> User has elected to end corrections without keeping any changes. \n')
 
+    (corr_var_one, corr_var_two) = history.current
+    (backup_var_one, backup_var_two) = history.original()
+
     ####################
     # Generate Final Graph
     # All previous graphs were either entirely before corrections, or showed differences between iterations
     # This graph is between completely original values and final corrected product
-    corr_fig = plotting_functions.variable_correction_plots(station, dt_array, backup_var_one, corr_var_one,
-                                                            backup_var_two, corr_var_two, code, folder_path)
-    save(corr_fig)
+    if make_plots:
+        plotting_functions.save_plots(session, plotting_functions.variable_correction_plots, station, dt_array,
+                                      backup_var_one, corr_var_one, backup_var_two, corr_var_two, code, folder_path,
+                                      cache=plot_cache, **plot_options)
+
+    if journal is not None and len(history.payloads()) > 0:
+        journal.append({'variable': recipe_functions.JOURNAL_CODE_VARIABLES[code], 'operations': history.payloads()})
+
+    if flags is not None:
+        flag_functions.flag_history(flags, history)
 
     # return corrected variables, or save original values as corrected values if correction was rejected
     corr_log.close()
     return corr_var_one, corr_var_two
 
 
+def overwrite_compiled_ea(log_writer, choice, start, end, compiled_ea, tmax, tmin, tavg, ea, tdew, tdew_ko, rhmax,
+                          rhmin, rhavg):
+    """
+        Overwrites an interval of compiled ea with ea calculated from the humidity variable the user selected
+
+        Parameters:
+            log_writer : logging object for log file
+            choice : integer of humidity variable selected in compiled_humidity_adjustment
+            start : starting index of interval
+            end : ending index of interval
+            compiled_ea : 1D array of compiled ea values
+            tmax : 1D array of maximum temperature values
+            tmin : 1D array of minimum temperature values
+            tavg : 1D array of average temperature values
+            ea : 1D array of vapor pressure values, which may be empty
+            tdew : 1D array of dewpoint temperature values, which may be empty
+            tdew_ko : 1D array of dewpoint temperature values, where missing values are filled in by Tmin-Ko curve
+            rhmax : 1D array of maximum relative humidity values, which may be empty
+            rhmin : 1D array of minimum relative humidity values, which may be empty
+            rhavg : 1D array of average relative humidity values, which may be empty
+
+        Returns:
+            edited_compiled_ea : 1D array of compiled ea after the interval was overwritten
+    """
+    edited_compiled_ea = np.array(compiled_ea)
+
+    log_writer.write('Selected interval started at %s and ended at %s. \n' % (start, end))
+
+    if choice == 1:
+        # User wants provided Ea
+        edited_compiled_ea[start:end] = ea[start:end]
+        print('\n The selected interval was overwritten by provided vapor pressure.')
+        log_writer.write('Variable used was provided vapor pressure. \n')
+
+    elif choice == 2:
+        # User wants provided TDew
+        s_tdew = tdew[start:end]  # Selected interval of tdew
+        calc_ea = np.array(0.6108 * np.exp((17.27 * s_tdew) / (s_tdew + 237.3)))  # EQ 8, units kPa
+        edited_compiled_ea[start:end] = calc_ea
+        print('\n The selected interval was overwritten by provided dewpoint temperature.')
+        log_writer.write('Variable used was provided dewpoint temperature. \n')
+
+    elif choice == 3:
+        # User wants provided RHMax and RHMin
+        s_tmax = tmax[start:end]
+        s_tmin = tmin[start:end]
+        s_rhmax = rhmax[start:end]
+        s_rhmin = rhmin[start:end]
+
+        eo_tmax = np.array(0.6108 * np.exp((17.27 * s_tmax) / (s_tmax + 237.3)))  # units kPa, EQ 7
+        eo_tmin = np.array(0.6108 * np.exp((17.27 * s_tmin) / (s_tmin + 237.3)))  # units kPa, EQ 7
+        calc_ea = np.array(((eo_tmin * (s_rhmax / 100)) + (eo_tmax * (s_rhmin / 100))) / 2)  # EQ 11
+        edited_compiled_ea[start:end] = calc_ea
+        print('\n The selected interval was overwritten by RH Maximum and Minimum.')
+        log_writer.write('Variable used was provided RH Maximum and Minimum. \n')
+
+    elif choice == 4:
+        # User wants provided RHAvg
+        s_tavg = tavg[start:end]
+        s_rhavg = rhavg[start:end]
+
+        eo_tavg = np.array(0.6108 * np.exp((17.27 * s_tavg) / (s_tavg + 237.3)))  # units kPa, EQ 7
+        calc_ea = np.array(eo_tavg * (s_rhavg / 100))  # EQ 14
+        edited_compiled_ea[start:end] = calc_ea
+        print('\n The selected interval was overwritten by RH Average.')
+        log_writer.write('Variable used was provided RH Average. \n')
+
+    elif choice == 5:
+        # User wants provided TDew that was completed by Tmin-Ko curve
+        s_tdew_ko = tdew_ko[start:end]  # Selected interval of tdew
+        calc_ea = np.array(0.6108 * np.exp((17.27 * s_tdew_ko) / (s_tdew_ko + 237.3)))  # EQ 8, units kPa
+        edited_compiled_ea[start:end] = calc_ea
+        print('\n The selected interval was overwritten by dewpoint temperature filled in with the k0 curve.')
+        log_writer.write('Variable used was provided dewpoint temperature filled in by the Ko curve. \n')
+
+    elif choice == 6:
+        print('\n The selected interval was not modified.')
+        log_writer.write('The selected interval was skipped. \n')
+
+    else:
+        # Incorrect choice was passed, raise an error
+        raise ValueError('Incorrect parameters: CHOICE in humidity adjustment was an unexpected value.')
+
+    return edited_compiled_ea
+
+
 def compiled_humidity_adjustment(station, log_path, folder_path, dt_array, tmax, tmin, tavg, compiled_ea, ea, ea_col,
-                                 tdew, tdew_col, tdew_ko, rhmax, rhmax_col, rhmin, rhmin_col, rhavg, rhavg_col):
+                                 tdew, tdew_col, tdew_ko, rhmax, rhmax_col, rhmin, rhmin_col, rhavg, rhavg_col,
+                                 recipe_operations=None, journal=None, flags=None, plot_options=None, session=None):
     """
         This function is display the 'compiled' ea generated from all available humidity data, and the user will have
         the option to overwrite sections of the 'compiled' ea with ea generated from a variable of their choice, should
@@ -890,15 +1336,32 @@ def compiled_humidity_adjustment(station, log_path, folder_path, dt_array, tmax,
             rhmin_col : column of rhmin variable in data file, if it was provided
             rhavg : 1D array of average relative humidity values, which may be empty
             rhavg_col : column of rhavg variable in data file, if it was provided
+            recipe_operations : list of recipe operations to apply without prompting the user, see
+                recipe_functions.read_recipe, if None the user is prompted as normal
+            journal : list of journal steps, if provided every accepted adjustment is appended to it
+            flags : 1D numpy array of QC flags of compiled_ea, if provided every overwritten day is flagged
+            plot_options : dictionary of keyword arguments passed on to plotting_functions.line_plot, such as
+                max_points and output_backend, None to use its defaults
+            session : session_functions.CorrectionSession to show the plots in, which also lets the user select
+                adjustment intervals with the box select tool, if None every plot is opened in a new browser tab
 
         Returns:
             Returns a "compiled" ea array that has had select sections replaced by the "best" variables
     """
-
+    if recipe_operations is None:
+        # Bokeh is slow to import, so it is only imported once the user is shown the humidity record to adjust
+        from . import plotting_functions
+        # Every figure made while adjusting is the same, so later ones only update the compiled ea
+        plot_cache = plotting_functions.FigureCache()
+
+    if plot_options is None:
+        plot_options = {}
+    selection = functools.partial(session.selected_interval, dt_array) if session is not None else None
     adjustment_loop = 1
     var_size = compiled_ea.shape[0]
-    backup_compiled_ea = np.array(compiled_ea)
-    edited_compiled_ea = np.array(compiled_ea)
+    sources = {value: key for (key, value) in recipe_functions.RECIPE_HUMIDITY_SOURCES.items()}
+    # Only the intervals changed by each iteration are stored, originals are rebuilt from them when needed
+    history = snapshot_functions.CorrectionHistory(np.array(compiled_ea))
 
     ####################
     # Logging
@@ -908,11 +1371,31 @@ def compiled_humidity_adjustment(station, log_path, folder_path, dt_array, tmax,
     humidity_log.write('\n------------------------------------------------------------------------------------------\n')
     humidity_log.write('Now beginning humidity record adjustment. \n')
 
-    humidity_fig = plotting_functions.humidity_adjustment_plots\
-        (station, dt_array, edited_compiled_ea, ea, ea_col, tmin, tdew, tdew_col, rhmax, rhmax_col, rhmin, rhmin_col,
-         rhavg, rhavg_col, tdew_ko, folder_path)
-
-    show(humidity_fig)
+    if recipe_operations is not None:
+        # Headless mode, each recipe operation is applied in order as if the user accepted it as another iteration
+        # Any parameters the recipe leaves out fall back to the same recommended values the automatic pass uses
+        adjustment_loop = 0
+        provided = {1: ea_col != -1, 2: tdew_col != -1, 3: rhmax_col != -1 and rhmin_col != -1, 4: rhavg_col != -1}
+        for operation in recipe_operations:
+            if not provided.get(operation['choice'], True):
+                raise ValueError('Recipe selected compiled humidity source \'{}\' but it was not provided by the '
+                                 'dataset.'.format(operation['source']))
+
+            (int_start, int_end) = recipe_functions.resolve_interval(operation, dt_array)
+            edited_compiled_ea = overwrite_compiled_ea(humidity_log, operation['choice'], int_start, int_end,
+                                                       history.current[0], tmax, tmin, tavg, ea, tdew, tdew_ko, rhmax,
+                                                       rhmin, rhavg)
+            humidity_log.write('---> Recipe operation was applied without prompting. \n')
+
+            checksum = recipe_functions.compute_checksum(int_start, int_end, edited_compiled_ea)
+            recipe_functions.verify_checksum(humidity_log, operation, checksum)
+            history.commit([edited_compiled_ea], int_start, int_end, recipe_functions.
+                           create_journal_entry(int_start, int_end, dt_array, operation, checksum))
+    else:
+        plotting_functions.show_plots(session, plotting_functions.humidity_adjustment_plots, station, dt_array,
+                                      history.current[0], ea, ea_col, tmin, tdew, tdew_col, rhmax, rhmax_col, rhmin,
+                                      rhmin_col, rhavg, rhavg_col, tdew_ko, folder_path, cache=plot_cache,
+                                      **plot_options)
 
     ####################
     # Adjustment Loop
@@ -922,7 +1405,7 @@ def compiled_humidity_adjustment(station, log_path, folder_path, dt_array, tmax,
         ####################
         # First the user will select an interval, then they will choose a variable to copy from.
 
-        (int_start, int_end) = generate_interval(var_size)
+        (int_start, int_end) = generate_interval(var_size, selection=selection)
 
         print('\nPlease select which variable you want to use for this interval:'
               '\n   To use Ea data provided by the input file, enter 1.'
@@ -956,86 +1439,57 @@ def compiled_humidity_adjustment(station, log_path, folder_path, dt_array, tmax,
                 print('Please enter a valid option.')
                 choice = int(input('Specify which variable you would like to use: '))
 
-        humidity_log.write('Selected interval started at %s and ended at %s. \n' % (int_start, int_end))
-
-        if choice == 1:
-            # User wants provided Ea
-            edited_compiled_ea[int_start:int_end] = ea[int_start:int_end]
-            print('\n The selected interval was overwritten by provided vapor pressure.')
-            humidity_log.write('Variable used was provided vapor pressure. \n')
-
-        elif choice == 2:
-            # User wants provided TDew
-            s_tdew = tdew[int_start:int_end]  # Selected interval of tdew
-            calc_ea = np.array(0.6108 * np.exp((17.27 * s_tdew) / (s_tdew + 237.3)))  # EQ 8, units kPa
-            edited_compiled_ea[int_start:int_end] = calc_ea
-            print('\n The selected interval was overwritten by provided dewpoint temperature.')
-            humidity_log.write('Variable used was provided dewpoint temperature. \n')
-
-        elif choice == 3:
-            # User wants provided RHMax and RHMin
-            s_tmax = tmax[int_start:int_end]
-            s_tmin = tmin[int_start:int_end]
-            s_rhmax = rhmax[int_start:int_end]
-            s_rhmin = rhmin[int_start:int_end]
-
-            eo_tmax = np.array(0.6108 * np.exp((17.27 * s_tmax) / (s_tmax + 237.3)))  # units kPa, EQ 7
-            eo_tmin = np.array(0.6108 * np.exp((17.27 * s_tmin) / (s_tmin + 237.3)))  # units kPa, EQ 7
-            calc_ea = np.array(((eo_tmin * (s_rhmax / 100)) + (eo_tmax * (s_rhmin / 100))) / 2)  # EQ 11
-            edited_compiled_ea[int_start:int_end] = calc_ea
-            print('\n The selected interval was overwritten by RH Maximum and Minimum.')
-            humidity_log.write('Variable used was provided RH Maximum and Minimum. \n')
-
-        elif choice == 4:
-            # User wants provided RHAvg
-            s_tavg = tavg[int_start:int_end]
-            s_rhavg = rhavg[int_start:int_end]
-
-            eo_tavg = np.array(0.6108 * np.exp((17.27 * s_tavg) / (s_tavg + 237.3)))  # units kPa, EQ 7
-            calc_ea = np.array(eo_tavg * (s_rhavg / 100))  # EQ 14
-            edited_compiled_ea[int_start:int_end] = calc_ea
-            print('\n The selected interval was overwritten by RH Average.')
-            humidity_log.write('Variable used was provided RH Average. \n')
-
-        elif choice == 5:
-            # User wants provided TDew that was completed by Tmin-Ko curve
-            s_tdew_ko = tdew_ko[int_start:int_end]  # Selected interval of tdew
-            calc_ea = np.array(0.6108 * np.exp((17.27 * s_tdew_ko) / (s_tdew_ko + 237.3)))  # EQ 8, units kPa
-            edited_compiled_ea[int_start:int_end] = calc_ea
-            print('\n The selected interval was overwritten by dewpoint temperature filled in with the k0 curve.')
-            humidity_log.write('Variable used was provided dewpoint temperature filled in by the Ko curve. \n')
-
-        elif choice == 6:
-            print('\n The selected interval was not modified.')
-            humidity_log.write('The selected interval was skipped. \n')
+        edited_compiled_ea = overwrite_compiled_ea(humidity_log, choice, int_start, int_end, history.current[0], tmax,
+                                                   tmin, tavg, ea, tdew, tdew_ko, rhmax, rhmin, rhavg)
 
-        else:
-            # Incorrect choice was passed, raise an error
-            raise ValueError('Incorrect parameters: CHOICE in humidity adjustment was an unexpected value.')
+        # The iteration is kept in the history until the user undoes it or starts over
+        iteration_entry = recipe_functions.create_journal_entry(
+            int_start, int_end, dt_array, {'source': sources[choice]},
+            recipe_functions.compute_checksum(int_start, int_end, edited_compiled_ea))
+        history.commit([edited_compiled_ea], int_start, int_end, iteration_entry)
 
         # Now that the section has been overwritten, replot the variables
-        humidity_fig = plotting_functions.humidity_adjustment_plots\
-            (station, dt_array, edited_compiled_ea, ea, ea_col, tmin, tdew, tdew_col, rhmax, rhmax_col,
-             rhmin, rhmin_col, rhavg, rhavg_col, tdew_ko, folder_path)
-
-        show(humidity_fig)
+        plotting_functions.show_plots(session, plotting_functions.humidity_adjustment_plots, station, dt_array,
+                                      history.current[0], ea, ea_col, tmin, tdew, tdew_col, rhmax, rhmax_col, rhmin,
+                                      rhmin_col, rhavg, rhavg_col, tdew_ko, folder_path, cache=plot_cache,
+                                      **plot_options)
 
         ####################
         # Determine if user wants to keep correcting
-        print('\nAre you done adjusting humidity?'
-              '\n   Enter 1 for yes.'
-              '\n   Enter 2 for another iteration.'
-              '\n   Enter 3 to start over.'
-              '\n   Enter 4 to discard all changes.')
+        # Undoing or redoing an iteration shows the result and then asks again
+        decision_loop = 1
+        while decision_loop:
+            print('\nAre you done adjusting humidity?'
+                  '\n   Enter 1 for yes.'
+                  '\n   Enter 2 for another iteration.'
+                  '\n   Enter 3 to start over.'
+                  '\n   Enter 4 to discard all changes.'
+                  '\n   Enter 5 to undo the most recent iteration.'
+                  '\n   Enter 6 to redo the most recently undone iteration.')
+
+            choice = int(input("Enter your selection: "))
+            loop = 1
+            while loop:
+                if 1 <= choice <= 6:
+                    loop = 0
+                else:
+                    print('Please enter a valid option.')
+                    choice = int(input('Enter your selection: '))
+
+            if choice == 5 or choice == 6:
+                if choice == 5 and history.undo():
+                    humidity_log.write('---> User has undone the most recent iteration of adjustments. \n')
+                elif choice == 6 and history.redo():
+                    humidity_log.write('---> User has redone the most recently undone iteration of adjustments. \n')
+                else:
+                    print('\nThere are no iterations to {}.'.format('undo' if choice == 5 else 'redo'))
 
-        choice = int(input("Enter your selection: "))
-        loop = 1
-        while loop:
-            if 1 <= choice <= 4:
-                loop = 0
+                plotting_functions.show_plots(session, plotting_functions.humidity_adjustment_plots, station, dt_array,
+                                              history.current[0], ea, ea_col, tmin, tdew, tdew_col, rhmax, rhmax_col,
+                                              rhmin, rhmin_col, rhavg, rhavg_col, tdew_ko, folder_path,
+                                              cache=plot_cache, **plot_options)
             else:
-                print('Please enter a valid option.')
-                choice = int(input('Enter your selection: '))
+                decision_loop = 0
 
         if choice == 1:
             adjustment_loop = 0
@@ -1043,15 +1497,21 @@ def compiled_humidity_adjustment(station, log_path, folder_path, dt_array, tmax,
         elif choice == 2:
             humidity_log.write('---> User has elected to do another iteration of adjustments. \n')
         elif choice == 3:
-            edited_compiled_ea = np.array(backup_compiled_ea)
+            history.revert()
             humidity_log.write('---> User has elected to ignore previous iterations of adjustments and start over. \n')
         else:
             adjustment_loop = 0
-            edited_compiled_ea = np.array(backup_compiled_ea)
+            history.revert()
             humidity_log.write('---> User has elected to end adjustments without keeping any changes. \n')
 
+    if journal is not None and len(history.payloads()) > 0:
+        journal.append({'variable': 'compiled_ea', 'operations': history.payloads()})
+
+    if flags is not None:
+        flag_functions.flag_history([flags], history)
+
     humidity_log.close()
-    return edited_compiled_ea
+    return history.current[0]
 
 
 # This is never run by itself
@@ -0,0 +1,307 @@
+import datetime as dt
+import hashlib
+import json
+import numpy as np
+import pathlib as pl
+from .input_functions import validate_file
+
+
+# Variables a recipe can correct, mapped onto the menu options used by WeatherQAQC._correct_data
+RECIPE_VARIABLES = {'tmax_tmin': 1, 'tmin_tdew': 2, 'ws': 3, 'precip': 4, 'rs': 5, 'ea': 6, 'rhmax_rhmin': 7,
+                    'rhavg': 8, 'compiled_ea': 9}
+
+# Correction methods a recipe can use, mapped onto the choices in qaqc_functions.generate_corr_menu
+# The recommended methods all use choice 4, so they are also tied to the menu options they are valid for
+RECIPE_METHODS = {'additive': (1, None), 'multiplicative': (2, None), 'set_to_nan': (3, None),
+                  'z_score_outliers': (4, [1, 2]), 'rs_period_ratio': (4, [5]),
+                  'rh_yearly_percentile': (4, [7]), 'skip': (4, [3, 4, 6, 8]), 'rolling_z_score_outliers': (5, None)}
+
+# Humidity variables that can be used to overwrite compiled ea, mapped onto the choices in
+# qaqc_functions.compiled_humidity_adjustment
+RECIPE_HUMIDITY_SOURCES = {'ea': 1, 'tdew': 2, 'rhmax_rhmin': 3, 'rhavg': 4, 'tdew_ko': 5, 'skip': 6}
+
+# Plotting/correction codes used by qaqc_functions.correction, mapped back onto recipe variables for the journal
+JOURNAL_CODE_VARIABLES = {1: 'tmax_tmin', 2: 'tmin_tdew', 3: 'ws', 4: 'precip', 5: 'rs', 7: 'ea', 8: 'rhmax_rhmin',
+                          9: 'rhavg'}
+
+# Method parameters that are copied into journal entries, everything else in a parameter dictionary is ignored
+# The end factor is worked out by the period and year based corrections rather than given, see qaqc_functions.end_factor
+JOURNAL_PARAMETERS = ['modifier', 'percentile', 'period', 'sample_size', 'window_type', 'half_width', 'end_factor']
+
+
+def read_recipe(recipe_file_path):
+    """
+        Opens a correction recipe (JSON or YAML) and converts it into the list of steps WeatherQAQC runs headlessly.
+
+        A recipe is a list of steps, run in the order they are listed. Each step names a variable and the operations
+        to apply to it, also in order. Intervals are given by 'start' and 'end', which are either record indices
+        (end is exclusive, same as when entering them by hand) or dates as 'YYYY-MM-DD' strings (end is inclusive).
+        Leaving out either bound extends the interval to that end of the record. Instead of bounds, an operation can
+        give 'candidate', the rank of one of the intervals proposed by change-point detection for that variable (see
+        changepoint_functions.propose_correction_intervals), and is skipped if fewer were proposed. Parameters left
+        out of a recommended method (percentile, period, sample_size, window_type, half_width) use the same
+        recommended values as the automatic first pass. Example:
+
+            {"steps": [
+                {"variable": "tmax_tmin", "operations": [{"method": "z_score_outliers"}]},
+                {"variable": "rhmax_rhmin", "operations": [{"method": "rh_yearly_percentile", "percentile": 1}]},
+                {"variable": "compiled_ea", "operations": [{"source": "rhmax_rhmin", "start": "2001-01-01",
+                                                            "end": "2003-12-31"}]},
+                {"variable": "rs", "operations": [{"method": "rs_period_ratio", "period": 60, "sample_size": 6},
+                                                  {"method": "rs_period_ratio", "candidate": 1}]},
+                {"variable": "ws", "operations": [{"method": "set_to_nan", "start": 120, "end": 400}]},
+                {"variable": "rhavg", "operations": [{"method": "rolling_z_score_outliers", "window_type": "moving",
+                                                      "half_width": 15}]}
+            ]}
+
+        Correction journals written by WeatherQAQC use this same format, with a checksum added to every operation, so
+        passing a journal in as a recipe replays every correction it recorded and reports any that no longer match.
+
+        Parameters:
+            recipe_file_path : string of path to recipe file
+
+        Returns:
+            recipe : list of dictionaries, one per step, each with the keys 'variable', 'option', and 'operations'
+    """
+    validate_file(recipe_file_path, ['json', 'yaml', 'yml'])
+
+    with open(recipe_file_path, 'r') as recipe_file:
+        if pl.PurePath(recipe_file_path).suffix.lower() == '.json':
+            raw_recipe = json.load(recipe_file)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('\n\nReading YAML recipe files requires the PyYAML package, either install it or '
+                                  'provide the recipe as a .json file.')
+            raw_recipe = yaml.safe_load(recipe_file)
+
+    if isinstance(raw_recipe, dict):
+        raw_recipe = raw_recipe.get('steps')
+
+    if not isinstance(raw_recipe, list):
+        raise ValueError('\n\nRecipe file \'{}\' does not contain a list of steps.'.format(recipe_file_path))
+
+    recipe = []
+    for raw_step in raw_recipe:
+        variable = str(raw_step.get('variable', '')).lower()
+        if variable not in RECIPE_VARIABLES:
+            raise ValueError('\n\nUnsupported recipe variable \'{}\', expected one of {}.'
+                             .format(variable, list(RECIPE_VARIABLES)))
+        option = RECIPE_VARIABLES[variable]
+
+        operations = []
+        for raw_operation in raw_step.get('operations', []):
+            operation = dict(raw_operation)
+
+            if option == 9:
+                source = str(operation.get('source', '')).lower()
+                if source not in RECIPE_HUMIDITY_SOURCES:
+                    raise ValueError('\n\nUnsupported compiled humidity source \'{}\', expected one of {}.'
+                                     .format(source, list(RECIPE_HUMIDITY_SOURCES)))
+                operation['choice'] = RECIPE_HUMIDITY_SOURCES[source]
+            else:
+                method = str(operation.get('method', '')).lower()
+                if method not in RECIPE_METHODS:
+                    raise ValueError('\n\nUnsupported recipe method \'{}\', expected one of {}.'
+                                     .format(method, list(RECIPE_METHODS)))
+                (choice, valid_options) = RECIPE_METHODS[method]
+                if valid_options is not None and option not in valid_options:
+                    raise ValueError('\n\nRecipe method \'{}\' cannot be used on variable \'{}\'.'
+                                     .format(method, variable))
+                if method in ['additive', 'multiplicative'] and 'modifier' not in operation:
+                    raise ValueError('\n\nRecipe method \'{}\' on variable \'{}\' requires a \'modifier\'.'
+                                     .format(method, variable))
+                operation['choice'] = choice
+
+            operations.append(operation)
+
+        recipe.append({'variable': variable, 'option': option, 'operations': operations})
+
+    return recipe
+
+
+def resolve_interval(operation, dt_array):
+    """
+        Converts the 'start' and 'end' entries of a recipe operation into record indices.
+
+        Parameters:
+            operation : dictionary of a single recipe operation
+            dt_array : 1D numpy datetime64 array of the record
+
+        Returns:
+            int_start : integer of index to start correction on
+            int_end : integer of index to end correction on, not inclusive
+    """
+    var_size = dt_array.shape[0]
+    bounds = []
+    for key, side in (('start', 'left'), ('end', 'right')):
+        bound = operation.get(key)
+        if bound is None:
+            bounds.append(0 if key == 'start' else var_size)
+        elif isinstance(bound, str):
+            # Dates are searched for in the record, an end date is included in the interval
+            bounds.append(int(np.searchsorted(dt_array, np.datetime64(bound, 'D'), side=side)))
+        else:
+            bounds.append(int(bound))
+
+    # Same bound checks as generate_interval, so recipes behave like entering the indices by hand
+    int_start = min(max(bounds[0], 0), var_size)
+    int_end = min(max(bounds[1], int_start), var_size)
+    return int_start, int_end
+
+
+def journal_method_name(choice, code):
+    """
+        Converts a choice from qaqc_functions.generate_corr_menu back into the name of the recipe method it runs
+
+        Parameters:
+            choice : integer of correction method, as returned by generate_corr_menu
+            code : integer code that indicates what variables were corrected
+
+        Returns:
+            method : string of recipe method name
+    """
+    if choice == 1:
+        method = 'additive'
+    elif choice == 2:
+        method = 'multiplicative'
+    elif choice == 3:
+        method = 'set_to_nan'
+    elif choice == 4 and (code == 1 or code == 2):
+        method = 'z_score_outliers'
+    elif choice == 4 and code == 5:
+        method = 'rs_period_ratio'
+    elif choice == 4 and code == 8:
+        method = 'rh_yearly_percentile'
+    elif choice == 4:
+        method = 'skip'
+    elif choice == 5:
+        method = 'rolling_z_score_outliers'
+    else:
+        raise ValueError('Unsupported code type {0} and choice type {1} passed to journal_method_name.'
+                         .format(code, choice))
+    return method
+
+
+def compute_checksum(start, end, *arrays):
+    """
+        Computes a checksum of the values inside an interval, after rounding them so that a checksum computed on one
+        machine will match one computed on another.
+
+        Parameters:
+            start : starting index of interval
+            end : ending index of interval, not inclusive
+            *arrays : any number of 1D numpy arrays to include in the checksum
+
+        Returns:
+            checksum : string of sha256 hex digest
+    """
+    hasher = hashlib.sha256()
+    for array in arrays:
+        # Adding zero turns any -0.0 into 0.0, so they don't change the checksum
+        rounded = np.round(np.array(array[start:end], dtype=np.float64), 6) + 0.0
+        hasher.update(rounded.tobytes())
+    return hasher.hexdigest()
+
+
+def checksum_bounds(choice, code, start, end, var_size):
+    """
+        Finds the part of the record a correction method can change, which is what its checksum is computed over.
+        Modified z-score outliers on temperature are found across the whole record whatever interval was selected, so
+        their checksum covers the whole record, every other method only changes the selected interval.
+
+        Parameters:
+            choice : integer of correction method, as returned by qaqc_functions.generate_corr_menu
+            code : integer code that indicates what variables were corrected
+            start : starting index of interval
+            end : ending index of interval, not inclusive
+            var_size : integer of number of days in the record
+
+        Returns:
+            checksum_start : starting index of values to include in the checksum
+            checksum_end : ending index of values to include in the checksum, not inclusive
+    """
+    if choice == 4 and (code == 1 or code == 2):
+        return 0, var_size
+    else:
+        return start, end
+
+
+def create_journal_entry(start, end, dt_array, parameters, checksum):
+    """
+        Creates a single journal entry for an accepted correction. Entries are written in the same format as recipe
+        operations so that a finished journal can be read back in by read_recipe and replayed.
+
+        Parameters:
+            start : starting index of interval
+            end : ending index of interval, not inclusive
+            dt_array : 1D numpy datetime64 array of the record
+            parameters : dictionary holding either the 'method' or 'source' used, along with any method parameters
+            checksum : string of checksum of the corrected values, see checksum_bounds
+
+        Returns:
+            entry : dictionary of journal entry
+    """
+    entry = {}
+    for key in ['method', 'source'] + JOURNAL_PARAMETERS:
+        if key in parameters:
+            entry[key] = parameters[key]
+
+    if 0 <= start < end <= dt_array.shape[0]:
+        # Dates are stored so the entry still lines up if the record is later extended in either direction
+        entry['start'] = str(np.datetime_as_string(dt_array[start], unit='D'))
+        entry['end'] = str(np.datetime_as_string(dt_array[end - 1], unit='D'))
+    else:
+        entry['start'] = int(start)
+        entry['end'] = int(end)
+    entry['start_index'] = int(start)
+    entry['end_index'] = int(end)
+    entry['checksum'] = checksum
+    return entry
+
+
+def verify_checksum(log_writer, operation, checksum):
+    """
+        Compares the checksum of a replayed recipe operation against the one stored by the journal it came from.
+        Operations that were written by hand have no checksum and are not checked.
+
+        Parameters:
+            log_writer : logging object for log file
+            operation : dictionary of a single recipe operation, the result of the check is stored in it
+            checksum : string of checksum of the values the operation produced
+
+        Returns:
+            None
+    """
+    if 'checksum' not in operation:
+        return
+
+    operation['checksum_matched'] = operation['checksum'] == checksum
+    if not operation['checksum_matched']:
+        print('\nSystem: Replayed operation on interval {0} to {1} no longer matches its journal checksum.'
+              .format(operation.get('start'), operation.get('end')))
+        log_writer.write('Replayed operation no longer matches its journal checksum, expected %s but got %s. \n' %
+                         (operation['checksum'], checksum))
+
+
+def write_journal(journal_file_path, station, journal):
+    """
+        Writes the correction journal out to a JSON file that can be passed back in as a recipe to replay it.
+
+        Parameters:
+            journal_file_path : string of path to write the journal to
+            station : string of station name
+            journal : list of journal steps, each of which has the keys 'variable' and 'operations'
+
+        Returns:
+            None
+    """
+    with open(journal_file_path, 'w') as journal_file:
+        json.dump({'station': station, 'created': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                   'steps': journal}, journal_file, indent=2)
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -0,0 +1,764 @@
+import math
+import numpy as np
+import warnings
+
+# Reference versions of every kernel that has been, or is likely to be, optimized. These are plain loops that follow
+# the description of each kernel as directly as possible, and are kept unchanged so that the optimized versions in the
+# rest of the modules can always be checked against them (see equivalence_functions). Nothing in this module should
+# ever be optimized, the point of it is to be obviously correct rather than fast.
+#
+# Kernels that have not been optimized yet are frozen copies of their current implementations, so that they are
+# still available as references once they are.
+
+
+########################################################################################################################
+# input_functions
+def remove_isolated_observations(original_var):
+    """
+        Reference for input_functions.remove_isolated_observations, sets every observation surrounded by missing
+        observations to nan.
+
+        Parameters:
+            original_var : 1D numpy array of original variable data
+
+        Returns:
+            processed_var : 1D numpy array of variable that has been filtered of all isolated observations.
+    """
+    data_size = original_var.shape[0]  # number of rows in data
+    processed_var = np.empty(data_size) * np.nan
+
+    for i in range(data_size):
+        if i == 0 or i == (data_size - 1):  # Special handling for first and last index
+            if i == 0:  # First index
+                if np.isnan(original_var[i + 1]):
+                    # Very first observation is followed by a nan, remove it
+                    pass
+                else:
+                    # First observation is not followed by a nan
+                    processed_var[i] = original_var[i]
+            else:  # last index
+                if np.isnan(original_var[i - 1]):
+                    # Very last observation is preceded by a nan, remove it
+                    pass
+                else:
+                    # Last observation is not preceded by a nan
+                    processed_var[i] = original_var[i]
+
+        elif np.isnan(original_var[i - 1]) and np.isnan(original_var[i + 1]) and not np.isnan(original_var[i]):
+            # Observation is surrounded by nans, remove it.
+            pass
+        else:
+            # Either observation is valid and not surrounded by nans or is itself a nan.
+            processed_var[i] = original_var[i]
+
+    return processed_var
+
+
+########################################################################################################################
+# fill_functions
+def monthly_mean_and_std(month, data):
+    """
+        Reference for fill_functions.monthly_mean_and_std, the mean and standard deviation of each month of the year.
+
+        Parameters:
+            month : 1D numpy array of month values
+            data : 1D numpy array of values
+
+        Returns:
+            mm_data : 1D numpy array of 12 monthly means, nan for months without any data
+            std_data : 1D numpy array of 12 monthly standard deviations, nan for months without any data
+    """
+    mm_data = np.zeros(12)
+    std_data = np.zeros(12)
+
+    warnings.filterwarnings('ignore', 'Mean of empty slice')
+    warnings.filterwarnings('ignore', 'Degrees of freedom')
+    for k in range(12):
+        temp_indexes = np.where(month == k + 1)[0]
+        temp_indexes = np.array(temp_indexes, dtype=int)
+        mm_data[k] = np.nanmean(data[temp_indexes])
+        std_data[k] = np.nanstd(data[temp_indexes])
+    warnings.resetwarnings()
+
+    return mm_data, std_data
+
+
+def fill_temperature(rng, month, tmax, tmin, mm_delta_t):
+    """
+        Reference for fill_functions.fill_temperature. Every missing tmax is sampled first and then every missing tmin,
+        in the order of the record, which is the order the optimized version takes its samples in.
+
+        Parameters:
+            rng : numpy random Generator to sample from
+            month : 1D numpy array of month values
+            tmax : 1D numpy array of maximum temperature values
+            tmin : 1D numpy array of minimum temperature values
+            mm_delta_t : 1D numpy array of 12 mean monthly differences between tmax and tmin
+
+        Returns:
+            complete_tmax : 1D numpy array of tmax with every gap filled where possible
+            complete_tmin : 1D numpy array of tmin with every gap filled where possible
+    """
+    data_length = tmax.shape[0]
+    complete_tmax = np.array(tmax)
+    complete_tmin = np.array(tmin)
+    (mm_tmax, std_tmax) = monthly_mean_and_std(month, tmax)
+    (mm_tmin, std_tmin) = monthly_mean_and_std(month, tmin)
+
+    for i in range(data_length):
+        if np.isnan(tmax[i]):
+            complete_tmax[i] = rng.normal(mm_tmax[month[i] - 1], std_tmax[month[i] - 1])
+
+    for i in range(data_length):
+        if np.isnan(tmin[i]):
+            complete_tmin[i] = rng.normal(mm_tmin[month[i] - 1], std_tmin[month[i] - 1])
+
+    for i in range(data_length):
+        if not (np.isnan(tmax[i]) or np.isnan(tmin[i])):
+            pass
+        elif (complete_tmax[i] <= complete_tmin[i]) or (complete_tmax[i] - complete_tmin[i] <= 3):
+            complete_tmax[i] = mm_tmax[month[i] - 1] + (0.5 * mm_delta_t[month[i] - 1])
+            complete_tmin[i] = mm_tmin[month[i] - 1] - (0.5 * mm_delta_t[month[i] - 1])
+
+    return complete_tmax, complete_tmin
+
+
+def fill_dewpoint(month, tdew, tmin, complete_tmin, mm_k_not):
+    """
+        Reference for fill_functions.fill_dewpoint, fills missing tdew with the tmin - ko curve.
+
+        Parameters:
+            month : 1D numpy array of month values
+            tdew : 1D numpy array of dewpoint temperature values
+            tmin : 1D numpy array of minimum temperature values
+            complete_tmin : 1D numpy array of tmin with every gap filled
+            mm_k_not : 1D numpy array of 12 mean monthly ko values
+
+        Returns:
+            tdew_ko : 1D numpy array of tdew filled wherever tmin is present
+            complete_tdew : 1D numpy array of tdew filled wherever complete_tmin is present
+    """
+    tdew_ko = np.array(tdew)
+    complete_tdew = np.array(tdew)
+    for i in range(tdew.shape[0]):
+        if np.isnan(tdew[i]):
+            tdew_ko[i] = tmin[i] - mm_k_not[month[i] - 1]
+            complete_tdew[i] = complete_tmin[i] - mm_k_not[month[i] - 1]
+
+    return tdew_ko, complete_tdew
+
+
+def fill_vapor_pressure(compiled_ea, complete_tdew):
+    """
+        Reference for fill_functions.fill_vapor_pressure, fills missing ea from the completed dewpoint temperature.
+
+        Parameters:
+            compiled_ea : 1D numpy array of compiled vapor pressure values
+            complete_tdew : 1D numpy array of tdew with every gap filled
+
+        Returns:
+            complete_ea : 1D numpy array of vapor pressure with every gap filled where possible
+    """
+    complete_ea = np.array(compiled_ea)
+    for i in range(compiled_ea.shape[0]):
+        if np.isnan(compiled_ea[i]):
+            complete_ea[i] = (0.6108 * np.exp((17.27 * complete_tdew[i]) / (complete_tdew[i] + 237.3)))
+
+    return complete_ea
+
+
+def fill_solar_radiation_and_wind(rng, month, rs, rs_tr, ws, min_ws=0.2):
+    """
+        Reference for fill_functions.fill_solar_radiation_and_wind, fills missing rs with rs_tr and missing ws with
+        samples from a monthly normal distribution, raised to min_ws if they fall below it.
+
+        Parameters:
+            rng : numpy random Generator to sample from
+            month : 1D numpy array of month values
+            rs : 1D numpy array of solar radiation values
+            rs_tr : 1D numpy array of thornton-running solar radiation values
+            ws : 1D numpy array of wind speed values
+            min_ws : float of lowest reasonable wind speed
+
+        Returns:
+            complete_rs : 1D numpy array of rs with every gap filled where possible
+            complete_ws : 1D numpy array of ws with every gap filled where possible
+    """
+    (mm_ws, std_ws) = monthly_mean_and_std(month, ws)
+    complete_rs = np.array(rs)
+    complete_ws = np.array(ws)
+
+    for i in range(rs.shape[0]):
+        if np.isnan(rs[i]):
+            complete_rs[i] = rs_tr[i]
+        if np.isnan(ws[i]):
+            complete_ws[i] = rng.normal(mm_ws[month[i] - 1], std_ws[month[i] - 1])
+            if complete_ws[i] < min_ws:
+                complete_ws[i] = min_ws
+
+    return complete_rs, complete_ws
+
+
+########################################################################################################################
+# rolling_functions
+def seasonal_median_mad(data, doy, half_width, min_samples):
+    """
+        Reference for rolling_functions.seasonal_median_mad, gathers and sorts the whole window of every day of year.
+
+        Parameters:
+            data : 1D numpy array of values
+            doy : 1D numpy array of day of year values (1 to 366) matching data
+            half_width : integer of days on either side of each day of year to include
+            min_samples : integer of minimum number of values needed in a window to calculate statistics
+
+        Returns:
+            median : 1D numpy array of length 367, indexed by day of year, nan where statistics were not calculated
+            mad : 1D numpy array of length 367, indexed by day of year, nan where statistics were not calculated
+    """
+    half_width = min(half_width, 182)
+    median = np.full(367, np.nan)
+    mad = np.full(367, np.nan)
+
+    for day in range(1, 367):
+        window_days = [(day + offset - 1) % 366 + 1 for offset in range(-half_width, half_width + 1)]
+        window = data[np.isin(doy, window_days) & ~np.isnan(data)]
+        if window.size >= min_samples:
+            median[day] = np.median(window)
+            mad[day] = np.median(np.abs(window - median[day]))
+
+    return median, mad
+
+
+def moving_median_mad(data, half_width, min_samples, start=0, end=None):
+    """
+        Reference for rolling_functions.moving_median_mad, gathers and sorts the whole window of every value.
+
+        Parameters:
+            data : 1D numpy array of values
+            half_width : integer of steps on either side of each value to include
+            min_samples : integer of minimum number of values needed in a window to calculate statistics
+            start : starting index of interval to calculate statistics for
+            end : ending index of interval to calculate statistics for, not inclusive
+
+        Returns:
+            median : 1D numpy array the same size as data, nan outside the interval and where not calculated
+            mad : 1D numpy array the same size as data, nan outside the interval and where not calculated
+    """
+    data_size = data.shape[0]
+    if end is None:
+        end = data_size
+    median = np.full(data_size, np.nan)
+    mad = np.full(data_size, np.nan)
+
+    for i in range(start, end):
+        window = data[max(i - half_width, 0):min(i + half_width + 1, data_size)]
+        window = window[~np.isnan(window)]
+        if window.size >= min_samples:
+            median[i] = np.median(window)
+            mad[i] = np.median(np.abs(window - median[i]))
+
+    return median, mad
+
+
+########################################################################################################################
+# data_functions
+def calc_rs_tr(month, rso, delta_t, mm_delta_t, b_zero, b_one, b_two):
+    """
+        Frozen copy of data_functions.calc_rs_tr, see that function for details.
+    """
+    mm_rs_tr = np.empty(12)
+    b_coefficient = np.array(b_zero + b_one * np.exp(b_two * mm_delta_t))
+    rs_tr = np.array(rso * (1 - 0.9 * np.exp(-1 * b_coefficient[month - 1] * delta_t ** 1.5)))
+
+    # Create mean monthly values
+    j = 1
+    for k in range(12):
+        temp_indexes = [ex for ex, ind in enumerate(month) if ind == j]
+        temp_indexes = np.array(temp_indexes, dtype=int)
+
+        mm_rs_tr[k] = np.nanmean(rs_tr[temp_indexes])
+        j += 1
+
+    return rs_tr, mm_rs_tr
+
+
+def compile_ea(tmax, tmin, tavg, ea, tdew, tdew_col, rhmax, rhmax_col, rhmin, rhmin_col, rhavg, rhavg_col, tdew_ko):
+    """
+        Frozen copy of data_functions.compile_ea, see that function for details.
+    """
+    data_length = ea.shape[0]
+    compiled_ea = np.empty(data_length) * np.nan
+    tdew_calc_ea = np.empty(data_length) * np.nan
+    rh_max_min_calc_ea = np.empty(data_length) * np.nan
+    rh_avg_calc_ea = np.empty(data_length) * np.nan
+
+    # TDew data filled in with TMin - Ko curve is always an option
+    tdew_ko_calc_ea = np.array(0.6108 * np.exp((17.27 * tdew_ko) / (tdew_ko + 237.3)))  # EQ 8, units kPa
+
+    if tdew_col != -1:  # Dewpoint temperature is provided
+
+        tdew_calc_ea = np.array(0.6108 * np.exp((17.27 * tdew) / (tdew + 237.3)))  # EQ 8, units kPa
+
+    if rhmax_col != -1 and rhmin_col != -1:  # relative humidity is provided
+
+        eo_tmax = np.array(0.6108 * np.exp((17.27 * tmax) / (tmax + 237.3)))  # units kPa, EQ 7
+        eo_tmin = np.array(0.6108 * np.exp((17.27 * tmin) / (tmin + 237.3)))  # units kPa, EQ 7
+
+        rh_max_min_calc_ea = np.array(((eo_tmin * (rhmax / 100)) + (eo_tmax * (rhmin / 100))) / 2)  # EQ 11
+
+    if rhavg_col != -1:  # RHAvg is provided
+
+        eo_tavg = np.array(0.6108 * np.exp((17.27 * tavg) / (tavg + 237.3)))  # units kPa, EQ 7
+        rh_avg_calc_ea = np.array(eo_tavg * (rhavg / 100))  # EQ 14
+
+    for i in range(data_length):
+        if np.isnan(ea[i]):  # Either Ea is provided or is already calculated by the best humidity variable available
+
+            if not np.isnan(tdew_calc_ea[i]):
+                compiled_ea[i] = tdew_calc_ea[i]
+
+            elif np.isnan(tdew_calc_ea[i]) and not np.isnan(rh_max_min_calc_ea[i]):
+                compiled_ea[i] = rh_max_min_calc_ea[i]
+
+            elif np.isnan(tdew_calc_ea[i]) and np.isnan(rh_max_min_calc_ea[i]) and not np.isnan(rh_avg_calc_ea[i]):
+                compiled_ea[i] = rh_avg_calc_ea[i]
+
+            elif np.isnan(tdew_calc_ea[i]) and np.isnan(rh_max_min_calc_ea[i]) and np.isnan(rh_avg_calc_ea[i]):
+                compiled_ea[i] = tdew_ko_calc_ea[i]
+
+        else:  # ea exists here so no need to fill
+            compiled_ea[i] = ea[i]
+
+    return compiled_ea
+
+
+########################################################################################################################
+# qaqc_functions
+def modified_z_score_outlier_detection(data):
+    """
+        Frozen copy of qaqc_functions.modified_z_score_outlier_detection, see that function for details.
+    """
+    threshold = 3.5
+    cleaned_data = np.array(data)
+
+    median = np.nanmedian(data)
+    median_absolute_deviation = np.nanmedian([np.abs(x - median) for x in data])
+    modified_z_scores = np.array([0.6745 * (x - median) / median_absolute_deviation for x in data])
+
+    warnings.filterwarnings('ignore', 'invalid value encountered')  # catch invalid value warning for nans in data
+    removed_indices = np.array(np.where(np.abs(modified_z_scores) > threshold))  # array of indices for zscore > thresh
+    warnings.resetwarnings()  # reset warning filter to default
+
+    cleaned_data[removed_indices] = np.nan  # set those indices to nan
+    outlier_count = removed_indices.size
+    return cleaned_data, outlier_count
+
+
+def temp_find_outliers(log_writer, t_var_one, var_one_name, t_var_two, var_two_name, month):
+    """
+        Frozen copy of qaqc_functions.temp_find_outliers, see that function for details.
+    """
+    log_writer.write('User has opted to use a modified z-score approach to identify and remove outliers. \n')
+    var_one_total_outliers = 0
+    var_two_total_outliers = 0
+
+    corrected_var_one = np.array(t_var_one)
+    corrected_var_two = np.array(t_var_two)
+
+    k = 1
+    while k <= 12:
+        t_index = np.where(month == k)[0]
+
+        (corrected_var_one[t_index], var_one_outlier_count) = modified_z_score_outlier_detection(t_var_one[t_index])
+        (corrected_var_two[t_index], var_two_outlier_count) = modified_z_score_outlier_detection(t_var_two[t_index])
+
+        var_one_total_outliers = var_one_total_outliers + var_one_outlier_count
+        var_two_total_outliers = var_two_total_outliers + var_two_outlier_count
+        k += 1
+
+    print('{0} outliers were removed on variable {1}.'.format(var_one_total_outliers, var_one_name))
+    print('{0} outliers were removed on variable {1}.'.format(var_two_total_outliers, var_two_name))
+    log_writer.write('{0} outliers were removed on variable {1}. \n'.format(var_one_total_outliers, var_one_name))
+    log_writer.write('{0} outliers were removed on variable {1}. \n'.format(var_two_total_outliers, var_two_name))
+
+    return corrected_var_one, corrected_var_two
+
+
+def rh_yearly_percentile_corr(log_writer, start, end, rhmax, rhmin, year, percentage):
+    """
+        Frozen copy of qaqc_functions.rh_yearly_percentile_corr, see that function for details.
+    """
+
+    # Obtain sample size from percentage value provided
+    percentage_sample_size = np.floor(100/percentage)
+    # ID unique years in data set
+    unique_years = np.unique(year)
+    corr_sample_per_year = np.zeros(unique_years.size)
+    rh_corr_per_year = np.zeros(unique_years.size)
+
+    corr_rhmax = np.array(rhmax)
+    corr_rhmin = np.array(rhmin)
+
+    for k in range(unique_years.size):
+        t_index = np.where(year == unique_years[k])[0]
+        t_index = np.array(t_index)
+
+        rh_year = np.array(rhmax[t_index])
+        rh_year = rh_year[~np.isnan(rh_year)]
+
+        # find the required number of days to sample each year by dividing the size of the year by percent_sample_size
+        corr_sample_per_year[k] = int(np.floor((rh_year.size / percentage_sample_size)))
+        if corr_sample_per_year[k] < 1:
+            corr_sample_per_year[k] = 1
+        else:
+            pass
+
+        rh_year_sorted = rh_year.argsort()
+        rh_values_to_pull = int(corr_sample_per_year[k])
+        rh_sample_indexes = rh_year_sorted[-rh_values_to_pull:]
+        rh_corr_per_year[k] = 100 / np.nanmean(rh_year[rh_sample_indexes])
+
+        print("{0} days were included in year {1} of the RH correction process."
+              .format(rh_year.size, unique_years[k]))
+
+    # Check to see if the years are lined up, Ex. data file starts in 2001 but correction starts in 2004
+    offset = 0
+    if start != 0:  # If the start of the interval is at 0 then we're already lined up
+        align_bool = 1
+        while align_bool == 1:
+            if year[start] != unique_years[offset]:
+                offset += 1
+            else:
+                align_bool = 0
+    else:
+        pass
+
+    # Now we apply the correction to both RHmax and RHmin
+    rhmax_cutoff = 0  # tracks number of observations corrected above 100%
+    rhmin_cutoff = 0  # tracks number of observations corrected above 100%
+    invert_max_min_cutoff = 0  # tracks the number of times rhmax was less than rhmin (as an initial problem w/ data)
+    for i in range(start, end):
+        if unique_years[offset] == year[i]:  # Years are aligned
+            corr_rhmax[i] = rhmax[i] * rh_corr_per_year[offset]
+            corr_rhmin[i] = rhmin[i] * rh_corr_per_year[offset]
+        else:
+            # Encountered last day of year, increment to next correction year and continue
+            offset += 1
+            corr_rhmax[i] = rhmax[i] * rh_corr_per_year[offset]
+            corr_rhmin[i] = rhmin[i] * rh_corr_per_year[offset]
+
+        # Check for corrected values exceeding 100%
+        if corr_rhmax[i] > 100:
+            corr_rhmax[i] = 100
+            rhmax_cutoff += 1
+        elif corr_rhmax[i] <= 0:  # This should never really happen but need to control for it anyways.
+            corr_rhmax[i] = 1
+        else:
+            pass
+
+        if corr_rhmin[i] > 100:
+            corr_rhmin[i] = 100
+            rhmin_cutoff += 1
+        elif corr_rhmin[i] <= 0:  # This should never really happen but need to control for it anyways
+            corr_rhmin[i] = 1
+        else:
+            pass
+
+        if corr_rhmax[i] < corr_rhmin[i]:
+            corr_rhmax[i] = np.nan
+            corr_rhmin[i] = np.nan
+            invert_max_min_cutoff += 1
+        else:
+            pass
+
+    print("\n" + str(rhmax_cutoff) + " RHMax data points were removed for exceeding the logical limit of 100%.")
+    print("\n" + str(rhmin_cutoff) + " RHMin data points were removed for exceeding the logical limit of 100%.")
+    print("\n" + str(invert_max_min_cutoff) + " indexes were removed because RHMax was less than RHMin.")
+    log_writer.write('Year-based RH correction used the top %s percentile (%s points for a full year), '
+                     'RHMax had %s points exceed 100 percent.'
+                     ' RHMin had %s points exceed 100 percent. \n'
+                     % (percentage, int(np.floor((365 / percentage_sample_size))), rhmax_cutoff, rhmin_cutoff))
+
+    return corr_rhmax, corr_rhmin
+
+
+def rs_period_ratio_corr(log_writer, start, end, rs, rso, sample_size_per_period, period):
+    """
+        Frozen copy of qaqc_functions.rs_period_ratio_corr, see that function for details.
+    """
+
+    corr_rs = np.array(rs)  # corrected variable that all the corrections are going to be written to
+    insufficient_period_counter = 0  # counter for the number of periods that were removed due to insufficient data
+    insufficient_data_counter = 0  # counter for the number of rs data points that were removed due to insufficient data
+    despike_counter = 0
+
+    # Determining correction factor for intervals based on pre-defined periods
+    num_periods = int(math.ceil((end - start) / period))
+    rs_period = np.zeros(period)
+    rso_period = np.zeros(period)
+    period_corr = np.zeros(num_periods)
+
+    # Placing intervals in separate array for easy handling
+    rs_interval = np.array(rs[start:end])
+    rso_interval = np.array(rso[start:end])
+    despiked_rs_interval = np.array([])  # used to recreate interval of rs that will track the despiking of points
+
+    # separate the interval into predefined periods and compute correction
+    count_one = 0  # index for full correction interval
+    count_two = 0  # index for within each period
+    count_three = 0  # index for number of periods
+    while count_one < len(rs_interval):
+        if ((count_two < period) and count_one == len(rs_interval) - 1) or count_two == period:
+            # The first part of this if statement handles reaching the end of the final period
+            # The second part of this if statement handles reaching the end of any other period
+
+            if count_two < period:  # We are dealing with the final period
+                rs_period[count_two] = rs_interval[count_one]
+                rso_period[count_two] = rso_interval[count_one]
+
+                # each period's data is overwritten by the subsequent period's data, because the final period may not
+                # have 60 days, chop off remaining days that have values from previous period.
+                rs_period = rs_period[:count_two + 1].copy()
+                rso_period = rso_period[:count_two + 1].copy()
+                count_one += 1  # increment by 1 to end the loop after this iteration
+
+            else:  # We have reached the end of a period, no special treatment needed
+                pass
+
+            # Now that we are at the end of a period or finishing up the last period, we check for the existence of
+            # potential voltage spikes
+            period_ratios = np.divide(rs_period, rso_period)
+            period_ratios_copy = np.array(period_ratios)  # make a copy, we remove largest val to find the next largest
+            max_ratio_indexes = []  # tracks the indexes of the maximum values found
+
+            invalid_period = 0  # boolean flag to specify if this period has the data necessary to calculate corr factor
+            despike_loop = 1  # boolean flag to specify if we should keep checking for voltage spikes or not
+
+            # First, check to see if there are non-nan values present
+            # and the period has at least the sample size in days present
+            # and pull the 6 largest ratios to serve as the initial correction factor.
+            if np.any(np.isfinite(period_ratios_copy)) and np.size(period_ratios_copy) >= sample_size_per_period:
+                for i in range(sample_size_per_period):  # loop through and return enough largest non nan values
+                    max_ratio_indexes.append(np.nanargmax(period_ratios_copy))
+                    period_ratios_copy[np.nanargmax(period_ratios_copy)] = np.nan  # set to nan to find next largest
+
+                    if np.any(np.isfinite(period_ratios_copy)):  # are any non-nan values still present?
+                        # Yes, continue to find next largest value
+                        pass
+                    else:
+                        # only nans are left, have to quit loop and throw out the data
+                        invalid_period = 1
+                        despike_loop = 0
+                        print('\nA period was thrown out due to insufficient data, failed finding valid point # %s '
+                              ' out of the required %s.' % (i + 1, sample_size_per_period))
+                        break
+            else:
+                # there is not enough data in this final period to compute correction data
+                print('\nA period was thrown out due to insufficient data, either because it had no valid ratios,'
+                      'or because it had less than %s days.' % sample_size_per_period)
+                invalid_period = 1
+                despike_loop = 0
+
+            # institute a loop that remains true as long as none of the ending conditions are met
+            # while we iterate down the rest of the values until we're reasonably sure that remaining points
+            # don't massively shift the data
+            cf_index_start = 0
+            cf_index_end = cf_index_start + sample_size_per_period  # ending index is not inclusive
+            new_cf_index_start = cf_index_start + 1
+            new_cf_index_end = cf_index_end + 1
+            while despike_loop == 1:
+
+                if np.any(np.isfinite(period_ratios_copy)) and np.size(period_ratios_copy) >= sample_size_per_period:
+                    max_ratio_indexes.append(np.nanargmax(period_ratios_copy))
+                    period_ratios_copy[np.nanargmax(period_ratios_copy)] = np.nan  # set to nan to find next largest
+
+                else:
+                    # only nans are left, end the loop and set the period as invalid
+                    # this is under the logic that if we've iterated through all points without finding a
+                    # non-likely-spike then something is obviously wrong with this period.
+                    invalid_period = 1
+                    despike_loop = 0
+                    print('\nA period was thrown out due to failing to find a sufficient '
+                          'number of valid values when testing for despiking.')
+
+                rs_avg = np.nanmean(rs_period[max_ratio_indexes[cf_index_start:cf_index_end]])
+                rso_avg = np.nanmean(rso_period[max_ratio_indexes[cf_index_start:cf_index_end]])
+
+                new_rs_avg = np.nanmean(rs_period[max_ratio_indexes[new_cf_index_start:new_cf_index_end]])
+                new_rso_avg = np.nanmean(rso_period[max_ratio_indexes[new_cf_index_start:new_cf_index_end]])
+
+                # Example: if current_cf uses largest points 0-5, new_cf uses largest points 1-6 (omitting the largest)
+
+                current_cf = rso_avg / rs_avg  # current correction factor from currently used points
+                new_cf = new_rso_avg / new_rs_avg  # exploratory correction factor used to check for large changes
+                diff_cf = new_cf - current_cf
+                percent_diff_cf = (diff_cf / current_cf) * 100
+
+                # First of the two rules used to check for the existence of voltage spikes, the logic is that if
+                # removing the largest point causes over a 2% change in the correction factor (which is an average of
+                # six largest points) then that point carried an undue influence and is a likely voltage spike
+                # We only need to care if Rs_average is above Rso_average, it it was below rso_average then it likely
+                # would not be a voltage spike
+                if percent_diff_cf >= 2.0 and rs_avg > rso_avg:
+                    new_cf_significant_change = True
+                else:
+                    new_cf_significant_change = False
+
+                # Second of the two rules used to check for the existence of voltage spikes is if Rs average
+                # is sufficiently larger than rso average. This would occur with a lot of spikes with consistent values,
+                # this should occur very infrequently
+                if (rs_avg - rso_avg) >= 75:
+                    rs_avg_greatly_exceeds_rso_avg = True
+                else:
+                    rs_avg_greatly_exceeds_rso_avg = False
+
+                # Now we see if either of the two rules were violated
+                if new_cf_significant_change or rs_avg_greatly_exceeds_rso_avg:
+                    # at least one of the rules were violated, so continue forward with the next iteration
+
+                    # check for the rarer rule occuring:
+                    if not new_cf_significant_change and rs_avg_greatly_exceeds_rso_avg:
+                        print('\nWARNING: The rule for rs greatly exceeding rso was triggered without triggering the'
+                              ' significant change to correction factor rule. Look at the data to make sure the data'
+                              ' has a lot of voltage spikes. Period was {} starting around {} and ending around {}. \n'
+                              .format(count_three, (count_one - period), count_one))
+
+                    # increment indexes and keep iterating for more spikes
+                    cf_index_start += 1
+                    cf_index_end = cf_index_start + sample_size_per_period  # ending index is not inclusive
+                    new_cf_index_start = cf_index_start + 1
+                    new_cf_index_end = cf_index_end + 1
+
+                    despike_counter += 1
+                else:
+                    # if neither of the two rules were violated, we can proceed with the assumption that all likely
+                    # spikes have been removed, and we use the current_cf as the correction factor
+                    despike_loop = 0
+
+            if invalid_period != 1:  # period has valid data to compute correction factor
+                rs_avg = np.nanmean(rs_period[max_ratio_indexes[cf_index_start:cf_index_end]])
+                rso_avg = np.nanmean(rso_period[max_ratio_indexes[cf_index_start:cf_index_end]])
+
+                period_corr[count_three] = rso_avg / rs_avg  # compute the correction factor
+
+                # Go through and set the rs points marked as likely spikes to a unique identifier to find later
+                rs_period[max_ratio_indexes[:cf_index_start]] = -12345
+
+            else:
+                # This period has insufficient data to correct, instead we will remove all poitns and track how many we
+                # remove
+                removed_points = np.count_nonzero(~np.isnan(rs_period))  # count number of points we're about to remove
+                rs_period[:] = np.nan  # insufficient data exists to correct this period, so set it to nan
+                period_corr[count_three] = np.nan
+                insufficient_period_counter += 1
+                insufficient_data_counter += removed_points
+                print('\nThis insufficient period contained %s datapoints for Rs, which have been set to nan.'
+                      % removed_points)
+
+            # add this period's rs data, which has potentially been thrown out or despiked, to the new interval of rs
+            despiked_rs_interval = np.append(despiked_rs_interval, rs_period)
+
+            # adjust counters to move to next period, if this is the final period then then does nothing.
+            count_two = 0
+            count_three += 1
+
+        elif count_two < period:
+            # haven't run out of data points, and period still hasn't been filled
+            rs_period[count_two] = rs_interval[count_one]
+            rso_period[count_two] = rso_interval[count_one]
+            count_one += 1
+            count_two += 1
+
+        else:
+            # This should never happen
+            pass
+
+    # Now that the correction factor has been computed for each period, we now step through each period again and
+    # apply those correction factors
+
+    corr_rs[start:end] = despiked_rs_interval[:]  # save all the values removed for despiking/insufficient data
+    correction_cutoff_counter = 0
+    rso_clipping_counter = 0
+    unchanged_data_counter = 0
+    x = start  # index that tracks along data points for the full selected correction interval
+    y = 0  # index that tracks how far along a period we are
+    z = 0  # index that tracks which correction period we are in
+    while x < len(rs) and x < end and z < len(period_corr):
+        # x is less than the length of var1 to prevent OOB,
+        # and is before or at the end of the correction interval
+        # and we have not yet run out of correction periods
+        # and capping correction by a fifty percent increase or decrease
+        if y <= period:
+            # if y is less than the size of a correction period
+
+            # Check to see if rs correction factor is smaller than a 50% relative increase or decrease
+            # if it is larger than that we will remove it for a later fill with Rs_TR
+            if period_corr[z] <= 1.50 or period_corr[z] >= 0.5:
+
+                # was the current rs point removed for being a voltage spike?
+                # if so, set it to 1.05*Rso and leave it there (do not later clip it)
+                if corr_rs[x] == -12345:
+                    corr_rs[x] = rso[x] * 1.05
+
+                # current rs point was not a potential voltage spike
+                else:
+                    if 0.97 <= period_corr[z] <= 1.03:
+                        # dont change the data under the assumption that the sensor is working
+                        unchanged_data_counter += 1
+                    else:
+                        # apply the correction to the data
+                        corr_rs[x] = rs[x] * period_corr[z]
+
+                    if corr_rs[x] > (rso[x] * 1.03):  # Check to see if Rs now sufficiently exceeds rso for clipping
+                        corr_rs[x] = rso[x]
+                        rso_clipping_counter += 1
+                    else:  # no special action needed
+                        pass
+
+            elif np.isnan(period_corr[z]):
+                # This data was already set to nan during the steps above, so pass
+                pass
+            else:
+                # correction factor would be too high, so throw out the data
+                corr_rs[x] = np.nan
+                correction_cutoff_counter += 1
+            x += 1
+            y += 1
+        else:
+            # We have reached the end of the correction period, go to next period
+            y = 1
+            z += 1
+
+    print('\n%s data points were removed as part of the despiking process. \n' % despike_counter)
+
+    print('\n%s Rs data points were removed due to their correction factor exceeding a '
+          '50 percent relative increase or decrease. \n' % correction_cutoff_counter)
+
+    print('\n%s Rs data points in %s different periods were removed due to insufficient data present in either Rs or '
+          'Rso to compute a correction factor. \n' % (insufficient_data_counter, insufficient_period_counter))
+
+    print('\n%s Rs data points were clipped to Rso due to exceeding 1.03 * Rso after correction.'
+          % rso_clipping_counter)
+
+    print('\n%s Rs data points were unchanged due to the correction factor being between 0.97 and 1.03.'
+          % unchanged_data_counter)
+
+    log_writer.write('Periodic ratio-based Rs corrections were applied,'
+                     ' period length was %s, and correction sample size was %s. \n'
+                     % (period, sample_size_per_period))
+    log_writer.write('%s data points were removed as part of the despiking process. \n'
+                     % despike_counter)
+    log_writer.write('%s Rs data points in %s different periods were removed due to insufficient data present in'
+                     ' either Rs or Rso to compute a correction factor. \n'
+                     % (insufficient_data_counter, insufficient_period_counter))
+    log_writer.write('%s data points were removed due to their correction factor exceeding a '
+                     '50 percent relative increase or decrease. \n' % correction_cutoff_counter)
+    log_writer.write('\n%s Rs data points were clipped to  1.03 * Rso due to exceeding 1.03 * Rso after correction.'
+                     % rso_clipping_counter)
+
+    return corr_rs, rso
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
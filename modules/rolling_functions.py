@@ -0,0 +1,184 @@
+from bisect import bisect_left, insort
+import numpy as np
+
+
+class SortedWindow:
+    """
+        Keeps the values of a sliding window in sorted order so that order statistics (median and median absolute
+        deviation) can be found without re-sorting the window every time it moves. Adding or removing a value is a
+        binary search plus a list insert/delete, and both statistics are found with binary searches, so sliding the
+        window over a record of length n with window size w costs O(n log w) comparisons.
+    """
+
+    def __init__(self):
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        insort(self.values, value)
+
+    def remove(self, value):
+        del self.values[bisect_left(self.values, value)]
+
+    def median(self):
+        size = len(self.values)
+        if size % 2 == 1:
+            return self.values[size // 2]
+        else:
+            return (self.values[size // 2 - 1] + self.values[size // 2]) / 2.0
+
+    def median_absolute_deviation(self, median):
+        """
+            Finds the median of the absolute deviations from the provided median. The deviations of the values below
+            the median and of those above it each form a sorted sequence, so the median of both together is found by
+            searching for the k-th smallest value of two sorted sequences instead of sorting all of the deviations.
+
+            Parameters:
+                median : float of window median
+
+            Returns:
+                mad : float of median absolute deviation
+        """
+        size = len(self.values)
+        split = bisect_left(self.values, median)
+
+        def below(j):  # j-th smallest deviation of the values below the median
+            return median - self.values[split - 1 - j]
+
+        def above(j):  # j-th smallest deviation of the values at or above the median
+            return self.values[split + j] - median
+
+        below_size = split
+        above_size = size - split
+        if size % 2 == 1:
+            return kth_of_two_sorted(below, below_size, above, above_size, size // 2)
+        else:
+            return (kth_of_two_sorted(below, below_size, above, above_size, size // 2 - 1) +
+                    kth_of_two_sorted(below, below_size, above, above_size, size // 2)) / 2.0
+
+
+def kth_of_two_sorted(first, first_size, second, second_size, k):
+    """
+        Finds the k-th smallest value (starting from 0) of two sorted sequences combined, in O(log n) steps.
+
+        Parameters:
+            first : function that returns the j-th value of the first sorted sequence
+            first_size : integer of size of first sequence
+            second : function that returns the j-th value of the second sorted sequence
+            second_size : integer of size of second sequence
+            k : integer of which value to find
+
+        Returns:
+            value : the k-th smallest value
+    """
+    # Binary search on how many of the k + 1 smallest values come from the first sequence
+    low = max(0, k + 1 - second_size)
+    high = min(first_size, k + 1)
+    while low < high:
+        taken = (low + high) // 2
+        if first(taken) < second(k - taken):
+            low = taken + 1
+        else:
+            high = taken
+
+    candidates = []
+    if low > 0:
+        candidates.append(first(low - 1))
+    if k - low >= 0:
+        candidates.append(second(k - low))
+    return max(candidates)
+
+
+def seasonal_median_mad(data, doy, half_width, min_samples):
+    """
+        Calculates the median and median absolute deviation for every day of year, using every value of the record
+        that falls within half_width days of that day of year (wrapping around the end of the year) in any year.
+
+        Parameters:
+            data : 1D numpy array of values
+            doy : 1D numpy array of day of year values (1 to 366) matching data
+            half_width : integer of days on either side of each day of year to include
+            min_samples : integer of minimum number of values needed in a window to calculate statistics
+
+        Returns:
+            median : 1D numpy array of length 367, indexed by day of year, nan where statistics were not calculated
+            mad : 1D numpy array of length 367, indexed by day of year, nan where statistics were not calculated
+    """
+    half_width = min(half_width, 182)  # Any wider and days would be counted twice
+    median = np.full(367, np.nan)
+    mad = np.full(367, np.nan)
+
+    valid = ~np.isnan(data)
+    groups = [[] for _ in range(367)]
+    for (value, day) in zip(data[valid].tolist(), doy[valid].tolist()):
+        groups[int(day)].append(value)
+
+    def wrap(day):  # days of year run from 1 to 366
+        return (day - 1) % 366 + 1
+
+    window = SortedWindow()
+    for day in range(1 - half_width, 2 + half_width):
+        for value in groups[wrap(day)]:
+            window.add(value)
+
+    for day in range(1, 367):
+        if len(window) >= min_samples:
+            median[day] = window.median()
+            mad[day] = window.median_absolute_deviation(median[day])
+
+        for value in groups[wrap(day - half_width)]:
+            window.remove(value)
+        for value in groups[wrap(day + half_width + 1)]:
+            window.add(value)
+
+    return median, mad
+
+
+def moving_median_mad(data, half_width, min_samples, start=0, end=None):
+    """
+        Calculates the median and median absolute deviation of a window centered on every value in an interval of the
+        record, using the values within half_width steps on either side of it.
+
+        Parameters:
+            data : 1D numpy array of values
+            half_width : integer of steps on either side of each value to include
+            min_samples : integer of minimum number of values needed in a window to calculate statistics
+            start : starting index of interval to calculate statistics for
+            end : ending index of interval to calculate statistics for, not inclusive
+
+        Returns:
+            median : 1D numpy array the same size as data, nan outside the interval and where not calculated
+            mad : 1D numpy array the same size as data, nan outside the interval and where not calculated
+    """
+    data_size = data.shape[0]
+    if end is None:
+        end = data_size
+    median = np.full(data_size, np.nan)
+    mad = np.full(data_size, np.nan)
+    values = data.tolist()
+
+    window = SortedWindow()
+    for i in range(max(start - half_width, 0), min(start + half_width + 1, data_size)):
+        if values[i] == values[i]:  # nan is the only value that isn't equal to itself
+            window.add(values[i])
+
+    for i in range(start, end):
+        if len(window) >= min_samples:
+            median[i] = window.median()
+            mad[i] = window.median_absolute_deviation(median[i])
+
+        leaving = i - half_width
+        entering = i + half_width + 1
+        if leaving >= 0 and values[leaving] == values[leaving]:
+            window.remove(values[leaving])
+        if entering < data_size and values[entering] == values[entering]:
+            window.add(values[entering])
+
+    return median, mad
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
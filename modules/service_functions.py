@@ -0,0 +1,498 @@
+import base64
+import binascii
+import concurrent.futures as cf
+import configparser as cp
+import datetime as dt
+import http.server
+import json
+import math
+import multiprocessing as mp
+import os
+import pathlib as pl
+import shutil
+import threading
+import urllib.parse
+import uuid
+from . import batch_functions
+
+
+# Largest request body the service accepts, in bytes, station files are sent inside the body
+MAX_REQUEST_BYTES = 512 * 1024 * 1024
+
+# Bytes sent at a time when streaming a file back
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def initialize_service_worker(memory_limit_mb):
+    """
+        Sets up every worker process of the service's pool. Workers are kept for as long as the service runs, so
+        everything a station needs is imported here once, rather than at the start of every job.
+
+        Parameters:
+            memory_limit_mb : maximum size in megabytes the worker's memory is allowed to grow to, None for no limit
+
+        Returns:
+            None
+    """
+    batch_functions.initialize_worker(memory_limit_mb)
+    # Every job writes a workbook, and the script itself imports pandas, refet, and every module a station uses
+    import xlsxwriter
+    from . import py_weather_qaqc
+
+
+class JobService:
+    """
+        Runs stations submitted to the HTTP service (see ServiceRequestHandler) as jobs on a pool of worker processes.
+        Unlike batches, the pool's workers are started once and kept between jobs, so every job after a worker's first
+        skips importing pandas, refet, and the rest of the script, which takes a large part of processing a short
+        record. Each job gets its own folder, holding the files it was sent and everything written while processing
+        it (the submitted config file can't choose where a job writes to, see _pinned_options), and is run headless
+        the same way batch_functions.run_station runs a batch station.
+
+        At most max_jobs jobs can be waiting or running at once, further jobs are turned away until some finish. If a
+        worker dies outright the pool cannot tell which job caused it, so every job that was still waiting on the pool
+        is started again in a new pool, up to batch_functions.MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, folder_path='service_files', workers=None, max_jobs=32, memory_limit_mb=None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError('Number of service workers must be at least 1, but {} was provided.'.format(workers))
+        if max_jobs < 1:
+            raise ValueError('Number of service jobs must be at least 1, but {} was provided.'.format(max_jobs))
+
+        self.folder_path = os.path.abspath(folder_path)
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.memory_limit_mb = memory_limit_mb
+        self.jobs = {}  # Every job submitted, keyed on its id
+        self.lock = threading.Lock()
+        self.executor = None
+        os.makedirs(self.folder_path, exist_ok=True)
+
+    def start(self):
+        """
+            Starts the pool's worker processes, so that the first jobs do not have to wait for them to start up.
+
+            Returns:
+                None
+        """
+        with self.lock:
+            self._start_pool()
+
+    def close(self):
+        """
+            Stops the pool's worker processes, jobs that haven't started are cancelled.
+
+            Returns:
+                None
+        """
+        with self.lock:
+            executor = self.executor
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, request):
+        """
+            Creates a job from a submitted station and queues it on the pool.
+
+            Parameters:
+                request : dictionary of the submitted station, with the keys
+                    'config' : string of contents of the station's config file
+                    'data' : string of base64 encoded contents of the station's data file
+                    'data_file_name' : string of name of the data file, its extension tells how it is read
+                    'recipe' : optional recipe (see recipe_functions.read_recipe) to correct the station with
+
+            Returns:
+                status : dictionary of the job's status, see status, None if max_jobs jobs are already waiting or
+                    running
+        """
+        for key in ['config', 'data', 'data_file_name']:
+            if not isinstance(request.get(key), str):
+                raise ValueError('Request is missing \'{}\'.'.format(key))
+        data_file_name = pl.PurePath(request['data_file_name']).name
+        if data_file_name in ['', '.', '..']:
+            raise ValueError('Request has an invalid data file name \'{}\'.'.format(request['data_file_name']))
+        try:
+            data = base64.b64decode(request['data'], validate=True)
+        except binascii.Error:
+            raise ValueError('Request \'data\' is not base64 encoded.')
+
+        job_id = uuid.uuid4().hex
+        job_folder_path = os.path.join(self.folder_path, job_id)
+        with self.lock:
+            if self._active_jobs() >= self.max_jobs:
+                return None
+            # Reserved before the files are written, so that jobs submitted at the same time can't exceed max_jobs
+            self.jobs[job_id] = {'id': job_id, 'folder_path': job_folder_path, 'attempts': 0, 'executor': None,
+                                 'future': None, 'result': None,
+                                 'submitted': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+        try:
+            os.makedirs(job_folder_path)
+            with open(os.path.join(job_folder_path, data_file_name), 'wb') as data_file:
+                data_file.write(data)
+            with open(os.path.join(job_folder_path, 'submitted_config.ini'), 'w') as config_file:
+                config_file.write(request['config'])
+
+            recipe_file_path = None
+            if request.get('recipe') is not None:
+                recipe_file_path = os.path.join(job_folder_path, 'recipe.json')
+                with open(recipe_file_path, 'w') as recipe_file:
+                    json.dump(request['recipe'], recipe_file)
+
+            # The station's files are read from, and its output files written to, the job's folder
+            # Jobs can't prompt the user, so any plots are saved instead of being served
+            config_file_path = os.path.join(job_folder_path, 'config.ini')
+            batch_functions.write_station_config(
+                os.path.join(job_folder_path, 'submitted_config.ini'), config_file_path,
+                {'METADATA': {'data_file_path': os.path.join(job_folder_path, data_file_name)},
+                 'OPTIONS': dict(self._pinned_options(job_folder_path), recipe_file_path='', plot_server_option=0)})
+        except Exception as error:
+            with self.lock:
+                del self.jobs[job_id]
+            shutil.rmtree(job_folder_path, ignore_errors=True)
+            if isinstance(error, (KeyError, cp.Error)):
+                # Config files missing a section, or that can't be parsed at all
+                raise ValueError('Request \'config\' is not a valid config file: {}'.format(error))
+            raise
+
+        with self.lock:
+            job = self.jobs[job_id]
+            job['station_job'] = {'name': 'station', 'config_path': config_file_path,
+                                  'recipe_file_path': recipe_file_path, 'metadata_id': None, 'run_count': None}
+            self._queue(job)
+            return self._status(job)
+
+    def _pinned_options(self, job_folder_path):
+        """
+            Finds the config file options that set where a job writes to, which are never taken from the submitted
+            config file, as that would let a request write to (or remove) any folder the service can reach. The
+            metadata store, Parquet dataset, and NetCDF cube of a job are kept in its own folder (a blank path puts
+            them next to the station's output files), and every job shares the service's result cache.
+        """
+        return {'metadata_store_path': os.path.join(job_folder_path, 'correction_metadata.db'),
+                'parquet_dataset_path': '', 'netcdf_file_path': '',
+                'result_cache_path': os.path.join(self.folder_path, 'result_cache')}
+
+    def status(self, job_id=None):
+        """
+            Finds the status of a job, or of every job.
+
+            Parameters:
+                job_id : string of id of the job, None for every job
+
+            Returns:
+                status : dictionary of the job's id, status ('queued', 'running', 'succeeded', or 'failed'), when it
+                    was submitted, and once it has finished, the outcome returned by batch_functions.run_station, None
+                    if there is no such job, or a list of them for every job. A job counts as running once the pool
+                    has handed it on to its workers, which it does for up to one more job than there are workers
+        """
+        with self.lock:
+            if job_id is None:
+                return [self._status(job) for job in self.jobs.values()]
+            elif job_id not in self.jobs:
+                return None
+            return self._status(self.jobs[job_id])
+
+    def summary(self):
+        """
+            Counts the workers of the service and its jobs by status.
+
+            Returns:
+                summary : dictionary of the number of workers, the most jobs that can wait or run at once, and the
+                    number of jobs of each status
+        """
+        summary = {'workers': self.workers, 'max_jobs': self.max_jobs, 'queued': 0, 'running': 0, 'succeeded': 0,
+                   'failed': 0}
+        for job_status in self.status():
+            summary[job_status['status']] += 1
+        return summary
+
+    def file_path(self, job_id, relative_path=None):
+        """
+            Finds a file of a finished job.
+
+            Parameters:
+                job_id : string of id of the job
+                relative_path : string of path of the file inside the job's folder, None for the job's output workbook
+
+            Returns:
+                file_path : string of path to the file, None if there is no such job or file
+                finished : boolean of whether the job has finished, files are only found once it has
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None, False
+            elif job['result'] is None:
+                return None, False
+            elif relative_path is None:
+                output_path = job['result']['output_path']
+                return (os.path.abspath(output_path) if output_path is not None else None), True
+
+        file_path = os.path.realpath(os.path.join(job['folder_path'], relative_path))
+        # Only files inside the job's own folder can be sent back
+        if os.path.commonpath([file_path, os.path.realpath(job['folder_path'])]) != \
+                os.path.realpath(job['folder_path']) or not os.path.isfile(file_path):
+            return None, True
+        return file_path, True
+
+    def files(self, job_id):
+        """
+            Lists every file of a finished job.
+
+            Parameters:
+                job_id : string of id of the job
+
+            Returns:
+                files : list of string of paths of the files, relative to the job's folder, None if there is no such
+                    job or it hasn't finished
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['result'] is None:
+                return None
+        return sorted(str(path.relative_to(job['folder_path'])) for path in pl.Path(job['folder_path']).rglob('*')
+                      if path.is_file())
+
+    def remove(self, job_id):
+        """
+            Deletes a finished job along with its folder.
+
+            Parameters:
+                job_id : string of id of the job
+
+            Returns:
+                removed : boolean of whether the job was removed, it isn't if it hasn't finished
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['result'] is None:
+                return False
+            del self.jobs[job_id]
+        shutil.rmtree(job['folder_path'], ignore_errors=True)
+        return True
+
+    def _active_jobs(self):
+        """
+            Counts the jobs that are waiting or running, must be called with the lock held
+        """
+        return len([job for job in self.jobs.values() if job['result'] is None])
+
+    def _finish(self, job, future):
+        """
+            Records the outcome of a job once the pool is done with it, restarting it in a new pool if its worker died
+        """
+        with self.lock:
+            if future is not job['future']:
+                return  # Outcome of a pool that was already replaced
+            try:
+                job['result'] = future.result()
+            except cf.CancelledError:
+                job['result'] = batch_functions.failed_result(job['station_job'], 'Service was stopped.')
+            except cf.process.BrokenProcessPool:
+                if job['attempts'] < batch_functions.MAX_ATTEMPTS and self.executor is not None:
+                    if job['executor'] is self.executor:
+                        # Only the first job to notice that the pool broke replaces it
+                        self._start_pool()
+                    self._queue(job)
+                    return
+                job['result'] = batch_functions.failed_result(job['station_job'], 'Worker process died unexpectedly.')
+            except Exception as error:
+                # Errors raised outside of the station itself, such as running out of memory while starting up
+                job['result'] = batch_functions.failed_result(job['station_job'], '{}: {}'.format(
+                    type(error).__name__, error))
+            print('\nSystem: Job {} {} after {} seconds.'.format(job['id'], job['result']['status'],
+                                                                 job['result']['seconds']))
+
+    def _queue(self, job):
+        """
+            Submits a job to the pool, must be called with the lock held
+        """
+        if self.executor is None:
+            raise IOError('\n\nThe service has been stopped, no more jobs can be run.')
+        job['attempts'] += 1
+        job['executor'] = self.executor
+        job['future'] = self.executor.submit(batch_functions.run_station, job['station_job'], job['folder_path'])
+        # Callbacks are called on the pool's own thread, which can't replace the pool if it broke
+        job['future'].add_done_callback(lambda future: threading.Thread(target=self._finish, args=(job, future))
+                                        .start())
+
+    def _start_pool(self):
+        """
+            Starts a new pool of workers, replacing a broken one, must be called with the lock held
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        # Spawning fresh processes keeps jobs from inheriting any state from the service, each worker then keeps its
+        # imports for every job it runs
+        self.executor = cf.ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context('spawn'),
+                                               initializer=initialize_service_worker,
+                                               initargs=(self.memory_limit_mb,))
+        for _ in range(self.workers):
+            # Workers are started as tasks are submitted, so an empty task is sent to start each one
+            self.executor.submit(int)
+
+    def _status(self, job):
+        """
+            Describes a job for status, must be called with the lock held
+        """
+        status = {'id': job['id'], 'submitted': job['submitted']}
+        if job['result'] is not None:
+            status['status'] = job['result']['status']
+            # Failed stations have no time or memory, which can't be written to JSON as NaN
+            status.update({key: (None if isinstance(value, float) and math.isnan(value) else value)
+                           for (key, value) in job['result'].items()
+                           if key not in ['name', 'config_path', 'status', 'output_path', 'metadata_id', 'run_count']})
+        elif job['future'] is not None and job['future'].running():
+            status['status'] = 'running'
+        else:
+            status['status'] = 'queued'
+        return status
+
+
+class ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+        Answers the requests of the HTTP service, every request and response body is JSON apart from downloads.
+
+            GET /status                         number of workers and of jobs by status
+            POST /jobs                          submits a station, see JobService.submit, returns the job's status
+            GET /jobs                           status of every job
+            GET /jobs/<id>                      status of a job, see JobService.status
+            GET /jobs/<id>/result               output workbook of a finished job, with the corrected data, ETo, ETr,
+                                                and QC flags of the station
+            GET /jobs/<id>/files                every file of a finished job, including its log and journal
+            GET /jobs/<id>/files/<path>         a single file of a finished job
+            DELETE /jobs/<id>                   deletes a finished job and its files
+
+        The server it is used by has to have a JobService as its service attribute, see create_server.
+    """
+
+    def do_DELETE(self):
+        parts = self._path_parts()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._send_json(404, {'error': 'Not found.'})
+        elif self.server.service.remove(parts[1]):
+            self._send_json(200, {'id': parts[1], 'removed': True})
+        elif self.server.service.status(parts[1]) is None:
+            self._send_json(404, {'error': 'No job with id {}.'.format(parts[1])})
+        else:
+            self._send_json(409, {'error': 'Job {} has not finished.'.format(parts[1])})
+
+    def do_GET(self):
+        parts = self._path_parts()
+        service = self.server.service
+        if parts == ['status']:
+            self._send_json(200, service.summary())
+        elif parts == ['jobs']:
+            self._send_json(200, service.status())
+        elif len(parts) < 2 or parts[0] != 'jobs':
+            self._send_json(404, {'error': 'Not found.'})
+        elif service.status(parts[1]) is None:
+            self._send_json(404, {'error': 'No job with id {}.'.format(parts[1])})
+        elif len(parts) == 2:
+            self._send_json(200, service.status(parts[1]))
+        elif parts[2:] == ['files']:
+            files = service.files(parts[1])
+            if files is None:
+                self._send_json(409, {'error': 'Job {} has not finished.'.format(parts[1])})
+            else:
+                self._send_json(200, files)
+        elif parts[2:] == ['result'] or (parts[2] == 'files' and len(parts) > 3):
+            relative_path = '/'.join(parts[3:]) if parts[2] == 'files' else None
+            (file_path, finished) = service.file_path(parts[1], relative_path)
+            if not finished:
+                self._send_json(409, {'error': 'Job {} has not finished.'.format(parts[1])})
+            elif file_path is None:
+                self._send_json(404, {'error': 'Job {} has no such file.'.format(parts[1])})
+            else:
+                self._send_file(file_path)
+        else:
+            self._send_json(404, {'error': 'Not found.'})
+
+    def do_POST(self):
+        if self._path_parts() != ['jobs']:
+            self._send_json(404, {'error': 'Not found.'})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_REQUEST_BYTES:
+            self._send_json(413, {'error': 'Request is larger than {} bytes.'.format(MAX_REQUEST_BYTES)})
+            return
+        try:
+            request = json.loads(self.rfile.read(length))
+            if not isinstance(request, dict):
+                raise ValueError('Request must be a JSON object.')
+            status = self.server.service.submit(request)
+        except ValueError as error:  # Includes JSON that can't be decoded
+            self._send_json(400, {'error': ' '.join(str(error).split())})
+            return
+        except OSError as error:
+            self._send_json(500, {'error': 'Job could not be created: {}'.format(' '.join(str(error).split()))})
+            return
+
+        if status is None:
+            self._send_json(503, {'error': 'The service already has {} jobs waiting or running, try again later.'
+                                  .format(self.server.service.max_jobs)})
+        else:
+            self._send_json(202, status)
+
+    def log_request(self, code='-', size='-'):
+        # Jobs are polled often, so only requests that failed are printed
+        if isinstance(code, int) and code >= 400:
+            super().log_request(code, size)
+
+    def _path_parts(self):
+        """
+            Splits the path of the request into its unquoted parts
+        """
+        path = urllib.parse.urlsplit(self.path).path
+        return [urllib.parse.unquote(part) for part in path.split('/') if part != '']
+
+    def _send_file(self, file_path):
+        """
+            Streams a file back a chunk at a time, so that large files are never read into memory at once
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(file_path)))
+        self.send_header('Content-Disposition', 'attachment; filename="{}"'.format(os.path.basename(file_path)))
+        self.end_headers()
+        with open(file_path, 'rb') as download_file:
+            shutil.copyfileobj(download_file, self.wfile, DOWNLOAD_CHUNK_BYTES)
+
+    def _send_json(self, code, payload):
+        """
+            Sends a JSON response
+        """
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(service, host='127.0.0.1', port=8080):
+    """
+        Creates the HTTP server of a job service, each request is answered on its own thread.
+
+        Parameters:
+            service : JobService that runs the submitted jobs
+            host : string of address to listen on, defaults to only accepting requests from this computer
+            port : integer of port to listen on
+
+        Returns:
+            server : http.server.ThreadingHTTPServer, started with serve_forever
+    """
+    server = http.server.ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.service = service
+    return server
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
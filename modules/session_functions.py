@@ -0,0 +1,286 @@
+import asyncio
+from bokeh.application import Application
+from bokeh.application.handlers import FunctionHandler
+from bokeh.events import SelectionGeometry
+from bokeh.layouts import column
+from bokeh.models import BoxSelectTool, Div, Plot
+from bokeh.plotting import save
+from bokeh.server.server import Server
+from bokeh.util.browser import view
+import functools
+import logging
+import numpy as np
+import threading
+import time
+
+
+# Path of the page the correction session is served on
+SESSION_PATH = '/correction'
+
+# Milliseconds the session of a closed browser tab is kept for. Discarding a session destroys every model of its
+# document, including the figure still being corrected, so this is longer than any station should take to correct.
+UNUSED_SESSION_LIFETIME = 7 * 24 * 60 * 60 * 1000
+
+
+class CorrectionSession:
+    """
+        A local bokeh server that shows the correction plots in a single browser tab for as long as the station is
+        being corrected, instead of saving a new HTML file and opening a new tab for every iteration. The figure shown
+        is kept in memory, so when the plotting functions update the data of a cached figure (see
+        plotting_functions.FigureCache) only the values that changed are sent to the browser, which takes milliseconds
+        rather than rewriting and reloading the whole file.
+
+        Every plot shown gets a box select tool that only spans dates. The last box drawn is kept, and is turned into
+        a correction interval by selected_interval, so that the user does not have to read indices off of the plots.
+
+        The server runs on its own thread, and the browser tab has to be updated from that thread with the document
+        locked, so everything that builds or changes a shown figure is passed to show or run rather than called
+        directly. Until a tab connects they are called directly instead, and the figure is shown once it does. A
+        reloaded or second tab takes over the figure from the one before it.
+    """
+
+    def __init__(self, port=5006):
+        self.port = port
+        self.url = 'http://localhost:{}{}'.format(port, SESSION_PATH)
+        self.server = None
+        self.thread = None
+        self.document = None  # Document of the browser tab the layout belongs to, None until a tab connects
+        self.latest_document = None  # Document of the last browser tab to connect, which the layout is moved to
+        self.moving = False
+        self.figure = None  # Figure currently being shown
+        self.status = Div(text='Waiting for plots.')
+        self.layout = column(self.status, sizing_mode='stretch_both')
+        self.selection = None  # Range of dates, in milliseconds since the epoch, of the last box selected
+        self.opened = False
+
+    def start(self):
+        """
+            Starts the bokeh server on a background thread, the browser tab is opened when the first plot is shown.
+
+            Returns:
+                None
+        """
+        started = threading.Event()
+        errors = []
+
+        def run_server():
+            # The server's thread needs an event loop of its own, the main thread keeps prompting the user
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            try:
+                self.server = Server({SESSION_PATH: Application(FunctionHandler(self._connect))}, port=self.port,
+                                     allow_websocket_origin=['localhost:{}'.format(self.port),
+                                                             '127.0.0.1:{}'.format(self.port)],
+                                     unused_session_lifetime_milliseconds=UNUSED_SESSION_LIFETIME)
+                self.server.start()
+            except Exception as error:
+                errors.append(error)
+                return
+            finally:
+                started.set()
+            self.server.io_loop.start()
+
+        self.thread = threading.Thread(target=run_server, daemon=True)
+        self.thread.start()
+        started.wait()
+        if len(errors) > 0:
+            raise IOError('\n\nThe correction session could not be started on port {}, set plot_server_port in the '
+                          'config file to a port that is free: {}'.format(self.port, errors[0]))
+        print('\nSystem: Correction plots are being served at {}.'.format(self.url))
+
+    def close(self):
+        """
+            Stops the bokeh server, the browser tab stays open but no longer updates.
+
+            Returns:
+                None
+        """
+        if self.server is not None:
+            self.server.io_loop.add_callback(self._stop)
+            self.thread.join()
+            self.server = None
+            self.thread = None
+            self.document = None
+
+    def show(self, build, *args, **kwargs):
+        """
+            Builds or updates a figure and shows it in the browser tab, opening the tab if it hasn't been yet.
+
+            Parameters:
+                build : function that returns the figure to show, such as plotting_functions.variable_correction_plots
+                *args, **kwargs : arguments passed on to build
+
+            Returns:
+                figure : figure returned by build
+        """
+        def update():
+            started = time.perf_counter()
+            figure = build(*args, **kwargs)
+            if figure is not self.figure:
+                self._attach(figure)
+            self.status.text = 'Plots updated in {:.0f} ms.{}'.format(1000 * (time.perf_counter() - started),
+                                                                     self._selection_text())
+            return figure
+
+        figure = self.run(update)
+        if not self.opened:
+            view(self.url)
+            self.opened = True
+        return figure
+
+    def run(self, function, *args, **kwargs):
+        """
+            Calls a function that reads or changes the figure being shown with the browser tab's document locked.
+            Waits for the server's thread to call it, then passes back what it returned or raised.
+
+            Parameters:
+                function : function to call
+                *args, **kwargs : arguments passed on to function
+
+            Returns:
+                result : value returned by function
+        """
+        if self.document is None:
+            return function(*args, **kwargs)
+
+        finished = threading.Event()
+        result = {}
+        self.document.add_next_tick_callback(functools.partial(self._locked_call, self.document, finished, result,
+                                                               function, args, kwargs))
+        finished.wait()
+        if 'error' in result:
+            raise result['error']
+        return result['value']
+
+    def save(self, figure):
+        """
+            Saves a figure shown in the browser tab to the file set by bokeh.plotting.output_file.
+
+            Parameters:
+                figure : figure to save
+
+            Returns:
+                None
+        """
+        self.run(self._save, figure)
+
+    def selected_interval(self, dt_array):
+        """
+            Finds the interval of the dates selected by the last box drawn in the browser tab.
+
+            Parameters:
+                dt_array : datetime array of the plots being shown
+
+            Returns:
+                interval : tuple of the starting index and the ending index (one past the last selected date) of the
+                    interval, None if nothing was selected or no dates fall inside the selection
+        """
+        if self.selection is None:
+            return None
+        dates = np.asarray(dt_array).astype('datetime64[ms]').astype(np.float64)
+        int_start = int(np.searchsorted(dates, self.selection[0], side='left'))
+        int_end = int(np.searchsorted(dates, self.selection[1], side='right'))
+        if int_start >= int_end:
+            return None
+        return int_start, int_end
+
+    def _attach(self, figure):
+        """
+            Replaces the figure shown in the browser tab, and adds the box select tool to each of its plots
+        """
+        for plot in figure.select({'type': Plot}):
+            plot.add_tools(BoxSelectTool(dimensions='width'))
+            plot.on_event(SelectionGeometry, self._select)
+        self.figure = figure
+        self.selection = None  # A box drawn on another figure may not even be of the same variable
+        self.layout.children = [self.status, figure]
+
+    def _connect(self, document):
+        """
+            Shows the layout in a browser tab that just connected, taking it over from the tab before it if there is one
+        """
+        document.title = 'Correction Session'
+        self.latest_document = document
+        if self.document is None:
+            self.document = document
+            document.add_root(self.layout)
+        elif not self.moving:
+            # A model can only belong to one document at a time, and the earlier tab's document has to be locked to
+            # take the layout out of it, so it is moved over in two steps, each with its own document locked
+            self.moving = True
+            self.document.add_next_tick_callback(functools.partial(self._move_out, self.document))
+
+    def _locked_call(self, document, finished, result, function, args, kwargs):
+        """
+            Calls a function for run, from the server's thread with the document the layout belongs to locked
+        """
+        if document is not self.document:
+            # The layout was moved to a newer tab after this was scheduled, so it is called with that one locked
+            self.document.add_next_tick_callback(functools.partial(self._locked_call, self.document, finished, result,
+                                                                   function, args, kwargs))
+            return
+        try:
+            result['value'] = function(*args, **kwargs)
+        except Exception as error:
+            result['error'] = error
+        finally:
+            finished.set()
+
+    def _move_in(self, document):
+        """
+            Second step of moving the layout to the latest tab, adds it to the tab's locked document
+        """
+        if document is not self.latest_document:
+            # Another tab connected while the layout was being moved, it goes to that one instead
+            self.latest_document.add_next_tick_callback(functools.partial(self._move_in, self.latest_document))
+            return
+        document.add_root(self.layout)
+        self.document = document
+        self.moving = False
+
+    def _move_out(self, document):
+        """
+            First step of moving the layout to the latest tab, removes it from the earlier tab's locked document
+        """
+        document.remove_root(self.layout)
+        self.latest_document.add_next_tick_callback(functools.partial(self._move_in, self.latest_document))
+
+    def _save(self, figure):
+        """
+            Saves a figure, without bokeh warning that the box select tool doesn't call back to python from the file
+        """
+        embed_log = logging.getLogger('bokeh.embed.util')
+        embed_log.disabled = True
+        try:
+            save(figure)
+        finally:
+            embed_log.disabled = False
+
+    def _select(self, event):
+        """
+            Keeps the range of dates of a box drawn with the box select tool once the user lets go of it
+        """
+        if event.final and event.geometry.get('type') == 'rect':
+            self.selection = (min(event.geometry['x0'], event.geometry['x1']),
+                              max(event.geometry['x0'], event.geometry['x1']))
+            self.status.text = 'Plots are up to date.' + self._selection_text()
+
+    def _selection_text(self):
+        """
+            Describes the selected dates for the status line above the plots
+        """
+        if self.selection is None:
+            return ''
+        (first_date, last_date) = (np.datetime64(int(x), 'ms').astype('datetime64[D]') for x in self.selection)
+        return ' Selected {} to {}, enter -3 as the starting index to use this interval.'.format(first_date, last_date)
+
+    def _stop(self):
+        """
+            Stops the server and then its event loop, from the server's thread
+        """
+        self.server.stop()
+        self.server.io_loop.stop()
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
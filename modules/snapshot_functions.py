@@ -0,0 +1,160 @@
+import numpy as np
+
+
+def changed_bounds(old_values, new_values):
+    """
+        Finds the smallest interval that contains every value that differs between two arrays. NaN's are treated as
+        equal to each other so that untouched missing data is not counted as a change.
+
+        Parameters:
+            old_values : 1D numpy array of values before a correction
+            new_values : 1D numpy array of values after a correction, same size as old_values
+
+        Returns:
+            start : integer of first changed index
+            end : integer of last changed index plus one, equal to start if nothing changed
+    """
+    with np.errstate(invalid='ignore'):
+        changed = ~((old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values)))
+    changed_indices = np.flatnonzero(changed)
+
+    if changed_indices.size == 0:
+        return 0, 0
+    else:
+        return int(changed_indices[0]), int(changed_indices[-1]) + 1
+
+
+class CorrectionHistory:
+    """
+        Keeps track of the iterations applied to one or more arrays during correction so that they can be undone and
+        redone. Only the interval each iteration changed is stored (the values before and after it), rather than a
+        full copy of every array, so the cost of each iteration depends on the size of the edit, not the record.
+
+        The arrays passed in are owned by the history and are edited in place, callers should pass copies if they
+        still need the values they started from. Those values can always be rebuilt with original().
+    """
+
+    def __init__(self, *arrays):
+        """
+            Parameters:
+                *arrays : any number of 1D numpy arrays that are corrected together
+        """
+        self.current = list(arrays)
+        self.undo_stack = []  # Deltas of every applied iteration, oldest first
+        self.redo_stack = []  # Deltas of every undone iteration, most recently undone last
+
+    def commit(self, new_arrays, start=None, end=None, payload=None):
+        """
+            Records an iteration and applies it to the current arrays.
+
+            Parameters:
+                new_arrays : list of 1D numpy arrays after the iteration, one for each tracked array
+                start : starting index of the interval the iteration was applied to, if known
+                end : ending index of the interval the iteration was applied to, not inclusive
+                payload : anything that should be kept with this iteration, such as its journal entry
+
+            Returns:
+                None
+        """
+        if start is None or end is None:
+            start = 0
+            end = self.current[0].shape[0]
+
+        delta = {'payload': payload, 'intervals': []}
+        for (current, new) in zip(self.current, new_arrays):
+            # Narrow the interval down to what actually changed before storing anything
+            (changed_start, changed_end) = changed_bounds(current[start:end], new[start:end])
+            changed_start += start
+            changed_end += start
+
+            delta['intervals'].append((changed_start, np.array(current[changed_start:changed_end]),
+                                       np.array(new[changed_start:changed_end])))
+            current[changed_start:changed_end] = new[changed_start:changed_end]
+
+        self.undo_stack.append(delta)
+        self.redo_stack = []  # A new iteration replaces anything that was undone
+
+    def undo(self):
+        """
+            Reverts the most recent iteration.
+
+            Returns:
+                True if an iteration was undone, False if there was nothing to undo
+        """
+        if len(self.undo_stack) == 0:
+            return False
+
+        delta = self.undo_stack.pop()
+        for (current, (changed_start, old_values, new_values)) in zip(self.current, delta['intervals']):
+            current[changed_start:changed_start + old_values.shape[0]] = old_values
+        self.redo_stack.append(delta)
+        return True
+
+    def redo(self):
+        """
+            Reapplies the most recently undone iteration.
+
+            Returns:
+                True if an iteration was redone, False if there was nothing to redo
+        """
+        if len(self.redo_stack) == 0:
+            return False
+
+        delta = self.redo_stack.pop()
+        for (current, (changed_start, old_values, new_values)) in zip(self.current, delta['intervals']):
+            current[changed_start:changed_start + new_values.shape[0]] = new_values
+        self.undo_stack.append(delta)
+        return True
+
+    def revert(self):
+        """
+            Reverts every iteration, and forgets them so they cannot be redone.
+
+            Returns:
+                None
+        """
+        while self.undo():
+            pass
+        self.redo_stack = []
+
+    def original(self):
+        """
+            Rebuilds the arrays as they were before any iteration was applied, without changing the current arrays.
+
+            Returns:
+                original_arrays : list of 1D numpy arrays
+        """
+        original_arrays = [np.array(current) for current in self.current]
+        for delta in reversed(self.undo_stack):
+            for (original, (changed_start, old_values, new_values)) in zip(original_arrays, delta['intervals']):
+                original[changed_start:changed_start + old_values.shape[0]] = old_values
+        return original_arrays
+
+    def payloads(self):
+        """
+            Returns the payload of every applied iteration, oldest first.
+        """
+        return [delta['payload'] for delta in self.undo_stack]
+
+    def changes(self):
+        """
+            Finds the indices every applied iteration changed, oldest first.
+
+            Returns:
+                changes : list of tuples of the iteration's payload and a list of 1D numpy arrays of changed indices,
+                    one for each tracked array
+        """
+        changes = []
+        for delta in self.undo_stack:
+            changed_indices = []
+            for (changed_start, old_values, new_values) in delta['intervals']:
+                with np.errstate(invalid='ignore'):
+                    changed = ~((old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values)))
+                changed_indices.append(np.flatnonzero(changed) + changed_start)
+            changes.append((delta['payload'], changed_indices))
+        return changes
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
@@ -0,0 +1,110 @@
+import numpy as np
+import os
+import pandas as pd
+from .batch_functions import write_station_config
+
+
+# Columns of every generated station file, in order, all in metric units
+SYNTHETIC_COLUMNS = ['date', 'tmax', 'tmin', 'tavg', 'tdew', 'ws', 'precip', 'rs', 'ea', 'rhmax', 'rhmin', 'rhavg']
+
+
+def generate_station(years, seed=0, start_year=1980, gap_fraction=0.02, outlier_fraction=0.002):
+    """
+        Creates a synthetic weather station record that is realistic enough to go through every step of the script.
+        Each variable follows a seasonal cycle with day to day noise, has a fraction of its days missing, and has a
+        smaller fraction of its days replaced with obvious outliers for the outlier detection to find.
+
+        Parameters:
+            years : integer of number of years in record
+            seed : integer seed, the same seed always creates the same station
+            start_year : integer of first year of record
+            gap_fraction : float of fraction of days of each variable that are missing
+            outlier_fraction : float of fraction of days of each variable that are outliers
+
+        Returns:
+            station_df : pandas dataframe of station record with the columns SYNTHETIC_COLUMNS
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('{}-01-01'.format(start_year), '{}-12-31'.format(start_year + years - 1), freq='D')
+    size = dates.size
+    season = np.cos(2 * np.pi * (dates.dayofyear.values - 200) / 365.25)  # 1 in mid july, -1 in mid january
+
+    tavg = 13 + 11 * season + rng.normal(0, 3, size)
+    delta_t = np.clip(13 + 4 * season + rng.normal(0, 3, size), 2, None)
+    tmax = tavg + delta_t / 2
+    tmin = tavg - delta_t / 2
+    tdew = tmin - np.clip(2 + 3 * season + rng.normal(0, 1.5, size), 0, None)
+    ea = 0.6108 * np.exp((17.27 * tdew) / (tdew + 237.3))
+
+    es_tmax = 0.6108 * np.exp((17.27 * tmax) / (tmax + 237.3))
+    es_tmin = 0.6108 * np.exp((17.27 * tmin) / (tmin + 237.3))
+    rhmax = np.clip(100 * ea / es_tmin, 0, 100)
+    rhmin = np.clip(100 * ea / es_tmax, 0, 100)
+    rhavg = (rhmax + rhmin) / 2
+
+    # Clear sky radiation following the seasons, reduced on cloudy days
+    rs = (200 + 130 * season) * np.clip(rng.beta(5, 1.5, size), 0.1, 1)
+    ws = rng.gamma(4, 0.6, size) + 0.2
+    precip = np.where(rng.random(size) < 0.25 - 0.15 * season, rng.exponential(6, size), 0)
+
+    station_df = pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'tmax': tmax, 'tmin': tmin, 'tavg': tavg,
+                               'tdew': tdew, 'ws': ws, 'precip': precip, 'rs': rs, 'ea': ea, 'rhmax': rhmax,
+                               'rhmin': rhmin, 'rhavg': rhavg}, columns=SYNTHETIC_COLUMNS)
+
+    for column in SYNTHETIC_COLUMNS[1:]:
+        values = station_df[column].values
+        outliers = rng.random(size) < outlier_fraction
+        values[outliers] = values[outliers] * rng.choice([0.5, 1.5], outliers.sum())
+        values[rng.random(size) < gap_fraction] = np.nan
+        station_df[column] = np.round(values, 3)
+
+    return station_df
+
+
+def write_station(station_df, folder_path, name, template_config_path, overrides=None):
+    """
+        Saves a synthetic station to a data file and creates a config file that points to it, so it can be run
+        the same way as a real station.
+
+        Parameters:
+            station_df : pandas dataframe of station record, see generate_station
+            folder_path : string of path to folder that the data and config files are saved to
+            name : string of station name, used for both file names
+            template_config_path : string of path to config file that the station config is copied from
+            overrides : dictionary of any other config sections and values to replace, see write_station_config
+
+        Returns:
+            config_file_path : string of path to the created config file
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    data_file_path = os.path.join(folder_path, name + '.csv')
+    config_file_path = os.path.join(folder_path, name + '_config.ini')
+    station_df.to_csv(data_file_path, index=False, na_rep='NO RECORD')
+
+    column_numbers = {column: number for (number, column) in enumerate(SYNTHETIC_COLUMNS)}
+    station_overrides = {
+        'METADATA': {'data_file_path': data_file_path, 'station_latitude': 40.0, 'station_longitude': -105.0,
+                     'station_elevation': 1500.0, 'anemometer_height': 2.0, 'missing_data_value': 'NO RECORD',
+                     'output_fill_value': 'nan', 'lines_of_file_header': 1, 'lines_of_file_footer': 0},
+        'OPTIONS': {'correction_option': 0, 'automatic_option': 0, 'fill_option': 0, 'plot_option': 0,
+                    'recipe_file_path': ''},
+        'DATA': {'date_format': 1, 'string_date_col': column_numbers['date'], 'year_col': -1, 'month_col': -1,
+                 'day_col': -1, 'day_of_year_col': -1, 'tmax_col': column_numbers['tmax'],
+                 'tavg_col': column_numbers['tavg'], 'tmin_col': column_numbers['tmin'],
+                 'tdew_col': column_numbers['tdew'], 'uz_col': column_numbers['ws'], 'pp_col': column_numbers['precip'],
+                 'rs_col': column_numbers['rs'], 'ea_col': column_numbers['ea'], 'rhmax_col': column_numbers['rhmax'],
+                 'rhavg_col': column_numbers['rhavg'], 'rhmin_col': column_numbers['rhmin'],
+                 'temp_f_flag': 0, 'temp_k_flag': 0, 'uz_mph_flag': 0, 'uz_kmh_flag': 0,
+                 'uz_wind_run_kilometers_flag': 0, 'uz_wind_run_miles_flag': 0, 'pp_inch_flag': 0, 'rs_lang_flag': 0,
+                 'rs_mj_flag': 0, 'rs_kwhr_flag': 0, 'ea_torr_flag': 0, 'ea_mbar_flag': 0, 'rh_fraction_flag': 0}}
+
+    for (section, values) in (overrides or {}).items():
+        station_overrides.setdefault(section, {}).update(values)
+
+    write_station_config(template_config_path, config_file_path, station_overrides)
+    return config_file_path
+
+
+# This is never run by itself
+if __name__ == "__main__":
+    print("\nThis module is called as a part of the QAQC script, it does nothing by itself.")
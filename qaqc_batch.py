@@ -0,0 +1,65 @@
+import argparse
+from modules import batch_functions, input_functions, output_functions
+import os
+
+
+if __name__ == "__main__":
+    # This code runs the WeatherQAQC class on many stations at once, each in its own worker process
+    # Stations are listed in either a manifest .csv with a 'config_path' column (and optionally 'recipe_file_path'),
+    # or a network metadata workbook, which also requires a template config file to build each station's config from.
+    # Batches cannot prompt the user, so stations are either not corrected or corrected with a recipe.
+
+    parser = argparse.ArgumentParser(description='Run the weather data QAQC script on many stations in parallel.')
+    parser.add_argument('manifest', help='path to manifest .csv or metadata workbook .xlsx')
+    parser.add_argument('--config', default=None, help='path to template config file, required for metadata workbooks')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of stations to process at once, defaults to the number of processors')
+    parser.add_argument('--memory-limit', type=float, default=None,
+                        help='maximum memory in megabytes for each worker, stations that exceed it fail')
+    parser.add_argument('--stations-per-worker', type=int, default=1,
+                        help='number of stations each worker runs, above 1 the output files of each station are '
+                             'written in the background while the next station is processed')
+    parser.add_argument('--parquet-dataset', default=None,
+                        help='folder of a Parquet dataset that every station is appended to, partitioned by station '
+                             'and year, which overrides the Parquet options of the config files')
+    parser.add_argument('--netcdf-file', default=None,
+                        help='NetCDF file of a station by day cube that every station is appended to, which overrides '
+                             'the NetCDF options of the config files')
+    parser.add_argument('--result-cache', default=None,
+                        help='folder of a result cache that every station is restored from if it is unchanged since '
+                             'it was cached, and added to otherwise, which overrides the result cache options of the '
+                             'config files')
+    parser.add_argument('--result-cache-max-mb', type=float, default=None,
+                        help='size in megabytes the result cache is kept under, defaults to the config files\' '
+                             'setting')
+    parser.add_argument('--append', action='store_true',
+                        help='only process the days added to each station\'s data file since it was last processed, '
+                             'stations that have not been processed before are processed in full')
+    parser.add_argument('--folder', default='batch_files',
+                        help='folder to save console output and generated config files of every station to')
+    parser.add_argument('--summary', default=None,
+                        help='path to save the batch summary .csv to, defaults to batch_summary.csv in the folder')
+    args = parser.parse_args()
+
+    print("\nSystem: Starting batch data QAQC script.")
+    # Checked before any station is started, rather than failing every one of them once it has been processed
+    output_functions.check_output_dependencies(args.parquet_dataset is not None, args.netcdf_file is not None)
+    batch_jobs = batch_functions.read_manifest(args.manifest, args.config, args.folder)
+    print("\nSystem: Found {} stations to process.".format(len(batch_jobs)))
+    for batch_job in batch_jobs:
+        batch_job['parquet_dataset_path'] = args.parquet_dataset
+        batch_job['netcdf_file_path'] = args.netcdf_file
+        batch_job['result_cache_path'] = args.result_cache
+        batch_job['result_cache_max_mb'] = args.result_cache_max_mb
+        batch_job['append'] = args.append
+
+    batch_results = batch_functions.run_batch(batch_jobs, args.workers, args.memory_limit, args.folder,
+                                              args.stations_per_worker)
+
+    if args.manifest.lower().endswith('.xlsx'):
+        batch_functions.update_network_progress(input_functions.read_config(args.config)['metadata_store_path'],
+                                                batch_results)
+
+    summary_path = args.summary if args.summary is not None else os.path.join(args.folder, 'batch_summary.csv')
+    batch_functions.write_batch_summary(summary_path, batch_results)
+    print("\nSystem: Now ending batch QAQC script.")
@@ -0,0 +1,66 @@
+import argparse
+from modules import benchmark_functions
+import sys
+
+
+if __name__ == "__main__":
+    # This code times the slowest parts of the script on synthetic stations of different lengths, and complete runs of
+    # batches of synthetic stations, then saves the results to a .json file that can be compared across commits.
+    # Importing the script with plotting off is also timed against a budget, and must not import bokeh at all, nor may
+    # a complete run of a station corrected by a recipe with plotting off.
+    # Batches of 1,000 stations take a long time, pass smaller --batch-sizes (or 0 to skip batches) for a quick check.
+
+    parser = argparse.ArgumentParser(description='Benchmark the weather data QAQC script on synthetic stations.')
+    parser.add_argument('--years', type=int, nargs='+', default=[10, 50, 150],
+                        help='lengths in years of the stations to run the station benchmarks on')
+    parser.add_argument('--benchmarks', nargs='+', default=None, choices=benchmark_functions.STATION_BENCHMARKS,
+                        help='station benchmarks to run, defaults to all of them')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times to run each station benchmark')
+    parser.add_argument('--mc-iterations', type=int, default=50,
+                        help='iterations of the Thornton-Running Monte Carlo simulation to benchmark')
+    parser.add_argument('--import-budget', type=float, default=benchmark_functions.IMPORT_TIME_BUDGET,
+                        help='seconds that importing the script may take when nothing is plotted')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help='numbers of stations to run the batch benchmark on, 0 to skip it')
+    parser.add_argument('--batch-years', type=int, default=10, help='length in years of every batch station')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of batch worker processes, defaults to the number of processors')
+    parser.add_argument('--config', default='config.ini', help='path to config file that station configs copy')
+    parser.add_argument('--folder', default='benchmark_files', help='folder to save the synthetic stations to')
+    parser.add_argument('--output', default='benchmark_results.json', help='path to save the results to')
+    parser.add_argument('--compare', default=None, help='path to earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fraction slower than the earlier results that counts as a regression')
+    args = parser.parse_args()
+
+    print("\nSystem: Starting benchmark script.")
+    import_result = benchmark_functions.run_import_benchmark(args.repeat)
+    headless_result = benchmark_functions.run_headless_benchmark(args.repeat, args.folder, args.config)
+    results = [import_result, headless_result]
+    for years in args.years:
+        results += benchmark_functions.run_station_benchmarks(years, args.repeat, args.folder, args.config,
+                                                              args.mc_iterations, args.benchmarks)
+
+    batch_sizes = [batch_size for batch_size in args.batch_sizes if batch_size > 0]
+    if len(batch_sizes) > 0:
+        results += benchmark_functions.run_batch_benchmarks(batch_sizes, args.batch_years, args.folder, args.config,
+                                                            args.workers)
+
+    benchmark_functions.write_results(args.output, results)
+    print("\nSystem: Benchmark results saved to {}.".format(args.output))
+
+    failed = False
+    for problem in benchmark_functions.check_import_budget(import_result, args.import_budget, headless_result):
+        print("\nSystem: Import budget exceeded, {}.".format(problem))
+        failed = True
+
+    if args.compare is not None:
+        regressions = benchmark_functions.compare_results(results, args.compare, args.threshold)
+        if len(regressions) > 0:
+            print("\nSystem: {} benchmarks got slower than the threshold allows.".format(len(regressions)))
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+    print("\nSystem: Now ending benchmark script.")
@@ -0,0 +1,51 @@
+import argparse
+from modules import equivalence_functions
+import sys
+
+
+if __name__ == "__main__":
+    # This code checks that every optimized kernel still gives the same results as the plain loop based version it
+    # replaced, kept in modules/reference_functions.py. Both versions are run on randomized stations with different
+    # patterns of missing data, and on a real station, and every difference between their outputs is reported.
+
+    kernel_names = [kernel[0] for kernel in equivalence_functions.KERNELS]
+    parser = argparse.ArgumentParser(description='Check optimized QAQC kernels against their reference versions.')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2],
+                        help='seeds of the randomized stations, every gap pattern is created once per seed')
+    parser.add_argument('--patterns', nargs='+', default=equivalence_functions.GAP_PATTERNS,
+                        choices=equivalence_functions.GAP_PATTERNS, help='gap patterns of the randomized stations')
+    parser.add_argument('--kernels', nargs='+', default=None, choices=kernel_names,
+                        help='kernels to check, defaults to all of them')
+    parser.add_argument('--real-config', default='config.ini',
+                        help='config file of a real station to also check, empty to skip it')
+    parser.add_argument('--rtol', type=float, default=1e-9, help='relative tolerance of floating point outputs')
+    parser.add_argument('--atol', type=float, default=1e-9, help='absolute tolerance of floating point outputs')
+    parser.add_argument('--output', default='equivalence_report.json', help='path to save the report to')
+    args = parser.parse_args()
+
+    print("\nSystem: Starting equivalence script.")
+    cases = [equivalence_functions.synthetic_case(pattern, seed) for seed in args.seeds for pattern in args.patterns]
+    if args.real_config != '':
+        cases.append(equivalence_functions.real_station_case(args.real_config))
+
+    reports = equivalence_functions.run_harness(cases, args.kernels, args.rtol, args.atol)
+    for report in reports:
+        if 'max_abs_diff' in report:
+            details = 'max abs {:.3g}, max rel {:.3g}, {} values, {} nans, {} flags differ, {:.1f}x faster'.format(
+                report['max_abs_diff'], report['max_rel_diff'], report['mismatched_values'], report['nan_mismatches'],
+                report['flag_mismatches'], report['speedup'])
+        else:
+            details = 'reference raised {}, optimized raised {}'.format(report['reference_error'],
+                                                                          report['optimized_error'])
+        print('    {} {} on {}: {}'.format('PASS' if report['passed'] else 'FAIL', report['kernel'], report['case'],
+                                           details))
+
+    equivalence_functions.write_report(args.output, reports, args.rtol, args.atol)
+    print("\nSystem: Equivalence report saved to {}.".format(args.output))
+
+    failures = [report for report in reports if not report['passed']]
+    if len(failures) > 0:
+        print("\nSystem: {} of {} checks found differences beyond the tolerances.".format(len(failures), len(reports)))
+        sys.exit(1)
+
+    print("\nSystem: Now ending equivalence script.")
@@ -0,0 +1,17 @@
+from modules import metadata_functions
+import sys
+
+
+if __name__ == "__main__":
+    # This code exports the metadata store to an .xlsx file for anyone who wants it as a spreadsheet
+    # Usage: python qaqc_export_metadata.py [output .xlsx] [metadata store] [network metadata workbook]
+    # The corrected stations are always exported, the network workbook is only exported, with the progress kept in the
+    # metadata store applied, if its path is provided.
+
+    print("\nSystem: Starting metadata export script.")
+    output_path = sys.argv[1] if len(sys.argv) >= 2 else 'correction_metadata.xlsx'
+    store_path = sys.argv[2] if len(sys.argv) >= 3 else metadata_functions.DEFAULT_METADATA_STORE
+    metadata_path = sys.argv[3] if len(sys.argv) >= 4 else None
+
+    metadata_functions.export_metadata(store_path, output_path, metadata_path)
+    print("\nSystem: Metadata store {} exported to {}.".format(store_path, output_path))
@@ -0,0 +1,39 @@
+import argparse
+from modules import service_functions
+
+
+if __name__ == "__main__":
+    # This code runs a local HTTP service that other tools can submit stations to as jobs, instead of running the script
+    # themselves. Each job is sent a station's config file and data file (and optionally a recipe), is run headless on
+    # a pool of worker processes, and its output workbook and other files can then be downloaded once it finishes.
+    # Workers are kept between jobs, so only the first job each worker runs waits on the script's imports.
+    # See service_functions.ServiceRequestHandler for the requests the service answers.
+
+    parser = argparse.ArgumentParser(description='Run the weather data QAQC script as a local HTTP job service.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on, defaults to only accepting requests from this computer')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of jobs to process at once, defaults to the number of processors')
+    parser.add_argument('--max-jobs', type=int, default=32,
+                        help='number of jobs that can be waiting or running at once, further jobs are turned away')
+    parser.add_argument('--memory-limit', type=float, default=None,
+                        help='maximum memory in megabytes for each worker, jobs that exceed it fail')
+    parser.add_argument('--folder', default='service_files',
+                        help='folder to save the files of every job to, each in a folder of its own')
+    args = parser.parse_args()
+
+    print("\nSystem: Starting QAQC job service.")
+    service = service_functions.JobService(args.folder, args.workers, args.max_jobs, args.memory_limit)
+    service.start()
+    server = service_functions.create_server(service, args.host, args.port)
+    print("\nSystem: Accepting jobs at http://{}:{}/jobs with {} workers.".format(args.host, args.port,
+                                                                             service.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    print("\nSystem: Now ending QAQC job service.")
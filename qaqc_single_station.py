@@ -7,18 +7,23 @@ if __name__ == "__main__":
     # Initial setup
     # Check if user has passed in a config file, or else just grab the default.
     # Also see if user has passed a metadata file to allow for automatic reading/writing into the metadata file.
+    # Passing --profile anywhere writes a report of the time and memory used by every step next to the station log.
+    # Passing --append anywhere only processes the days added to the data file since the station was last processed.
 
     print("\nSystem: Starting single station data QAQC script.")
-    if len(sys.argv) == 2:
-        config_path = sys.argv[1]
+    profile = '--profile' in sys.argv
+    append = '--append' in sys.argv
+    arguments = [argument for argument in sys.argv[1:] if argument not in ['--profile', '--append']]
+    if len(arguments) == 1:
+        config_path = arguments[0]
         metadata_path = None
-    elif len(sys.argv) == 3:
-        config_path = sys.argv[1]
-        metadata_path = sys.argv[2]
+    elif len(arguments) == 2:
+        config_path = arguments[0]
+        metadata_path = arguments[1]
     else:
         config_path = 'config.ini'
         metadata_path = None
 
-    station_qaqc = WeatherQAQC(config_path, metadata_path, gridplot_columns=1)
+    station_qaqc = WeatherQAQC(config_path, metadata_path, gridplot_columns=1, profile=profile, append=append)
     station_qaqc.process_station()
     print("\nSystem: Now ending single station QAQC script.")
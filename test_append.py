@@ -0,0 +1,119 @@
+import configparser
+import contextlib
+import io
+import json
+import numpy as np
+import pathlib
+import pytest as pt
+from modules import append_functions, flag_functions
+from modules.py_weather_qaqc import WeatherQAQC
+
+
+def journal_operation(method, start_index, end_index, end, **kwargs):
+    return dict(method=method, start='2018-01-01', end=end, start_index=start_index, end_index=end_index, **kwargs)
+
+
+def test_extend_carried_steps():
+    """Check that operations carried to appended days are carried again the next time days are appended"""
+    journal = [{'variable': 'tmax_tmin', 'operations': [journal_operation('additive', 10, 100, '2018-04-10',
+                                                                          modifier=0.5),
+                                                        journal_operation('additive', 10, 50, '2018-02-19',
+                                                                          modifier=1.0)]},
+               {'variable': 'ws', 'operations': [journal_operation('multiplicative', 0, 100, 100, modifier=1.1)]},
+               {'variable': 'compiled_ea', 'operations': [{'source': 'skip', 'start': '2018-01-01',
+                                                           'end': '2018-04-10', 'start_index': 0,
+                                                           'end_index': 100}]}]
+
+    for (record_length, appended_length, end_date) in [(100, 30, '2018-05-10'), (130, 5, '2018-05-15')]:
+        steps = append_functions.carried_steps(journal, record_length)
+        assert [(variable, operation['modifier']) for (variable, operation) in steps] == \
+            [('tmax_tmin', 0.5), ('ws', 1.1)]
+        append_functions.extend_carried_steps(steps, record_length, appended_length, end_date)
+
+    assert journal[0]['operations'][0]['end'] == '2018-05-15'
+    assert journal[0]['operations'][0]['end_index'] == 135
+    # Operations that ended before the record did, and intervals that were out of bounds, are left as they were
+    assert journal[0]['operations'][1]['end_index'] == 50
+    assert journal[1]['operations'][0]['end'] == 135
+    assert journal[2]['operations'][0]['end_index'] == 100
+
+
+def write_config(folder_path):
+    """Writes the config and recipe of a station read from station.csv in folder_path, returns the config path"""
+    recipe = {'steps': [{'variable': 'tmax_tmin',
+                         'operations': [{'method': 'additive', 'modifier': 0.5, 'start': '2017-06-01'}]},
+                        {'variable': 'ws', 'operations': [{'method': 'multiplicative', 'modifier': 1.1}]}]}
+    with open(folder_path / 'recipe.json', 'w') as recipe_file:
+        json.dump(recipe, recipe_file)
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    config['METADATA']['data_file_path'] = str(folder_path / 'station.csv')
+    config['OPTIONS'].update({'fill_option': '0', 'plot_option': '0', 'random_seed': '0',
+                              'recipe_file_path': str(folder_path / 'recipe.json'),
+                              'metadata_store_path': str(folder_path / 'metadata.db')})
+    with open(folder_path / 'config.ini', 'w') as config_file:
+        config.write(config_file)
+    return str(folder_path / 'config.ini')
+
+
+def run_station(config_file_path, header, rows, last_date, append):
+    """Processes the station with its data file cut off after last_date"""
+    with open(pathlib.Path(config_file_path).parent / 'station.csv', 'w') as station_file:
+        station_file.write('\n'.join([header] + [line for line in rows if line[:10] <= last_date]) + '\n')
+    station = WeatherQAQC(config_file_path, use_checkpoints=False, append=append)
+    with contextlib.redirect_stdout(io.StringIO()):
+        station.process_station()
+    return station
+
+
+@pt.mark.filterwarnings('ignore')
+def test_two_consecutive_appends(tmp_path):
+    """Check that corrections reaching the end of the record are still applied after appending twice"""
+    lines = open('test_files/test_data.csv', encoding='utf-8-sig').read().splitlines()
+    rows = [line for line in lines[1:] if '2016-01-01' <= line[:10] <= '2018-12-31']
+    config_file_path = write_config(tmp_path)
+
+    runs = [run_station(config_file_path, lines[0], rows, last_date, append=i > 0)
+            for (i, last_date) in enumerate(['2018-09-30', '2018-10-31', '2018-12-31'])]
+
+    (full, _first, second) = (runs[0], runs[1], runs[2])
+    assert second.data_length == full.data_length + 92
+    original_tmax = np.array(second.original_df['tmax'])
+    original_ws = np.array(second.original_df['ws'])
+    np.testing.assert_allclose(second.data_tmax[-61:], original_tmax[-61:] + 0.5)
+    np.testing.assert_allclose(second.data_ws[-61:], original_ws[-61:] * 1.1)
+    assert [operation['end_index'] for journal_step in second.journal
+            for operation in journal_step['operations']] == [second.data_length, second.data_length]
+
+
+@pt.mark.filterwarnings('ignore')
+def test_append_matches_full_run(tmp_path):
+    """Check that a record appended to across an isolated observation matches the same record processed at once"""
+    lines = open('test_files/test_data.csv', encoding='utf-8-sig').read().splitlines()
+    rows = [line.split(',') for line in lines[1:] if '2016-01-01' <= line[:10] <= '2018-12-31']
+    dates = [row[0] for row in rows]
+    # TMax of the last day before appending is isolated until the days after it are known, while TMin of the first
+    # appended day only has the day before it as a neighbour
+    rows[dates.index('2018-06-29')][7] = 'NO RECORD'
+    rows[dates.index('2018-07-02')][8] = 'NO RECORD'
+    rows = [','.join(row) for row in rows]
+
+    (tmp_path / 'full').mkdir()
+    (tmp_path / 'appended').mkdir()
+    full = run_station(write_config(tmp_path / 'full'), lines[0], rows, '2018-12-31', append=False)
+    config_file_path = write_config(tmp_path / 'appended')
+    first = run_station(config_file_path, lines[0], rows, '2018-06-30', append=False)
+    assert np.isnan(first.data_tmax[-1])
+    appended = run_station(config_file_path, lines[0], rows, '2018-12-31', append=True)
+
+    assert appended.data_length == full.data_length
+    np.testing.assert_array_equal(appended.dt_array, full.dt_array)
+    for name in ['tmax', 'tmin', 'tavg', 'tdew', 'ea', 'rhmax', 'rhmin', 'rhavg', 'rs', 'ws', 'precip']:
+        np.testing.assert_allclose(getattr(appended, 'data_' + name), getattr(full, 'data_' + name), err_msg=name)
+    np.testing.assert_allclose(appended.compiled_ea, full.compiled_ea)
+    for var in flag_functions.FLAG_VARIABLES:
+        np.testing.assert_array_equal(appended.qc_flags[var], full.qc_flags[var], err_msg=var)
+    np.testing.assert_array_equal(appended.original_df['tmax'], full.original_df['tmax'])
+    assert [operation['end_index'] for journal_step in appended.journal
+            for operation in journal_step['operations']] == [full.data_length, full.data_length]
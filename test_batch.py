@@ -0,0 +1,29 @@
+import configparser
+import pandas as pd
+from modules import batch_functions
+
+
+def test_workbook_correction_runs_need_recipes(tmp_path):
+    """Check that workbook stations due to be corrected only run with a recipe, and are reported otherwise"""
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    config['OPTIONS']['metadata_store_path'] = str(tmp_path / 'metadata.db')
+    with open(tmp_path / 'config.ini', 'w') as config_file:
+        config.write(config_file)
+
+    metadata_df = pd.read_excel('test_files/test_metadata.xlsx', index_col=0)
+    metadata_df = pd.concat([metadata_df.iloc[[0]]] * 4, ignore_index=True)
+    metadata_df['id'] = [1, 2, 3, 4]
+    metadata_df['run_count'] = [0, 1, 1, 2]
+    metadata_df['recipe_file_path'] = [None, None, 'recipe.json', None]
+    metadata_df.to_excel(tmp_path / 'metadata.xlsx', engine='openpyxl')
+
+    jobs = batch_functions.read_manifest(str(tmp_path / 'metadata.xlsx'), str(tmp_path / 'config.ini'),
+                                         str(tmp_path / 'batch'))
+    assert [(job['metadata_id'], job['recipe_file_path'], job['needs_correction']) for job in jobs] == \
+        [(1, None, False), (2, None, True), (3, 'recipe.json', False)]
+
+    # The station is reported without being started, so it doesn't fail on a prompt it can't answer
+    (result,) = batch_functions.run_batch([jobs[1]], folder_path=str(tmp_path / 'batch'))
+    assert result['status'] == 'needs interactive correction'
+    assert not (tmp_path / 'batch' / (jobs[1]['name'] + '_console.txt')).exists()
@@ -0,0 +1,138 @@
+import configparser
+import contextlib
+import io
+import json
+import os
+import pytest as pt
+import time
+from modules import cache_functions
+from modules.py_weather_qaqc import WeatherQAQC
+
+
+def write_outputs(folder_path, station_name, size=100, content='a'):
+    """Writes output files of a station, along with a file of another station that must never be cached with it"""
+    correction_path = folder_path / 'correction_files'
+    (correction_path / 'histograms').mkdir(parents=True, exist_ok=True)
+    for file_name in ['output.xlsx', 'changes_log.txt', 'histograms/{}_histograms.html']:
+        file_path = correction_path / (file_name.format(station_name) if '/' in file_name
+                                       else station_name + '_' + file_name)
+        file_path.write_text(content * size)
+    (correction_path / (station_name + '_b_output.xlsx')).write_text('other station')
+
+
+def store(cache_path, key, folder_path, station_name, max_mb=10):
+    cache_functions.store_result(str(cache_path), key, str(folder_path), station_name, 0, '2000-01-01',
+                                 '2000-12-31', max_mb)
+
+
+@pt.fixture
+def config_dict(tmp_path):
+    (tmp_path / 'station.csv').write_text('date,tmax\n2000-01-01,10\n')
+    return {'data_file_path': str(tmp_path / 'station.csv'), 'recipe_file_path': '', 'fill_flag': True,
+            'plot_flag': False, 'random_seed': 0, 'plot_server_port': 5006, 'result_cache_max_mb': 2048}
+
+
+def test_result_key(tmp_path, config_dict):
+    """Check that the key follows the data, recipe, and config settings, other than the ignored ones"""
+    key = cache_functions.result_key(config_dict, 'a')
+    assert cache_functions.result_key(dict(config_dict), 'a') == key
+    assert cache_functions.result_key(config_dict, 'b') != key
+    assert cache_functions.result_key(config_dict, 'a', [{'option': 1, 'operations': []}]) != key
+    assert cache_functions.result_key(config_dict, 'a', settings={'gridplot_columns': 2}) != key
+    for (config_key, value) in [('fill_flag', False), ('random_seed', 1), ('plot_flag', True)]:
+        assert cache_functions.result_key(dict(config_dict, **{config_key: value}), 'a') != key
+
+    # Ignored settings, and a data file with the same contents somewhere else, give the same key
+    (tmp_path / 'copy.csv').write_text((tmp_path / 'station.csv').read_text())
+    for config_key in cache_functions.IGNORED_CONFIG_KEYS:
+        value = str(tmp_path / 'copy.csv') if config_key == 'data_file_path' else 'elsewhere'
+        assert cache_functions.result_key(dict(config_dict, **{config_key: value}), 'a') == key
+
+    (tmp_path / 'station.csv').write_text('date,tmax\n2000-01-01,11\n')
+    assert cache_functions.result_key(config_dict, 'a') != key
+
+
+def test_store_and_restore(tmp_path):
+    """Check that a station's outputs are restored, and that a changed cached file drops the entry instead"""
+    write_outputs(tmp_path / 'first', 'a')
+    store(tmp_path / 'cache', 'key', tmp_path / 'first', 'a')
+    assert sorted(json.loads((tmp_path / 'cache' / 'key' / 'manifest.json').read_text())['files']) == \
+        ['a_changes_log.txt', 'a_output.xlsx', 'histograms/a_histograms.html']
+
+    manifest = cache_functions.restore_result(str(tmp_path / 'cache'), 'key', str(tmp_path / 'second'))
+    assert manifest['station_name'] == 'a'
+    assert cache_functions.station_result_files(str(tmp_path / 'second'), 'a') == \
+        ['a_changes_log.txt', 'a_output.xlsx', 'histograms/a_histograms.html']
+    assert (tmp_path / 'second' / 'correction_files' / 'a_output.xlsx').read_text() == 'a' * 100
+    assert cache_functions.restore_result(str(tmp_path / 'cache'), 'missing', str(tmp_path / 'second')) is None
+
+    (tmp_path / 'cache' / 'key' / 'files' / 'a_output.xlsx').write_text('changed')
+    assert cache_functions.restore_result(str(tmp_path / 'cache'), 'key', str(tmp_path / 'third')) is None
+    assert not (tmp_path / 'cache' / 'key').exists()
+    assert not (tmp_path / 'third' / 'correction_files' / 'a_output.xlsx').exists()
+
+
+def test_evict_least_recently_used(tmp_path):
+    """Check that the results used the longest time ago are removed until the cache fits"""
+    now = time.time()
+    for (age, key) in [(300, 'oldest'), (200, 'restored'), (100, 'newest')]:
+        write_outputs(tmp_path / key, key, size=100 * 1024)
+        store(tmp_path / 'cache', key, tmp_path / key, key)
+        os.utime(tmp_path / 'cache' / key / 'manifest.json', (now - age, now - age))
+    cache_functions.restore_result(str(tmp_path / 'cache'), 'restored', str(tmp_path / 'restored'))
+
+    # Every result is 300 kB, so only three fit in 1 MB
+    write_outputs(tmp_path / 'last', 'last', size=100 * 1024)
+    store(tmp_path / 'cache', 'last', tmp_path / 'last', 'last', max_mb=1)
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['last', 'newest', 'restored']
+
+    cache_functions.evict_results(str(tmp_path / 'cache'), 700 * 1024)
+    remaining = sorted(os.listdir(tmp_path / 'cache'))
+    assert remaining == ['last', 'restored']
+    assert sum(json.loads((tmp_path / 'cache' / key / 'manifest.json').read_text())['size']
+               for key in remaining) <= 700 * 1024
+
+
+def test_detach_before_reprocessing(tmp_path):
+    """Check that writing over restored output files in place never writes through to the cache"""
+    write_outputs(tmp_path / 'first', 'a')
+    store(tmp_path / 'cache', 'key', tmp_path / 'first', 'a')
+    cache_functions.restore_result(str(tmp_path / 'cache'), 'key', str(tmp_path / 'second'))
+
+    output_path = tmp_path / 'second' / 'correction_files' / 'a_output.xlsx'
+    assert os.stat(output_path).st_nlink > 1  # Restored as a link to the cached file
+    cache_functions.detach_result_files(str(tmp_path / 'second'), 'a')
+    assert os.stat(output_path).st_nlink == 1
+    with open(output_path, 'w') as output_file:  # The script writes its outputs in place, same as this
+        output_file.write('reprocessed')
+
+    assert (tmp_path / 'cache' / 'key' / 'files' / 'a_output.xlsx').read_text() == 'a' * 100
+    assert cache_functions.restore_result(str(tmp_path / 'cache'), 'key', str(tmp_path / 'third')) is not None
+
+
+@pt.mark.filterwarnings('ignore')
+def test_reprocess_without_cache(tmp_path):
+    """Check that a station restored from the cache and then processed without it leaves the cached result intact"""
+    lines = open('test_files/test_data.csv', encoding='utf-8-sig').read().splitlines()
+    with open(tmp_path / 'station.csv', 'w') as station_file:
+        station_file.write('\n'.join([lines[0]] + [line for line in lines[1:] if line[:4] == '2018']) + '\n')
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    config['METADATA']['data_file_path'] = str(tmp_path / 'station.csv')
+    config['OPTIONS'].update({'plot_option': '0', 'result_cache_path': str(tmp_path / 'cache'),
+                              'metadata_store_path': str(tmp_path / 'metadata.db')})
+
+    for (run, cache_option) in enumerate(['1', '1', '0']):
+        config['OPTIONS']['result_cache_option'] = cache_option
+        with open(tmp_path / 'config.ini', 'w') as config_file:
+            config.write(config_file)
+        station = WeatherQAQC(str(tmp_path / 'config.ini'), use_checkpoints=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            station.process_station()
+        if run == 0:
+            (key,) = os.listdir(tmp_path / 'cache')
+            cached_log = (tmp_path / 'cache' / key / 'files' / 'station_changes_log.txt').read_text()
+
+    # The last run wrote its log again without the cache, which must not have reached the cached copy
+    assert (tmp_path / 'cache' / key / 'files' / 'station_changes_log.txt').read_text() == cached_log
+    assert cache_functions.restore_result(str(tmp_path / 'cache'), key, str(tmp_path / 'restored')) is not None
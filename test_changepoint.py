@@ -0,0 +1,68 @@
+import io
+import numpy as np
+import pytest as pt
+from modules import changepoint_functions, qaqc_functions
+
+dt_array = np.arange(np.datetime64('2010-01-01'), np.datetime64('2016-01-01'), dtype='datetime64[D]')
+
+
+def test_binary_segmentation_single_step():
+    """Check that a single step change in a noisy signal is found at the step"""
+    generator = np.random.default_rng(0)
+    signal = generator.normal(0.0, 1.0, 200)
+    signal[137:] += 4.0
+
+    assert changepoint_functions.binary_segmentation(signal, 5, 3.0 * np.log(200)) == [137]
+
+
+def test_binary_segmentation_two_steps():
+    """Check that a shift that later returns to the original level is split into its own segment"""
+    generator = np.random.default_rng(1)
+    signal = generator.normal(0.0, 0.5, 300)
+    signal[80:190] -= 3.0
+
+    assert changepoint_functions.binary_segmentation(signal, 5, 3.0 * np.log(300)) == [80, 190]
+
+
+def test_binary_segmentation_no_change():
+    """Check that a flat signal and a signal shorter than two segments are never split"""
+    generator = np.random.default_rng(2)
+    assert changepoint_functions.binary_segmentation(generator.normal(0.0, 1.0, 200), 5, 3.0 * np.log(200)) == []
+    assert changepoint_functions.binary_segmentation(np.array([0.0, 0.0, 10.0, 10.0]), 3, 0.0) == []
+
+
+def test_propose_correction_intervals_rs_drop():
+    """Check that a drop in Rs relative to Rso is proposed as the best candidate, starting near the break"""
+    generator = np.random.default_rng(3)
+    doy = (dt_array - dt_array.astype('datetime64[Y]')).astype(int)
+    rso = 20.0 + 10.0 * np.sin(2 * np.pi * (doy - 80) / 365.25)
+    rs = rso * np.clip(generator.normal(0.9, 0.08, dt_array.shape[0]), 0.3, 1.0)
+    break_index = 900
+    rs[break_index:1500] *= 0.75
+
+    candidates = changepoint_functions.propose_correction_intervals(5, rs, rso, dt_array)
+
+    assert len(candidates) >= 1
+    assert candidates[0]['rank'] == 1
+    # Candidates start on block boundaries, so the break is found to within a block
+    assert abs(candidates[0]['start'] - break_index) <= 30
+    assert abs(candidates[0]['end'] - 1500) <= 30
+
+
+def test_propose_correction_intervals_other_codes():
+    """Check that variables without a change-point signal get no candidates"""
+    values = np.ones(dt_array.shape[0])
+    assert changepoint_functions.propose_correction_intervals(3, values, values, dt_array) == []
+
+
+@pt.mark.parametrize("interval_size", [120, 180, 119, 150])
+def test_rs_period_ratio_corr_final_period(interval_size):
+    """Check that the final period is corrected, including when the interval is an exact multiple of the period"""
+    rso = 30.0 + np.sin(np.arange(interval_size) / 10.0)
+    rs = 0.8 * rso
+
+    (corr_rs, corr_rso) = qaqc_functions.rs_period_ratio_corr(io.StringIO(), 0, interval_size, rs, rso, 6, 60)
+
+    assert corr_rs.shape == rs.shape
+    np.testing.assert_allclose(corr_rs, rso)
+    np.testing.assert_array_equal(corr_rso, rso)
@@ -0,0 +1,105 @@
+import configparser
+import contextlib
+import io
+import json
+import numpy as np
+import os
+import pytest as pt
+from modules import checkpoint_functions
+from modules.py_weather_qaqc import WeatherQAQC
+
+
+@pt.fixture
+def station(tmp_path):
+    """Config, data, and recipe files of a short station corrected with a recipe"""
+    lines = open('test_files/test_data.csv', encoding='utf-8-sig').read().splitlines()
+    with open(tmp_path / 'station.csv', 'w') as station_file:
+        station_file.write('\n'.join([lines[0]] + [line for line in lines[1:] if line[:4] in ['2017', '2018']]) + '\n')
+
+    with open(tmp_path / 'recipe.json', 'w') as recipe_file:
+        json.dump({'steps': [{'variable': 'tmax_tmin', 'operations': [{'method': 'z_score_outliers'}]},
+                             {'variable': 'ws', 'operations': [{'method': 'multiplicative', 'modifier': 1.1}]}]},
+                  recipe_file)
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    config['METADATA']['data_file_path'] = str(tmp_path / 'station.csv')
+    config['OPTIONS'].update({'fill_option': '1', 'plot_option': '0', 'random_seed': '0',
+                              'recipe_file_path': str(tmp_path / 'recipe.json'),
+                              'metadata_store_path': str(tmp_path / 'metadata.db')})
+    with open(tmp_path / 'config.ini', 'w') as config_file:
+        config.write(config_file)
+    return {'config': str(tmp_path / 'config.ini'), 'data': str(tmp_path / 'station.csv'),
+            'recipe': str(tmp_path / 'recipe.json'), 'checkpoint': str(tmp_path / 'checkpoint.pkl')}
+
+
+def resumed_station(station):
+    """New station resumed from the checkpoint, along with the number of stages it skips"""
+    resumed = WeatherQAQC(station['config'], checkpoint_file_path=station['checkpoint'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        finished_stages = resumed._resume_checkpoint()
+    return resumed, finished_stages
+
+
+@pt.mark.filterwarnings('ignore')
+def test_resume_every_stage(station):
+    """Check that every stage is resumed with the same arrays, generator, and journal it was saved with"""
+    qaqc = WeatherQAQC(station['config'], checkpoint_file_path=station['checkpoint'])
+    stages = [('obtain_data', [qaqc._obtain_data]),
+              ('secondary_vars', [qaqc._calculate_secondary_vars, qaqc._start_correction]),
+              ('correction', [qaqc._correct_data]), ('rs_tr', [])]
+
+    for (stage_number, (stage, stage_functions)) in enumerate(stages):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for stage_function in stage_functions:
+                stage_function()
+        # Correction saves its own checkpoints, ending with the rs_tr stage, so it is saved again at each stage
+        qaqc._save_checkpoint(stage)
+
+        (resumed, finished_stages) = resumed_station(station)
+        assert finished_stages == stage_number + 1
+        assert resumed.checkpoint_stage == stage
+        arrays = [key for (key, value) in qaqc.__dict__.items() if isinstance(value, np.ndarray)]
+        assert 'data_tmax' in arrays
+        for key in arrays:
+            np.testing.assert_array_equal(getattr(resumed, key), getattr(qaqc, key))
+        assert resumed.rng.bit_generator.state == qaqc.rng.bit_generator.state
+        if stage_number >= 1:
+            assert resumed.journal == qaqc.journal
+
+    assert [journal_step['variable'] for journal_step in resumed.journal] == ['tmax_tmin', 'ws']
+
+
+@pt.mark.parametrize("changed_file", ['data', 'config', 'recipe'])
+@pt.mark.parametrize("change", ['size', 'mtime'])
+def test_changed_input_discards_checkpoint(station, changed_file, change):
+    """Check that a checkpoint is discarded once any file the run was created from changes"""
+    qaqc = WeatherQAQC(station['config'], checkpoint_file_path=station['checkpoint'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        qaqc._obtain_data()
+    qaqc._save_checkpoint('obtain_data')
+    assert resumed_station(station)[1] == 1
+
+    file_path = station[changed_file]
+    if change == 'size':
+        with open(file_path, 'a') as changed:
+            changed.write('\n')
+    else:
+        file_stats = os.stat(file_path)
+        os.utime(file_path, ns=(file_stats.st_atime_ns, file_stats.st_mtime_ns + 10 ** 9))
+
+    assert checkpoint_functions.load_checkpoint(station['checkpoint']) == (None, None)
+    assert resumed_station(station)[1] == 0
+
+
+def test_version_discards_checkpoint(station, monkeypatch):
+    """Check that a checkpoint saved by a different version of the script is discarded"""
+    checkpoint_functions.save_checkpoint(station['checkpoint'], 'obtain_data', {'data_length': 1},
+                                         [station['config']])
+    assert checkpoint_functions.load_checkpoint(station['checkpoint']) == ('obtain_data', {'data_length': 1})
+
+    monkeypatch.setattr(checkpoint_functions, 'CHECKPOINT_VERSION', checkpoint_functions.CHECKPOINT_VERSION + 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert checkpoint_functions.load_checkpoint(station['checkpoint']) == (None, None)
+    with pt.raises(ValueError):
+        checkpoint_functions.save_checkpoint(station['checkpoint'], 'fill_data', {}, [])
@@ -0,0 +1,12 @@
+import pytest as pt
+from modules import equivalence_functions
+
+
+@pt.mark.filterwarnings('ignore')
+@pt.mark.parametrize("pattern", ['short_record', 'leap_years'])
+def test_kernels_match_reference(pattern):
+    """Check that every optimized kernel gives the same results as its reference on a randomized station"""
+    reports = equivalence_functions.run_harness([equivalence_functions.synthetic_case(pattern, 0)])
+    assert sorted(report['kernel'] for report in reports) == \
+        sorted(kernel[0] for kernel in equivalence_functions.KERNELS)
+    assert [report['kernel'] for report in reports if not report['passed']] == []
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest as pt
+from modules import fill_functions
+
+
+@pt.fixture
+def record():
+    """Four years of daily values with gaps, including observed days where tmax and tmin are close together"""
+    rng = np.random.default_rng(42)
+    dates = pd.date_range('2000-01-01', '2003-12-31')
+    month = np.array(dates.month)
+    tmax = 20 + 10 * np.sin(2 * np.pi * np.array(dates.dayofyear) / 365) + rng.normal(0, 2, dates.size)
+    tmin = tmax - 12 + rng.normal(0, 2, dates.size)
+    tmin[::50] = tmax[::50] - 1  # Observed, so has to be left alone even though it's too close to be filled like it
+    ws = rng.normal(5, 0.5, dates.size)
+    rs = rng.uniform(50, 300, dates.size)
+
+    for values in [tmax, tmin, ws, rs]:
+        values[rng.random(dates.size) < 0.2] = np.nan
+    mm_delta_t = np.array([np.nanmean((tmax - tmin)[month == k + 1]) for k in range(12)])
+    return {'month': month, 'tmax': tmax, 'tmin': tmin, 'ws': ws, 'rs': rs, 'rs_tr': rng.uniform(50, 300, dates.size),
+            'mm_delta_t': mm_delta_t}
+
+
+def fill(record, seed):
+    rng = fill_functions.create_generator(seed)
+    return (fill_functions.fill_temperature(rng, record['month'], record['tmax'], record['tmin'],
+                                            record['mm_delta_t']) +
+            fill_functions.fill_solar_radiation_and_wind(rng, record['month'], record['rs'], record['rs_tr'],
+                                                         record['ws']))
+
+
+def test_seeded_fill_is_repeatable(record):
+    """Check that filling with the same seed gives identical values, and that another seed gives different ones"""
+    first = fill(record, 7)
+    for (first_values, second_values) in zip(first, fill(record, 7)):
+        np.testing.assert_array_equal(first_values, second_values)
+    (complete_tmax, _complete_tmin, _complete_rs, complete_ws) = fill(record, 8)
+    assert not np.array_equal(complete_tmax, first[0])
+    assert not np.array_equal(complete_ws, first[3])
+
+
+def test_fill_only_touches_gaps(record):
+    """Check that every gap is filled, filled tmax is warmer than tmin, and observed days are left alone"""
+    (complete_tmax, complete_tmin, complete_rs, complete_ws) = fill(record, 7)
+    for complete_values in [complete_tmax, complete_tmin, complete_rs, complete_ws]:
+        assert not np.isnan(complete_values).any()
+
+    # Filled days are at least 3 degrees apart, days with both temperatures observed are kept as they are
+    filled = np.isnan(record['tmax']) | np.isnan(record['tmin'])
+    assert (complete_tmax[filled] - complete_tmin[filled] > 3).all()
+    np.testing.assert_array_equal(complete_tmax[~filled], record['tmax'][~filled])
+    np.testing.assert_array_equal(complete_tmin[~filled], record['tmin'][~filled])
+    assert (complete_tmax[~filled] - complete_tmin[~filled] <= 3).any()
+
+    for (name, complete_values) in [('rs', complete_rs), ('ws', complete_ws)]:
+        observed = ~np.isnan(record[name])
+        np.testing.assert_array_equal(complete_values[observed], record[name][observed])
+    np.testing.assert_array_equal(complete_rs[np.isnan(record['rs'])], record['rs_tr'][np.isnan(record['rs'])])
+
+
+def test_filled_wind_uses_monthly_std(record):
+    """Check that filled wind speed spreads like the monthly standard deviation, not the monthly mean"""
+    (_complete_tmax, _complete_tmin, _complete_rs, complete_ws) = fill(record, 7)
+    missing = np.isnan(record['ws'])
+    (mm_ws, std_ws) = fill_functions.monthly_mean_and_std(record['month'], record['ws'])
+    residuals = complete_ws[missing] - mm_ws[record['month'][missing] - 1]
+    assert abs(np.std(residuals) - np.mean(std_ws)) < 0.1
+    assert (complete_ws[missing] >= 0.2).all()
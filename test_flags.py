@@ -0,0 +1,80 @@
+import configparser
+import contextlib
+import io
+import json
+import numpy as np
+import pytest as pt
+from modules import flag_functions as ff
+from modules.py_weather_qaqc import WeatherQAQC
+
+
+def test_flags_are_combined():
+    """Check that flagging a step sets its bit next to the bits already set, and that NaN to NaN isn't a change"""
+    flags = np.array([0, ff.LIMITS, ff.ISOLATED, 0], dtype=ff.FLAG_DTYPE)
+    old_values = np.array([1.0, np.nan, 3.0, 4.0])
+    new_values = np.array([np.nan, np.nan, np.nan, 4.0])
+    ff.flag_removed(flags, old_values, new_values, ff.SET_TO_NAN)
+    np.testing.assert_array_equal(flags, [ff.SET_TO_NAN, ff.LIMITS, ff.ISOLATED | ff.SET_TO_NAN, 0])
+
+    ff.flag_changed(flags, new_values, np.array([5.0, 6.0, np.nan, 4.0]), ff.FILLED)
+    np.testing.assert_array_equal(flags, [ff.SET_TO_NAN | ff.FILLED, ff.LIMITS | ff.FILLED, ff.ISOLATED | ff.SET_TO_NAN,
+                                          0])
+    np.testing.assert_array_equal(ff.flag_values(flags, np.arange(4.0), ff.FILLED), [0.0, 1.0, 0.0, 0.0])
+    assert [bit_number for (bit_number, _value, _description) in ff.flag_legend()] == list(range(13))
+
+
+@pt.mark.filterwarnings('ignore')
+def test_station_flags(tmp_path):
+    """Check the flags of every step that removes data from a station, from reading it in through correction and
+    filling, and that each step adds its bit onto the ones set before it"""
+    lines = open('test_files/test_data.csv', encoding='utf-8-sig').read().splitlines()
+    rows = [line.split(',') for line in lines[1:] if line[:4] == '2018']
+    for day in [10, 20, 22]:
+        rows[day][7] = '200'  # TMax is in F, so this is over the 60 C limit, which leaves day 21 isolated
+    rows[30][7] = rows[30][8] = '50'  # TMax equal to TMin marks a missing day
+    with open(tmp_path / 'station.csv', 'w') as station_file:
+        station_file.write('\n'.join([lines[0]] + [','.join(row) for row in rows]) + '\n')
+
+    # Throws out days 8 to 11, which includes day 10 where tmax was already removed
+    with open(tmp_path / 'recipe.json', 'w') as recipe_file:
+        json.dump({'steps': [{'variable': 'tmax_tmin', 'operations': [{'method': 'set_to_nan', 'start': 8,
+                                                                       'end': 12}]}]}, recipe_file)
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    config['METADATA']['data_file_path'] = str(tmp_path / 'station.csv')
+    config['OPTIONS'].update({'fill_option': '1', 'plot_option': '0', 'random_seed': '0',
+                              'recipe_file_path': str(tmp_path / 'recipe.json'),
+                              'metadata_store_path': str(tmp_path / 'metadata.db')})
+    with open(tmp_path / 'config.ini', 'w') as config_file:
+        config.write(config_file)
+
+    qaqc = WeatherQAQC(str(tmp_path / 'config.ini'), use_checkpoints=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        qaqc._obtain_data()
+        read_flags = {var: np.array(qaqc.qc_flags[var]) for var in ['tmax', 'tmin', 'ws', 'precip']}
+        qaqc._calculate_secondary_vars()
+        qaqc._start_correction()
+        qaqc._correct_data()
+        qaqc._fill_data()
+    flags = qaqc.qc_flags
+
+    assert read_flags['tmax'][[10, 20, 21, 22, 30]].tolist() == \
+        [ff.LIMITS, ff.LIMITS, ff.ISOLATED, ff.LIMITS, ff.TMAX_EQUALS_TMIN]
+    assert read_flags['tmin'][[10, 21, 30]].tolist() == [0, 0, ff.TMAX_EQUALS_TMIN]
+    assert read_flags['ws'][30] == read_flags['precip'][30] == ff.TMAX_EQUALS_TMIN
+
+    # Day 10 keeps its limits bit for tmax instead of getting the correction's, as it was already missing
+    assert flags['tmax'][[8, 9, 10, 11]].tolist() == [ff.SET_TO_NAN | ff.FILLED] * 2 + \
+        [ff.LIMITS | ff.FILLED, ff.SET_TO_NAN | ff.FILLED]
+    assert flags['tmin'][[8, 9, 10, 11]].tolist() == [ff.SET_TO_NAN | ff.FILLED] * 4
+    assert flags['tmax'][[20, 21, 22, 30]].tolist() == \
+        [ff.LIMITS | ff.FILLED, ff.ISOLATED | ff.FILLED, ff.LIMITS | ff.FILLED, ff.TMAX_EQUALS_TMIN | ff.FILLED]
+    assert flags['ws'][30] == ff.TMAX_EQUALS_TMIN | ff.FILLED
+    assert flags['precip'][30] == ff.TMAX_EQUALS_TMIN  # Precipitation is never filled
+
+    # Every other day of tmax was left alone
+    untouched = np.setdiff1d(np.arange(flags['tmax'].size), [8, 9, 10, 11, 20, 21, 22, 30])
+    assert (flags['tmax'][untouched] == 0).all()
+    np.testing.assert_array_equal(ff.flag_values(flags['tmax'], qaqc.data_tmax, ff.FILLED) != 0,
+                                  (flags['tmax'] & ff.FILLED) != 0)
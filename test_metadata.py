@@ -0,0 +1,23 @@
+import datetime as dt
+import pandas as pd
+from modules import metadata_functions
+
+
+def test_import_legacy_metadata(tmp_path, monkeypatch):
+    """Check that the run counts of an existing correction_metadata.xlsx carry on in a new metadata store"""
+    monkeypatch.chdir(tmp_path)
+    rows = [{'Station': station, 'Latitude': 40.0, 'Longitude': -110.0, 'station_elev_m': 1000.0,
+             'record_start': dt.date(2000, 1, 1), 'record_end': dt.date(2001, 1, day), 'anemom_height_m': 2.0,
+             'Filename': '{}_{}.xlsx'.format(station, day)} for (station, day) in [('a', 1), ('b', 2), ('a', 3)]]
+    with pd.ExcelWriter(metadata_functions.LEGACY_METADATA_WORKBOOK, engine='openpyxl', mode='w') as writer:
+        pd.DataFrame(rows).to_excel(writer, header=True, index=False, sheet_name='Sheet1')
+
+    store_path = metadata_functions.DEFAULT_METADATA_STORE
+    metadata_functions.upsert_corrected_station(store_path, 'a', 40.0, -110.0, 1000.0, '2000-01-01', '2002-01-01',
+                                                2.0, 'a_new.xlsx')
+    # Opening the store again must not import the workbook a second time
+    with metadata_functions.open_metadata_store(store_path) as connection:
+        stations = connection.execute('SELECT station, record_end, output_path, run_count FROM corrected_stations '
+                                      'ORDER BY station').fetchall()
+
+    assert stations == [('a', '2002-01-01', 'a_new.xlsx', 3), ('b', '2001-01-02', 'b_2.xlsx', 1)]
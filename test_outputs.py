@@ -0,0 +1,143 @@
+import configparser
+import importlib.util
+import numpy as np
+import pytest as pt
+from modules import batch_functions, input_functions, output_functions
+from modules.py_weather_qaqc import WeatherQAQC
+
+
+@pt.fixture
+def missing_exports(monkeypatch):
+    """Makes pyarrow and netCDF4 look uninstalled, whether or not they are"""
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec',
+                        lambda name, *args: None if name in ['pyarrow', 'netCDF4'] else find_spec(name, *args))
+
+
+@pt.mark.parametrize("option,argument", [('parquet_option', 'parquet_dataset_path'),
+                                         ('netcdf_option', 'netcdf_file_path')])
+def test_missing_export_package_fails_up_front(tmp_path, missing_exports, option, argument):
+    """Check that a missing export package fails when the config is read, before the station is processed"""
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    config['OPTIONS'][option] = '1'
+    with open(tmp_path / 'config.ini', 'w') as config_file:
+        config.write(config_file)
+
+    with pt.raises(ImportError, match=option):
+        input_functions.read_config(str(tmp_path / 'config.ini'))
+    # Exports passed in directly are checked as soon as the station is created
+    with pt.raises(ImportError, match=option):
+        WeatherQAQC('config.ini', use_checkpoints=False, **{argument: 'export'})
+    output_functions.check_output_dependencies()
+
+
+def test_failed_export_keeps_other_outputs():
+    """Check that a failed export does not skip the station's other outputs, but still fails the station"""
+    written = []
+
+    def fail():
+        raise ImportError('no pyarrow')
+
+    with output_functions.OutputWriter() as writer:
+        writer.submit('a', 'a workbook', written.append, 'workbook')
+        writer.submit(output_functions.export_tag('a'), 'a parquet dataset', fail)
+        writer.submit('a', 'a state', written.append, 'state')
+        result = {'station': 'a', 'status': 'succeeded', 'error': None}
+        batch_functions.finish_outputs(result, writer)
+
+    assert written == ['workbook', 'state']
+    assert result['status'] == 'failed' and 'exports could not be' in result['error']
+
+
+def cube_record(dates, first_value):
+    return {name: np.arange(first_value, first_value + dates.shape[0], dtype=float)
+            for (name, _attributes) in output_functions.CUBE_VARIABLES}
+
+
+def test_netcdf_cube_append_and_replace(tmp_path):
+    """Check that stations line up on the shared time axis, and that a station written again replaces its record"""
+    netCDF4 = pt.importorskip('netCDF4')
+    cube_file_path = str(tmp_path / 'cube.nc')
+    first_dates = np.arange(np.datetime64('2000-01-01'), np.datetime64('2000-01-11'))
+    # Starts before the first station and skips a day, which has to be left missing rather than shifting the rest
+    second_dates = np.array(['1999-12-30', '1999-12-31', '2000-01-02'], dtype='datetime64[D]')
+    replaced_dates = np.arange(np.datetime64('2000-01-05'), np.datetime64('2000-01-08'))
+
+    for (station_name, dates, first_value) in [('a', first_dates, 1.0), ('b', second_dates, 100.0),
+                                               ('a', replaced_dates, 50.0)]:
+        output_functions.write_netcdf_cube(cube_file_path, station_name, 40.0, -110.0, 1000.0, 2.0, dates,
+                                           cube_record(dates, first_value))
+
+    def day(date):
+        return int((np.datetime64(date, 'D') - output_functions.CUBE_EPOCH).astype(int))
+
+    with netCDF4.Dataset(cube_file_path) as cube:
+        assert list(cube['station_name'][:]) == ['a', 'b']
+        # The time axis counts days from the epoch and only grows, replacing a station never shortens it
+        np.testing.assert_array_equal(cube['time'][:], np.arange(day('2000-01-10') + 1))
+        first = np.ma.filled(cube['tmax'][0, day('1999-12-30'):day('2000-01-10') + 1].astype(float), np.nan)
+        second = np.ma.filled(cube['tmax'][1, day('1999-12-30'):day('2000-01-10') + 1].astype(float), np.nan)
+
+    # Days run from 1999-12-30, so the replaced record of the first station starts at index 6
+    np.testing.assert_array_equal(first, [np.nan] * 6 + [50.0, 51.0, 52.0] + [np.nan] * 3)
+    np.testing.assert_array_equal(second, [100.0, 101.0, np.nan, 102.0] + [np.nan] * 8)
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def test_output_writer_skips_failed_tag():
+    """Check that outputs after a failed one are skipped for its tag only, and that wait collects only that tag"""
+    written = []
+    writer = output_functions.OutputWriter(max_pending=2)
+    writer.submit('a', 'a first', written.append, 'a first')
+    writer.submit('a', 'a broken', fail, 'disk full')
+    writer.submit('b', 'b first', written.append, 'b first')
+    writer.submit('a', 'a after', written.append, 'a after')
+    writer.submit('b', 'b broken', fail, 'bad value')
+    writer.submit('c', 'c first', written.append, 'c first')
+
+    assert writer.wait('a') == ['a broken : ValueError: disk full',
+                                'a after : skipped, an earlier output of a could not be written.']
+    assert writer.wait('c') == []
+    assert writer.wait('a') == []  # Errors are only collected once
+    assert written == ['a first', 'b first', 'c first']
+    # Once its errors are collected, the tag is written again
+    writer.submit('a', 'a again', written.append, 'a again')
+    assert writer.wait('a') == []
+    assert written[-1] == 'a again'
+
+    with pt.raises(IOError, match='bad value'):
+        writer.close()
+
+
+def test_output_writer_raises_errors():
+    """Check that flush and close raise the errors of failed outputs, and that nothing is handed over once closed"""
+    # Leaving the with block closes the writer, raising what is left
+    with pt.raises(IOError, match='bad value'):
+        with output_functions.OutputWriter() as writer:
+            writer.submit('a', 'a broken', fail, 'disk full')
+            with pt.raises(IOError, match='1 outputs could not be written:\na broken : ValueError: disk full'):
+                writer.flush()
+            writer.flush()  # Already raised, so not raised again
+            writer.submit('b', 'b broken', fail, 'bad value')
+
+    with pt.raises(IOError, match='already been closed'):
+        writer.submit('c', 'c first', print)
+
+
+def test_output_writer_close_raises():
+    """Check that close raises the errors it finds, unless asked not to"""
+    writer = output_functions.OutputWriter()
+    writer.submit('a', 'a broken', fail, 'disk full')
+    with pt.raises(IOError, match='disk full'):
+        writer.close()
+    writer.close()  # Closing again does nothing
+
+    writer = output_functions.OutputWriter()
+    writer.submit('a', 'a broken', fail, 'disk full')
+    writer.close(raise_errors=False)
+    with pt.raises(IOError, match='already been closed'):
+        writer.submit('a', 'a after', print)
@@ -0,0 +1,45 @@
+from math import ceil
+import numpy as np
+import pytest as pt
+from modules import plotting_functions
+
+
+@pt.mark.parametrize("max_points", [100, 257, 1000])
+def test_downsample_keeps_bucket_extremes(max_points):
+    """Check that the lowest and highest value of every bucket, spikes included, and part of every gap are kept"""
+    rng = np.random.default_rng(0)
+    record_length = 10000
+    first = np.sin(np.arange(record_length) / 200) + rng.normal(0, 0.1, record_length)
+    second = rng.normal(0, 1, record_length)
+    # Spikes are further apart than the largest bucket, so every one of them is the extreme of its own bucket
+    spikes = np.arange(317, record_length, 700)
+    first[spikes[::2]] = 50.0
+    second[spikes[1::2]] = -50.0
+    second[4000:4100] = np.nan
+
+    indices = plotting_functions.downsample_indices([first, second], max_points)
+    assert indices.size <= max_points
+    assert (np.diff(indices) > 0).all()
+    assert indices[0] == 0 and indices[-1] == record_length - 1
+    assert 4000 in indices
+    assert np.isin(spikes, indices).all()
+
+    # Buckets are sized the same way the function sizes them, and each one has to keep its extremes
+    bucket_size = ceil(record_length / max(1, (max_points - 2) // 6))
+    for values in [first, second]:
+        for bucket_start in range(0, record_length, bucket_size):
+            bucket = values[bucket_start:bucket_start + bucket_size]
+            kept = values[indices[(indices >= bucket_start) & (indices < bucket_start + bucket_size)]]
+            if np.isnan(bucket).any():
+                assert np.isnan(kept).any()
+            if np.isnan(bucket).all():
+                continue
+            assert np.nanmin(kept) == np.nanmin(bucket)
+            assert np.nanmax(kept) == np.nanmax(bucket)
+
+
+def test_downsample_short_series():
+    """Check that a series that already fits is returned whole"""
+    values = np.array([1.0, np.nan, 3.0, 2.0])
+    np.testing.assert_array_equal(plotting_functions.downsample_indices([values, values * 2], 4), np.arange(4))
+    np.testing.assert_array_equal(plotting_functions.downsample_indices([values], 100), np.arange(4))
@@ -0,0 +1,73 @@
+import json
+import numpy as np
+import pytest as pt
+from modules import recipe_functions
+
+dt_array = np.arange(np.datetime64('2018-01-01'), np.datetime64('2018-01-11'), dtype='datetime64[D]')
+
+
+def write_recipe(tmp_path, steps):
+    recipe_file_path = str(tmp_path / 'recipe.json')
+    with open(recipe_file_path, 'w') as recipe_file:
+        json.dump({'steps': steps}, recipe_file)
+    return recipe_file_path
+
+
+def test_read_recipe(tmp_path):
+    """Check that read_recipe maps variables, methods, and humidity sources onto their menu options and choices"""
+    recipe = recipe_functions.read_recipe(write_recipe(tmp_path, [
+        {'variable': 'tmax_tmin', 'operations': [{'method': 'z_score_outliers'},
+                                                 {'method': 'additive', 'modifier': 0.5, 'start': 2, 'end': 5}]},
+        {'variable': 'RS', 'operations': [{'method': 'rs_period_ratio', 'period': 60}]},
+        {'variable': 'compiled_ea', 'operations': [{'source': 'rhmax_rhmin'}]}]))
+
+    assert [step['option'] for step in recipe] == [1, 5, 9]
+    assert [operation['choice'] for operation in recipe[0]['operations']] == [4, 1]
+    assert recipe[0]['operations'][1]['modifier'] == 0.5
+    assert recipe[1]['variable'] == 'rs'
+    assert recipe[2]['operations'][0]['choice'] == 3
+
+
+@pt.mark.parametrize("steps", [
+    [{'variable': 'tavg', 'operations': []}],
+    [{'variable': 'ws', 'operations': [{'method': 'z_score_outliers'}]}],
+    [{'variable': 'ws', 'operations': [{'method': 'additive'}]}],
+    [{'variable': 'compiled_ea', 'operations': [{'source': 'tavg'}]}]])
+def test_read_recipe_rejects_invalid_steps(tmp_path, steps):
+    """Check that unknown variables, methods that don't apply, and missing modifiers are rejected"""
+    with pt.raises(ValueError):
+        recipe_functions.read_recipe(write_recipe(tmp_path, steps))
+
+
+@pt.mark.parametrize("operation,expected", [
+    ({}, (0, 10)),
+    ({'start': 2, 'end': 5}, (2, 5)),
+    ({'start': '2018-01-03', 'end': '2018-01-05'}, (2, 5)),
+    ({'start': '2018-01-03'}, (2, 10)),
+    ({'end': '2018-01-10'}, (0, 10)),
+    ({'start': -4, 'end': 40}, (0, 10)),
+    ({'start': 6, 'end': 3}, (6, 6))])
+def test_resolve_interval(operation, expected):
+    """Check that index ends are exclusive, date ends are inclusive, and both are kept within the record"""
+    assert recipe_functions.resolve_interval(operation, dt_array) == expected
+
+
+def test_checksum_stability():
+    """Check that checksums ignore rounding noise and negative zeros, but not real changes or values outside range"""
+    values = np.array([1.0, 2.5, -0.0, np.nan, 4.25, 7.0])
+    checksum = recipe_functions.compute_checksum(1, 5, values)
+
+    assert checksum == recipe_functions.compute_checksum(1, 5, values + 1e-9)
+    assert checksum == recipe_functions.compute_checksum(1, 5, np.where(values == 0, 0.0, values))
+    assert checksum == recipe_functions.compute_checksum(1, 5, list(values))
+    assert checksum == recipe_functions.compute_checksum(1, 5, np.where(np.arange(6) == 5, 99.0, values))
+    assert checksum != recipe_functions.compute_checksum(1, 5, np.where(np.arange(6) == 2, 0.01, values))
+    assert checksum != recipe_functions.compute_checksum(1, 5, values, values)
+
+
+def test_checksum_bounds():
+    """Check that temperature outlier checksums cover the whole record, since they change it whatever the interval"""
+    assert recipe_functions.checksum_bounds(4, 1, 3, 6, 10) == (0, 10)
+    assert recipe_functions.checksum_bounds(4, 2, 3, 6, 10) == (0, 10)
+    assert recipe_functions.checksum_bounds(4, 5, 3, 6, 10) == (3, 6)
+    assert recipe_functions.checksum_bounds(1, 1, 3, 6, 10) == (3, 6)
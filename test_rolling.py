@@ -0,0 +1,101 @@
+import numpy as np
+import pytest as pt
+from modules import rolling_functions
+
+
+def brute_force_median_mad(window_values, min_samples):
+    """Median and median absolute deviation of a window by sorting it, nan if it has too few values"""
+    window_values = np.asarray(window_values, dtype=float)
+    window_values = window_values[~np.isnan(window_values)]
+    if window_values.size < min_samples or window_values.size == 0:
+        return np.nan, np.nan
+    median = np.median(window_values)
+    return median, np.median(np.abs(window_values - median))
+
+
+def random_record(size, nan_fraction, seed):
+    generator = np.random.default_rng(seed)
+    # Rounding makes repeated values common, which is where off-by-one errors in the binary searches show up
+    data = np.round(generator.normal(10.0, 5.0, size), 1)
+    data[generator.random(size) < nan_fraction] = np.nan
+    return data
+
+
+@pt.mark.parametrize("size", [1, 2, 3, 4, 7, 10, 25, 26])
+def test_sorted_window(size):
+    """Check the median and median absolute deviation of odd and even sized windows, including after removals"""
+    generator = np.random.default_rng(size)
+    values = np.round(generator.normal(0.0, 3.0, size + 3), 0).tolist()
+    window = rolling_functions.SortedWindow()
+    for value in values:
+        window.add(value)
+    for value in values[:3]:
+        window.remove(value)
+
+    assert len(window) == size
+    (median, mad) = brute_force_median_mad(values[3:], 1)
+    assert window.median() == pt.approx(median)
+    assert window.median_absolute_deviation(window.median()) == pt.approx(mad)
+
+
+@pt.mark.parametrize("first,second", [([], [1.0]), ([1.0, 2.0], []), ([1.0, 4.0, 9.0], [2.0, 3.0]),
+                                      ([5.0, 5.0, 5.0], [5.0, 6.0]), ([0.0], [1.0, 2.0, 3.0, 4.0])])
+def test_kth_of_two_sorted(first, second):
+    """Check every k of two sorted sequences against merging them"""
+    merged = sorted(first + second)
+    for k in range(len(merged)):
+        assert rolling_functions.kth_of_two_sorted(first.__getitem__, len(first), second.__getitem__, len(second),
+                                                   k) == merged[k]
+
+
+@pt.mark.parametrize("half_width,nan_fraction,min_samples", [(0, 0.0, 1), (1, 0.0, 1), (2, 0.3, 3), (5, 0.8, 4),
+                                                             (3, 0.95, 2), (30, 0.5, 10), (60, 0.0, 200)])
+def test_moving_median_mad(half_width, nan_fraction, min_samples):
+    """Check the moving window against brute force, including windows cut short by the edges of the record"""
+    data = random_record(120, nan_fraction, half_width)
+    (median, mad) = rolling_functions.moving_median_mad(data, half_width, min_samples)
+
+    for i in range(data.shape[0]):
+        expected = brute_force_median_mad(data[max(i - half_width, 0):i + half_width + 1], min_samples)
+        assert median[i] == pt.approx(expected[0], nan_ok=True)
+        assert mad[i] == pt.approx(expected[1], nan_ok=True)
+
+
+@pt.mark.parametrize("start,end", [(0, 1), (0, 50), (10, 20), (45, 50), (50, 50)])
+def test_moving_median_mad_interval(start, end):
+    """Check that only the interval is calculated, while its windows still use the values outside it"""
+    data = random_record(50, 0.2, start)
+    (median, mad) = rolling_functions.moving_median_mad(data, 4, 2, start, end)
+    (full_median, full_mad) = rolling_functions.moving_median_mad(data, 4, 2)
+
+    outside = np.ones(50, dtype=bool)
+    outside[start:end] = False
+    assert np.isnan(median[outside]).all() and np.isnan(mad[outside]).all()
+    np.testing.assert_array_equal(median[start:end], full_median[start:end])
+    np.testing.assert_array_equal(mad[start:end], full_mad[start:end])
+
+
+@pt.mark.parametrize("half_width,nan_fraction,min_samples", [(0, 0.0, 1), (3, 0.5, 2), (7, 0.9, 5), (15, 0.3, 40),
+                                                             (200, 0.0, 1)])
+def test_seasonal_median_mad(half_width, nan_fraction, min_samples):
+    """Check the seasonal window against brute force, including the windows that wrap around the end of the year"""
+    dt_array = np.arange(np.datetime64('2015-01-01'), np.datetime64('2019-01-01'), dtype='datetime64[D]')
+    doy = np.array([date.timetuple().tm_yday for date in dt_array.astype(object)])
+    data = random_record(dt_array.shape[0], nan_fraction, half_width)
+    (median, mad) = rolling_functions.seasonal_median_mad(data, doy, half_width, min_samples)
+
+    assert median.shape == (367,) and np.isnan(median[0]) and np.isnan(mad[0])
+    window_width = min(half_width, 182)
+    for day in range(1, 367):
+        distance = np.abs(doy - day)
+        distance = np.minimum(distance, 366 - distance)
+        expected = brute_force_median_mad(data[distance <= window_width], min_samples)
+        assert median[day] == pt.approx(expected[0], nan_ok=True)
+        assert mad[day] == pt.approx(expected[1], nan_ok=True)
+
+
+def test_all_nan_record():
+    """Check that a record without any values produces no statistics instead of failing"""
+    data = np.full(30, np.nan)
+    assert np.isnan(rolling_functions.moving_median_mad(data, 3, 1)[0]).all()
+    assert np.isnan(rolling_functions.seasonal_median_mad(data, np.arange(1, 31), 3, 1)[1]).all()
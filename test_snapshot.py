@@ -0,0 +1,101 @@
+import numpy as np
+import pytest as pt
+from modules import snapshot_functions
+
+
+def edited(values, start, end, change):
+    """Copy of values with change added over an interval"""
+    new_values = np.array(values)
+    new_values[start:end] += change
+    return new_values
+
+
+@pt.fixture
+def record():
+    values = np.arange(20, dtype=float)
+    values[[3, 15]] = np.nan
+    return values
+
+
+def test_changed_bounds(record):
+    """Check that only the values that differ bound the interval, and that NaN to NaN is not a change"""
+    assert snapshot_functions.changed_bounds(record, np.array(record)) == (0, 0)
+    assert snapshot_functions.changed_bounds(record, edited(record, 5, 9, 1.0)) == (5, 9)
+
+    new_values = np.array(record)
+    new_values[[2, 12]] = np.nan  # Values thrown out are changes, the NaNs that were already there are not
+    assert snapshot_functions.changed_bounds(record, new_values) == (2, 13)
+
+
+def test_commit_undo_redo(record):
+    """Check that undoing and redoing a commit round trips every tracked array"""
+    (first, second) = (np.array(record), np.array(record) * 2)
+    history = snapshot_functions.CorrectionHistory(first, second)
+    new_arrays = [edited(record, 4, 10, 1.5), edited(record * 2, 6, 8, -3.0)]
+    history.commit(new_arrays, 4, 10, payload='step')
+
+    # Only what actually changed is stored
+    assert [(changed_start, old_values.shape[0]) for (changed_start, old_values, _new_values)
+            in history.undo_stack[0]['intervals']] == [(4, 6), (6, 2)]
+    for _round_trip in range(2):
+        assert history.undo()
+        np.testing.assert_array_equal(history.current[0], record)
+        np.testing.assert_array_equal(history.current[1], record * 2)
+        assert history.payloads() == []
+        assert history.redo()
+        np.testing.assert_array_equal(history.current[0], new_arrays[0])
+        np.testing.assert_array_equal(history.current[1], new_arrays[1])
+        assert history.payloads() == ['step']
+
+    assert not history.redo()
+    # The arrays passed in are edited in place
+    assert history.current[0] is first
+
+
+def test_undo_then_commit_clears_redo(record):
+    """Check that a new commit after undoing several levels forgets everything that was undone"""
+    history = snapshot_functions.CorrectionHistory(np.array(record))
+    for (i, start) in enumerate([0, 5, 10]):
+        history.commit([edited(history.current[0], start, start + 5, 1.0)], start, start + 5, payload=i)
+    assert history.undo() and history.undo()
+    np.testing.assert_array_equal(history.current[0], edited(record, 0, 5, 1.0))
+
+    history.commit([edited(history.current[0], 8, 12, 10.0)], 8, 12, payload='new')
+    assert not history.redo()
+    assert history.payloads() == [0, 'new']
+    assert history.undo() and history.undo() and not history.undo()
+    np.testing.assert_array_equal(history.current[0], record)
+
+
+def test_original_after_overlapping_commits(record):
+    """Check that the original arrays are rebuilt through intervals that overlap, without changing the current ones"""
+    history = snapshot_functions.CorrectionHistory(np.array(record))
+    expected = np.array(record)
+    for (start, end, change) in [(2, 12, 1.0), (8, 18, 2.0), (0, 20, -0.5), (5, 9, 4.0)]:
+        expected = edited(expected, start, end, change)
+        expected[start + 1] = np.nan  # Throw a value out too, so the original has to bring it back
+        history.commit([expected], start, end)
+
+    np.testing.assert_array_equal(history.original()[0], record)
+    np.testing.assert_array_equal(history.current[0], expected)
+    history.revert()
+    np.testing.assert_array_equal(history.current[0], record)
+    assert not history.redo()
+
+
+def test_whole_record_commit(record):
+    """Check that a commit without an interval looks at the whole record, and that NaN to NaN is not counted"""
+    history = snapshot_functions.CorrectionHistory(np.array(record))
+    new_values = np.array(record)
+    new_values[[1, 17]] = [-1.0, -17.0]
+    history.commit([new_values])
+
+    [(changed_start, old_values, new_stored)] = history.undo_stack[0]['intervals']
+    assert (changed_start, old_values.shape[0]) == (1, 17)
+    [(_payload, [changed_indices])] = history.changes()
+    np.testing.assert_array_equal(changed_indices, [1, 17])
+
+    # The missing values are still missing, which is not a change, so nothing is stored
+    history.commit([np.array(history.current[0])])
+    assert history.undo_stack[1]['intervals'][0][1].shape[0] == 0
+    assert history.changes()[1][1][0].size == 0